@@ -19,7 +19,8 @@ from anyjson import dumps, loads
 from bunch import Bunch
 
 # gevent
-from gevent import sleep
+from gevent import sleep, spawn
+from gevent.queue import Queue
 
 # Redis
 import redis
@@ -49,7 +50,25 @@ NEEDS_TMP_KEY = [v for k,v in TOPICS.items() if k in(
 CODE_RENAMED = 10
 CODE_NO_SUCH_FROM_KEY = 11
 
-def BrokerClient(kvdb, client_type, topic_callbacks, _initial_lua_programs):
+# A Redis list that async invocations are pushed to and popped off by servers
+WORK_QUEUE_KEY = 'zato:broker:queue{}'
+
+# How long to block waiting for new work queue messages before checking if the client is still running, in seconds
+WORK_QUEUE_POP_TIMEOUT = 1
+
+# Pushes a message to the work queue and makes the list expire no sooner than the message does. The list's TTL is only
+# ever extended so that a message with a short expiration cannot make Redis drop other messages waiting in the list.
+lua_zato_work_queue_push = """
+redis.call('lpush', KEYS[1], ARGV[1])
+
+local expiration = tonumber(ARGV[2])
+if redis.call('ttl', KEYS[1]) < expiration then
+    redis.call('expire', KEYS[1], expiration)
+end
+"""
+
+def BrokerClient(kvdb, client_type, topic_callbacks, _initial_lua_programs,
+    async_transport=BROKER.ASYNC_TRANSPORT.WORK_QUEUE, work_queue_batch_size=BROKER.DEFAULT_WORK_QUEUE_BATCH_SIZE):
 
     # Imported here so it's guaranteed to be monkey-patched using gevent.monkey.patch_all by whoever called us
     from zato.common.py23_ import start_new_thread
@@ -140,13 +159,25 @@ def BrokerClient(kvdb, client_type, topic_callbacks, _initial_lua_programs):
            that bad as it may seem, there will be at most as many clients as there
            are servers in the cluster and truth to be told, Zero MQ < 3.x also would
            do client-side PUB/SUB filtering and it did scale nicely.
+
+           That is the 'pub-sub' transport. By default, 3) uses the 'work-queue' one instead - messages are pushed
+           to a Redis list which all the servers pop them off of, in batches, with each message given to exactly
+           one of the servers that wait for it.
+
+           In either case, if the caller allows it and the message can be handled by our own process,
+           it is put on an in-process queue without going through Redis at all.
         """
-        def __init__(self, kvdb, client_type, topic_callbacks, initial_lua_programs):
+        def __init__(self, kvdb, client_type, topic_callbacks, initial_lua_programs, async_transport, work_queue_batch_size):
             self.kvdb = kvdb
             self.decrypt_func = kvdb.decrypt_func
             self.name = '{}-{}'.format(client_type, new_cid())
             self.topic_callbacks = topic_callbacks
             self.lua_container = LuaContainer(self.kvdb.conn, initial_lua_programs)
+            self.lua_container.add_lua_program('zato.work_queue_push', lua_zato_work_queue_push)
+            self.async_transport = async_transport
+            self.work_queue_batch_size = work_queue_batch_size
+            self.local_queue = Queue()
+            self.keep_running = True
             self.ready = False
 
         def run(self):
@@ -159,6 +190,11 @@ def BrokerClient(kvdb, client_type, topic_callbacks, _initial_lua_programs):
             start_new_thread(self.pub_client.run, ())
             start_new_thread(self.sub_client.run, ())
 
+            # Only clients that handle async invocations need to wait for them
+            if TOPICS[MESSAGE_TYPE.TO_PARALLEL_ANY] in self.topic_callbacks:
+                start_new_thread(self.run_work_queue, (MESSAGE_TYPE.TO_PARALLEL_ANY,))
+                start_new_thread(self.run_local_queue, ())
+
             for client in(self.pub_client, self.sub_client):
                 while client.keep_running == ZATO_NONE:
                     time.sleep(0.01)
@@ -170,7 +206,11 @@ def BrokerClient(kvdb, client_type, topic_callbacks, _initial_lua_programs):
             msg = dumps(msg)
             self.pub_client.publish(topic, msg)
 
-        def invoke_async(self, msg, msg_type=MESSAGE_TYPE.TO_PARALLEL_ANY, expiration=BROKER.DEFAULT_EXPIRATION):
+        def invoke_async(self, msg, msg_type=MESSAGE_TYPE.TO_PARALLEL_ANY, expiration=BROKER.DEFAULT_EXPIRATION,
+            allow_local=False):
+            """ Sends a message to one of the servers. If allow_local is True and our own process can handle the message,
+            it will do it without going through Redis.
+            """
             msg['msg_type'] = msg_type
 
             try:
@@ -181,6 +221,21 @@ def BrokerClient(kvdb, client_type, topic_callbacks, _initial_lua_programs):
                 raise
             else:
                 topic = TOPICS[msg_type]
+
+                if allow_local and topic in self.topic_callbacks:
+                    self.local_queue.put((topic, msg))
+                    return
+
+                if self.async_transport == BROKER.ASYNC_TRANSPORT.WORK_QUEUE and msg_type == MESSAGE_TYPE.TO_PARALLEL_ANY:
+                    key = WORK_QUEUE_KEY.format(KEYS[msg_type])
+
+                    # The list as a whole expires only after all the messages pushed to it would have, e.g. because there
+                    # are no servers to consume them. Otherwise, each message is checked for expiration when it is popped.
+                    self.lua_container.run_lua('zato.work_queue_push', [key], ['{};{}'.format(time.time() + expiration, msg),
+                        expiration])
+
+                    return
+
                 key = broker_msg = 'zato:broker{}:{}'.format(KEYS[msg_type], new_cid())
 
                 self.kvdb.conn.set(key, str(msg))
@@ -226,12 +281,76 @@ def BrokerClient(kvdb, client_type, topic_callbacks, _initial_lua_programs):
                     if has_debug:
                         logger.debug('No payload in msg: `%s`', msg)
 
+        def run_work_queue(self, msg_type):
+            """ Pops batches of messages off the work queue, blocking until there are any. Since each message is given
+            to one client only, no one needs to race for it the way pub-sub clients do for keys published to them.
+            """
+            kvdb = self.kvdb.copy()
+            kvdb.init()
+
+            key = WORK_QUEUE_KEY.format(KEYS[msg_type])
+            callback = self.topic_callbacks[TOPICS[msg_type]]
+
+            while self.keep_running:
+                try:
+                    response = kvdb.conn.brpop(key, WORK_QUEUE_POP_TIMEOUT)
+
+                    # Timed out, check if we are still running and block again
+                    if not response:
+                        continue
+
+                    batch = [response[1]]
+
+                    # Take as many of the next messages as there are available, up to the batch size. Messages are pushed
+                    # to the head of the list so the oldest ones are at its end.
+                    if self.work_queue_batch_size > 1:
+                        pipeline = kvdb.conn.pipeline()
+                        pipeline.lrange(key, 1 - self.work_queue_batch_size, -1)
+                        pipeline.ltrim(key, 0, -self.work_queue_batch_size)
+                        batch.extend(reversed(pipeline.execute()[0]))
+
+                    now = time.time()
+
+                    for data in batch:
+                        if isinstance(data, bytes):
+                            data = data.decode('utf8')
+
+                        expires_at, msg = data.split(';', 1)
+
+                        if float(expires_at) < now:
+                            logger.info('Skipping expired work queue message `%s`', msg)
+                        else:
+                            spawn(callback, Bunch(loads(msg)))
+
+                except Exception:
+                    if self.keep_running:
+                        logger.warn('Work queue error, will retry after %ss, e:`%s`', WORK_QUEUE_POP_TIMEOUT, format_exc())
+                        sleep(WORK_QUEUE_POP_TIMEOUT)
+
+            kvdb.close()
+
+        def run_local_queue(self):
+            """ Hands messages that our own process can handle over to their callbacks.
+            """
+            while self.keep_running:
+                item = self.local_queue.get()
+
+                # We are being closed
+                if item is None:
+                    break
+
+                topic, msg = item
+                spawn(self.topic_callbacks[topic], Bunch(loads(msg)))
+
         def close(self):
+            self.keep_running = False
+            self.local_queue.put(None)
+
             for client in(self.pub_client, self.sub_client):
                 client.keep_running = False
                 client.kvdb.close()
 
-    client = _BrokerClient(kvdb, client_type, topic_callbacks, _initial_lua_programs)
+    client = _BrokerClient(kvdb, client_type, topic_callbacks, _initial_lua_programs, async_transport, work_queue_batch_size)
     start_new_thread(client.run, ())
 
     return client
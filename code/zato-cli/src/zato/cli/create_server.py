@@ -142,12 +142,18 @@ startup_callable=
 
 [http]
 methods_allowed=GET, POST, DELETE, PUT, PATCH, HEAD, OPTIONS
+url_match_cache_size=10000 # How many matches of URL paths with parameters to cache
 
 [ibm_mq]
 ipc_tcp_start_port=34567
 
+[broker]
+async_transport=work-queue # Either work-queue or pub-sub
+work_queue_batch_size=50 # How many async invocations each worker process takes off the work queue at a time
+
 [stats]
 expire_after=168 # In hours, 168 = 7 days = 1 week
+flush_interval=5 # In seconds, how often each worker sends statistics to KVDB, must be lower than 60
 
 [kvdb]
 host={{kvdb_host}}
@@ -170,6 +176,7 @@ zato.notif.init-notifiers=
 zato.kvdb.log-connection-info=
 zato.sso.cleanup.cleanup=300
 zato.updates.check-updates=
+zato.stats.migrate-index=
 pub.zato.channel.web-socket.cleanup-wsx=
 
 [startup_services_any_worker]
@@ -231,6 +238,13 @@ log_if_wsx_deliv_server_not_found=False
 data_prefix_len=2048
 data_prefix_short_len=64
 sk_server_table_columns=6, 15, 8, 6, 17, 80
+gd_maintenance_interval=60
+gd_cleanup_batch_size=1000
+journal_enabled=False
+journal_dir=./work/pubsub-journal
+journal_segment_size=16777216
+journal_compact_interval=10
+journal_recovery_grace_period=300
 
 [pubsub_meta_topic]
 enabled=True
@@ -543,9 +543,16 @@ class CACHE:
     class SYNC_METHOD:
         NO_SYNC = NameId('No synchronization', 'no-sync')
         IN_BACKGROUND = NameId('In background', 'in-background')
+        IN_BACKGROUND_BATCHED = NameId('In background, batched', 'in-background-batched')
+        SHARED_MEMORY = NameId('Shared memory', 'shared-memory')
 
         def __iter__(self):
-            return iter((self.NO_SYNC, self.IN_BACKGROUND))
+            return iter((self.NO_SYNC, self.IN_BACKGROUND, self.IN_BACKGROUND_BATCHED, self.SHARED_MEMORY))
+
+    class SYNC_BATCH:
+        INTERVAL = 0.005 # In seconds, how long to buffer operations for before publishing them
+        MAX_OPS = 1000 # Publish a batch earlier if it has this many operations
+        MAX_VALUE_SIZE = 1000 # Larger values are not published, other workers only delete their keys
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -596,6 +603,10 @@ class KVDB(Attrs):
     SERVICE_SUMMARY_BY_MONTH = 'zato:stats:service:summary:by-month:'
     SERVICE_SUMMARY_BY_YEAR = 'zato:stats:service:summary:by-year:'
 
+    SERVICE_STATS_INDEX = 'zato:stats:index:'
+    SERVICE_STATS_INDEX_MIGRATED = 'zato:stats:index-migrated'
+    SERVICE_TIME_RAW_INDEX = 'zato:stats:index:service:time:raw'
+
     ZMQ_CONFIG_READY_PREFIX = 'zato:zmq.config.ready.{}'
 
     REQ_RESP_SAMPLE = 'zato:req-resp:sample:'
@@ -703,6 +714,11 @@ class DELIVERY_CALLBACK_INVOKER(Attrs):
 
 class BROKER:
     DEFAULT_EXPIRATION = 15 # In seconds
+    DEFAULT_WORK_QUEUE_BATCH_SIZE = 50
+
+    class ASYNC_TRANSPORT:
+        PUB_SUB = 'pub-sub'
+        WORK_QUEUE = 'work-queue'
 
 # ################################################################################################################################
 # ################################################################################################################################
@@ -898,6 +914,14 @@ class PUBSUB:
         INTERNAL_ENDPOINT_NAME = 'zato.pubsub.default.internal.endpoint'
         ON_NO_SUBS_PUB = 'accept'
         SK_OPAQUE = ('deliver_to_sk', 'reply_to_sk')
+        GD_GROUP_COMMIT_TIME = 0 # In milliseconds, 0 = group commits are disabled
+        GD_GROUP_COMMIT_MAX_MSG = 100
+        GD_MAINTENANCE_INTERVAL = 60 # In seconds
+        GD_CLEANUP_BATCH_SIZE = 1000
+        JOURNAL_DIR = './work/pubsub-journal' # Relative to the server's directory
+        JOURNAL_SEGMENT_SIZE = 16 * 1024 * 1024 # In bytes
+        JOURNAL_COMPACT_INTERVAL = 10 # In seconds
+        JOURNAL_RECOVERY_GRACE_PERIOD = 300 # In seconds
 
     class QUEUE_TYPE:
         STAGING = 'staging'
@@ -484,6 +484,8 @@ class CACHE(Constants):
     MEMCACHED_EDIT = ValueConstant('')
     MEMCACHED_DELETE = ValueConstant('')
 
+    BUILTIN_STATE_CHANGED_BATCH = ValueConstant('')
+
 class SERVER_STATUS(Constants):
     code_start = 106800
 
@@ -11,14 +11,69 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 # stdlib
 import os
 from datetime import datetime
+from struct import Struct
 from tempfile import gettempdir
 
-# ZeroMQ
-import zmq.green as zmq
+# gevent
+from gevent.socket import AF_UNIX, SOCK_STREAM, socket
 
 # Zato
 from zato.common import DATA_FORMAT, NO_DEFAULT_VALUE
-from zato.common.util import get_logger_for_class, make_repr, new_cid, spawn_greenlet
+from zato.common.util import get_logger_for_class, make_repr, new_cid
+
+# Python 2/3 compatibility
+from zato.common.py23_ import pickle_dumps, pickle_loads
+
+# ################################################################################################################################
+
+# Each frame sent through an IPC socket is prefixed with the length of the pickled object that it contains
+_frame_length = Struct('!I')
+_frame_length_size = _frame_length.size
+
+# How many bytes at most to read from a socket at a time
+_recv_size = 65536
+
+# ################################################################################################################################
+
+def send_frame(sock, lock, data):
+    """ Sends data to a socket as a single frame. The lock is needed because frames are sent by many greenlets
+    through the same socket and a greenlet may switch to another one before all of its frame has been sent.
+    """
+    data = pickle_dumps(data, -1)
+    with lock:
+        sock.sendall(_frame_length.pack(len(data)) + data)
+
+# ################################################################################################################################
+
+def _recv_exactly(sock, size):
+    """ Returns exactly size bytes read from a socket or None if the latter was closed before that many were received.
+    """
+    chunks = []
+
+    while size:
+        data = sock.recv(min(size, _recv_size))
+        if not data:
+            return None
+
+        chunks.append(data)
+        size -= len(data)
+
+    return b''.join(chunks)
+
+# ################################################################################################################################
+
+def recv_frame(sock):
+    """ Reads a single frame from a socket and returns the object it contains, or None if the socket was closed.
+    """
+    length = _recv_exactly(sock, _frame_length_size)
+    if length is None:
+        return None
+
+    data = _recv_exactly(sock, _frame_length.unpack(length)[0])
+    if data is None:
+        return None
+
+    return pickle_loads(data)
 
 # ################################################################################################################################
 
@@ -35,6 +90,7 @@ class Request(object):
         self.target_pid = None
         self.reply_to_tag = ''
         self.reply_to_fifo = ''
+        self.needs_response = False
         self.in_reply_to = ''
         self.creation_time_utc = datetime.utcnow()
 
@@ -58,10 +114,9 @@ class IPCBase(object):
     def __init__(self, name, pid):
         self.name = name
         self.pid = pid
-        self.ctx = zmq.Context()
-        spawn_greenlet(self.set_up_sockets)
         self.keep_running = True
         self.logger = get_logger_for_class(self.__class__)
+        self.set_up_sockets()
         self.log_connected()
 
     def __repr__(self):
@@ -79,29 +134,26 @@ class IPCBase(object):
 # ################################################################################################################################
 
 class IPCEndpoint(IPCBase):
-    """ A participant in IPC conversations, i.e. either publisher or subscriber.
+    """ A participant in IPC conversations, i.e. either publisher or subscriber, communicating through a Unix domain socket.
     """
     socket_method = None
-    socket_type = None
 
     def __init__(self, name, pid):
         self.address = self.get_address(name)
         super(IPCEndpoint, self).__init__(name, pid)
 
     def get_address(self, address):
-        return 'ipc://{}'.format(os.path.join(gettempdir(), 'zato-ipc-{}'.format(address)))
+        return os.path.join(gettempdir(), 'zato-ipc-{}'.format(address))
 
     def set_up_sockets(self):
-        self.socket = self.ctx.socket(getattr(zmq, self.socket_type.upper()))
-        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket = socket(AF_UNIX, SOCK_STREAM)
         getattr(self.socket, self.socket_method)(self.address)
 
     def log_connected(self):
-        self.logger.info('Established %s/%s to %s (self.pid: %s)', self.socket_type, self.socket_method, self.address, self.pid)
+        self.logger.info('Established %s to %s (self.pid: %s)', self.socket_method, self.address, self.pid)
 
     def close(self):
         self.keep_running = False
         self.socket.close()
-        self.ctx.term()
 
 # ################################################################################################################################
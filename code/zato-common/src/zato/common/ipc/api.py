@@ -9,26 +9,15 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # stdlib
-import errno
 import logging
-import os
-import stat
-import tempfile
-from datetime import datetime, timedelta
-from fcntl import fcntl
-from io import StringIO
 from traceback import format_exc
-from uuid import uuid4
 
 # gevent
-from gevent import sleep
+from gevent.lock import RLock
 
 # pyrapidjson
 from rapidjson import loads
 
-# Python 2/3 compatibility
-from builtins import bytes
-
 # Zato
 from zato.common import IPC
 from zato.common.ipc.publisher import Publisher
@@ -41,14 +30,6 @@ logger = logging.getLogger(__name__)
 
 # ################################################################################################################################
 
-fifo_create_mode = stat.S_IRUSR | stat.S_IWUSR
-fifo_ignore_err = errno.EAGAIN, errno.EWOULDBLOCK
-
-# On Linux, this is F_LINUX_SPECIFIC_BASE (1024) + 7
-_F_SETPIPE_SZ = 1031
-
-# ################################################################################################################################
-
 class IPCAPI(object):
     """ API through which IPC is performed.
     """
@@ -59,6 +40,9 @@ class IPCAPI(object):
         self.pid_publishers = {} # Target PID -> Publisher object connected to that target PID's subscriber socket
         self.subscriber = None
 
+        # Makes sure that there is only one connection to each PID, even if many greenlets need one at the same time
+        self.publisher_lock = RLock()
+
 # ################################################################################################################################
 
     @staticmethod
@@ -88,104 +72,53 @@ class IPCAPI(object):
 
     def _get_pid_publisher(self, cluster_name, server_name, target_pid):
 
-        # We do no have a publisher connected to that PID, so we need to create it ..
-        if target_pid not in self.pid_publishers:
+        with self.publisher_lock:
+            publisher = self.pid_publishers.get(target_pid)
 
-            # Create a publisher and sleep for a moment until it connects to the other socket
-            publisher = Publisher(self.get_endpoint_name(cluster_name, server_name, target_pid), self.pid)
+            # We do no have a publisher connected to that PID, or its connection was closed, so we need to create a new one.
+            # Connecting to a Unix socket is synchronous, so the publisher can be used right away.
+            if not (publisher and publisher.keep_running):
+                publisher = Publisher(self.get_endpoint_name(cluster_name, server_name, target_pid), self.pid)
+                self.pid_publishers[target_pid] = publisher
 
-            # We can tolerate it because it happens only the very first time our PID invokes target_pid
-            sleep(0.1)
-
-            # We can now store it for later use
-            self.pid_publishers[target_pid] = publisher
-
-        # At this point we are sure we have a publisher for target PID
-        return self.pid_publishers[target_pid]
+            return publisher
 
 # ################################################################################################################################
 
-    def _get_response(self, fifo, buffer_size, read_size=21, fifo_ignore_err=fifo_ignore_err, empty=('', b'', None)):
-
-        try:
-            buff = StringIO()
-            data = object() # Use a sentinel because '' or None are expected from os.read
-
-            # The most common use-case for IPC are publish/subscribe messages and the most
-            # common response is this: 'zs;{"r": {"r": null}}'
-            # which is 21 bytes.
-
-            while data not in empty:
-                data = os.read(fifo, read_size)
-                buff.write(data.decode('utf8') if isinstance(data, bytes) else data)
-
-            response = buff.getvalue()
-
-            status = response[:IPC.STATUS.LENGTH]
-            response = response[IPC.STATUS.LENGTH+1:] # Add 1 to account for the separator
-            is_success = status == IPC.STATUS.SUCCESS
-
-            if is_success:
-                response = loads(response) if response else ''
+    def _get_response(self, response, empty=('', b'', None)):
+        """ Turns a response from another process, if any was received, into a tuple of (is_success, response).
+        """
+        if response in empty:
+            return False, None
 
-            buff.close()
+        status = response[:IPC.STATUS.LENGTH]
+        response = response[IPC.STATUS.LENGTH+1:] # Add 1 to account for the separator
+        is_success = status == IPC.STATUS.SUCCESS
 
-            return is_success, response
+        if is_success:
+            response = loads(response) if response else ''
 
-        except OSError as e:
-            if e.errno not in fifo_ignore_err:
-                raise
+        return is_success, response
 
 # ################################################################################################################################
 
     def invoke_by_pid(self, service, payload, cluster_name, server_name, target_pid,
-        fifo_response_buffer_size, timeout=90, is_async=False):
+        fifo_response_buffer_size=None, timeout=90, is_async=False):
         """ Invokes a service through IPC, synchronously or in background. If target_pid is an exact PID then this one worker
-        process will be invoked if it exists at all.
+        process will be invoked if it exists at all. All invocations of a given PID share a single connection to it
+        and each one waits only until its own response arrives. fifo_response_buffer_size is no longer used.
         """
-        # Create a FIFO pipe to receive replies to come through
-        fifo_path = os.path.join(tempfile.tempdir, 'zato-ipc-fifo-{}'.format(uuid4().hex))
-        os.mkfifo(fifo_path, fifo_create_mode)
-
         try:
             publisher = self._get_pid_publisher(cluster_name, server_name, target_pid)
-            publisher.publish(payload, service, target_pid, reply_to_fifo=fifo_path)
 
             # Async = we do not need to wait for any response
             if is_async:
+                publisher.publish(payload, service, target_pid)
                 return
 
-            is_success, response = False, None
-
-            try:
-
-                # Open the pipe for reading ..
-                fifo_fd = os.open(fifo_path, os.O_RDONLY|os.O_NONBLOCK)
-                fcntl(fifo_fd, _F_SETPIPE_SZ, 1000000)
-
-                # .. and wait for response ..
-                now = datetime.utcnow()
-                until = now + timedelta(seconds=timeout)
-
-                while now < until:
-                    sleep(0.05)
-                    is_success, response = self._get_response(fifo_fd, fifo_response_buffer_size)
-                    if response:
-                        break
-                    else:
-                        now = datetime.utcnow()
-
-            except Exception:
-                logger.warn('Exception in IPC FIFO, e:`%s`', format_exc())
-
-            finally:
-                os.close(fifo_fd)
-
-            return is_success, response
+            return self._get_response(publisher.invoke(payload, service, target_pid, timeout=timeout))
 
         except Exception:
             logger.warn(format_exc())
-        finally:
-            os.remove(fifo_path)
 
 # ################################################################################################################################
@@ -8,19 +8,77 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+# stdlib
+from traceback import format_exc
+
+# gevent
+from gevent import spawn, Timeout
+from gevent.event import AsyncResult
+from gevent.lock import RLock
+
 # Zato
 from zato.common import IPC
-from zato.common.ipc import IPCEndpoint, Request
+from zato.common.ipc import IPCEndpoint, Request, recv_frame, send_frame
 
 # ################################################################################################################################
 
 class Publisher(IPCEndpoint):
-    """ Sends outgoing IPC messages to any party listening for them.
+    """ Sends outgoing IPC messages to a subscriber, all of them through a single connection, and receives responses
+    to the ones that need them. Responses may arrive in any order - each is matched with its request by the latter's ID.
     """
     socket_method = 'connect'
-    socket_type = 'pub'
 
-    def publish(self, payload, service='', target_pid=None, action=IPC.ACTION.INVOKE_SERVICE, reply_to_fifo=None):
+    def __init__(self, *args, **kwargs):
+        self.send_lock = RLock()
+        self.responses = {} # Request ID -> AsyncResult waiting for a response to that request
+        super(Publisher, self).__init__(*args, **kwargs)
+
+# ################################################################################################################################
+
+    def set_up_sockets(self):
+        super(Publisher, self).set_up_sockets()
+        spawn(self._read_responses)
+
+# ################################################################################################################################
+
+    def _read_responses(self):
+        """ Hands over each response received to whoever is waiting for it.
+        """
+        try:
+            while self.keep_running:
+
+                response = recv_frame(self.socket)
+
+                # The subscriber closed the connection
+                if response is None:
+                    break
+
+                request_id, data = response
+
+                # There will be no result if the request timed out in the meantime
+                result = self.responses.pop(request_id, None)
+                if result:
+                    result.set(data)
+
+        except Exception:
+            if self.keep_running:
+                self.logger.warn('Error in IPC publisher `%s`, e:`%s`', self.name, format_exc())
+
+        finally:
+            self.keep_running = False
+
+            # No responses will be received anymore so we need to let everyone still waiting know about it
+            responses, self.responses = self.responses, {}
+            for result in responses.values():
+                result.set_exception(IOError('IPC connection to `{}` was closed'.format(self.address)))
+
+# ################################################################################################################################
+
+    def publish(self, payload, service='', target_pid=None, action=IPC.ACTION.INVOKE_SERVICE, reply_to_fifo=None,
+            needs_response=False):
+        """ Sends a request to the subscriber. If needs_response is True, returns an AsyncResult that will be set
+        to the subscriber's response.
+        """
         request = Request(self.name, self.pid)
 
         request.payload = payload
@@ -28,7 +86,30 @@ class Publisher(IPCEndpoint):
         request.action = action
         request.target_pid = target_pid
         request.reply_to_fifo = reply_to_fifo
+        request.needs_response = needs_response
+
+        result = None
+        if needs_response:
+            result = self.responses[request.request_id] = AsyncResult()
+
+        try:
+            send_frame(self.socket, self.send_lock, request)
+        except Exception:
+            self.responses.pop(request.request_id, None)
+            raise
+
+        return result
+
+# ################################################################################################################################
+
+    def invoke(self, payload, service='', target_pid=None, action=IPC.ACTION.INVOKE_SERVICE, timeout=90):
+        """ Sends a request to the subscriber and blocks until its response is received, or returns None on timeout.
+        """
+        result = self.publish(payload, service, target_pid, action, needs_response=True)
 
-        self.socket.send_pyobj(request)
+        try:
+            return result.get(timeout=timeout)
+        except Timeout:
+            self.logger.warn('IPC request to `%s` timed out after %ss (service:`%s`)', self.address, timeout, service)
 
 # ################################################################################################################################
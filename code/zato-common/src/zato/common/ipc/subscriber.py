@@ -9,14 +9,15 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # stdlib
-from errno import ENOTSOCK
+import os
 from traceback import format_exc
 
-# ZeroMQ
-import zmq.green as zmq
+# gevent
+from gevent import spawn
+from gevent.lock import RLock
 
 # Zato
-from zato.common.ipc import IPCEndpoint, Request
+from zato.common.ipc import IPCEndpoint, Request, recv_frame, send_frame
 
 # This is needed so that unpickling of requests works
 Request = Request
@@ -24,26 +25,90 @@ Request = Request
 # ################################################################################################################################
 
 class Subscriber(IPCEndpoint):
-    """ Listens for incoming IPC messages and invokes callbacks for each one received.
+    """ Listens for incoming IPC messages and invokes callbacks for each one received. Each publisher keeps a single
+    connection open and each of its requests is handled in a greenlet of its own, so that slow requests do not block
+    the ones sent after them. Values returned by callbacks are sent back to publishers if a request needs a response.
     """
     socket_method = 'bind'
-    socket_type = 'sub'
 
     def __init__(self, on_message_callback, *args, **kwargs):
         self.on_message_callback = on_message_callback
+        self.connections = set()
         super(Subscriber, self).__init__(*args, **kwargs)
 
-    def serve_forever(self):
-        self.socket.setsockopt(zmq.SUBSCRIBE, b'')
+# ################################################################################################################################
+
+    def set_up_sockets(self):
+
+        # A socket file left behind by a process that had the same PID
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+        super(Subscriber, self).set_up_sockets()
+        self.socket.listen(128)
+
+# ################################################################################################################################
 
+    def serve_forever(self):
         while self.keep_running:
             try:
-                self.on_message_callback(self.socket.recv_pyobj())
-            except zmq.ZMQError as e:
-                if e.errno == ENOTSOCK:
-                    self.logger.debug('Stopping IPC socket `%s` (ENOTSOCK)', self.name)
-                    self.keep_running = False
+                conn, _ = self.socket.accept()
             except Exception:
-                self.logger.warn('Error in IPC subscriber, e:`%s`', format_exc())
+                if self.keep_running:
+                    self.logger.warn('Error in IPC subscriber, e:`%s`', format_exc())
+                else:
+                    self.logger.debug('Stopping IPC socket `%s`', self.name)
+            else:
+                spawn(self._handle_connection, conn)
+
+# ################################################################################################################################
+
+    def _handle_connection(self, conn):
+        send_lock = RLock()
+        self.connections.add(conn)
+
+        try:
+            while self.keep_running:
+                request = recv_frame(conn)
+
+                # The publisher closed the connection
+                if request is None:
+                    break
+
+                spawn(self._handle_request, conn, send_lock, request)
+
+        except Exception:
+            if self.keep_running:
+                self.logger.warn('Error in IPC subscriber connection, e:`%s`', format_exc())
+
+        finally:
+            self.connections.discard(conn)
+            conn.close()
+
+# ################################################################################################################################
+
+    def _handle_request(self, conn, send_lock, request):
+        try:
+            response = self.on_message_callback(request)
+        except Exception:
+            self.logger.warn('Error in IPC subscriber, e:`%s`', format_exc())
+            response = None
+
+        if request.needs_response:
+            try:
+                send_frame(conn, send_lock, (request.request_id, response))
+            except Exception:
+                self.logger.warn('Could not send IPC response to `%s`, e:`%s`', request.request_id, format_exc())
+
+# ################################################################################################################################
+
+    def close(self):
+        super(Subscriber, self).close()
+
+        for conn in list(self.connections):
+            conn.close()
+
+        if os.path.exists(self.address):
+            os.remove(self.address)
 
 # ################################################################################################################################
@@ -23,12 +23,14 @@ from zato.common import FALSE_TRUE, TRUE_FALSE
 logger = logging.getLogger(__name__)
 
 class Matcher(object):
-    def __init__(self):
+    def __init__(self, max_cache_size=10000):
         self.config = None
         self.items = {True:[], False:[]}
         self.order1 = None
         self.order2 = None
         self.is_allowed_cache = {}
+        self.is_allowed_cache_size = 0
+        self.max_cache_size = max_cache_size
         self.special_case = None
 
     def read_config(self, config):
@@ -76,5 +78,11 @@ class Matcher(object):
             # No match at all - we don't allow it in that case
             is_allowed = is_allowed if (is_allowed is not None) else False
 
+            # Values may be arbitrary so the cache starts afresh rather than grow without bound
+            if self.is_allowed_cache_size >= self.max_cache_size:
+                self.is_allowed_cache.clear()
+                self.is_allowed_cache_size = 0
+
             self.is_allowed_cache[value] = is_allowed
+            self.is_allowed_cache_size += 1
             return is_allowed
@@ -9,7 +9,7 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # SQLAlchemy
-from sqlalchemy import true as sa_true
+from sqlalchemy import exists, true as sa_true
 
 # Zato
 from zato.common import PUBSUB
@@ -20,6 +20,9 @@ from zato.common.odb.model import PubSubEndpointEnqueuedMessage, PubSubMessage
 _delivered = PUBSUB.DELIVERY_STATUS.DELIVERED
 _to_delete = PUBSUB.DELIVERY_STATUS.TO_DELETE
 
+MsgTable = PubSubMessage.__table__
+EnqueuedMsgTable = PubSubEndpointEnqueuedMessage.__table__
+
 # ################################################################################################################################
 
 def delete_msg_delivered(session, cluster_id, topic_id):
@@ -85,3 +88,76 @@ def delete_enq_marked_deleted(session, cluster_id, topic_id, status=_to_delete):
     return _delete_enq_msg_by_status(session, cluster_id, topic_id, status)
 
 # ################################################################################################################################
+
+def _delete_in_batches(session, table, query, batch_size):
+    """ Deletes rows whose IDs are returned by query, in batches of up to batch_size rows, each committed separately,
+    so that a single statement never needs to lock a large number of rows. Returns the total number of rows deleted.
+    """
+    total = 0
+
+    while True:
+        id_list = [elem.id for elem in query.limit(batch_size).all()]
+
+        if id_list:
+            session.execute(table.delete().where(table.c.id.in_(id_list)))
+            session.commit()
+            total += len(id_list)
+
+        if len(id_list) < batch_size:
+            return total
+
+# ################################################################################################################################
+
+def delete_topic_enq_by_status_batched(session, cluster_id, topic_id, status, batch_size):
+    """ Deletes in batches messages with a given status from delivery queues of a single topic.
+    """
+    q = session.query(PubSubEndpointEnqueuedMessage.id).\
+        filter(PubSubEndpointEnqueuedMessage.cluster_id==cluster_id).\
+        filter(PubSubEndpointEnqueuedMessage.topic_id==topic_id).\
+        filter(PubSubEndpointEnqueuedMessage.delivery_status==status)
+
+    return _delete_in_batches(session, EnqueuedMsgTable, q, batch_size)
+
+# ################################################################################################################################
+
+def delete_topic_msg_delivered_batched(session, cluster_id, topic_id, batch_size):
+    """ Deletes in batches messages from a single topic that were moved to subscriber queues and that have been already
+    delivered, i.e. there are no references to them in any queue anymore.
+    """
+    q = session.query(PubSubMessage.id).\
+        filter(PubSubMessage.cluster_id==cluster_id).\
+        filter(PubSubMessage.topic_id==topic_id).\
+        filter(PubSubMessage.is_in_sub_queue==sa_true()).\
+        filter(~exists().where(PubSubEndpointEnqueuedMessage.pub_msg_id==PubSubMessage.pub_msg_id))
+
+    return _delete_in_batches(session, MsgTable, q, batch_size)
+
+# ################################################################################################################################
+
+def delete_topic_msg_expired_batched(session, cluster_id, topic_id, now, batch_size):
+    """ Deletes in batches expired messages from a single topic.
+    """
+    q = session.query(PubSubMessage.id).\
+        filter(PubSubMessage.cluster_id==cluster_id).\
+        filter(PubSubMessage.topic_id==topic_id).\
+        filter(PubSubMessage.expiration_time<=now)
+
+    return _delete_in_batches(session, MsgTable, q, batch_size)
+
+# ################################################################################################################################
+
+def cleanup_topic_batched(session, cluster_id, topic_id, now, batch_size):
+    """ Deletes in batches all the messages of a single topic that are no longer needed, committing each batch.
+    Returns the total number of rows deleted.
+    """
+    total = 0
+
+    # Queues go first so that topic messages that had references in queues only to delivered messages can be deleted too
+    total += delete_topic_enq_by_status_batched(session, cluster_id, topic_id, _delivered, batch_size)
+    total += delete_topic_enq_by_status_batched(session, cluster_id, topic_id, _to_delete, batch_size)
+    total += delete_topic_msg_delivered_batched(session, cluster_id, topic_id, batch_size)
+    total += delete_topic_msg_expired_batched(session, cluster_id, topic_id, now, batch_size)
+
+    return total
+
+# ################################################################################################################################
@@ -6,17 +6,25 @@ Copyright (C) 2019, Zato Source s.r.o. https://zato.io
 Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 """
 
+from __future__ import absolute_import, division, print_function, unicode_literals
+
 # stdlib
+from io import StringIO
 from logging import DEBUG, getLogger
 from traceback import format_exc
 
 # SQLAlchemy
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import and_, literal, select
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+# Python 2/3 compatibility
+from past.builtins import unicode
 
 # Zato
 from zato.common import PUBSUB
 from zato.common.exception import BadRequest
-from zato.common.odb.model import PubSubEndpoint, PubSubEndpointEnqueuedMessage, PubSubEndpointTopic, PubSubMessage, PubSubTopic
+from zato.common.odb.model import PubSubEndpoint, PubSubEndpointEnqueuedMessage, PubSubEndpointTopic, PubSubMessage, \
+     PubSubSubscription, PubSubTopic
 from zato.common.util.sql import sql_op_with_deadlock_retry
 
 # ################################################################################################################################
@@ -36,11 +44,29 @@ MsgTable = PubSubMessage.__table__
 TopicTable = PubSubTopic.__table__
 EndpointTable = PubSubEndpoint.__table__
 EndpointTopicTable = PubSubEndpointTopic.__table__
+EnqueuedMsgTable = PubSubEndpointEnqueuedMessage.__table__
+SubscriptionTable = PubSubSubscription.__table__
 
 # ################################################################################################################################
 
 _initialized=PUBSUB.DELIVERY_STATUS.INITIALIZED
 
+# How many messages to insert in one executemany call - does not apply to PostgreSQL which uses COPY instead
+msg_insert_chunk_size = 500
+
+# How many sub_keys and message IDs to use in one INSERT ... SELECT, at most. Both are bind parameters in the statement
+# so their sum must not exceed what each database supports, e.g. SQLite's default limit is 999 parameters.
+fan_out_chunk_size = 400
+
+# Columns populated by INSERT ... SELECT when messages are enqueued for subscribers, in the same order
+# as the columns that the SELECT part returns.
+_queue_insert_columns = ('creation_time', 'pub_msg_id', 'endpoint_id', 'topic_id', 'sub_key', 'cluster_id',
+    'sub_pattern_matched')
+
+# For escaping values in PostgreSQL's COPY text format
+_copy_escape = (('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r'))
+_copy_null = '\\N'
+
 # ################################################################################################################################
 
 def _sql_publish_with_retry(session, cid, cluster_id, topic_id, subscriptions_by_topic, gd_msg_list, now):
@@ -110,10 +136,99 @@ def sql_publish_with_retry(*args):
 
 # ################################################################################################################################
 
-def _insert_topic_messages(session, msg_list):
+def _get_msg_rows(msg_list, _columns=MsgTable.c):
+    """ Returns names of columns to insert messages to along with messages turned into rows, i.e. dicts with the same keys
+    for each message. Keys that are not columns, e.g. topic_name, are skipped and values missing in a message become None.
+    """
+    keys = set()
+
+    for msg in msg_list:
+        keys.update(msg)
+
+    keys = [key for key in sorted(keys) if key in _columns]
+    rows = [dict((key, msg.get(key)) for key in keys) for msg in msg_list]
+
+    return keys, rows
+
+# ################################################################################################################################
+
+def _get_copy_value(value, processor, _null=_copy_null, _escape=_copy_escape):
+    """ Turns a Python value into its representation in PostgreSQL's COPY text format.
+    """
+    if processor:
+        value = processor(value)
+
+    if value is None:
+        return _null
+
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+
+    if isinstance(value, bytes):
+        value = value.decode('utf8')
+
+    # repr rather than unicode to keep all the digits of timestamps under Python 2
+    elif isinstance(value, float):
+        value = unicode(repr(value))
+
+    else:
+        value = unicode(value)
+
+    for char, replacement in _escape:
+        value = value.replace(char, replacement)
+
+    return value
+
+# ################################################################################################################################
+
+def _get_copy_data(keys, rows, processors):
+    """ Returns a file-like object with rows in PostgreSQL's COPY text format, ready to be read from.
+    """
+    data = StringIO()
+
+    for row in rows:
+        data.write('\t'.join(_get_copy_value(row[key], processor) for key, processor in zip(keys, processors)))
+        data.write('\n')
+
+    data.seek(0)
+    return data
+
+# ################################################################################################################################
+
+def _copy_topic_messages(connection, keys, rows):
+    """ Inserts messages to a topic under PostgreSQL using COPY which is much faster than individual INSERT statements.
+    """
+    dialect = connection.dialect
+    processors = [MsgTable.c[key].type.dialect_impl(dialect).bind_processor(dialect) for key in keys]
+
+    data = _get_copy_data(keys, rows, processors)
+
+    query = 'COPY {} ({}) FROM STDIN'.format(MsgTable.name, ', '.join('"{}"'.format(key) for key in keys))
+
+    # COPY goes directly through the driver so its exceptions need to be wrapped in SQLAlchemy ones,
+    # e.g. in IntegrityError for duplicate msg_id values, as they would be in the case of an INSERT.
+    try:
+        cursor = connection.connection.cursor()
+        cursor.copy_expert(query, data)
+    except dialect.dbapi.Error as e:
+        raise DBAPIError.instance(query, None, e, dialect.dbapi.Error)
+
+# ################################################################################################################################
+
+def _insert_topic_messages(session, msg_list, _chunk_size=msg_insert_chunk_size):
     """ A low-level implementation for insert_topic_messages.
     """
-    session.execute(MsgInsert().values(msg_list))
+    keys, rows = _get_msg_rows(msg_list)
+    connection = session.connection()
+
+    # PostgreSQL can load all the rows in one go
+    if connection.dialect.name == 'postgresql':
+        _copy_topic_messages(connection, keys, rows)
+
+    # Other databases receive rows in chunks, through executemany
+    else:
+        for idx in range(0, len(rows), _chunk_size):
+            session.execute(MsgInsert(), rows[idx:idx+_chunk_size])
 
 # ################################################################################################################################
 
@@ -136,34 +251,48 @@ def insert_topic_messages(session, cid, msg_list):
 
 # ################################################################################################################################
 
-def _insert_queue_messages(session, queue_msgs):
-    """ A low-level call to enqueue messages.
+def _insert_queue_messages(session, cluster_id, topic_id, sub_keys, pub_msg_ids, now):
+    """ A low-level call to enqueue messages - a single INSERT ... SELECT creates a row for each pair of a subscription
+    and a message on the database side, with subscription details taken from PubSubSubscription rows.
     """
-    session.execute(EnqueuedMsgInsert().values(queue_msgs))
+    query = select([
+        literal(now, EnqueuedMsgTable.c.creation_time.type),
+        MsgTable.c.pub_msg_id,
+        SubscriptionTable.c.endpoint_id,
+        SubscriptionTable.c.topic_id,
+        SubscriptionTable.c.sub_key,
+        SubscriptionTable.c.cluster_id,
+        SubscriptionTable.c.sub_pattern_matched,
+        ]).\
+        where(and_(
+            MsgTable.c.cluster_id==cluster_id,
+            MsgTable.c.pub_msg_id.in_(pub_msg_ids),
+            SubscriptionTable.c.cluster_id==cluster_id,
+            SubscriptionTable.c.topic_id==topic_id,
+            SubscriptionTable.c.sub_key.in_(sub_keys),
+        ))
+
+    session.execute(EnqueuedMsgInsert().from_select(_queue_insert_columns, query))
 
 # ################################################################################################################################
 
-def insert_queue_messages(session, cluster_id, subscriptions_by_topic, msg_list, topic_id, now, cid, _initialized=_initialized):
+def insert_queue_messages(session, cluster_id, subscriptions_by_topic, msg_list, topic_id, now, cid, _initialized=_initialized,
+    _chunk_size=fan_out_chunk_size):
     """ Moves messages to each subscriber's queue, i.e. runs an INSERT that adds relevant references to the topic message.
     Also, updates each message's is_in_sub_queue flag to indicate that it is no longer available for other subscribers.
     """
-    queue_msgs = []
-
-    for sub in subscriptions_by_topic:
-        for msg in msg_list:
-
-            # Enqueues the message for each subscriber
-            queue_msgs.append({
-                'creation_time': now,
-                'pub_msg_id': msg['pub_msg_id'],
-                'endpoint_id': sub.endpoint_id,
-                'topic_id': topic_id,
-                'sub_key': sub.sub_key,
-                'cluster_id': cluster_id,
-                'sub_pattern_matched': msg['sub_pattern_matched'][sub.sub_key],
-            })
-
-    # Move the message to endpoint queues
-    return sql_op_with_deadlock_retry(cid, 'insert_queue_messages', _insert_queue_messages, session, queue_msgs)
+    # Only the subscriptions given on input are enqueued for, e.g. if a publisher sent its messages to selected sub_keys only
+    sub_keys = [sub.sub_key for sub in subscriptions_by_topic]
+    pub_msg_ids = [msg['pub_msg_id'] for msg in msg_list]
+
+    # Each statement gets a chunk of sub_keys and messages, in the typical case there will be exactly one statement
+    for sub_key_idx in range(0, len(sub_keys), _chunk_size):
+        for msg_idx in range(0, len(pub_msg_ids), _chunk_size):
+
+            # Move the message to endpoint queues
+            sql_op_with_deadlock_retry(cid, 'insert_queue_messages', _insert_queue_messages, session, cluster_id, topic_id,
+                sub_keys[sub_key_idx:sub_key_idx+_chunk_size], pub_msg_ids[msg_idx:msg_idx+_chunk_size], now)
+
+    return True
 
 # ################################################################################################################################
@@ -10,11 +10,15 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 from datetime import datetime, timedelta
+from fcntl import LOCK_EX, LOCK_UN, lockf
 from json import loads
 from logging import getLogger
 from mmap import mmap
+from struct import Struct
+from threading import RLock
 from time import sleep
 from traceback import format_exc
+from zlib import crc32
 
 # posix-ipc
 import posix_ipc as ipc
@@ -32,17 +36,44 @@ _shmem_pattern = '/zato-shmem-{}'
 
 # ################################################################################################################################
 
+# Segment header - magic, slot_count, data_end
+_magic = b'ZATOIPC1'
+_header = Struct('<8sQQ')
+_header_size = 64
+
+# Slot header - version, key_hash, record_len, record_offset
+_slot = Struct('<QIIQ')
+_version = Struct('<Q')
+
+# Length of a key at the beginning of each record
+_key_len = Struct('<H')
+
+# How many bytes of a segment there are for each slot of its hash table
+_bytes_per_slot = 1024
+
+# ################################################################################################################################
+
 class SharedMemoryIPC(object):
     """ An IPC object which Zato worker process use to communicate with each other using mmap files
-    backed by shared memory. All data in shared memory is kept as a dictionary and serialized as JSON
-    each time any read or write is needed.
+    backed by shared memory.
+
+    Each key is stored separately in a fixed-size hash table whose slots point to length-prefixed records
+    with keys and their JSON-serialized values, so reading or writing a key never needs to look at any other one.
+    Records are append-only - a new value of a key is written to the end of the data area and its slot is updated
+    to point to it, with the data area compacted when it runs out of room. Writers are serialized through
+    a POSIX record lock on the segment's header whereas readers take no locks - each slot has a version
+    which is odd while the slot is being updated, and readers retry until they see the same even version
+    both before and after copying a record.
     """
     key_name = '<invalid>'
 
     def __init__(self):
         self.shmem_name = ''
         self.size = -1
+        self.slot_count = -1
+        self.data_start = -1
         self._mmap = None
+        self._lock = RLock()
         self.running = False
 
     def create(self, shmem_suffix, size, needs_create):
@@ -63,35 +94,40 @@ class SharedMemoryIPC(object):
         # Map memory to mmap
         self._mmap = mmap(self._mem.fd, self.size)
 
-        # Write initial data so that JSON .loads always succeeds
+        # Write initial data so that the hash table can be used
         self.store_initial()
 
         self.running = True
 
-    def store(self, data):
-        """ Serializes input data as JSON and stores it in RAM, overwriting any previous data.
-        """
-        self._mmap.seek(0)
-        self._mmap.write(dumps(data).encode('utf8'))
-        self._mmap.flush()
+    def _lock_writers(self):
+        self._lock.acquire()
+        lockf(self._mem.fd, LOCK_EX, 1, 0)
+
+    def _unlock_writers(self):
+        lockf(self._mem.fd, LOCK_UN, 1, 0)
+        self._lock.release()
 
     def store_initial(self):
-        """ Stores initial data in shmem unless there is already data in there.
+        """ Writes the header of the hash table unless another process already did it.
         """
-        if self.load(False):
-            return
-        else:
-            self.store({})
+        slot_count = max(self.size // _bytes_per_slot, 1)
 
-    def load(self, needs_loads=True):
-        """ Reads in all data from RAM and, optionally, loads it as JSON.
-        """
-        self._mmap.seek(0)
-        data = self._mmap.read(self.size).strip(b'\x00')
-        return loads(data.decode('utf8')) if needs_loads else data
+        self.slot_count = slot_count
+        self.data_start = _header_size + slot_count * _slot.size
 
-    def close(self):
-        """ Closes all underlying in-RAM structures.
+        self._lock_writers()
+        try:
+            magic, existing_slot_count, _ = _header.unpack_from(self._mmap, 0)
+            if magic != _magic:
+                _header.pack_into(self._mmap, 0, _magic, slot_count, self.data_start)
+            elif existing_slot_count != slot_count:
+                raise ValueError('Shmem `{}` has {} slots instead of {}'.format(self.shmem_name, existing_slot_count, slot_count))
+        finally:
+            self._unlock_writers()
+
+    def close(self, needs_unlink=True):
+        """ Closes all underlying in-RAM structures. Unless needs_unlink is False, the segment is also removed
+        so that processes which open it from now on receive a new, empty, one.
         """
         if not self.running:
             logger.debug('Skipped close, IPC not running (%s)', self.key_name)
@@ -100,42 +136,166 @@ class SharedMemoryIPC(object):
             logger.info('Closing IPC (%s)', self.key_name)
 
         self._mmap.close()
-        try:
-            self._mem.unlink()
-        except ipc.ExistentialError:
-            pass
+        self.running = False
+
+        if needs_unlink:
+            try:
+                self._mem.unlink()
+            except ipc.ExistentialError:
+                pass
 
-    def get_parent(self, parent_path, needs_data=True):
-        """ Returns element pointed to by parent_path, creating all elements along the way, if neccessary.
+    def _get_full_key(self, parent, key):
+        """ Returns a key under which a given parent's key is stored, encoded to bytes, along with its hash.
         """
-        data = self.load()
-        parent_path = [elem for elem in parent_path.split('/') if elem]
+        full_key = '/'.join([elem for elem in parent.split('/') if elem] + [key]).encode('utf8')
+        return full_key, crc32(full_key) & 0xffffffff
+
+    def _read_slot(self, offset):
+        """ Returns a consistent copy of a slot's hash and record, or (None, None) if the slot is empty.
+        """
+        attempts = 0
+
+        while True:
+            version = _version.unpack_from(self._mmap, offset)[0]
 
-        # Find or create element that is parent of input key
-        current = data
-        while parent_path:
-            next = parent_path.pop(0)
-            current = current.setdefault(next, {})
+            # An even version means that no one is updating the slot right now
+            if not version & 1:
+                _, key_hash, record_len, record_offset = _slot.unpack_from(self._mmap, offset)
+                record = self._mmap[record_offset:record_offset + record_len] if record_len else None
 
-        return (data, current) if needs_data else current
+                # The slot was not updated while we were copying it
+                if _version.unpack_from(self._mmap, offset)[0] == version:
+                    return (key_hash, record) if record_len else (None, None)
+
+            # Let the writer run if it is a greenlet or thread of our own process
+            attempts += 1
+            if attempts % 100 == 0:
+                sleep(0)
+
+    def _iter_slots(self, key_hash):
+        """ Yields offsets of all slots in the order in which a key with a given hash is looked up.
+        """
+        first = key_hash % self.slot_count
+        for idx in range(self.slot_count):
+            yield _header_size + ((first + idx) % self.slot_count) * _slot.size
+
+    def _iter_records(self):
+        """ Yields keys and values of all records in the hash table.
+        """
+        for idx in range(self.slot_count):
+            _, record = self._read_slot(_header_size + idx * _slot.size)
+            if record is not None:
+                key_len = _key_len.unpack_from(record, 0)[0]
+                key_start = _key_len.size
+                yield record[key_start:key_start + key_len].decode('utf8'), loads(record[key_start + key_len:].decode('utf8'))
+
+    def load(self):
+        """ Returns all data from RAM as a dictionary, with each key nested under all of its parents.
+        """
+        data = {}
+
+        for key, value in self._iter_records():
+            path = key.split('/')
+            current = data
+            for elem in path[:-1]:
+                current = current.setdefault(elem, {})
+            current[path[-1]] = value
+
+        return data
+
+    def get_parent(self, parent_path):
+        """ Returns a dictionary of all keys stored under parent_path.
+        """
+        current = self.load()
+
+        for elem in (elem for elem in parent_path.split('/') if elem):
+            current = current.get(elem, {})
+
+        return current
+
+    def _compact(self):
+        """ Moves all records that are still in use to the beginning of the data area, reclaiming the space
+        of previous values of keys. Must be called with writers locked.
+        """
+        used = []
+
+        for idx in range(self.slot_count):
+            offset = _header_size + idx * _slot.size
+            version, key_hash, record_len, record_offset = _slot.unpack_from(self._mmap, offset)
+            if record_len:
+                used.append([offset, version, key_hash, record_len, self._mmap[record_offset:record_offset + record_len]])
+
+        # Readers must not use any of the slots while records are being moved
+        for offset, version, _, _, _ in used:
+            _version.pack_into(self._mmap, offset, version + 1)
+
+        data_end = self.data_start
+
+        for offset, version, key_hash, record_len, record in used:
+            self._mmap[data_end:data_end + record_len] = record
+            _slot.pack_into(self._mmap, offset, version + 2, key_hash, record_len, data_end)
+            data_end += record_len
+
+        _header.pack_into(self._mmap, 0, _magic, self.slot_count, data_end)
+
+        return data_end
 
     def set_key(self, parent, key, value):
         """ Set key to value under element called 'parent'.
         """
-        # Get parent to add our key to - will create it if needed
-        data, parent = self.get_parent(parent)
+        full_key, key_hash = self._get_full_key(parent, key)
+        prefix = _key_len.pack(len(full_key)) + full_key
+        record = prefix + dumps(value).encode('utf8')
+        record_len = len(record)
+
+        self._lock_writers()
+        try:
+            # Find a slot with our key or the first free one if there is no such key yet
+            for offset in self._iter_slots(key_hash):
+                _, slot_hash, slot_record_len, record_offset = _slot.unpack_from(self._mmap, offset)
+                if not slot_record_len:
+                    break
+                if slot_hash == key_hash and self._mmap[record_offset:record_offset + len(prefix)] == prefix:
+                    break
+            else:
+                raise ValueError('No free slots in shmem `{}` for key `{}`'.format(self.shmem_name, full_key))
+
+            data_end = _header.unpack_from(self._mmap, 0)[2]
 
-        # Set key to value
-        parent[key] = value
+            if data_end + record_len > self.size:
+                data_end = self._compact()
+                if data_end + record_len > self.size:
+                    raise ValueError('No room in shmem `{}` for key `{}` ({} bytes)'.format(
+                        self.shmem_name, full_key, record_len))
 
-        # Save it all back
-        self.store(data)
+            # No one reads this area yet so the record can be written before the slot is updated
+            self._mmap[data_end:data_end + record_len] = record
+            _header.pack_into(self._mmap, 0, _magic, self.slot_count, data_end + record_len)
+
+            version = _version.unpack_from(self._mmap, offset)[0]
+            _version.pack_into(self._mmap, offset, version + 1)
+            _slot.pack_into(self._mmap, offset, version + 2, key_hash, record_len, data_end)
+
+        finally:
+            self._unlock_writers()
 
     def _get_key(self, parent, key):
         """ Low-level implementation of get_key which does not handle timeouts.
         """
-        parent = self.get_parent(parent, False)
-        return parent[key]
+        full_key, key_hash = self._get_full_key(parent, key)
+        prefix = _key_len.pack(len(full_key)) + full_key
+
+        for offset in self._iter_slots(key_hash):
+            slot_hash, record = self._read_slot(offset)
+
+            # An empty slot means there is no such key
+            if record is None:
+                break
+
+            if slot_hash == key_hash and record.startswith(prefix):
+                return loads(record[len(prefix):].decode('utf8'))
+
+        raise KeyError(key)
 
     def get_key(self, parent, key, timeout=None, _sleep=sleep, _utcnow=datetime.utcnow):
         """ Returns a specific key from parent dictionary.
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from timeit import default_timer
+
+# Bunch
+from bunch import Bunch
+
+# SQLAlchemy
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Zato
+from zato.common.odb.model import Base
+from zato.common.odb.query.pubsub.publish import EnqueuedMsgInsert, MsgInsert, SubscriptionTable, sql_publish_with_retry
+from zato.common.util.time_ import utcnow_as_ms
+
+# ################################################################################################################################
+
+# Run with `python bench_pubsub_publish.py`. Publishes GD messages to a topic with a varying number of subscribers,
+# once with one row built in Python for each pair of a subscriber and a message, as previously, and once with the current
+# implementation which lets the database build such rows through INSERT ... SELECT.
+
+cluster_id = 1
+topic_id = 1
+endpoint_id = 1
+sub_counts = (1, 10, 100, 1000)
+batch_count = 50
+msg_per_batch = 10
+
+# ################################################################################################################################
+
+def get_session(sub_count):
+
+    # Foreign keys are not enforced by SQLite so rows of clusters, endpoints and topics are not needed
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+
+    session = sessionmaker(bind=engine)()
+    session.execute(SubscriptionTable.insert(), [{
+        'is_internal': False,
+        'creation_time': utcnow_as_ms(),
+        'sub_key': 'zpsk.bench.{}'.format(idx),
+        'sub_pattern_matched': 'sub=/bench',
+        'is_durable': True,
+        'has_gd': True,
+        'active_status': 'fully-enabled',
+        'is_staging_enabled': False,
+        'delivery_method': 'notify',
+        'delivery_data_format': 'json',
+        'delivery_batch_size': 500,
+        'wrap_one_msg_in_list': True,
+        'delivery_max_size': 500000,
+        'delivery_max_retry': 123456789,
+        'delivery_err_should_block': True,
+        'wait_sock_err': 10,
+        'wait_non_sock_err': 5,
+        'topic_id': topic_id,
+        'endpoint_id': endpoint_id,
+        'cluster_id': cluster_id,
+    } for idx in range(sub_count)])
+    session.commit()
+
+    subscriptions = [Bunch(sub_key='zpsk.bench.{}'.format(idx), endpoint_id=endpoint_id) for idx in range(sub_count)]
+
+    return session, subscriptions
+
+# ################################################################################################################################
+
+def get_msg_list(batch_idx, subscriptions):
+    now = utcnow_as_ms()
+    sub_pattern_matched = dict((sub.sub_key, 'sub=/bench') for sub in subscriptions)
+    msg_list = []
+
+    for idx in range(msg_per_batch):
+        msg_list.append({
+            'pub_msg_id': 'zpsm.bench.{}.{}'.format(batch_idx, idx),
+            'pub_pattern_matched': 'pub=/bench',
+            'pub_time': now,
+            'expiration': 86400000,
+            'expiration_time': now + 86400,
+            'data': 'abc' * 100,
+            'data_prefix': 'abc' * 10,
+            'data_prefix_short': 'abc',
+            'mime_type': 'application/json',
+            'priority': 5,
+            'size': 300,
+            'has_gd': True,
+            'published_by_id': endpoint_id,
+            'topic_id': topic_id,
+            'cluster_id': cluster_id,
+            'topic_name': '/bench',
+            'sub_pattern_matched': sub_pattern_matched,
+        })
+
+    return now, msg_list
+
+# ################################################################################################################################
+
+def publish_per_row(session, cid, cluster_id, topic_id, subscriptions, msg_list, now):
+    """ How messages were published previously.
+    """
+    session.execute(MsgInsert().values([dict((key, value) for key, value in msg.items()
+        if key not in ('topic_name', 'sub_pattern_matched')) for msg in msg_list]))
+
+    queue_msgs = []
+
+    for sub in subscriptions:
+        for msg in msg_list:
+            queue_msgs.append({
+                'creation_time': now,
+                'pub_msg_id': msg['pub_msg_id'],
+                'endpoint_id': sub.endpoint_id,
+                'topic_id': topic_id,
+                'sub_key': sub.sub_key,
+                'cluster_id': cluster_id,
+                'sub_pattern_matched': msg['sub_pattern_matched'][sub.sub_key],
+            })
+
+    session.execute(EnqueuedMsgInsert().values(queue_msgs))
+
+# ################################################################################################################################
+
+def run(name, publish_func, sub_count):
+
+    session, subscriptions = get_session(sub_count)
+    elapsed = 0
+
+    for batch_idx in range(batch_count):
+        now, msg_list = get_msg_list(batch_idx, subscriptions)
+
+        start = default_timer()
+        publish_func(session, 'cid.bench', cluster_id, topic_id, subscriptions, msg_list, now)
+        session.commit()
+        elapsed += default_timer() - start
+
+    enqueued = session.execute('SELECT COUNT(*) FROM pubsub_endp_msg_queue').scalar()
+
+    print('{:<10} subscribers:{:>5}; enqueued:{:>7}; {:.0f} msg/s'.format(
+        name, sub_count, enqueued, batch_count * msg_per_batch / elapsed))
+
+# ################################################################################################################################
+
+def main():
+    for sub_count in sub_counts:
+        run('Per row', publish_per_row, sub_count)
+        run('Bulk', sql_publish_with_retry, sub_count)
+
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    main()
+
+# ################################################################################################################################
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os
+from json import dumps
+from unittest import TestCase
+
+# gevent
+from gevent import joinall, sleep, spawn
+
+# Zato
+from zato.common import IPC
+from zato.common.ipc.api import IPCAPI
+from zato.common.util import new_cid
+
+# ################################################################################################################################
+
+cluster_name = 'test-cluster'
+server_name = 'test-server'
+
+# ################################################################################################################################
+
+class IPCAPITestCase(TestCase):
+
+    def setUp(self):
+        self.target_pid = os.getpid()
+        self.requests = []
+
+        self.target = IPCAPI(IPCAPI.get_endpoint_name(cluster_name, server_name, self.target_pid), self.on_message,
+            self.target_pid)
+        self.target.run()
+
+        self.source = IPCAPI(new_cid(), None, self.target_pid)
+
+    def tearDown(self):
+        self.source.close()
+        self.target.close()
+
+    def on_message(self, msg):
+        self.requests.append(msg)
+
+        # Each request tells us how long to take before the response is returned
+        sleep(msg.payload['sleep'])
+
+        if msg.payload.get('fail'):
+            return '{};{}'.format(IPC.STATUS.FAILURE, 'Error')
+
+        return '{};{}'.format(IPC.STATUS.SUCCESS, dumps({'service': msg.service, 'data': msg.payload['data']}))
+
+    def invoke(self, payload, **kwargs):
+        return self.source.invoke_by_pid('my.service', payload, cluster_name, server_name, self.target_pid, **kwargs)
+
+# ################################################################################################################################
+
+    def test_invoke(self):
+        is_success, response = self.invoke({'sleep': 0, 'data': 'abc'})
+
+        self.assertTrue(is_success)
+        self.assertEqual(response, {'service': 'my.service', 'data': 'abc'})
+
+# ################################################################################################################################
+
+    def test_invoke_failure(self):
+        is_success, response = self.invoke({'sleep': 0, 'data': None, 'fail': True})
+
+        self.assertFalse(is_success)
+        self.assertEqual(response, 'Error')
+
+# ################################################################################################################################
+
+    def test_concurrent_invocations_share_connection(self):
+
+        # Requests sent first take the longest so their responses arrive last
+        greenlets = [spawn(self.invoke, {'sleep': (10 - idx) / 100.0, 'data': idx}) for idx in range(10)]
+        joinall(greenlets)
+
+        for idx, greenlet in enumerate(greenlets):
+            self.assertEqual(greenlet.value, (True, {'service': 'my.service', 'data': idx}))
+
+        self.assertEqual(len(self.source.pid_publishers), 1)
+
+# ################################################################################################################################
+
+    def test_large_response(self):
+        data = 'a' * 5000000
+        is_success, response = self.invoke({'sleep': 0, 'data': data})
+
+        self.assertTrue(is_success)
+        self.assertEqual(response['data'], data)
+
+# ################################################################################################################################
+
+    def test_async(self):
+        self.assertIsNone(self.invoke({'sleep': 0, 'data': 'abc'}, is_async=True))
+        sleep(0.1)
+
+        self.assertEqual(len(self.requests), 1)
+        self.assertFalse(self.requests[0].needs_response)
+
+# ################################################################################################################################
+
+    def test_timeout(self):
+        self.assertEqual(self.invoke({'sleep': 0.5, 'data': 'abc'}, timeout=0.1), (False, None))
+
+        # No response is kept around for the request that timed out
+        sleep(0.5)
+        self.assertEqual(self.source.pid_publishers[self.target_pid].responses, {})
+
+# ################################################################################################################################
+
+    def test_reconnect(self):
+        self.invoke({'sleep': 0, 'data': 'abc'})
+
+        # Simulate a restart of the target process
+        self.target.close()
+        sleep(0.1)
+
+        self.target = IPCAPI(IPCAPI.get_endpoint_name(cluster_name, server_name, self.target_pid), self.on_message,
+            self.target_pid)
+        self.target.run()
+
+        self.assertEqual(self.invoke({'sleep': 0, 'data': 'abc'}), (True, {'service': 'my.service', 'data': 'abc'}))
+
+# ################################################################################################################################
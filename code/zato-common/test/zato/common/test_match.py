@@ -327,4 +327,18 @@ class MatcherTestCase(TestCase):
         m.is_allowed('aaa.zxc')
         self.assertEquals(m.is_allowed_cache, {})
 
+    def test_is_allowed_cache_is_bounded(self):
+
+        m = Matcher(max_cache_size=3)
+        m.read_config(default_config)
+
+        for value in ('a1.zxc', 'a2.zxc', 'a3.zxc'):
+            m.is_allowed(value)
+
+        self.assertEquals(len(m.is_allowed_cache), 3)
+
+        # The cache is full so it is cleared before the new value is added
+        self.assertIs(m.is_allowed('qwe.444.aaa'), False)
+        self.assertDictEqual(m.is_allowed_cache, {'qwe.444.aaa': False})
+
 # ################################################################################################################################
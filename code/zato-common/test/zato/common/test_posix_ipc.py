@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+from uuid import uuid4
+
+# Zato
+from zato.common.util.posix_ipc_ import ConnectorConfigIPC, ServerStartupIPC, SharedMemoryIPC
+
+# ################################################################################################################################
+
+class SharedMemoryIPCTestCase(TestCase):
+
+    def setUp(self):
+        self.suffix = uuid4().hex
+        self.ipc_list = []
+
+    def tearDown(self):
+        for ipc in self.ipc_list:
+            ipc.close()
+
+    def get_ipc(self, size=10000, needs_create=True, class_=SharedMemoryIPC):
+        ipc = class_()
+        ipc.create(self.suffix, size, needs_create)
+        self.ipc_list.append(ipc)
+        return ipc
+
+# ################################################################################################################################
+
+    def test_set_get_key(self):
+        ipc = self.get_ipc()
+
+        ipc.set_key('/a/b', 'key1', {'value': 1})
+        ipc.set_key('/a/b', 'key2', [1, 2, 3])
+        ipc.set_key('/a', 'key1', 'abc')
+
+        self.assertEqual(ipc.get_key('/a/b', 'key1'), {'value': 1})
+        self.assertEqual(ipc.get_key('/a/b', 'key2'), [1, 2, 3])
+        self.assertEqual(ipc.get_key('/a', 'key1'), 'abc')
+        self.assertRaises(KeyError, ipc.get_key, '/a', 'key2')
+
+        # Overwrite an existing key
+        ipc.set_key('/a/b', 'key1', {'value': 2})
+        self.assertEqual(ipc.get_key('/a/b', 'key1'), {'value': 2})
+
+        self.assertEqual(ipc.get_parent('/a/b'), {'key1': {'value': 2}, 'key2': [1, 2, 3]})
+        self.assertEqual(ipc.load(), {'a': {'key1': 'abc', 'b': {'key1': {'value': 2}, 'key2': [1, 2, 3]}}})
+
+# ################################################################################################################################
+
+    def test_shared_between_processes(self):
+        ipc1 = self.get_ipc(class_=ServerStartupIPC)
+        ipc1.set_pubsub_pid(123)
+
+        # Opening an existing segment keeps its data
+        ipc2 = ServerStartupIPC()
+        ipc2.create(self.suffix, 10000, False)
+        self.ipc_list.append(ipc2)
+
+        self.assertEqual(ipc2.get_pubsub_pid(), 123)
+
+        ipc2.set_pubsub_pid(456)
+        self.assertEqual(ipc1.get_pubsub_pid(), 456)
+
+# ################################################################################################################################
+
+    def test_compaction(self):
+        ipc = self.get_ipc(class_=ConnectorConfigIPC)
+        ipc.set_config('sftp', {'name': 'sftp'})
+
+        # Each new value takes up more room in the data area until it is compacted
+        for idx in range(1000):
+            ipc.set_config('ibm-mq', {'idx': idx, 'data': 'a' * 100})
+
+        self.assertEqual(ipc.get_config('ibm-mq'), {'idx': 999, 'data': 'a' * 100})
+        self.assertEqual(ipc.get_config('sftp'), {'name': 'sftp'})
+
+# ################################################################################################################################
+
+    def test_no_room(self):
+        ipc = self.get_ipc(size=2000)
+
+        self.assertRaises(ValueError, ipc.set_key, '/a', 'key1', 'a' * 2000)
+
+        # Slots are used up
+        ipc.set_key('/a', 'key1', 'abc')
+        ipc.set_key('/a', 'key1', 'def')
+        self.assertRaises(ValueError, ipc.set_key, '/a', 'key2', 'abc')
+
+        self.assertEqual(ipc.get_key('/a', 'key1'), 'def')
+
+# ################################################################################################################################
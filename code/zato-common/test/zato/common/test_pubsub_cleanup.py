@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# SQLAlchemy
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Zato
+from zato.common import PUBSUB
+from zato.common.odb.model import Base
+from zato.common.odb.query.pubsub.cleanup import _delete_in_batches, cleanup_topic_batched, EnqueuedMsgTable, MsgTable
+
+# ################################################################################################################################
+
+cluster_id = 1
+topic_id = 1
+other_topic_id = 2
+batch_size = 3
+now = 1000000.0
+
+_delivered = PUBSUB.DELIVERY_STATUS.DELIVERED
+_initialized = PUBSUB.DELIVERY_STATUS.INITIALIZED
+_to_delete = PUBSUB.DELIVERY_STATUS.TO_DELETE
+
+# ################################################################################################################################
+
+class CleanupTestCase(TestCase):
+
+    def setUp(self):
+
+        # Foreign keys are not enforced by SQLite so rows of clusters, endpoints and topics are not needed
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+
+        self.session = sessionmaker(bind=engine)()
+        self.commit_count = 0
+
+        # Each batch is committed separately so counting commits means counting batches
+        commit = self.session.commit
+
+        def _commit():
+            self.commit_count += 1
+            commit()
+
+        self.session.commit = _commit
+
+# ################################################################################################################################
+
+    def add_msg(self, name, is_in_sub_queue=False, is_expired=False, queues=(), topic_id=topic_id):
+        """ Adds a message to a topic and to subscriber queues, one for each delivery status in queues.
+        """
+        pub_msg_id = 'zpsm.{}'.format(name)
+
+        self.session.execute(MsgTable.insert().values({
+            'pub_msg_id': pub_msg_id,
+            'pub_pattern_matched': 'pub=/test',
+            'pub_time': now - 100,
+            'expiration': 50 if is_expired else 86400000,
+            'expiration_time': now - 50 if is_expired else now + 86400,
+            'data': 'abc',
+            'data_prefix': 'abc',
+            'data_prefix_short': 'abc',
+            'mime_type': 'application/json',
+            'priority': 5,
+            'size': 3,
+            'has_gd': True,
+            'is_in_sub_queue': is_in_sub_queue,
+            'published_by_id': 1,
+            'topic_id': topic_id,
+            'cluster_id': cluster_id,
+        }))
+
+        for idx, delivery_status in enumerate(queues):
+            self.session.execute(EnqueuedMsgTable.insert().values({
+                'creation_time': now - 100,
+                'sub_pattern_matched': 'sub=/test',
+                'delivery_status': delivery_status,
+                'pub_msg_id': pub_msg_id,
+                'endpoint_id': 1,
+                'topic_id': topic_id,
+                'sub_key': 'zpsk.{}'.format(idx),
+                'cluster_id': cluster_id,
+            }))
+
+        self.session.commit()
+
+    def add_msg_list(self, prefix, count, **kwargs):
+        for idx in range(count):
+            self.add_msg('{}.{}'.format(prefix, idx), **kwargs)
+
+# ################################################################################################################################
+
+    def get_msg_ids(self):
+        return sorted(row.pub_msg_id for row in self.session.execute(MsgTable.select()))
+
+    def get_enq_rows(self):
+        return sorted((row.pub_msg_id, row.sub_key, row.delivery_status) for row in
+            self.session.execute(EnqueuedMsgTable.select()))
+
+# ################################################################################################################################
+
+    def delete_in_batches(self, count):
+        self.add_msg_list('msg', count)
+        self.add_msg('other', topic_id=other_topic_id)
+        self.commit_count = 0
+
+        query = self.session.query(MsgTable.c.id).filter(MsgTable.c.topic_id==topic_id)
+        total = _delete_in_batches(self.session, MsgTable, query, batch_size)
+
+        self.assertEqual(total, count)
+        self.assertEqual(self.get_msg_ids(), ['zpsm.other'])
+
+        return self.commit_count
+
+    def test_delete_in_batches_none(self):
+        self.assertEqual(self.delete_in_batches(0), 0)
+
+    def test_delete_in_batches_below_batch_size(self):
+        self.assertEqual(self.delete_in_batches(batch_size - 1), 1)
+
+    def test_delete_in_batches_at_batch_size(self):
+        self.assertEqual(self.delete_in_batches(batch_size), 1)
+
+    def test_delete_in_batches_above_batch_size(self):
+        self.assertEqual(self.delete_in_batches(batch_size + 1), 2)
+
+    def test_delete_in_batches_multiple_of_batch_size(self):
+        self.assertEqual(self.delete_in_batches(batch_size * 2), 2)
+
+# ################################################################################################################################
+
+    def test_cleanup_topic_batched(self):
+
+        # Delivered to all subscribers - above batch size
+        self.add_msg_list('delivered', batch_size + 1, is_in_sub_queue=True, queues=(_delivered, _delivered))
+
+        # Marked for deletion - exactly at batch size
+        self.add_msg_list('to-delete', batch_size, is_in_sub_queue=True, queues=(_to_delete,))
+
+        # Expired before any subscriber took them - below batch size
+        self.add_msg_list('expired', batch_size - 1, is_expired=True)
+
+        # Still waiting for one of the subscribers
+        self.add_msg('pending', is_in_sub_queue=True, queues=(_delivered, _initialized))
+
+        # Waiting in the topic for subscribers
+        self.add_msg('waiting')
+
+        # Another topic is never cleaned up
+        self.add_msg('other', is_in_sub_queue=True, queues=(_delivered,), topic_id=other_topic_id)
+        self.add_msg('other-expired', is_expired=True, topic_id=other_topic_id)
+
+        self.commit_count = 0
+        total = cleanup_topic_batched(self.session, cluster_id, topic_id, now, batch_size)
+
+        # 9 delivered and 3 to-delete queue rows, then 7 topic messages left without queue rows and 2 expired ones ..
+        self.assertEqual(total, 9 + 3 + 7 + 2)
+
+        # .. which means 3 + 1 + 3 + 1 batches.
+        self.assertEqual(self.commit_count, 8)
+
+        self.assertEqual(self.get_msg_ids(), ['zpsm.other', 'zpsm.other-expired', 'zpsm.pending', 'zpsm.waiting'])
+        self.assertEqual(self.get_enq_rows(), [
+            ('zpsm.other', 'zpsk.0', _delivered),
+            ('zpsm.pending', 'zpsk.1', _initialized),
+        ])
+
+# ################################################################################################################################
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# Zato
+from zato.common.odb.query.pubsub.publish import _get_copy_data
+
+# ################################################################################################################################
+
+class CopyDataTestCase(TestCase):
+
+    def get_copy_data(self, rows, processors=None):
+        keys = sorted(rows[0])
+        return _get_copy_data(keys, rows, processors or [None] * len(keys)).read()
+
+# ################################################################################################################################
+
+    def test_values(self):
+        data = self.get_copy_data([
+            {'a': 'abc', 'b': 1, 'c': 1.5, 'd': True, 'e': None},
+            {'a': 'zażółć', 'b': 2, 'c': 1555555555.123456, 'd': False, 'e': b'bytes'},
+        ])
+
+        self.assertEqual(data, 'abc\t1\t1.5\tt\t\\N\nzażółć\t2\t1555555555.123456\tf\tbytes\n')
+
+# ################################################################################################################################
+
+    def test_native_strings(self):
+
+        # Under Python 2 these are str objects, as opposed to the unicode ones above
+        data = self.get_copy_data([{'a': str('abc'), 'b': 'zażółć'.encode('utf8')}])
+        self.assertEqual(data, 'abc\tzażółć\n')
+
+# ################################################################################################################################
+
+    def test_escape(self):
+        data = self.get_copy_data([{'a': 'a\tb\nc\rd\\e'}])
+        self.assertEqual(data, 'a\\tb\\nc\\rd\\\\e\n')
+
+# ################################################################################################################################
+
+    def test_processors(self):
+        data = self.get_copy_data([{'a': 'abc', 'b': 'def'}], [None, lambda value: value.upper()])
+        self.assertEqual(data, 'abc\tDEF\n')
+
+# ################################################################################################################################
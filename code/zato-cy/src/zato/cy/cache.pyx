@@ -9,13 +9,15 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 # stdlib
 import inspect
 from base64 import b64decode
+from collections import OrderedDict
 from datetime import datetime
 from decimal import Decimal
 from email.utils import formatdate as stdlib_format_date
 from hashlib import sha256
+from heapq import heapify, heappop, heappush
 from json import dumps as json_dumps, JSONEncoder
 from logging import getLogger
-from sys import getsizeof
+from sys import getsizeof, maxunicode
 
 # Arrow
 from arrow import Arrow
@@ -24,18 +26,22 @@ from arrow import Arrow
 from cpython.dict cimport PyDict_Contains, PyDict_DelItem, PyDict_GetItem, PyDict_Items, PyDict_Keys, PyDict_SetItem, \
     PyDict_Values
 from cpython.int cimport PyInt_AS_LONG,  PyInt_FromLong, PyInt_GetMax
-from cpython.list cimport PyList_GET_SIZE, PyList_Insert, PyList_SetSlice
-from cpython.object cimport Py_EQ, PyObject, PyObject_RichCompareBool
-from cpython.sequence cimport PySequence_ITEM
+from cpython.list cimport PyList_GET_SIZE
+from cpython.object cimport PyObject
 from libc.stdint cimport uint64_t
+from libc.stdlib cimport calloc, free
+from libc.string cimport memset
 from posix.time cimport timeval, timezone, gettimeofday
 
 # regex
 from regex import compile as re_compile
 
+# sortedcontainers
+from sortedcontainers import SortedList
+
 # Python 2/3 compatibility
 from builtins import bytes
-from six import binary_type, integer_types, string_types, text_type
+from six import binary_type, integer_types, string_types, text_type, unichr
 from zato.common.py23_ import maxint
 
 # Zato
@@ -54,6 +60,13 @@ str_types = string_types + (text_type,)
 len_values = (binary_type,) + str_types
 key_types = len_values + integer_types
 
+# How many compiled regex patterns each cache keeps at most
+regex_cache_size = 1000
+
+# Characters that end a literal prefix of a regex pattern, and the ones among them that make the preceding character optional
+_regex_special = set('.^$*+?{}[]\\|()')
+_regex_quantifiers = set('*?{')
+
 # ################################################################################################################################
 
 class CACHE:
@@ -110,6 +123,16 @@ cdef class Entry:
         # This entry's position in index
         public long position
 
+        # Neighbours of this entry in the recency list, _prev is the more recently used one
+        Entry _prev
+        Entry _next
+
+        # When this entry was last moved to the head of the recency list, in terms of Cache._next_stamp
+        long _stamp
+
+        # What expires_at this entry was last added to the expiry heap with, 0.0 if it is not there
+        double _heap_at
+
         # Hashed in SHA256
         public str hash
 
@@ -195,9 +218,107 @@ cdef class Entry:
 
 # ################################################################################################################################
 
+def get_regex_literal_prefix(pattern):
+    """ Returns a literal prefix that all keys matched by a regex pattern from their beginning must start with,
+    e.g. 'customer' for 'customer[0-9]+'. The prefix is empty if it cannot be found without fully parsing the pattern.
+    """
+    cdef Py_ssize_t idx = 0
+    cdef Py_ssize_t pattern_len = len(pattern)
+
+    # Alternatives and inline flags may change the meaning of a pattern's leading characters
+    if '|' in pattern or '(?' in pattern:
+        return pattern[:0]
+
+    while idx < pattern_len and pattern[idx] not in _regex_special:
+        idx += 1
+
+    # A quantifier, such as in 'ab?', may make the last of the literal characters optional
+    if idx and idx < pattern_len and pattern[idx] in _regex_quantifiers:
+        idx -= 1
+
+    return pattern[:idx]
+
+# ################################################################################################################################
+
+cdef object _get_prefix_upper_bound(object prefix):
+    """ Returns the smallest string greater than all the strings starting with the input prefix, e.g. 'abd' for 'abc',
+    or None if there is no such string.
+    """
+    cdef bint is_text = isinstance(prefix, text_type)
+    cdef long max_code = maxunicode if is_text else 255
+    cdef Py_ssize_t idx = len(prefix) - 1
+    cdef long code
+
+    while idx >= 0:
+        code = ord(prefix[idx])
+        if code < max_code:
+            return prefix[:idx] + (unichr(code + 1) if is_text else chr(code + 1))
+        idx -= 1
+
+# ################################################################################################################################
+
+cdef class KeyIndex:
+    """ Keeps string-like keys of a cache sorted, along with their reversed versions, so that keys with a given prefix
+    or suffix can be found in O(log n + matches) rather than by looking up each key in cache. Must be used with
+    the cache's lock held.
+    """
+    cdef:
+        object _keys          # All string-like keys, sorted
+        object _reversed_keys # The same keys reversed, so that looking up a suffix means looking up a prefix
+
+    def __cinit__(self):
+        self._keys = SortedList()
+        self._reversed_keys = SortedList()
+
+    cdef add(self, object key):
+        if isinstance(key, str_types):
+            self._keys.add(key)
+            self._reversed_keys.add(key[::-1])
+
+    cdef remove(self, object key):
+        if isinstance(key, str_types):
+            self._keys.discard(key)
+            self._reversed_keys.discard(key[::-1])
+
+    cdef clear(self):
+        self._keys = SortedList()
+        self._reversed_keys = SortedList()
+
+    cdef list _get_range(self, object sorted_keys, object prefix, int limit):
+        """ Returns up to limit elements of sorted_keys that start with prefix, or all of them if limit is 0.
+        """
+        cdef Py_ssize_t start = sorted_keys.bisect_left(prefix)
+        cdef Py_ssize_t stop
+        cdef object upper_bound = _get_prefix_upper_bound(prefix)
+
+        stop = sorted_keys.bisect_left(upper_bound) if upper_bound is not None else len(sorted_keys)
+
+        if limit > 0 and stop - start > limit:
+            stop = start + limit
+
+        return sorted_keys[start:stop]
+
+    cdef list by_prefix(self, object prefix, int limit):
+        return self._get_range(self._keys, prefix, limit)
+
+    cdef list by_suffix(self, object suffix, int limit):
+        return [key[::-1] for key in self._get_range(self._reversed_keys, suffix[::-1], limit)]
+
+# ################################################################################################################################
+
 cdef class Cache(object):
     """ An LRU cache that optionally rejects entries bigger than N bytes. Entries can have a TTL assigned - periodic processes
     will clean up entries older than allowed.
+
+    Recency of entries is kept in a doubly-linked list running through the entries themselves. Positions of entries
+    in that list are computed from a Fenwick tree of the stamps that entries receive each time they are moved
+    to the list's head. Expiration times are kept in a min-heap so that deleting expired entries does not require
+    looking up all of them.
+
+    If needs_key_index is True, string-like keys are also kept in a KeyIndex so that the *_by_prefix and *_by_suffix
+    methods, as well as *_by_regex ones for patterns beginning with literal characters, do not look up all keys.
+    In that case, the limit argument of these methods is the maximum number of matching keys rather than
+    the maximum number of keys looked up.
     """
     cdef:
         public long max_size
@@ -205,8 +326,16 @@ cdef class Cache(object):
         public bint has_max_item_size
         public bint extend_expiry_on_get
         public bint extend_expiry_on_set
+        public bint needs_key_index
         public dict _data
-        public list _index
+        KeyIndex _key_index           # Sorted keys, None unless needs_key_index is True
+        Entry _head                   # Most recently used entry
+        Entry _tail                   # Least recently used entry
+        long *_stamp_tree             # A Fenwick tree with a 1 for each stamp currently held by an entry
+        long _stamp_tree_size         # How many stamps the tree can hold
+        long _next_stamp              # A stamp to give to the next entry moved to the head of the recency list
+        list _expiry_heap             # (expires_at, seq, entry) tuples
+        uint64_t _expiry_seq          # A tie-breaker for entries with the same expires_at
         public uint64_t misses
         public uint64_t hits
         public uint64_t set_ops
@@ -215,36 +344,59 @@ cdef class Cache(object):
         public list _expired_on_op    # Keys that were found to have expired during a .get or .set operation
         public object _lock
         public object default_get # A singleton indicating that no default value was given for self.get
-        public dict _regex_cache
+        public object _regex_cache    # Pattern -> (compiled pattern, literal prefix), the least recently used ones first
 
     def __cinit__(self):
         self._data = {}
-        self._index = []
+        self._key_index = None
+        self._head = None
+        self._tail = None
+        self._stamp_tree = NULL
+        self._stamp_tree_size = 0
+        self._next_stamp = 1
+        self._expiry_heap = []
+        self._expiry_seq = 0
         self.hits_per_position = {}
         self._expired_on_op = []
         self.hits = 0
         self.misses = 0
         self.set_ops = 0
         self.get_ops = 0
-        self._regex_cache = {}
+        self._regex_cache = OrderedDict()
+
+    def __dealloc__(self):
+        free(self._stamp_tree)
 
-    def __init__(self, max_size=None, max_item_size=None, extend_expiry_on_get=True, extend_expiry_on_set=True, lock=None):
+    def __init__(self, max_size=None, max_item_size=None, extend_expiry_on_get=True, extend_expiry_on_set=True, lock=None,
+        needs_key_index=False):
         self._lock = lock or RLock()
         self.default_get = object()
         with self._lock:
-            self._update_config(max_size, max_item_size, extend_expiry_on_get, extend_expiry_on_set)
+            self._update_config(max_size, max_item_size, extend_expiry_on_get, extend_expiry_on_set, needs_key_index)
 
-    def _update_config(self, max_size, max_item_size, extend_expiry_on_get, extend_expiry_on_set):
+    def _update_config(self, max_size, max_item_size, extend_expiry_on_get, extend_expiry_on_set, needs_key_index=False):
         self.max_size = max_size or CACHE.DEFAULT_SIZE
         self.max_item_size = max_item_size or CACHE.MAX_ITEM_SIZE
         self.has_max_item_size = self.max_item_size > 0
         self.extend_expiry_on_get = extend_expiry_on_get
         self.extend_expiry_on_set = extend_expiry_on_set
         self.hits_per_position.update(dict((key, 0) for key in xrange(self.max_size)))
+        self._renumber()
+
+        # Build the index out of keys already in cache if it has just been enabled
+        self.needs_key_index = needs_key_index
+        if needs_key_index:
+            if self._key_index is None:
+                self._key_index = KeyIndex()
+                for key in self._data:
+                    self._key_index.add(key)
+        else:
+            self._key_index = None
 
     def update_config(self, config):
         with self._lock:
-            self._update_config(config.max_size, config.max_item_size, config.extend_expiry_on_get, config.extend_expiry_on_set)
+            self._update_config(config.max_size, config.max_item_size, config.extend_expiry_on_get, config.extend_expiry_on_set,
+                getattr(config, 'needs_key_index', False))
 
 # ################################################################################################################################
 
@@ -273,7 +425,7 @@ cdef class Cache(object):
 
     def __len__(self):
         with self._lock:
-            return PyList_GET_SIZE(self._index)
+            return len(self._data)
 
 # ################################################################################################################################
 
@@ -287,11 +439,25 @@ cdef class Cache(object):
         with self._lock:
             return self._data.iterkeys()
 
+# ################################################################################################################################
+
+    cdef list _keys_by_position(self):
+        """ Returns all keys, from the most to the least recently used one. Must be called with self._lock held.
+        """
+        cdef list out = []
+        cdef Entry entry = self._head
+
+        while entry is not None:
+            out.append(entry.key)
+            entry = entry._next
+
+        return out
+
 # ################################################################################################################################
 
     cpdef list keys_by_position(self):
         with self._lock:
-            return list(self._index)
+            return self._keys_by_position()
 
 # ################################################################################################################################
 
@@ -321,10 +487,10 @@ cdef class Cache(object):
 
     def get_slice(self, start, stop, step):
         with self._lock:
-            for key in self._index[start:stop:step]:
+            for position, key in list(enumerate(self._keys_by_position()))[start:stop:step]:
                 entry = self._data[key]
                 as_dict = entry.to_dict()
-                as_dict['position'] = self._get_index(key)
+                as_dict['position'] = position
                 yield as_dict
 
 # ################################################################################################################################
@@ -334,8 +500,21 @@ cdef class Cache(object):
         """
         # The attributes cleared below must be kept in sync with the ones from __cinit__.
         with self._lock:
+
+            # Break references between entries so they can be released right away
+            entry = self._head
+            while entry is not None:
+                next_entry = entry._next
+                entry._prev = entry._next = None
+                entry = next_entry
+
             self._data.clear()
-            self._index[:] = []
+            if self._key_index is not None:
+                self._key_index.clear()
+            self._head = None
+            self._tail = None
+            self._expiry_heap[:] = []
+            self._renumber()
             self.hits_per_position.clear()
             self._expired_on_op[:] = []
             self.hits = 0
@@ -353,10 +532,13 @@ cdef class Cache(object):
             return
         else:
             # We run under self.lock so at this point we know that the key was valid
-            # and _remove_from_index_by_idx is safe to call.
+            # and _unlink is safe to call.
             out = entry.value
             del self._data[key]
-            self._remove_from_index_by_idx(self._get_index(key))
+            self._unlink(entry)
+
+            if self._key_index is not None:
+                self._key_index.remove(key)
 
             return out
 
@@ -368,6 +550,87 @@ cdef class Cache(object):
 
     __del__ = delete
 
+# ################################################################################################################################
+
+    cdef tuple _get_regex(self, object data):
+        """ Returns a compiled regex pattern along with its literal prefix. Recently used patterns are cached,
+        up to regex_cache_size of them. Must be called with self._lock held.
+        """
+        cdef tuple out = self._regex_cache.pop(data, None)
+
+        if out is None:
+            out = (re_compile(data), get_regex_literal_prefix(data))
+            if len(self._regex_cache) >= regex_cache_size:
+                self._regex_cache.popitem(False)
+
+        self._regex_cache[data] = out
+        return out
+
+# ################################################################################################################################
+
+    cdef list _find_by_prefix(self, object data, int limit):
+        """ Returns all string-like keys starting with data. Must be called with self._lock held.
+        """
+        cdef list out
+
+        if self._key_index is not None:
+            return self._key_index.by_prefix(data, limit)
+
+        out = []
+        for idx, key in enumerate(self._data.iterkeys(), 1):
+            if isinstance(key, str_types) and key.startswith(data):
+                out.append(key)
+            if idx == limit:
+                break
+
+        return out
+
+# ################################################################################################################################
+
+    cdef list _find_by_suffix(self, object data, int limit):
+        """ Returns all string-like keys ending with data. Must be called with self._lock held.
+        """
+        cdef list out
+
+        if self._key_index is not None:
+            return self._key_index.by_suffix(data, limit)
+
+        out = []
+        for idx, key in enumerate(self._data.iterkeys(), 1):
+            if isinstance(key, str_types) and key.endswith(data):
+                out.append(key)
+            if idx == limit:
+                break
+
+        return out
+
+# ################################################################################################################################
+
+    cdef list _find_by_regex(self, object data, int limit):
+        """ Returns all string-like keys matching the regex pattern in data. Must be called with self._lock held.
+        """
+        cdef object regex
+        cdef object prefix
+        cdef list out = []
+
+        regex, prefix = self._get_regex(data)
+
+        # Only keys starting with the pattern's literal prefix, if there is any, can possibly match it
+        if self._key_index is not None:
+            for key in self._key_index.by_prefix(prefix, 0):
+                if regex.match(key):
+                    out.append(key)
+                    if len(out) == limit:
+                        break
+        else:
+            for idx, key in enumerate(self._data.iterkeys(), 1):
+                if isinstance(key, str_types) and regex.match(key):
+                    out.append(key)
+                if idx == limit:
+                    break
+
+        return out
+
 # ################################################################################################################################
 
     cpdef dict delete_by_prefix(self, object data, bint return_found, int limit):
@@ -378,23 +641,12 @@ cdef class Cache(object):
         cdef object key
         cdef dict out = {}
         cdef object value = None
-        cdef list to_delete = []
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-                if not isinstance(key, str_types):
-                    continue
-                if key.startswith(data):
-                    if return_found:
-                        out[key] = <Entry>self._data[key].value
-                    to_delete.append(key)
-                if idx == limit:
-                    break
-
-        # We could not do in the loop above because that would have changed self._data
-        # and result in 'RuntimeError: dictionary changed size during iteration'.
-        for key in to_delete:
-            self._delete(key)
+            for key in self._find_by_prefix(data, limit):
+                value = self._delete(key)
+                if return_found:
+                    out[key] = value
 
         return out
 
@@ -408,23 +660,12 @@ cdef class Cache(object):
         cdef object key
         cdef dict out = {}
         cdef object value = None
-        cdef list to_delete = []
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-                if not isinstance(key, str_types):
-                    continue
-                if key.endswith(data):
-                    if return_found:
-                        out[key] = <Entry>self._data[key].value
-                    to_delete.append(key)
-                if idx == limit:
-                    break
-
-        # We could not do in the loop above because that would have changed self._data
-        # and result in 'RuntimeError: dictionary changed size during iteration'.
-        for key in to_delete:
-            self._delete(key)
+            for key in self._find_by_suffix(data, limit):
+                value = self._delete(key)
+                if return_found:
+                    out[key] = value
 
         return out
 
@@ -435,27 +676,15 @@ cdef class Cache(object):
         that matched the input criteria along with their previous values.
         Similarly to other self.get/set/expire/delete methods, it's a separate one to reduce code branching/CPU mispredictions.
         """
-        cdef object regex = self._regex_cache.setdefault(data, re_compile(data))
         cdef object key
         cdef dict out = {}
         cdef object value = None
-        cdef list to_delete = []
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-                if not isinstance(key, str_types):
-                    continue
-                if regex.match(key):
-                    if return_found:
-                        out[key] = <Entry>self._data[key].value
-                    to_delete.append(key)
-                if idx == limit:
-                    break
-
-        # We could not do in the loop above because that would have changed self._data
-        # and result in 'RuntimeError: dictionary changed size during iteration'.
-        for key in to_delete:
-            self._delete(key)
+            for key in self._find_by_regex(data, limit):
+                value = self._delete(key)
+                if return_found:
+                    out[key] = value
 
         return out
 
@@ -600,18 +829,103 @@ cdef class Cache(object):
 
 # ################################################################################################################################
 
-    cdef inline long _get_index(self, object key):
-        """ C-only version of self.get_position that will always return a long - must be called only
-        if key is known to be in self._index or self._data and only with self._lock held.
+    cdef inline void _stamp_tree_add(self, long stamp, long delta):
+        """ Adds delta to the count of stamps in the Fenwick tree.
+        """
+        while stamp <= self._stamp_tree_size:
+            self._stamp_tree[stamp] += delta
+            stamp += stamp & -stamp
+
+    cdef inline long _stamp_tree_sum(self, long stamp):
+        """ Returns how many entries have a stamp lower than or equal to the input one.
         """
-        cdef Py_ssize_t index_idx = 0
-        cdef Py_ssize_t cache_size = PyList_GET_SIZE(self._index)
-        cdef bint index_key_eq
+        cdef long out = 0
+
+        # The tree may have failed to be allocated, in which case it holds no stamps at all
+        if stamp > self._stamp_tree_size:
+            stamp = self._stamp_tree_size
 
-        while index_idx < cache_size:
-            if PyObject_RichCompareBool(PySequence_ITEM(self._index, index_idx), <object>key, Py_EQ):
-                return index_idx
-            index_idx += 1
+        while stamp > 0:
+            out += self._stamp_tree[stamp]
+            stamp -= stamp & -stamp
+
+        return out
+
+# ################################################################################################################################
+
+    cdef void _renumber(self) except *:
+        """ Gives consecutive stamps to all entries, starting from the least recently used one, and rebuilds the Fenwick tree.
+        Called each time the tree runs out of stamps, which happens no more often than once in max_size operations.
+        Raises MemoryError if the tree cannot be allocated, in which case it will be allocated again on the next operation.
+        """
+        cdef long size = len(self._data)
+        cdef long tree_size = 2 * max(self.max_size, size) + 16
+        cdef long stamp = 0
+        cdef Entry entry = self._tail
+
+        if tree_size != self._stamp_tree_size:
+            free(self._stamp_tree)
+            self._stamp_tree_size = 0
+            self._stamp_tree = <long *>calloc(tree_size + 1, sizeof(long))
+            if self._stamp_tree == NULL:
+                raise MemoryError()
+            self._stamp_tree_size = tree_size
+        else:
+            memset(self._stamp_tree, 0, (tree_size + 1) * sizeof(long))
+
+        while entry is not None:
+            stamp += 1
+            entry._stamp = stamp
+            self._stamp_tree_add(stamp, 1)
+            entry = entry._prev
+
+        self._next_stamp = stamp + 1
+
+# ################################################################################################################################
+
+    cdef inline void _link_head(self, Entry entry) except *:
+        """ Inserts an entry at the head of the recency list, i.e. at position 0.
+        """
+        if self._next_stamp > self._stamp_tree_size:
+            self._renumber()
+
+        entry._prev = None
+        entry._next = self._head
+        if self._head is not None:
+            self._head._prev = entry
+        else:
+            self._tail = entry
+        self._head = entry
+
+        entry._stamp = self._next_stamp
+        self._next_stamp += 1
+        self._stamp_tree_add(entry._stamp, 1)
+
+# ################################################################################################################################
+
+    cdef inline void _unlink(self, Entry entry):
+        """ Removes an entry from the recency list.
+        """
+        if entry._prev is not None:
+            entry._prev._next = entry._next
+        else:
+            self._head = entry._next
+
+        if entry._next is not None:
+            entry._next._prev = entry._prev
+        else:
+            self._tail = entry._prev
+
+        entry._prev = entry._next = None
+        self._stamp_tree_add(entry._stamp, -1)
+
+# ################################################################################################################################
+
+    cdef inline long _get_position(self, Entry entry):
+        """ Returns the position of an entry in the recency list, i.e. how many entries were used more recently than this one.
+        Must be called only with self._lock held.
+        """
+        return len(self._data) - self._stamp_tree_sum(entry._stamp)
 
 # ################################################################################################################################
 
@@ -620,18 +934,42 @@ cdef class Cache(object):
         """
         with self._lock:
             if PyDict_Contains(self._data, key):
-                return self._get_index(key)
+                return self._get_position(<Entry>PyDict_GetItem(self._data, key))
 
 # ################################################################################################################################
 
-    cdef inline object _remove_from_index_by_idx(self, long idx):
-        """ Remove object from from index by its position - this is what listremove in Objects/listobject.c does
-        and we use the same technique because there is no public PyList_Remove function. Returns the removed key.
+    cdef inline void _schedule_expiry(self, Entry entry):
+        """ Makes sure an entry can be found in the expiry heap no later than when it expires. If its expiration time
+        is extended, the entry is not added to the heap again - this happens only when the heap's item is popped.
+        Must be called after each change to entry.expires_at.
         """
-        cdef object index_key = PySequence_ITEM(self._index, idx)
-        PyList_SetSlice(self._index, idx, idx+1, <object>NULL)
+        if entry.expires_at and (not entry._heap_at or entry.expires_at < entry._heap_at):
+            entry._heap_at = entry.expires_at
+            self._expiry_seq += 1
+            heappush(self._expiry_heap, (entry.expires_at, self._expiry_seq, entry))
 
-        return index_key
+            # Do not let obsolete items accumulate in the heap
+            if PyList_GET_SIZE(self._expiry_heap) > 2 * len(self._data) + 1024:
+                self._rebuild_expiry_heap()
+
+# ################################################################################################################################
+
+    cdef void _rebuild_expiry_heap(self):
+        """ Recreates the expiry heap using current entries only.
+        """
+        cdef Entry entry
+        cdef list heap = []
+
+        for entry in PyDict_Values(self._data):
+            if entry.expires_at:
+                self._expiry_seq += 1
+                entry._heap_at = entry.expires_at
+                heap.append((entry.expires_at, self._expiry_seq, entry))
+            else:
+                entry._heap_at = 0.0
+
+        heapify(heap)
+        self._expiry_heap = heap
 
 # ################################################################################################################################
 
@@ -658,10 +996,8 @@ cdef class Cache(object):
         cdef Entry entry
         cdef double _now
         cdef double _orig_now = 0.0
-        cdef Py_ssize_t cache_size = PyList_GET_SIZE(self._index)
-        cdef Py_ssize_t index_idx
-        cdef bint old_key_eq
-        cdef long hits_per_position
+        cdef Py_ssize_t cache_size = len(self._data)
+        cdef Entry lru_entry
         cdef long len_value
 
         # If multiple processes synchronize contents of their caches, the one that originally added the keys
@@ -709,6 +1045,8 @@ cdef class Cache(object):
                         if self.extend_expiry_on_set and entry.expiry:
                             entry.expires_at = _now + entry.expiry
 
+            self._schedule_expiry(entry)
+
             # Update access information for that entry, if we get to this point, the entry is not expired,
             # or at least its expiry time has been extended.
             entry.prev_write = entry.last_write
@@ -721,8 +1059,13 @@ cdef class Cache(object):
         else:
 
             # Make sure there is room for the new key
-            if cache_size == self.max_size:
-                PyDict_DelItem(self._data, self._index.pop())
+            if cache_size >= self.max_size:
+                lru_entry = self._tail
+                PyDict_DelItem(self._data, lru_entry.key)
+                self._unlink(lru_entry)
+
+                if self._key_index is not None:
+                    self._key_index.remove(lru_entry.key)
 
             # Actually insert entry
             entry = Entry()
@@ -738,7 +1081,11 @@ cdef class Cache(object):
             entry.set_metadata()
 
             PyDict_SetItem(self._data, key, entry)
-            PyList_Insert(self._index, 0, key)
+            self._link_head(entry)
+
+            if self._key_index is not None:
+                self._key_index.add(key)
+            self._schedule_expiry(entry)
 
         # If any output dict for metadata was passed in by reference, set its requires items.
         if meta_ref is not None:
@@ -767,27 +1114,20 @@ cdef class Cache(object):
         cdef double _now = orig_now if orig_now else self._get_timestamp()
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-                if not isinstance(key, str_types):
-                    continue
-                if key.startswith(data):
-
-                    # Set it before the update which would overwrite it, this is why we can return
-                    # value alone, without any metadata.
-                    if return_found:
-                        entry = <Entry>self._data[key]
-                        out[key] = entry if details else entry.value
+            for key in self._find_by_prefix(data, limit):
 
-                    self._set(key, value, expiry, False, None, _now)
+                # Set it before the update which would overwrite it, this is why we can return
+                # value alone, without any metadata.
+                if return_found:
+                    entry = <Entry>self._data[key]
+                    out[key] = entry if details else entry.value
 
-                    # Indicate to our caller that there was at least one matching key
-                    if _needs_any_found_report:
-                        meta_ref['_any_found'] = True
-                        _needs_any_found_report = False
+                self._set(key, value, expiry, False, None, _now)
 
-                # Our caller knows how many keys to look up at most
-                if idx == limit:
-                    break
+                # Indicate to our caller that there was at least one matching key
+                if _needs_any_found_report:
+                    meta_ref['_any_found'] = True
+                    _needs_any_found_report = False
 
         if meta_ref:
             meta_ref['_now'] = _now
@@ -808,29 +1148,20 @@ cdef class Cache(object):
         cdef double _now = orig_now if orig_now else self._get_timestamp()
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
+            for key in self._find_by_suffix(data, limit):
 
-                if not isinstance(key, str_types):
-                    continue
+                # Set it before the update which would overwrite it, this is why we can return
+                # value alone, without any metadata.
+                if return_found:
+                    entry = <Entry>self._data[key]
+                    out[key] = entry if details else entry.value
 
-                if key.endswith(data):
+                self._set(key, value, expiry, False, None, _now)
 
-                    # Set it before the update which would overwrite it, this is why we can return
-                    # value alone, without any metadata.
-                    if return_found:
-                        entry = <Entry>self._data[key]
-                        out[key] = entry if details else entry.value
-
-                    self._set(key, value, expiry, False, None, _now)
-
-                    # Indicate to our caller that there was at least one matching key
-                    if _needs_any_found_report:
-                        meta_ref['_any_found'] = True
-                        _needs_any_found_report = False
-
-                # Our caller knows how many keys to look up at most
-                if idx == limit:
-                    break
+                # Indicate to our caller that there was at least one matching key
+                if _needs_any_found_report:
+                    meta_ref['_any_found'] = True
+                    _needs_any_found_report = False
 
         if meta_ref:
             meta_ref['_now'] = _now
@@ -847,34 +1178,24 @@ cdef class Cache(object):
         """
         cdef dict out = {}
         cdef Entry entry
-        cdef object regex = self._regex_cache.setdefault(data, re_compile(data))
         cdef bint _needs_any_found_report = True if meta_ref else False
         cdef double _now = orig_now if orig_now else self._get_timestamp()
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-
-                if not isinstance(key, str_types):
-                    continue
-
-                if regex.match(key):
-
-                    # Set it before the update which would overwrite it, this is why we can return
-                    # value alone, without any metadata.
-                    if return_found:
-                        entry = <Entry>self._data[key]
-                        out[key] = entry if details else entry.value
+            for key in self._find_by_regex(data, limit):
 
-                    self._set(key, value, expiry, False, None, _now)
+                # Set it before the update which would overwrite it, this is why we can return
+                # value alone, without any metadata.
+                if return_found:
+                    entry = <Entry>self._data[key]
+                    out[key] = entry if details else entry.value
 
-                    # Indicate to our caller that there was at least one matching key
-                    if _needs_any_found_report:
-                        meta_ref['_any_found'] = True
-                        _needs_any_found_report = False
+                self._set(key, value, expiry, False, None, _now)
 
-                # Our caller knows how many keys to look up at most
-                if idx == limit:
-                    break
+                # Indicate to our caller that there was at least one matching key
+                if _needs_any_found_report:
+                    meta_ref['_any_found'] = True
+                    _needs_any_found_report = False
 
         if meta_ref:
             meta_ref['_now'] = _now
@@ -1073,9 +1394,7 @@ cdef class Cache(object):
         """
         cdef object _item
         cdef Entry entry
-        cdef Py_ssize_t index_idx
-        cdef Py_ssize_t cache_size
-        cdef object index_key
+        cdef long index_idx
         cdef double _now = self._get_timestamp()
 
         try:
@@ -1104,7 +1423,7 @@ cdef class Cache(object):
             self.hits += 1
 
             # Current position of that key in index
-            index_idx = self._get_index(key)
+            index_idx = self._get_position(entry)
 
             # We have the key's position so we can now update per-position counter
             # to be able to offer statistics on how often a key is found at a given position.
@@ -1112,11 +1431,10 @@ cdef class Cache(object):
             hits_per_position += 1
             PyDict_SetItem(self.hits_per_position, index_idx, PyInt_FromLong(hits_per_position))
 
-            # Remove key from index
-            index_key = self._remove_from_index_by_idx(index_idx)
-
-            # Now insert the key back at the head position.
-            PyList_Insert(self._index, 0, index_key)
+            # Move the entry to the head position, unless it is already there
+            if index_idx:
+                self._unlink(entry)
+                self._link_head(entry)
 
             # Update last/prev access information + hits
             entry.prev_read = entry.last_read
@@ -1155,13 +1473,8 @@ cdef class Cache(object):
         cdef dict out = {}
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-                if not isinstance(key, str_types):
-                    continue
-                if key.startswith(data):
-                    out[key] = self._get(key, self.default_get, details)
-                if idx == limit:
-                    break
+            for key in self._find_by_prefix(data, limit):
+                out[key] = self._get(key, self.default_get, details)
 
         return out
 
@@ -1175,13 +1488,8 @@ cdef class Cache(object):
         cdef dict out = {}
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-                if not isinstance(key, str_types):
-                    continue
-                if key.endswith(data):
-                    out[key] = self._get(key, self.default_get, details)
-                if idx == limit:
-                    break
+            for key in self._find_by_suffix(data, limit):
+                out[key] = self._get(key, self.default_get, details)
 
         return out
 
@@ -1193,16 +1501,10 @@ cdef class Cache(object):
         it's a separate one to reduce code branching/CPU mispredictions.
         """
         cdef dict out = {}
-        cdef object regex = self._regex_cache.setdefault(data, re_compile(data))
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-                if not isinstance(key, str_types):
-                    continue
-                if regex.match(key):
-                    out[key] = self._get(key, self.default_get, details)
-                if idx == limit:
-                    break
+            for key in self._find_by_regex(data, limit):
+                out[key] = self._get(key, self.default_get, details)
 
         return out
 
@@ -1337,14 +1639,9 @@ cdef class Cache(object):
         cpdef bint found_any = False
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-                if not isinstance(key, str_types):
-                    continue
-                if key.startswith(data):
-                    self._expire(key, expiry, None)
-                    found_any = True
-                if idx == limit:
-                    break
+            for key in self._find_by_prefix(data, limit):
+                self._expire(key, expiry, None)
+                found_any = True
 
         return found_any
 
@@ -1357,14 +1654,9 @@ cdef class Cache(object):
         cpdef bint found_any = False
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-                if not isinstance(key, str_types):
-                    continue
-                if key.endswith(data):
-                    self._expire(key, expiry, None)
-                    found_any = True
-                if idx == limit:
-                    break
+            for key in self._find_by_suffix(data, limit):
+                self._expire(key, expiry, None)
+                found_any = True
 
         return found_any
 
@@ -1375,17 +1667,11 @@ cdef class Cache(object):
         Similarly to other self.get/set/expire/delete methods, it's a separate one to reduce code branching/CPU mispredictions.
         """
         cpdef bint found_any = False
-        cdef object regex = self._regex_cache.setdefault(data, re_compile(data))
 
         with self._lock:
-            for idx, key in enumerate(self._data.iterkeys(), 1):
-                if not isinstance(key, str_types):
-                    continue
-                if regex.match(key):
-                    self._expire(key, expiry, None)
-                    found_any = True
-                if idx == limit:
-                    break
+            for key in self._find_by_regex(data, limit):
+                self._expire(key, expiry, None)
+                found_any = True
 
         return found_any
 
@@ -1512,6 +1798,7 @@ cdef class Cache(object):
                 if expires_at > entry.expires_at:
                     entry.expiry = expiry
                     entry.expires_at = expires_at
+                    self._schedule_expiry(entry)
 
 # ################################################################################################################################
 
@@ -1519,22 +1806,37 @@ cdef class Cache(object):
         """ Deletes all entries expired as of now. Also, deletes all entries possibly found to have expired by .get or .set calls.
         """
         cdef list deleted
+        cdef list heap
         cdef double _now = self._get_timestamp()
         cdef double expires_at
-
-        # Collects all keys to be deleted and in another pass, delete them all.
-        # It's performed it two steps so as to be able to hold self._lock only once.
+        cdef Entry entry
 
         with self._lock:
 
             deleted = self._expired_on_op[:]
+            heap = self._expiry_heap
 
-            # Collect keys still in cache
-            for key, value in PyDict_Items(self._data):
-                expires_at = value.expires_at
-                if expires_at and _now > expires_at:
-                    self._delete(key)
-                    deleted.append(key)
+            # Only entries whose expiration time has already passed are looked up
+            while heap and heap[0][0] < _now:
+                expires_at, _, entry = heappop(heap)
+
+                # Ignore items left over by entries deleted or re-scheduled to expire earlier
+                if entry._heap_at != expires_at or self._data.get(entry.key) is not entry:
+                    continue
+
+                entry._heap_at = 0.0
+
+                # Expiration was turned off for that entry
+                if not entry.expires_at:
+                    continue
+
+                if _now > entry.expires_at:
+                    self._delete(entry.key)
+                    deleted.append(entry.key)
+
+                # Expiration was extended so the entry needs to be scheduled again
+                else:
+                    self._schedule_expiry(entry)
 
             # Collect keys deleted by .get operations
             self._expired_on_op[:] = []
@@ -10,6 +10,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import re as stdlib_re
+from collections import OrderedDict
 from datetime import datetime
 from logging import getLogger
 from operator import itemgetter
@@ -35,6 +36,9 @@ TRACE1 = 6
 target_separator = ':::'
 unused_marker = 'unused'
 
+# How many matches of dynamic URL paths, i.e. ones with path parameters, to keep in CyURLData's cache by default
+default_match_cache_size = 10000
+
 # ################################################################################################################################
 
 _internal_url_path_indicator = '{}/zato/'.format(target_separator)
@@ -116,35 +120,302 @@ cdef class Matcher(object):
 # ################################################################################################################################
 # ################################################################################################################################
 
+# URL path segments consisting of these characters only are matched literally by their Matcher's regex
+# and can be used as keys in the router's trie. Anything else, e.g. {param} or regex meta-characters, ends the static prefix.
+_literal_segment = re_compile(r'^[\w\-~%,;@!:=&]*$', stdlib_re.UNICODE).match
+
+# Named groups are turned into non-capturing ones in combined patterns - their values are extracted by each Matcher separately.
+_named_group_sub = re_compile(r'\(\?P<[^>]+>', stdlib_re.UNICODE).sub
+
+# ################################################################################################################################
+
+cdef class _RouterNode(object):
+    """ A single node of URLRouter's trie - keeps all channels whose static URL path prefix ends at this node,
+    in the same order as in channel_data, along with a combined regex matching any of them.
+    """
+    cdef:
+        public dict children
+        public list entries
+        public object combined_match
+        public dict idx_by_group
+        public bint has_internal
+        public bint is_single
+
+    def __init__(self):
+        self.children = {}
+        self.entries = []
+        self.combined_match = None
+        self.idx_by_group = {}
+        self.has_internal = False
+        self.is_single = False
+
+# ################################################################################################################################
+
+    cpdef compile(self):
+        """ Builds a single alternation regex out of all the entries' patterns. Alternatives are tried left to right
+        and each one is anchored with $ so the first one to match is always the one with the lowest index in channel_data.
+        Each alternative ends in an empty marker group which, being the last one matched, tells us which entry it was.
+        """
+        cdef list alternatives = []
+        cdef Matcher matcher
+
+        self.idx_by_group.clear()
+
+        # A single entry needs no combined regex, its own one can be used as is
+        if len(self.entries) == 1:
+            matcher = self.entries[0][1]
+            self.has_internal = matcher.is_internal
+            self.combined_match = matcher.match_func
+            self.is_single = True
+            return
+
+        for pos, (idx, matcher, item) in enumerate(self.entries):
+            group_name = '_zato_r{}'.format(pos)
+            self.idx_by_group[group_name] = pos
+            alternatives.append('{}(?P<{}>)'.format(_named_group_sub('(?:', matcher.matcher.pattern), group_name))
+
+            if matcher.is_internal:
+                self.has_internal = True
+
+        try:
+            self.combined_match = re_compile('|'.join(alternatives), stdlib_re.UNICODE).match
+        except Exception:
+            # Patterns that cannot be combined, e.g. because of global inline flags, are still matched one by one
+            logger.info('Could not combine URL patterns, falling back to sequential matching; `%s`',
+                [matcher.pattern for (idx, matcher, item) in self.entries])
+            self.combined_match = None
+
+# ################################################################################################################################
+
+    cdef tuple find(self, unicode target, bint needs_user):
+        """ Returns a tuple of (idx, matcher, item) of the first entry whose pattern matches target, or None.
+        """
+        cdef Matcher matcher
+
+        # Internal channels may need to be skipped so we cannot rely on the combined regex in such a case
+        if self.combined_match is None or (needs_user and self.has_internal):
+            for idx, matcher, item in self.entries:
+                if needs_user and matcher.is_internal:
+                    continue
+                if matcher.match_func(target):
+                    return (idx, matcher, item)
+            return None
+
+        m = self.combined_match(target)
+        if m:
+            if self.is_single:
+                return self.entries[0]
+            return self.entries[self.idx_by_group[m.lastgroup]]
+
+# ################################################################################################################################
+# ################################################################################################################################
+
+cdef class URLRouter(object):
+    """ Matches targets against all channels at once. Each channel is placed in a trie of URL path segments, under the node
+    that its static prefix leads to, e.g. '/api/user/{user_id}' is kept in the node of ['', 'api', 'user']. Matching walks
+    the incoming URL path segment by segment and runs a single combined regex in each node visited so only channels
+    that can possibly match are ever looked at. Of all the nodes' candidates, the one that comes first in channel_data wins,
+    which is the same rule that a linear scan of channel_data follows.
+    """
+    cdef:
+        public _RouterNode root
+        public int size
+        unicode sep
+
+    def __init__(self, list channel_data=None, unicode sep=target_separator):
+        self.sep = sep
+        self.build(channel_data or [])
+
+# ################################################################################################################################
+
+    cdef list _get_static_prefix(self, unicode pattern):
+        """ Returns all leading segments of the URL path in pattern that are matched literally.
+        """
+        cdef list out = []
+        cdef list parts = pattern.split(self.sep, 3)
+
+        # No URL path found so this pattern must be looked at for each target
+        if len(parts) != 4:
+            return out
+
+        for segment in parts[3].split('/'):
+            if _literal_segment(segment):
+                out.append(segment)
+            else:
+                break
+
+        return out
+
+# ################################################################################################################################
+
+    cpdef build(self, list channel_data):
+        """ Creates the trie out of channel_data, which is expected to be sorted already.
+        """
+        cdef _RouterNode root = _RouterNode()
+        cdef _RouterNode node
+        cdef _RouterNode child
+        cdef Matcher matcher
+        cdef list nodes = [root]
+
+        for idx, item in enumerate(channel_data):
+            matcher = item['match_target_compiled']
+            node = root
+
+            for segment in self._get_static_prefix(matcher.pattern):
+                child = node.children.get(segment)
+                if child is None:
+                    child = node.children[segment] = _RouterNode()
+                    nodes.append(child)
+                node = child
+
+            node.entries.append((idx, matcher, item))
+
+        for node in nodes:
+            if node.entries:
+                node.compile()
+
+        # Assign it only now so that concurrent lookups never see a partially built trie
+        self.root = root
+        self.size = len(channel_data)
+
+# ################################################################################################################################
+
+    cpdef tuple match(self, unicode target, unicode url_path, bint needs_user):
+        """ Returns a (url_match, channel_item) tuple for the first channel matching target, or (None, None) if there is none.
+        """
+        cdef _RouterNode node = self.root
+        cdef _RouterNode child
+        cdef tuple found
+        cdef tuple current = None
+        cdef Matcher matcher
+
+        if node.entries:
+            current = node.find(target, needs_user)
+
+        for segment in url_path.split('/'):
+            child = node.children.get(segment)
+            if child is None:
+                break
+            node = child
+
+            if node.entries:
+
+                # Everything in this node comes after what we have already found, no need to check it
+                if current is not None and node.entries[0][0] > current[0]:
+                    continue
+
+                found = node.find(target, needs_user)
+                if found is not None:
+                    if current is None or found[0] < current[0]:
+                        current = found
+
+        if current is None:
+            return None, None
+
+        matcher = current[1]
+        return matcher.match(target), current[2]
+
+# ################################################################################################################################
+# ################################################################################################################################
+
 cdef class CyURLData(object):
 
     cdef:
         public list channel_data
         public dict url_path_cache
+        public object url_match_cache
+        public dict targets_by_channel
+        public int match_cache_size
+        public long match_cache_hits
+        public long match_cache_misses
+        public URLRouter router
         bint has_trace1
 
-    def __init__(self, channel_data=None):
+    def __init__(self, channel_data=None, match_cache_size=default_match_cache_size):
         self.channel_data = channel_data
         self.url_path_cache = {}
         self.url_target_cache = {}
+
+        # Matches of dynamic URL paths, in LRU order, keyed by target -> (path params, channel item, channel's match target)
+        self.url_match_cache = OrderedDict()
+        self.match_cache_size = match_cache_size
+        self.match_cache_hits = 0
+        self.match_cache_misses = 0
+
+        # Channel's match target -> all targets cached for that channel, both static and dynamic ones
+        self.targets_by_channel = {}
+
+        self.router = None
         self.has_trace1 = logger.isEnabledFor(TRACE1)
 
 # ################################################################################################################################
 
-    cpdef _remove_from_cache(self, unicode match_target):
+    cpdef URLRouter rebuild_router(self):
+        """ Compiles channel_data into a new router - needs to be called each time channel_data changes.
+        """
+        self.router = URLRouter(self.channel_data)
+        return self.router
 
-        targets_to_remove = []
-        cached_targets = self.url_path_cache.keys()
+# ################################################################################################################################
 
-        for target in cached_targets:
-            for item in self.channel_data:
-                matcher = item['match_target_compiled']
-                if matcher.pattern == match_target:
-                    if matcher.match(target) is not None:
-                        targets_to_remove.append(target)
+    cpdef invalidate_channel_cache(self, unicode match_target):
+        """ Removes from cache all the targets that were matched by a channel of the given match_target.
+        """
+        targets = self.targets_by_channel.pop(match_target, None)
+        if targets:
+            for target in targets:
+                self.url_path_cache.pop(target, None)
+                self.url_match_cache.pop(target, None)
 
-        for target in targets_to_remove:
-            del self.url_path_cache[target]
+# ################################################################################################################################
+
+    cpdef clear_cache(self):
+        """ Removes all targets from cache. Needs to be called when a new channel is added because it may shadow,
+        depending on its position in channel_data, any of the targets that other channels matched previously.
+        """
+        self.url_path_cache = {}
+        self.url_match_cache = OrderedDict()
+        self.targets_by_channel = {}
+
+# ################################################################################################################################
+
+    cpdef dict get_match_cache_stats(self):
+        """ Returns usage statistics of the cache of dynamic URL path matches.
+        """
+        return {
+            'size': len(self.url_match_cache),
+            'max_size': self.match_cache_size,
+            'hits': self.match_cache_hits,
+            'misses': self.match_cache_misses,
+        }
+
+# ################################################################################################################################
+
+    cdef _add_to_cache(self, unicode target, dict match, object item_bunch, Matcher matcher):
+        """ Caches a newly matched target, static URL paths in url_path_cache and dynamic ones in the bounded url_match_cache.
+        """
+        cdef unicode channel_key = matcher.pattern
+
+        if matcher.is_static:
+            self.url_path_cache[target] = item_bunch
+
+        else:
+            if self.match_cache_size < 1:
+                return
+
+            # Evict the least recently used entry if the cache is full
+            if len(self.url_match_cache) >= self.match_cache_size:
+                old_target, (_, _, old_channel_key) = self.url_match_cache.popitem(False)
+                old_channel_targets = self.targets_by_channel.get(old_channel_key)
+                if old_channel_targets:
+                    old_channel_targets.discard(old_target)
+
+            self.url_match_cache[target] = (match, item_bunch, channel_key)
+
+        channel_targets = self.targets_by_channel.get(channel_key)
+        if channel_targets is None:
+            channel_targets = self.targets_by_channel[channel_key] = set()
+        channel_targets.add(target)
 
 # ################################################################################################################################
 
@@ -156,8 +427,10 @@ cdef class CyURLData(object):
         """
         cdef bint needs_user, has_target_in_cache=True
         cdef Matcher matcher
+        cdef URLRouter router
         cdef dict item
         cdef object item_bunch
+        cdef tuple cached
 
         cdef unicode target = ''
         target += soap_action
@@ -178,27 +451,39 @@ cdef class CyURLData(object):
             ctx, channel_item = {}, self.url_path_cache[target]
             return ctx, channel_item
         except KeyError:
+
+            # Dynamic URL paths come next, each hit moves the target to the end of the LRU list
+            cached = self.url_match_cache.pop(target, None)
+            if cached is not None:
+                self.match_cache_hits += 1
+                self.url_match_cache[target] = cached
+
+                # A copy is returned because path parameters are handed over to services as they are
+                return dict(cached[0]), cached[1]
+
+            self.match_cache_misses += 1
             needs_user = not url_path.startswith('/zato')
 
-            for item in self.channel_data:
+            router = self.router
+            if router is None:
+                router = self.rebuild_router()
 
-                matcher = item['match_target_compiled']
-                if needs_user and matcher.is_internal:
-                    continue
+            match, item = router.match(target, url_path, needs_user)
 
-                match = matcher.match(target)
+            if match is not None:
+                if self.has_trace1:
+                    _log_trace1(_trace1, 'Matched target:`%s` with:`%r`', target, item)
 
-                if match is not None:
-                    if self.has_trace1:
-                        _log_trace1(_trace1, 'Matched target:`%s` with:`%r`', target, item)
+                matcher = item['match_target_compiled']
+                item_bunch = _bunchify(item)
 
-                    item_bunch = _bunchify(item)
+                if not has_target_in_cache:
+                    self._add_to_cache(target, match, item_bunch, matcher)
 
-                    # Cache that target but only if it's a static URL without dynamic variables
-                    if (not has_target_in_cache) and matcher.is_static:
-                        self.url_path_cache[target] = item_bunch
+                    if not matcher.is_static:
+                        return dict(match), item_bunch
 
-                    return match, item_bunch
+                return match, item_bunch
 
             return None, None
 
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from random import Random
+from timeit import default_timer
+
+# Zato
+from zato.cache import Cache
+
+# ################################################################################################################################
+
+# Run with `python bench_cache.py` - shows that get, set and delete_expired do not slow down as the cache grows.
+
+cache_sizes = (1000, 50000, 500000)
+op_count = 50000
+
+# ################################################################################################################################
+
+def main():
+
+    random = Random(0)
+
+    for cache_size in cache_sizes:
+
+        c = Cache(cache_size)
+
+        start = default_timer()
+        for idx in range(cache_size):
+            c.set('key{}'.format(idx), idx, 3600.0 if idx % 2 else 0.0, False)
+        fill_time = default_timer() - start
+
+        keys = ['key{}'.format(random.randrange(cache_size)) for _ in range(op_count)]
+
+        start = default_timer()
+        for key in keys:
+            c.get(key, None, False)
+        get_time = default_timer() - start
+
+        start = default_timer()
+        for idx, key in enumerate(keys):
+            c.set(key, idx, 0.0, False)
+        set_time = default_timer() - start
+
+        start = default_timer()
+        c.delete_expired()
+        delete_expired_time = default_timer() - start
+
+        print('Size:{:>7}; fill: {:.2f}s; get: {:.2f} us/op; set: {:.2f} us/op; delete_expired: {:.2f} ms'.format(
+            cache_size, fill_time, get_time / op_count * 1e6, set_time / op_count * 1e6, delete_expired_time * 1e3))
+
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    main()
+
+# ################################################################################################################################
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from random import Random
+from timeit import default_timer
+
+# Zato
+from zato.url_dispatcher import Matcher, URLRouter
+
+# ################################################################################################################################
+
+# Run with `python bench_url_dispatcher.py` - compares a linear scan of all channels with URLRouter.
+
+_sep = ':::'
+_accept_any = 'haanyHTTP_SEPhaany'
+
+channel_count = 10000
+request_count = 500
+
+# ################################################################################################################################
+
+def get_channel_data(count):
+    out = []
+
+    for idx in range(count):
+        if idx % 2:
+            url_path = '/api/v{}/resource{}/{{item_id}}'.format(idx % 5, idx)
+        else:
+            url_path = '/api/v{}/resource{}/{{item_id}}/sub/{{sub_id}}'.format(idx % 5, idx)
+
+        match_target = '{}{}{}{}{}{}{}'.format('', _sep, 'GET', _sep, _accept_any, _sep, url_path)
+        out.append({
+            'name': 'channel-{}'.format(idx),
+            'match_target': match_target,
+            'match_target_compiled': Matcher(match_target, True),
+        })
+
+    return out
+
+# ################################################################################################################################
+
+def get_requests(count, channel_count):
+    out = []
+    random = Random(0)
+
+    for _ in range(count):
+        idx = random.randrange(channel_count)
+        if idx % 2:
+            url_path = '/api/v{}/resource{}/123'.format(idx % 5, idx)
+        else:
+            url_path = '/api/v{}/resource{}/123/sub/456'.format(idx % 5, idx)
+
+        out.append((url_path, '{}{}{}{}{}{}{}'.format('', _sep, 'GET', _sep, '*/*', _sep, url_path)))
+
+    return out
+
+# ################################################################################################################################
+
+def linear_match(channel_data, target):
+    for item in channel_data:
+        match = item['match_target_compiled'].match(target)
+        if match is not None:
+            return match, item
+    return None, None
+
+# ################################################################################################################################
+
+def main():
+
+    channel_data = get_channel_data(channel_count)
+    requests = get_requests(request_count, channel_count)
+
+    start = default_timer()
+    router = URLRouter(channel_data)
+    build_time = default_timer() - start
+
+    start = default_timer()
+    for url_path, target in requests:
+        linear_match(channel_data, target)
+    linear_time = default_timer() - start
+
+    start = default_timer()
+    for url_path, target in requests:
+        router.match(target, url_path, True)
+    router_time = default_timer() - start
+
+    print('Channels:{}; requests:{}; router build time:{:.3f}s'.format(channel_count, request_count, build_time))
+    print('Linear scan: {:.3f}s ({:.1f} us/request)'.format(linear_time, linear_time / request_count * 1e6))
+    print('Router:      {:.3f}s ({:.1f} us/request)'.format(router_time, router_time / request_count * 1e6))
+
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    main()
+
+# ################################################################################################################################
@@ -13,7 +13,7 @@ from unittest import main as unittest_main, TestCase
 from uuid import uuid4
 
 # Zato
-from zato.cache import Cache, KeyExpiredError
+from zato.cache import Cache, get_regex_literal_prefix, KeyExpiredError, regex_cache_size
 from zato.common.py23_ import maxint
 
 # ################################################################################################################################
@@ -363,6 +363,59 @@ class CacheTestCace(TestCase):
         self.assertIn(key2, c)
         self.assertNotIn(key3, c)
 
+# ################################################################################################################################
+
+    def test_delete_expired_extended_expiry(self):
+
+        key1, expected1 = 'key1', 'value1'
+        key2, expected2 = 'key2', 'value2'
+
+        c = Cache()
+        c.set(key1, expected1, 0.05, None)
+        c.set(key2, expected2, 0.05, None)
+
+        # Reading key1 extends its expiration time
+        sleep(0.03)
+        c.get(key1, None, False)
+        sleep(0.03)
+
+        deleted = c.delete_expired()
+        self.assertEquals(deleted, [key2])
+        self.assertIn(key1, c)
+
+        sleep(0.06)
+
+        deleted = c.delete_expired()
+        self.assertEquals(deleted, [key1])
+        self.assertEquals(len(c), 0)
+
+# ################################################################################################################################
+
+    def test_keys_by_position(self):
+
+        max_size = 3
+        c = Cache(max_size)
+
+        # Many more operations than max_size so that positions have to be renumbered a few times
+        for idx in range(100):
+            c.set('key{}'.format(idx % 5), idx, 0.0, None)
+            c.get('key{}'.format((idx + 2) % 5), None, False)
+
+        keys = c.keys_by_position()
+        self.assertEquals(len(keys), max_size)
+
+        for position, key in enumerate(keys):
+            self.assertEquals(c.index(key), position)
+
+        # Getting the least recently used key moves it to the head position
+        returned = c.get(keys[-1], None, True)
+        self.assertEquals(returned.position, max_size - 1)
+        self.assertListEqual(c.keys_by_position(), [keys[-1]] + keys[:-1])
+
+        # Adding a new key evicts the least recently used one
+        c.set('new', 'value', 0.0, None)
+        self.assertListEqual(c.keys_by_position(), ['new', keys[-1], keys[0]])
+
 # ################################################################################################################################
 
     def test_get_deletes_expired_key(self):
@@ -480,6 +533,115 @@ class CacheTestCace(TestCase):
         returned1 = c.get(key1, None, False)
         self.assertIs(returned1, expected1)
 
+# ################################################################################################################################
+
+    def _get_cache_with_keys(self, needs_key_index):
+        c = Cache(needs_key_index=needs_key_index)
+        for key in ('customer.1', 'customer.2', 'customer.20', 'customer', 'customes.1', 'order.1.customer', 'order.2', 1, 2):
+            c.set(key, key, 0.0, None)
+        return c
+
+# ################################################################################################################################
+
+    def test_key_index_same_results_as_without_index(self):
+
+        for needs_key_index in (False, True):
+
+            c = self._get_cache_with_keys(needs_key_index)
+
+            self.assertEquals(sorted(c.get_by_prefix('customer.', False, 0)), ['customer.1', 'customer.2', 'customer.20'])
+            self.assertEquals(sorted(c.get_by_suffix('.1', False, 0)), ['customer.1', 'customes.1'])
+            self.assertEquals(sorted(c.get_by_regex('customer\\.[0-9]$', False, 0)), ['customer.1', 'customer.2'])
+            self.assertEquals(sorted(c.get_by_regex('.*customer$', False, 0)), ['customer', 'order.1.customer'])
+
+            self.assertTrue(c.expire_by_suffix('customer', 100.0, 0))
+            self.assertEquals(c.get('customer', None, True).expiry, 100.0)
+            self.assertEquals(c.get('order.1.customer', None, True).expiry, 100.0)
+
+            c.set_by_regex('order\\.', 'new', 0.0, False, None, False, 0)
+            self.assertEquals(c.get('order.2', None, False), 'new')
+
+            deleted = c.delete_by_prefix('customer', True, 0)
+            self.assertEquals(sorted(deleted), ['customer', 'customer.1', 'customer.2', 'customer.20'])
+            self.assertEquals(c.get_by_prefix('customer', False, 0), {})
+            self.assertEquals(sorted(c.keys(), key=str), [1, 2, 'customes.1', 'order.1.customer', 'order.2'])
+
+# ################################################################################################################################
+
+    def test_key_index_limit(self):
+
+        c = self._get_cache_with_keys(True)
+
+        # With an index, the limit is the number of matching keys returned
+        self.assertEquals(c.get_by_prefix('customer.', False, 2), {'customer.1':'customer.1', 'customer.2':'customer.2'})
+        self.assertEquals(len(c.get_by_regex('customer\\.', False, 1)), 1)
+        self.assertEquals(len(c.delete_by_suffix('1', True, 1)), 1)
+
+# ################################################################################################################################
+
+    def test_key_index_evicted_and_expired(self):
+
+        c = Cache(max_size=2, needs_key_index=True)
+        c.set('key1', 'value1', 0.0, None)
+        c.set('key2', 'value2', 0.01, None)
+        c.set('key3', 'value3', 0.0, None)
+
+        self.assertEquals(sorted(c.get_by_prefix('key', False, 0)), ['key2', 'key3'])
+
+        sleep(0.02)
+        c.delete_expired()
+
+        self.assertEquals(c.get_by_prefix('key', False, 0), {'key3':'value3'})
+
+        c.clear()
+        self.assertEquals(c.get_by_prefix('key', False, 0), {})
+
+# ################################################################################################################################
+
+    def test_key_index_enabled_by_update_config(self):
+
+        class Config:
+            max_size = 10
+            max_item_size = 100
+            extend_expiry_on_get = True
+            extend_expiry_on_set = True
+            needs_key_index = True
+
+        c = self._get_cache_with_keys(False)
+        c.update_config(Config)
+
+        self.assertTrue(c.needs_key_index)
+        self.assertEquals(sorted(c.get_by_suffix('customer', False, 0)), ['customer', 'order.1.customer'])
+
+        Config.needs_key_index = False
+        c.update_config(Config)
+
+        self.assertFalse(c.needs_key_index)
+        self.assertEquals(sorted(c.get_by_suffix('customer', False, 0)), ['customer', 'order.1.customer'])
+
+# ################################################################################################################################
+
+    def test_get_regex_literal_prefix(self):
+        self.assertEquals(get_regex_literal_prefix('customer\\.[0-9]+'), 'customer')
+        self.assertEquals(get_regex_literal_prefix('customer'), 'customer')
+        self.assertEquals(get_regex_literal_prefix('customers?'), 'customer')
+        self.assertEquals(get_regex_literal_prefix('customers+'), 'customers')
+        self.assertEquals(get_regex_literal_prefix('.*customer'), '')
+        self.assertEquals(get_regex_literal_prefix('customer|order'), '')
+        self.assertEquals(get_regex_literal_prefix('customer(?i)'), '')
+
+# ################################################################################################################################
+
+    def test_regex_cache_bounded(self):
+
+        c = Cache()
+        for idx in range(regex_cache_size + 10):
+            c.get_by_regex('key{}'.format(idx), False, 0)
+
+        self.assertEquals(len(c._regex_cache), regex_cache_size)
+        self.assertNotIn('key0', c._regex_cache)
+        self.assertIn('key{}'.format(regex_cache_size + 9), c._regex_cache)
+
 # ################################################################################################################################
 
 if __name__ == '__main__':
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# Zato
+from zato.url_dispatcher import CyURLData, Matcher, URLRouter
+
+# ################################################################################################################################
+
+_sep = ':::'
+_accept_any = 'haanyHTTP_SEPhaany'
+
+# ################################################################################################################################
+
+def get_channel(name, url_path, method='GET', soap_action='', is_internal=False, match_slash=True):
+    match_target = '{}{}{}{}{}{}{}'.format(soap_action, _sep, method, _sep, _accept_any, _sep, url_path)
+    return {
+        'name': name,
+        'is_internal': is_internal,
+        'match_target': match_target,
+        'match_target_compiled': Matcher(match_target, match_slash),
+    }
+
+def get_target(url_path, method='GET', soap_action='', accept='*/*'):
+    return '{}{}{}{}{}{}{}'.format(soap_action, _sep, method, _sep, accept, _sep, url_path)
+
+# ################################################################################################################################
+
+class _URLData(CyURLData):
+    """ CyURLData needs a Python-level subclass to hold non-cdef attributes.
+    """
+
+# ################################################################################################################################
+
+class URLRouterTestCase(TestCase):
+
+    def setUp(self):
+        self.channel_data = [
+            get_channel('user-by-id', '/api/user/{user_id}'),
+            get_channel('user-me', '/api/user/me'),
+            get_channel('any-me', '/api/{object_type}/me'),
+            get_channel('version', '/api/v.1/{name}', method='POST'),
+            get_channel('static', '/api/static'),
+            get_channel('ping', '/zato/ping', is_internal=True),
+        ]
+
+    def _linear_match(self, target, url_path):
+        """ Matches target the way that CyURLData used to, by scanning all the channels in order.
+        """
+        needs_user = not url_path.startswith('/zato')
+
+        for item in self.channel_data:
+            matcher = item['match_target_compiled']
+            if needs_user and matcher.is_internal:
+                continue
+            match = matcher.match(target)
+            if match is not None:
+                return match, item
+
+        return None, None
+
+# ################################################################################################################################
+
+    def test_first_match_wins(self):
+        router = URLRouter(self.channel_data)
+
+        # Even though 'user-me' is more specific, 'user-by-id' comes first in channel_data
+        match, item = router.match(get_target('/api/user/me'), '/api/user/me', True)
+        self.assertEqual(item['name'], 'user-by-id')
+        self.assertDictEqual(match, {'user_id': 'me'})
+
+        match, item = router.match(get_target('/api/group/me'), '/api/group/me', True)
+        self.assertEqual(item['name'], 'any-me')
+        self.assertDictEqual(match, {'object_type': 'group'})
+
+# ################################################################################################################################
+
+    def test_static(self):
+        router = URLRouter(self.channel_data)
+
+        match, item = router.match(get_target('/api/static'), '/api/static', True)
+        self.assertEqual(item['name'], 'static')
+        self.assertDictEqual(match, {})
+
+        match, item = router.match(get_target('/zato/ping'), '/zato/ping', False)
+        self.assertEqual(item['name'], 'ping')
+
+# ################################################################################################################################
+
+    def test_no_match(self):
+        router = URLRouter(self.channel_data)
+
+        self.assertEqual(router.match(get_target('/api/static/abc'), '/api/static/abc', True), (None, None))
+        self.assertEqual(router.match(get_target('/api/v.1/abc'), '/api/v.1/abc', True), (None, None))
+        self.assertEqual(router.match(get_target('/zato/ping'), '/zato/ping', True), (None, None))
+
+# ################################################################################################################################
+
+    def test_same_as_linear(self):
+        router = URLRouter(self.channel_data)
+
+        for url_path, method in (
+            ('/api/user/me', 'GET'),
+            ('/api/user/123', 'GET'),
+            ('/api/user/123/456', 'GET'),
+            ('/api/abc/me', 'GET'),
+            ('/api/v.1/abc', 'POST'),
+            ('/api/vx1/abc', 'POST'),
+            ('/api/static', 'GET'),
+            ('/api/static', 'POST'),
+            ('/zato/ping', 'GET'),
+            ('/not/found', 'GET'),
+            ):
+            target = get_target(url_path, method)
+            self.assertEqual(router.match(target, url_path, not url_path.startswith('/zato')),
+                self._linear_match(target, url_path), url_path)
+
+# ################################################################################################################################
+
+    def test_url_data_rebuild_router(self):
+        url_data = _URLData(self.channel_data)
+
+        match, item = url_data.match('/api/abc/me', '', 'GET', '*/*', False)
+        self.assertEqual(item['name'], 'any-me')
+
+        # This is what URLData does when a new channel is created
+        self.channel_data.insert(0, get_channel('new', '/api/abc/me'))
+        url_data.clear_cache()
+        url_data.rebuild_router()
+
+        match, item = url_data.match('/api/abc/me', '', 'GET', '*/*', False)
+        self.assertEqual(item['name'], 'new')
+
+# ################################################################################################################################
+
+class URLMatchCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.channel_data = [
+            get_channel('user-by-id', '/api/user/{user_id}'),
+            get_channel('static', '/api/static'),
+        ]
+
+# ################################################################################################################################
+
+    def test_hits_misses(self):
+        url_data = _URLData(self.channel_data)
+
+        match1, item1 = url_data.match('/api/user/123', '', 'GET', '*/*', False)
+        match2, item2 = url_data.match('/api/user/123', '', 'GET', '*/*', False)
+
+        self.assertDictEqual(match1, {'user_id': '123'})
+        self.assertDictEqual(match2, {'user_id': '123'})
+        self.assertIs(item1, item2)
+
+        # Callers receive their own copies of path parameters
+        match2['user_id'] = 'changed'
+        match3, _ = url_data.match('/api/user/123', '', 'GET', '*/*', False)
+        self.assertDictEqual(match3, {'user_id': '123'})
+
+        # Static targets are cached separately and do not count towards the dynamic cache
+        url_data.match('/api/static', '', 'GET', '*/*', False)
+        url_data.match('/api/static', '', 'GET', '*/*', False)
+
+        stats = url_data.get_match_cache_stats()
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 2)
+
+# ################################################################################################################################
+
+    def test_max_size(self):
+        url_data = _URLData(self.channel_data, 2)
+
+        url_data.match('/api/user/1', '', 'GET', '*/*', False)
+        url_data.match('/api/user/2', '', 'GET', '*/*', False)
+
+        # Touch the first one so that the second one is evicted next
+        url_data.match('/api/user/1', '', 'GET', '*/*', False)
+        url_data.match('/api/user/3', '', 'GET', '*/*', False)
+
+        self.assertEqual(len(url_data.url_match_cache), 2)
+        self.assertListEqual([key.split(':::')[-1] for key in url_data.url_match_cache], ['/api/user/1', '/api/user/3'])
+
+        match_target = self.channel_data[0]['match_target']
+        self.assertEqual(len(url_data.targets_by_channel[match_target]), 2)
+
+# ################################################################################################################################
+
+    def test_invalidate_channel_cache(self):
+        url_data = _URLData(self.channel_data)
+
+        url_data.match('/api/user/1', '', 'GET', '*/*', False)
+        url_data.match('/api/static', '', 'GET', '*/*', False)
+
+        url_data.invalidate_channel_cache(self.channel_data[0]['match_target'])
+
+        self.assertEqual(len(url_data.url_match_cache), 0)
+        self.assertEqual(len(url_data.url_path_cache), 1)
+
+        url_data.invalidate_channel_cache(self.channel_data[1]['match_target'])
+        self.assertEqual(len(url_data.url_path_cache), 0)
+
+# ################################################################################################################################
+
+    def test_clear_cache(self):
+        url_data = _URLData(self.channel_data)
+
+        url_data.match('/api/user/1', '', 'GET', '*/*', False)
+        url_data.match('/api/static', '', 'GET', '*/*', False)
+
+        url_data.clear_cache()
+
+        self.assertEqual(len(url_data.url_match_cache), 0)
+        self.assertEqual(len(url_data.url_path_cache), 0)
+        self.assertDictEqual(url_data.targets_by_channel, {})
+
+# ################################################################################################################################
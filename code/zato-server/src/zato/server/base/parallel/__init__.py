@@ -15,6 +15,7 @@ from datetime import datetime, timedelta
 from logging import INFO, WARN
 from re import IGNORECASE
 from tempfile import mkstemp
+from time import time
 from traceback import format_exc
 from uuid import uuid4
 
@@ -23,6 +24,7 @@ from anyjson import dumps
 
 # gevent
 import gevent.monkey # Needed for Cassandra
+from gevent import joinall, spawn
 
 # globre
 import globre
@@ -37,7 +39,7 @@ from paste.util.converters import asbool
 from zato.broker import BrokerMessageReceiver
 from zato.broker.client import BrokerClient
 from zato.bunch import Bunch
-from zato.common import DATA_FORMAT, default_internal_modules, KVDB, SECRETS, SERVER_STARTUP, SERVER_UP_STATUS, \
+from zato.common import BROKER, DATA_FORMAT, default_internal_modules, KVDB, SECRETS, SERVER_STARTUP, SERVER_UP_STATUS, \
      ZATO_ODB_POOL_NAME
 from zato.common.audit import audit_pii
 from zato.common.broker_message import HOT_DEPLOY, MESSAGE_TYPE, TOPICS
@@ -52,12 +54,14 @@ from zato.common.util.time_ import TimeUtil
 from zato.distlock import LockManager
 from zato.server.base.worker import WorkerStore
 from zato.server.config import ConfigStore
+from zato.server.connection.cache_shmem import unlink_deployment_caches
 from zato.server.connection.server import Servers
 from zato.server.base.parallel.config import ConfigLoader
 from zato.server.base.parallel.http import HTTPHandler
 from zato.server.base.parallel.subprocess_.ibm_mq import IBMMQIPC
 from zato.server.base.parallel.subprocess_.sftp import SFTPIPC
 from zato.server.pickup import PickupManager
+from zato.server.stats import StatsCollector
 
 # ################################################################################################################################
 
@@ -81,6 +85,9 @@ kvdb_logger = logging.getLogger('zato_kvdb')
 
 megabyte = 10**6
 
+# Error message for processes that did not reply to a scatter-gather invocation in time
+_no_pid_response = 'No response from PID `{}` within {}s'
+
 # ################################################################################################################################
 # ################################################################################################################################
 
@@ -123,6 +130,7 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         self.cluster = None
         self.cluster_id = None
         self.kvdb = None
+        self.stats_collector = None # type: StatsCollector
         self.startup_jobs = None
         self.worker_store = None # type: WorkerStore
         self.service_store = None # type: ServiceStore
@@ -377,6 +385,10 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         # TimeUtil needs self.kvdb so it can be set now
         self.time_util = TimeUtil(self.kvdb)
 
+        # Statistics of services invoked in this worker, flushed to KVDB periodically
+        self.stats_collector = StatsCollector(self.kvdb.conn,
+            float(self.fs_server_config.get('stats', {}).get('flush_interval', 5)))
+
         # Service sources
         self.service_sources = []
         for name in open(os.path.join(self.repo_location, self.fs_server_config.main.service_sources)):
@@ -552,7 +564,11 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
             TOPICS[MESSAGE_TYPE.TO_PARALLEL_ALL]: self.worker_store.on_broker_msg,
         }
 
-        self.broker_client = BrokerClient(self.kvdb, 'parallel', broker_callbacks, self.get_lua_programs())
+        broker_config = self.fs_server_config.get('broker', {})
+
+        self.broker_client = BrokerClient(self.kvdb, 'parallel', broker_callbacks, self.get_lua_programs(),
+            broker_config.get('async_transport', BROKER.ASYNC_TRANSPORT.WORK_QUEUE),
+            int(broker_config.get('work_queue_batch_size', BROKER.DEFAULT_WORK_QUEUE_BATCH_SIZE)))
         self.worker_store.set_broker_client(self.broker_client)
 
         # Make sure that broker client's connection is ready before continuing
@@ -627,6 +643,10 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         self.ipc_api.on_message_callback = self.worker_store.on_ipc_message
         spawn_greenlet(self.ipc_api.run)
 
+        # Statistics
+        if self.component_enabled.stats:
+            spawn_greenlet(self.stats_collector.run)
+
         self.startup_callable_tool.invoke(SERVER_STARTUP.PHASE.AFTER_STARTED, kwargs={
             'parallel_server': self,
         })
@@ -752,41 +772,88 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
 
 # ################################################################################################################################
 
-    def invoke_all_pids(self, service, request, timeout=5, *args, **kwargs):
-        """ Invokes a given service in each of processes current server has.
+    def _invoke_pid_timed(self, service, request, pid, timeout, *args, **kwargs):
+        """ Invokes a service in a single process on behalf of self.gather_by_pid and returns its response along with
+        the time it took to obtain it.
         """
+        response = {
+            'is_ok': False,
+            'pid_data': None,
+            'error_info': None,
+            'is_timeout': False,
+            'response_time': None,
+        }
+
+        start = time()
+
         try:
-            # PID -> response from that process
-            out = {}
+            is_ok, pid_data = self.invoke_by_pid(service, request, pid, timeout=timeout, *args, **kwargs)
+            response['is_ok'] = is_ok
+            response['pid_data' if is_ok else 'error_info'] = pid_data
 
-            # Get all current PIDs
-            data = self.invoke('zato.info.get-worker-pids', serialize=False).getvalue(False)
-            pids = data['response']['pids']
+            # IPC returns no data at all if there was no response in time
+            if not is_ok and pid_data is None and time() - start >= timeout:
+                response['is_timeout'] = True
+                response['error_info'] = _no_pid_response.format(pid, timeout)
+
+        except Exception:
+            response['error_info'] = format_exc()
+
+        finally:
+            response['response_time'] = time() - start
+
+        return response
+
+# ################################################################################################################################
+
+    def gather_by_pid(self, service, request, pids, timeout=5, *args, **kwargs):
+        """ Invokes a given service in all the processes from input concurrently and waits for their responses no longer
+        than timeout seconds in total. Processes that do not reply before the deadline are reported as timed out
+        and responses of all the other ones are still returned. Each response carries the time it took to obtain it.
+        """
+        # PID -> response from that process
+        out = {}
+
+        # Underlying IPC needs strings on input instead of None
+        request = request or ''
+
+        start = time()
+        greenlets = [(pid, spawn(self._invoke_pid_timed, service, request, pid, timeout, *args, **kwargs)) for pid in pids]
 
-            # Underlying IPC needs strings on input instead of None
-            request = request or ''
+        # Each invocation has the same timeout so they all should be finished by now. Those still running are not killed,
+        # as it could interrupt them halfway through writing to a socket, so they will time out on their own in background.
+        joinall([greenlet for _, greenlet in greenlets], timeout=timeout)
 
-            for pid in pids:
-                response = {
+        for pid, greenlet in greenlets:
+            if greenlet.ready():
+                out[pid] = greenlet.value
+            else:
+                out[pid] = {
                     'is_ok': False,
                     'pid_data': None,
-                    'error_info': None
+                    'error_info': _no_pid_response.format(pid, timeout),
+                    'is_timeout': True,
+                    'response_time': time() - start,
                 }
 
-                try:
-                    is_ok, pid_data = self.invoke_by_pid(service, request, pid, timeout=timeout, *args, **kwargs)
-                    response['is_ok'] = is_ok
-                    response['pid_data' if is_ok else 'error_info'] = pid_data
-
-                except Exception:
-                    e = format_exc()
-                    response['error_info'] = e
-                finally:
-                    out[pid] = response
+        return out
+
+# ################################################################################################################################
+
+    def invoke_all_pids(self, service, request, timeout=5, *args, **kwargs):
+        """ Invokes a given service in each of processes current server has, all of them concurrently,
+        waiting up to timeout seconds in total for their responses - see self.gather_by_pid for details.
+        """
+        try:
+            # Get all current PIDs
+            data = self.invoke('zato.info.get-worker-pids', serialize=False).getvalue(False)
+            pids = data['response']['pids']
+
+            return self.gather_by_pid(service, request, pids, timeout, *args, **kwargs)
+
         except Exception:
             logger.warn('PID invocation error `%s`', format_exc())
-        finally:
-            return out
+            return {}
 
 # ################################################################################################################################
 
@@ -922,6 +989,15 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
         # Invoke cleanup procedures
         worker.app.zato_wsgi_app.cleanup_on_stop()
 
+# ################################################################################################################################
+
+    @staticmethod
+    def on_exit(arbiter):
+        """ A Gunicorn hook invoked in the main process once all the workers are stopped. Worker processes do not unlink
+        the shared memory of built-in caches when they stop because other ones may still use it, hence it is done here.
+        """
+        unlink_deployment_caches(arbiter.zato_deployment_key)
+
 # ################################################################################################################################
 
     def cleanup_wsx(self, needs_pid=False):
@@ -973,9 +1049,16 @@ class ParallelServer(BrokerMessageReceiver, ConfigLoader, HTTPHandler):
             self.server_startup_ipc.close()
             self.connector_config_ipc.close()
 
+            # Close built-in caches, including ones kept in shared memory
+            self.worker_store.cache_api.close()
+
             # Close ZeroMQ-based IPC
             self.ipc_api.close()
 
+            # Flush any statistics still collected
+            if self.stats_collector:
+                self.stats_collector.stop()
+
             # WSX connections for this server cleanup
             self.cleanup_wsx(True)
 
@@ -871,16 +871,19 @@ class WorkerStore(_WorkerStoreBase, BrokerMessageReceiver):
     def init_pubsub(self):
         """ Sets up all pub/sub endpoints, subscriptions and topics. Also, configures pubsub with getters for each endpoint type.
         """
-        for value in self.worker_config.pubsub_endpoint.values():
-            self.pubsub.create_endpoint(bunchify(value['config']))
+        # Each kind of object is added in a single batch so that pubsub's maps are not copied for each object separately
+        self.pubsub.create_endpoints([bunchify(value['config']) for value in self.worker_config.pubsub_endpoint.values()])
+
+        sub_config_list = []
 
         for value in self.worker_config.pubsub_subscription.values():
             config = bunchify(value['config'])
             config.add_subscription = True # We don't create WSX subscriptions here so it is always True
-            self.pubsub._subscribe(config)
+            sub_config_list.append(config)
+
+        self.pubsub._subscribe_many(sub_config_list)
 
-        for value in self.worker_config.pubsub_topic.values():
-            self.pubsub.create_topic(bunchify(value['config']))
+        self.pubsub.create_topics([bunchify(value['config']) for value in self.worker_config.pubsub_topic.values()])
 
         self.pubsub.endpoint_impl_getter[PUBSUB.ENDPOINT_TYPE.AMQP.id] = None # Not used for now
         self.pubsub.endpoint_impl_getter[PUBSUB.ENDPOINT_TYPE.REST.id] = self.worker_config.out_plain_http.get_by_id
@@ -1548,13 +1551,17 @@ class WorkerStore(_WorkerStoreBase, BrokerMessageReceiver):
             self.worker_config.simple_io, job_type=msg.get('job_type'), wsgi_environ=wsgi_environ,
             environ=msg.get('environ'))
 
+        # The service may be handed over to another request once it is released so its response is read first
+        response_payload = service.response.payload
+        self.server.service_store.release_instance(service)
+
         # Invoke the callback, if any.
         if msg.get('is_async') and msg.get('callback'):
 
             cb_msg = {}
             cb_msg['action'] = SERVICE.PUBLISH.value
             cb_msg['service'] = msg['callback']
-            cb_msg['payload'] = service.response.payload
+            cb_msg['payload'] = response_payload
             cb_msg['cid'] = new_cid()
             cb_msg['channel'] = CHANNEL.INVOKE_ASYNC_CALLBACK
             cb_msg['data_format'] = data_format
@@ -1565,7 +1572,7 @@ class WorkerStore(_WorkerStoreBase, BrokerMessageReceiver):
             self.broker_client.invoke_async(cb_msg)
 
         if kwargs.get('needs_response'):
-            return service.response.payload
+            return response_payload
 
 # ################################################################################################################################
 
@@ -2240,7 +2247,8 @@ class WorkerStore(_WorkerStoreBase, BrokerMessageReceiver):
 # ################################################################################################################################
 
     def on_ipc_message(self, msg, success=IPC.STATUS.SUCCESS, failure=IPC.STATUS.FAILURE):
-
+        """ Invokes a service on behalf of another process and returns the response that will be sent back to it.
+        """
         # If there is target_pid we cannot continue if we are not the recipient.
         if msg.target_pid and msg.target_pid != self.server.pid:
             return
@@ -2256,10 +2264,15 @@ class WorkerStore(_WorkerStoreBase, BrokerMessageReceiver):
         finally:
             data = '{};{}'.format(status, response)
 
-        try:
-            with open(msg.reply_to_fifo, 'wb') as fifo:
-                fifo.write(data if isinstance(data, bytes) else data.encode('utf'))
-        except Exception:
-            logger.warn('Could not write to FIFO, m:`%s`, r:`%s`, s:`%s`, e:`%s`', msg, response, status, format_exc())
+        # Responses are sent back through the same IPC connection that the message was received from,
+        # but the sender may have also asked for them to be written to a FIFO.
+        if msg.reply_to_fifo:
+            try:
+                with open(msg.reply_to_fifo, 'wb') as fifo:
+                    fifo.write(data if isinstance(data, bytes) else data.encode('utf'))
+            except Exception:
+                logger.warn('Could not write to FIFO, m:`%s`, r:`%s`, s:`%s`, e:`%s`', msg, response, status, format_exc())
+
+        return data
 
 # ################################################################################################################################
@@ -11,6 +11,9 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 # stdlib
 from base64 import b64decode
 
+# Bunch
+from bunch import Bunch
+
 # Zato
 from zato.common import CACHE
 from zato.server.base.worker.common import WorkerImpl
@@ -210,4 +213,25 @@ class CacheBuiltin(WorkerImpl):
         if msg.source_worker_id != self.server.worker_id:
             self.cache_api.sync_after_clear(_BUILTIN, msg)
 
+# ################################################################################################################################
+
+    def on_broker_msg_CACHE_BUILTIN_STATE_CHANGED_BATCH(self, msg, _BUILTIN=CACHE.TYPE.BUILTIN, _pickle_loads=pickle_loads):
+        if msg.source_worker_id != self.server.worker_id:
+
+            ops = []
+
+            for op, data in msg['ops']:
+                data = Bunch(data)
+
+                if data.get('is_key_pickled'):
+                    data.key = _pickle_loads(b64decode(data.key))
+
+                if data.get('is_value_pickled'):
+                    data.value = _pickle_loads(b64decode(data.value))
+
+                ops.append((op, data))
+
+            msg.ops = ops
+            self.cache_api.sync_after_batch(_BUILTIN, msg)
+
 # ################################################################################################################################
@@ -14,7 +14,7 @@ from logging import getLogger
 from traceback import format_exc
 
 # gevent
-from gevent import sleep, spawn
+from gevent import sleep, spawn, spawn_later
 from gevent.lock import RLock
 
 # python-memcached
@@ -28,6 +28,7 @@ from zato.cache import Cache as _CyCache
 from zato.common import CACHE, ZATO_NOT_GIVEN
 from zato.common.broker_message import CACHE as CACHE_BROKER_MSG
 from zato.common.util import parse_extra_into_dict
+from zato.server.connection.cache_shmem import SharedMemoryCache
 
 # Python 2/3 compatibility
 from future.utils import iteritems, itervalues
@@ -73,18 +74,103 @@ default_get = ZATO_NOT_GIVEN # A singleton to indicate that no default for Cache
 
 # ################################################################################################################################
 
+# Operations that fully replace what a key holds, i.e. they make any previous operations on the same key irrelevant
+_key_replace_ops = {CACHE.STATE_CHANGED.SET, CACHE.STATE_CHANGED.DELETE}
+
+# Operations that change a single key only
+_key_ops = _key_replace_ops | {CACHE.STATE_CHANGED.EXPIRE}
+
+# Operations that may be turned into deletions if the value they carry is too big to be published
+_set_to_delete_ops = dict((getattr(CACHE.STATE_CHANGED, op), getattr(CACHE.STATE_CHANGED, op.replace('SET', 'DELETE', 1)))
+    for op in builtin_ops if op.startswith('SET'))
+
+# ################################################################################################################################
+
+class SyncBatch(object):
+    """ Operations on a single cache, buffered before they are published to other worker processes in one broker message.
+    Operations on the same key are coalesced - a set or delete makes all previous operations on this key no longer needed,
+    unless there was an operation on multiple keys in between, e.g. delete_by_prefix, after which coalescing starts anew.
+    """
+    def __init__(self):
+        self.ops = []
+        self.size = 0
+
+        # Key -> indexes in self.ops of operations on that key since the last multi-key operation
+        self._by_key = {}
+
+    def add(self, op, data, _CLEAR=CACHE.STATE_CHANGED.CLEAR, _key_ops=_key_ops, _key_replace_ops=_key_replace_ops):
+
+        # Nothing published before a clear operation matters any longer
+        if op == _CLEAR:
+            self.ops[:] = []
+            self.size = 0
+            self._by_key.clear()
+
+        elif op in _key_ops:
+            key = data['key']
+            key_idx = self._by_key.setdefault(key, [])
+
+            if op in _key_replace_ops:
+                for idx in key_idx:
+                    self.ops[idx] = None
+                    self.size -= 1
+                key_idx[:] = []
+
+            key_idx.append(len(self.ops))
+
+        # A multi-key operation - previous ones cannot be coalesced with the ones that follow it
+        else:
+            self._by_key.clear()
+
+        self.ops.append((op, data))
+        self.size += 1
+
+    def get_ops(self):
+        return [elem for elem in self.ops if elem is not None]
+
+# ################################################################################################################################
+
 class Cache(object):
     """ The cache API through which services access the built-in self.cache objects.
-    Attribute self.impl is the actual Cython-based cache implementation.
+    Attribute self.impl is the actual Cython-based or shared memory cache implementation.
     """
     def __init__(self, config):
         self.config = config
         self.after_state_changed_callback = self.config.after_state_changed_callback
-        self.needs_sync = self.config.sync_method != CACHE.SYNC_METHOD.NO_SYNC.id
-        self.impl = _CyCache(self.config.max_size, self.config.max_item_size, self.config.extend_expiry_on_get,
-            self.config.extend_expiry_on_set)
+        self.add_to_sync_batch_callback = self.config.add_to_sync_batch_callback
+        self._set_sync_flags()
+        self.impl = self._get_impl(self.config)
         spawn(self._delete_expired)
 
+# ################################################################################################################################
+
+    def _set_sync_flags(self, _sync_methods=(CACHE.SYNC_METHOD.IN_BACKGROUND.id, CACHE.SYNC_METHOD.IN_BACKGROUND_BATCHED.id)):
+        self.needs_sync = self.config.sync_method in _sync_methods
+        self.needs_batch_sync = self.config.sync_method == CACHE.SYNC_METHOD.IN_BACKGROUND_BATCHED.id
+
+# ################################################################################################################################
+
+    def _after_state_changed(self, op, cache_name, data):
+        """ Notifies other worker processes of a change to this cache, either right away or as part of a batch.
+        """
+        if self.needs_batch_sync:
+            self.add_to_sync_batch_callback(op, cache_name, data)
+        else:
+            spawn(self.after_state_changed_callback, op, cache_name, data)
+
+# ################################################################################################################################
+
+    def _get_impl(self, config):
+        """ Returns a cache implementation for input configuration - either one kept in shared memory, used directly
+        by all worker processes, or an in-process one, optionally synchronized with other processes through the broker.
+        """
+        if config.sync_method == CACHE.SYNC_METHOD.SHARED_MEMORY.id:
+            return SharedMemoryCache(config.deployment_key, config.id, config.max_size, config.max_item_size,
+                config.extend_expiry_on_get, config.extend_expiry_on_set)
+        else:
+            return _CyCache(config.max_size, config.max_item_size, config.extend_expiry_on_get,
+                config.extend_expiry_on_set, needs_key_index=config.get('needs_key_index', False))
+
 # ################################################################################################################################
 
     def __getitem__(self, key):
@@ -178,7 +264,7 @@ class Cache(object):
         meta_ref = {'key':key, 'value':value, 'expiry':expiry} if self.needs_sync else None
         value = self.impl.set(key, value, expiry, details, meta_ref)
         if self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, meta_ref)
+            self._after_state_changed(_OP, self.config.name, meta_ref)
 
         return value
 
@@ -194,7 +280,7 @@ class Cache(object):
         out = self.impl.set_by_prefix(key, value, expiry, False, meta_ref, return_found, limit)
 
         if meta_ref['_any_found'] and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'value':value,
                 'expiry':expiry,
@@ -216,7 +302,7 @@ class Cache(object):
         out = self.impl.set_by_suffix(key, value, expiry, False, meta_ref, return_found, limit)
 
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'value':value,
                 'expiry':expiry,
@@ -238,7 +324,7 @@ class Cache(object):
         out = self.impl.set_by_regex(key, value, expiry, False, meta_ref, return_found, limit)
 
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'value':value,
                 'expiry':expiry,
@@ -260,7 +346,7 @@ class Cache(object):
         out = self.impl.set_contains(key, value, expiry, False, meta_ref, return_found, limit)
 
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'value':value,
                 'expiry':expiry,
@@ -282,7 +368,7 @@ class Cache(object):
         out = self.impl.set_not_contains(key, value, expiry, False, meta_ref, return_found, limit)
 
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'value':value,
                 'expiry':expiry,
@@ -304,7 +390,7 @@ class Cache(object):
         out = self.impl.set_contains_all(key, value, expiry, False, meta_ref, return_found, limit)
 
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'value':value,
                 'expiry':expiry,
@@ -326,7 +412,7 @@ class Cache(object):
         out = self.impl.set_contains_any(key, value, expiry, False, meta_ref, return_found, limit)
 
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'value':value,
                 'expiry':expiry,
@@ -348,7 +434,7 @@ class Cache(object):
                 raise
         else:
             if self.needs_sync:
-                spawn(self.after_state_changed_callback, _OP, self.config.name, {'key':key})
+                self._after_state_changed(_OP, self.config.name, {'key':key})
 
             return value
 
@@ -360,7 +446,7 @@ class Cache(object):
         """
         out = self.impl.delete_by_prefix(key, return_found, limit)
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'limit':limit
             })
@@ -375,7 +461,7 @@ class Cache(object):
         """
         out = self.impl.delete_by_suffix(key, return_found, limit)
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'limit':limit
             })
@@ -390,7 +476,7 @@ class Cache(object):
         """
         out = self.impl.delete_by_regex(key, return_found, limit)
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'limit':limit
             })
@@ -405,7 +491,7 @@ class Cache(object):
         """
         out = self.impl.delete_contains(key, return_found, limit)
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'limit':limit
             })
@@ -420,7 +506,7 @@ class Cache(object):
         """
         out = self.impl.delete_not_contains(key, return_found, limit)
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'limit':limit
             })
@@ -435,7 +521,7 @@ class Cache(object):
         """
         out = self.impl.delete_contains_all(key, return_found, limit)
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'limit':limit
             })
@@ -450,7 +536,7 @@ class Cache(object):
         """
         out = self.impl.delete_contains_any(key, return_found, limit)
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'limit':limit
             })
@@ -466,7 +552,7 @@ class Cache(object):
         found_key = self.impl.expire(key, expiry, meta_ref)
 
         if self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, meta_ref)
+            self._after_state_changed(_OP, self.config.name, meta_ref)
 
         return found_key
 
@@ -477,7 +563,7 @@ class Cache(object):
         """
         out = self.impl.expire_by_prefix(key, expiry)
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'expiry':expiry,
                 'limit':limit
@@ -492,7 +578,7 @@ class Cache(object):
         """
         out = self.impl.expire_by_suffix(key, expiry)
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'expiry':expiry,
                 'limit':limit
@@ -507,7 +593,7 @@ class Cache(object):
         """
         out = self.impl.expire_by_regex(key, expiry)
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'expiry':expiry,
                 'limit':limit
@@ -522,7 +608,7 @@ class Cache(object):
         """
         out = self.impl.expire_contains(key, expiry)
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'expiry':expiry,
                 'limit':limit
@@ -537,7 +623,7 @@ class Cache(object):
         """
         out = self.impl.expire_not_contains(key, expiry)
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'expiry':expiry,
                 'limit':limit
@@ -552,7 +638,7 @@ class Cache(object):
         """
         out = self.impl.expire_contains_all(key, expiry)
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'expiry':expiry,
                 'limit':limit
@@ -567,7 +653,7 @@ class Cache(object):
         """
         out = self.impl.expire_contains_any(key, expiry)
         if out and self.needs_sync:
-            spawn(self.after_state_changed_callback, _OP, self.config.name, {
+            self._after_state_changed(_OP, self.config.name, {
                 'key':key,
                 'expiry':expiry,
                 'limit':limit
@@ -625,13 +711,32 @@ class Cache(object):
         self.impl.clear()
 
         if self.needs_sync:
-            spawn(self.after_state_changed_callback, _CLEAR, self.config.name, {})
+            self._after_state_changed(_CLEAR, self.config.name, {})
 
 # ################################################################################################################################
 
     def update_config(self, config):
-        self.needs_sync = self.config.sync_method != CACHE.SYNC_METHOD.NO_SYNC.id
-        self.impl.update_config(config)
+        is_shared_memory = self.config.sync_method == CACHE.SYNC_METHOD.SHARED_MEMORY.id
+        needs_shared_memory = config.sync_method == CACHE.SYNC_METHOD.SHARED_MEMORY.id
+
+        self.config.update(config)
+        self._set_sync_flags()
+
+        # Entries cannot be moved between shared memory and in-process caches so a new, empty, one is needed
+        if is_shared_memory != needs_shared_memory:
+            self.close()
+            self.impl = self._get_impl(self.config)
+        else:
+            self.impl.update_config(config)
+
+# ################################################################################################################################
+
+    def close(self, needs_unlink=False):
+        """ Releases resources held by the underlying implementation, if there are any. Shared memory is unlinked
+        only if needs_unlink is True - otherwise, other worker processes can still use it.
+        """
+        if isinstance(self.impl, SharedMemoryCache):
+            self.impl.close(needs_unlink)
 
 # ################################################################################################################################
 
@@ -662,40 +767,40 @@ class Cache(object):
     def sync_after_set_by_prefix(self, data):
         """ Invoked by Cache API to synchronizes this worker's cache after a .set_by_prefix operation in another worker process.
         """
-        self.impl.set_by_prefix(data.key, data.value, data.expiry, False, None, data.limit, data.orig_now)
+        self.impl.set_by_prefix(data.key, data.value, data.expiry, False, None, False, data.limit, data.orig_now)
 
     def sync_after_set_by_suffix(self, data):
         """ Invoked by Cache API to synchronizes this worker's cache after a .set_by_suffix operation in another worker process.
         """
-        self.impl.set_by_suffix(data.key, data.value, data.expiry, False, None, data.limit, data.orig_now)
+        self.impl.set_by_suffix(data.key, data.value, data.expiry, False, None, False, data.limit, data.orig_now)
 
     def sync_after_set_by_regex(self, data):
         """ Invoked by Cache API to synchronizes this worker's cache after a .set_by_regex operation in another worker process.
         """
-        self.impl.set_by_regex(data.key, data.value, data.expiry, False, None, data.limit, data.orig_now)
+        self.impl.set_by_regex(data.key, data.value, data.expiry, False, None, False, data.limit, data.orig_now)
 
     def sync_after_set_contains(self, data):
         """ Invoked by Cache API to synchronizes this worker's cache after a .set_contains operation in another worker process.
         """
-        self.impl.set_contains(data.key, data.value, data.expiry, False, None, data.limit, data.orig_now)
+        self.impl.set_contains(data.key, data.value, data.expiry, False, None, False, data.limit, data.orig_now)
 
     def sync_after_set_not_contains(self, data):
         """ Invoked by Cache API to synchronizes this worker's cache after a .set_not_contains operation
         in another worker process.
         """
-        self.impl.set_not_contains(data.key, data.value, data.expiry, False, None, data.limit, data.orig_now)
+        self.impl.set_not_contains(data.key, data.value, data.expiry, False, None, False, data.limit, data.orig_now)
 
     def sync_after_set_contains_all(self, data):
         """ Invoked by Cache API to synchronizes this worker's cache after a .set_contains_all operation
         in another worker process.
         """
-        self.impl.set_contains_all(data.key, data.value, data.expiry, False, None, data.limit, data.orig_now)
+        self.impl.set_contains_all(data.key, data.value, data.expiry, False, None, False, data.limit, data.orig_now)
 
     def sync_after_set_contains_any(self, data):
         """ Invoked by Cache API to synchronizes this worker's cache after a .set_contains_any operation
         in another worker process.
         """
-        self.impl.set_contains_any(data.key, data.value, data.expiry, False, None, data.limit, data.orig_now)
+        self.impl.set_contains_any(data.key, data.value, data.expiry, False, None, False, data.limit, data.orig_now)
 
 # ################################################################################################################################
 
@@ -802,6 +907,23 @@ class Cache(object):
         """
         self.impl.clear()
 
+# ################################################################################################################################
+
+    def sync_after_batch(self, ops, _CLEAR=CACHE.STATE_CHANGED.CLEAR):
+        """ Invoked by Cache API to synchronizes this worker's cache after a batch of operations in another worker process.
+        All of them are applied with the cache's lock held so no one can observe the cache with only a part of them applied.
+        """
+        with self.impl._lock:
+            for op, data in ops:
+                try:
+                    if op == _CLEAR:
+                        self.sync_after_clear()
+                    else:
+                        getattr(self, 'sync_after_{}'.format(op.lower()))(data)
+                except Exception:
+                    logger.warn('Could not apply `%s` from a batch in cache `%s`, data:`%s`, e:`%s`',
+                        op, self.config.name, data, format_exc())
+
 # ################################################################################################################################
 
 class _NotConfiguredAPI(object):
@@ -826,6 +948,14 @@ class CacheAPI(object):
         self.builtin = self.caches[CACHE.TYPE.BUILTIN]
         self.memcached = self.caches[CACHE.TYPE.MEMCACHED]
 
+        # Cache name -> SyncBatch with operations not published to other worker processes yet
+        self.sync_batches = {}
+        self.sync_batch_lock = RLock()
+        self.sync_batch_interval = CACHE.SYNC_BATCH.INTERVAL
+        self.sync_batch_max_ops = CACHE.SYNC_BATCH.MAX_OPS
+        self.sync_batch_max_value_size = CACHE.SYNC_BATCH.MAX_VALUE_SIZE
+        self._sync_batch_flush_scheduled = False
+
     def _maybe_set_default(self, config, cache):
         if config.is_default:
             self.default = cache
@@ -865,12 +995,102 @@ class CacheAPI(object):
             logger.warn('Could not run `%s` after_state_changed in cache `%s`, data:`%s`, e:`%s`',
                 op, cache_name, data, format_exc())
 
+# ################################################################################################################################
+
+    def add_to_sync_batch(self, op, cache_name, data):
+        """ Callback method invoked by each cache that is synchronized with other worker processes in batches.
+        Buffers an operation to be published along with all the other ones taking place in the next few milliseconds.
+        """
+        with self.sync_batch_lock:
+
+            batch = self.sync_batches.get(cache_name)
+            if not batch:
+                batch = self.sync_batches[cache_name] = SyncBatch()
+
+            batch.add(op, data)
+
+            if batch.size >= self.sync_batch_max_ops:
+                spawn(self._publish_sync_batch, cache_name, self.sync_batches.pop(cache_name))
+
+            elif not self._sync_batch_flush_scheduled:
+                self._sync_batch_flush_scheduled = True
+                spawn_later(self.sync_batch_interval, self.flush_sync_batches)
+
+# ################################################################################################################################
+
+    def flush_sync_batches(self):
+        """ Publishes all operations buffered so far to other worker processes, one broker message per cache.
+        """
+        with self.sync_batch_lock:
+            self._sync_batch_flush_scheduled = False
+            sync_batches, self.sync_batches = self.sync_batches, {}
+
+        for cache_name, batch in iteritems(sync_batches):
+            self._publish_sync_batch(cache_name, batch)
+
+# ################################################################################################################################
+
+    def _publish_sync_batch(self, cache_name, batch, _action=CACHE_BROKER_MSG.BUILTIN_STATE_CHANGED_BATCH.value):
+        """ Publishes all operations from a batch to other worker processes.
+        """
+        try:
+            self.server.broker_client.publish({
+                'action': _action,
+                'cache_name': cache_name,
+                'source_worker_id': self.server.worker_id,
+                'ops': [self._get_sync_batch_op(op, data) for op, data in batch.get_ops()],
+            })
+        except Exception:
+            logger.warn('Could not publish a batch of %d operation(s) in cache `%s`, e:`%s`',
+                batch.size, cache_name, format_exc())
+
+# ################################################################################################################################
+
+    def _get_sync_batch_op(self, op, data, _set_to_delete_ops=_set_to_delete_ops, _pickle_dumps=pickle_dumps):
+        """ Turns a single operation into a form that can be published in a batch. Keys and values that are not strings
+        are pickled and values that are too big are not published at all - other worker processes delete their keys instead,
+        which means that they will have to be set again in each of them.
+        """
+        out = {}
+
+        key = data.get('key')
+        if key is not None:
+            if isinstance(key, basestring):
+                out['key'] = key
+            else:
+                out['key'] = b64encode(_pickle_dumps(key)).decode('utf8')
+                out['is_key_pickled'] = True
+
+        if 'value' in data:
+            value = data['value']
+            is_value_pickled = not isinstance(value, basestring)
+
+            if is_value_pickled:
+                value = b64encode(_pickle_dumps(value)).decode('utf8')
+
+            if len(value) > self.sync_batch_max_value_size:
+                op = _set_to_delete_ops[op]
+                if 'limit' in data:
+                    out['limit'] = data['limit']
+                return op, out
+
+            out['value'] = value
+            out['is_value_pickled'] = is_value_pickled
+
+        for name in ('expiry', 'expires_at', 'orig_now', 'limit'):
+            if name in data:
+                out[name] = data[name]
+
+        return op, out
+
 # ################################################################################################################################
 
     def _create_builtin(self, config):
         """ A low-level method building a bCache object for built-in caches. Must be called with self.lock held.
         """
         config.after_state_changed_callback = self.after_state_changed
+        config.add_to_sync_batch_callback = self.add_to_sync_batch
+        config.deployment_key = self.server.deployment_key
         return Cache(config)
 
 # ################################################################################################################################
@@ -926,6 +1146,7 @@ class CacheAPI(object):
         """
         if config.cache_type == CACHE.TYPE.BUILTIN:
             cache = self.caches[config.cache_type].pop(config.old_name)
+            config.deployment_key = self.server.deployment_key
             cache.update_config(config)
             self._add_cache(config, cache)
         else:
@@ -951,6 +1172,9 @@ class CacheAPI(object):
 
         if cache_type == CACHE.TYPE.BUILTIN:
             self._clear(cache_type, name)
+
+            # The cache's definition is deleted so no worker process needs its shared memory anymore
+            cache.close(True)
         else:
             cache.disconnect_all()
 
@@ -994,6 +1218,17 @@ class CacheAPI(object):
         """
         return len(self.caches[cache_type][name])
 
+# ################################################################################################################################
+
+    def close(self):
+        """ Closes all built-in caches. Shared memory is not unlinked because other worker processes may still use it.
+        """
+        self.flush_sync_batches()
+
+        with self.lock:
+            for cache in itervalues(self.builtin):
+                cache.close()
+
 # ################################################################################################################################
 
     def sync_after_set(self, cache_type, data):
@@ -1127,4 +1362,11 @@ class CacheAPI(object):
         """
         self.caches[cache_type][data.cache_name].sync_after_clear()
 
+# ################################################################################################################################
+
+    def sync_after_batch(self, cache_type, data):
+        """ Synchronizes the state of this worker's cache after a batch of operations in another worker process.
+        """
+        self.caches[cache_type][data.cache_name].sync_after_batch(data.ops)
+
 # ################################################################################################################################
@@ -0,0 +1,904 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os
+from collections import OrderedDict
+from fcntl import LOCK_EX, LOCK_UN, lockf
+from logging import getLogger
+from struct import Struct
+from time import time
+from zlib import crc32
+
+# gevent
+from gevent.lock import RLock
+
+# posix_ipc
+import posix_ipc as ipc
+
+# regex
+from regex import compile as re_compile
+
+# Zato
+from zato.cache import Entry, KeyExpiredError
+from zato.common import CACHE
+from zato.common.util.posix_ipc_ import _shmem_pattern, SharedMemoryIPC
+
+# Python 2/3 compatibility
+from six import binary_type, integer_types, string_types, text_type
+from zato.common.py23_ import pickle_dumps, pickle_loads
+
+# ################################################################################################################################
+
+logger = getLogger(__name__)
+
+# ################################################################################################################################
+
+# How many entries each bucket of the hash table has room for
+slots_per_bucket = 8
+
+# Maximum length of an encoded key, in bytes
+max_key_size = 256
+
+# How many compiled regex patterns each cache keeps at most
+regex_cache_size = 1000
+
+# ################################################################################################################################
+
+# What kind of data a key or value is encoded from
+_type_text = 1
+_type_bytes = 2
+_type_int = 3
+_type_pickle = 4
+
+# Segment header - magic, bucket_count, slots_per_bucket, max_key_size, max_value_size
+_magic = b'ZATOCSH1'
+_header = Struct('<8sQQQQ')
+_header_size = 64
+
+# Slot header - state, key_type, value_type, key_len, key_hash, value_len, hits,
+# expiry, expires_at, last_read, prev_read, last_write, prev_write
+_slot = Struct('<BBBHIIQdddddd')
+
+_slot_free = 0
+_slot_used = 1
+
+# Indexes of fields in slot headers
+_state, _key_type, _value_type, _key_len, _key_hash, _value_len, _hits, \
+    _expiry, _expires_at, _last_read, _prev_read, _last_write, _prev_write = range(13)
+
+# ################################################################################################################################
+
+def _match_prefix(key, data):
+    return key.startswith(data)
+
+def _match_suffix(key, data):
+    return key.endswith(data)
+
+def _match_regex(key, data):
+    return data.match(key)
+
+def _match_contains(key, data):
+    return data in key
+
+def _match_not_contains(key, data):
+    return data not in key
+
+def _match_contains_all(key, data):
+    return all(elem in key for elem in data)
+
+def _match_contains_any(key, data):
+    return any(elem in key for elem in data)
+
+# ################################################################################################################################
+
+def _encode(data, is_key=False):
+    """ Returns a type marker and bytes that a key or value is stored as in shared memory.
+    """
+    if isinstance(data, text_type):
+        return _type_text, data.encode('utf8')
+
+    elif isinstance(data, binary_type):
+        return _type_bytes, data
+
+    # bool is a subclass of int but it cannot be round-tripped through str
+    elif isinstance(data, integer_types) and not isinstance(data, bool):
+        return _type_int, str(data).encode('utf8')
+
+    elif is_key:
+        raise ValueError('Key must be an instance of one of {}'.format(string_types + (binary_type,) + integer_types))
+
+    else:
+        return _type_pickle, pickle_dumps(data)
+
+def _decode(data_type, data):
+    if data_type == _type_text:
+        return data.decode('utf8')
+    elif data_type == _type_bytes:
+        return data
+    elif data_type == _type_int:
+        return int(data)
+    else:
+        return pickle_loads(data)
+
+# ################################################################################################################################
+
+class CacheIPC(SharedMemoryIPC):
+    """ A shared memory segment with the hash table of a single built-in cache.
+    """
+    key_name = '/cache'
+
+    def __init__(self, layout):
+        super(CacheIPC, self).__init__()
+
+        # bucket_count, slots_per_bucket, max_key_size, max_value_size
+        self.layout = layout
+
+    @staticmethod
+    def get_suffix_prefix(deployment_key):
+        return 'cache-{}-'.format(deployment_key)
+
+    def create(self, deployment_key, cache_id, size, needs_create=True):
+        suffix = '{}{}-{}'.format(self.get_suffix_prefix(deployment_key), cache_id, '-'.join(str(elem) for elem in self.layout))
+        super(CacheIPC, self).create(suffix, size, needs_create)
+
+    def store_initial(self):
+        """ Writes the header of the hash table unless another process already did it.
+        """
+        lockf(self._mem.fd, LOCK_EX, _header.size, 0)
+
+        try:
+            header = _header.unpack_from(self._mmap, 0)
+            if header[0] != _magic:
+                _header.pack_into(self._mmap, 0, _magic, *self.layout)
+            elif tuple(header[1:]) != tuple(self.layout):
+                raise ValueError('Shmem `{}` has layout {} instead of {}'.format(self.shmem_name, header[1:], self.layout))
+        finally:
+            lockf(self._mem.fd, LOCK_UN, _header.size, 0)
+
+# ################################################################################################################################
+
+def unlink_deployment_caches(deployment_key, shmem_dir='/dev/shm'):
+    """ Unlinks shared memory segments of all the caches of a given deployment. Called by the main process of a server
+    when it stops, i.e. when no worker process can use them anymore. Segments can be listed under Linux only,
+    elsewhere they are left to the operating system.
+    """
+    if not os.path.isdir(shmem_dir):
+        return
+
+    prefix = _shmem_pattern.format(CacheIPC.get_suffix_prefix(deployment_key)).lstrip('/')
+
+    for name in os.listdir(shmem_dir):
+        if name.startswith(prefix):
+            try:
+                ipc.unlink_shared_memory('/' + name)
+            except ipc.ExistentialError:
+                pass
+
+# ################################################################################################################################
+
+class SharedMemoryCache(object):
+    """ A built-in cache whose entries are kept in a POSIX shared memory segment that all worker processes of a server
+    read and write directly, i.e. without synchronizing their own copies of the cache. Offers the same API
+    as zato.cache.Cache.
+
+    Entries are stored in an open-addressing hash table of fixed-size slots, divided into buckets of slots_per_bucket slots.
+    A key is stored in any free slot of the bucket its hash points to and, if there is none, the least recently used entry
+    of that bucket is evicted. Each bucket is guarded by a POSIX record lock on its first byte, which the operating
+    system releases should a process holding it die.
+
+    Strings and integers are stored as they are, other values are pickled. Unlike with in-process caches,
+    max_item_size is the maximum length of a value as stored in shared memory, in bytes, and keys cannot be longer
+    than max_key_size, i.e. 256 bytes once encoded to UTF-8 - ValueError is raised for longer ones.
+
+    The segment outlives this object - closing it only unmaps it from the current process whereas other worker
+    processes can still use it. It is unlinked only when the cache is deleted or when its layout changes,
+    and all the segments of a server are removed by the main process when the server stops.
+    """
+    def __init__(self, deployment_key, cache_id, max_size=None, max_item_size=None, extend_expiry_on_get=True,
+        extend_expiry_on_set=True, lock=None):
+        self.deployment_key = deployment_key
+        self.cache_id = cache_id
+        self._lock = lock or RLock()
+        self.default_get = object()
+        self._ipc = None
+        self._mmap = None
+        self._fd = -1
+        self._expired_on_op = []
+        self._regex_cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.set_ops = 0
+        self.get_ops = 0
+
+        with self._lock:
+            self._update_config(max_size, max_item_size, extend_expiry_on_get, extend_expiry_on_set)
+
+# ################################################################################################################################
+
+    def _update_config(self, max_size, max_item_size, extend_expiry_on_get, extend_expiry_on_set):
+        self.max_size = max_size or CACHE.DEFAULT.MAX_SIZE
+        self.max_item_size = max_item_size or CACHE.DEFAULT.MAX_ITEM_SIZE
+        self.extend_expiry_on_get = extend_expiry_on_get
+        self.extend_expiry_on_set = extend_expiry_on_set
+
+        bucket_count = -(-self.max_size // slots_per_bucket)
+        layout = (bucket_count, slots_per_bucket, max_key_size, self.max_item_size)
+
+        # Sizes of entries are part of the layout of shared memory, so a new segment is needed if they change.
+        # All the worker processes receive the same new configuration so none of them will need the old segment anymore.
+        if self._ipc is None or self._ipc.layout != layout:
+            self.close(True)
+            self._open(layout)
+
+    def update_config(self, config):
+        with self._lock:
+            self._update_config(config.max_size, config.max_item_size, config.extend_expiry_on_get, config.extend_expiry_on_set)
+
+# ################################################################################################################################
+
+    def _open(self, layout):
+        """ Creates or opens a shared memory segment for the input layout. Must be called with self._lock held.
+        """
+        self.bucket_count, self.slots_per_bucket, self.max_key_size, self.max_value_size = layout
+        self.slot_size = _slot.size + self.max_key_size + self.max_value_size
+        self.bucket_size = self.slot_size * self.slots_per_bucket
+
+        self._ipc = CacheIPC(layout)
+        self._ipc.create(self.deployment_key, self.cache_id, _header_size + self.bucket_count * self.bucket_size)
+        self._mmap = self._ipc._mmap
+        self._fd = self._ipc._mem.fd
+
+# ################################################################################################################################
+
+    def close(self, needs_unlink=False):
+        """ Unmaps the underlying shared memory segment from the current process. The segment is also unlinked
+        if needs_unlink is True, which must be done only if no other process will need it, e.g. when the cache is deleted.
+        """
+        if self._ipc:
+            self._ipc.close(needs_unlink)
+            self._ipc._mem.close_fd()
+            self._ipc = None
+            self._mmap = None
+
+# ################################################################################################################################
+
+    def __repr__(self):
+        return '<{} at {}, id:{}, max_size:{}, max_item_size:{}, hits/misses:{}/{}, get/set:{}/{}>'.format(
+            self.__class__.__name__, hex(id(self)), self.cache_id, self.max_size, self.max_item_size,
+            self.hits, self.misses, self.get_ops, self.set_ops)
+
+# ################################################################################################################################
+
+    def _get_bucket(self, key_hash):
+        return _header_size + (key_hash % self.bucket_count) * self.bucket_size
+
+    def _lock_bucket(self, bucket):
+        lockf(self._fd, LOCK_EX, 1, bucket)
+
+    def _unlock_bucket(self, bucket):
+        lockf(self._fd, LOCK_UN, 1, bucket)
+
+# ################################################################################################################################
+
+    def _iter_slots(self, bucket):
+        """ Yields offsets and headers of all slots in a bucket. Must be called with the bucket's lock held.
+        """
+        for slot in range(bucket, bucket + self.bucket_size, self.slot_size):
+            yield slot, list(_slot.unpack_from(self._mmap, slot))
+
+    def _find(self, bucket, key_type, key_data, key_hash):
+        """ Returns the offset and header of a slot holding a given key or (None, None) if there is no such key.
+        Must be called with the bucket's lock held.
+        """
+        for slot, header in self._iter_slots(bucket):
+            if header[_state] == _slot_used and header[_key_hash] == key_hash and header[_key_type] == key_type:
+                if self._read_key_data(slot, header) == key_data:
+                    return slot, header
+
+        return None, None
+
+    def _find_free(self, bucket, now):
+        """ Returns a slot in which a new key can be stored, evicting an expired or the least recently used entry if needed.
+        Must be called with the bucket's lock held.
+        """
+        lru_slot = None
+        lru_used_at = None
+
+        for slot, header in self._iter_slots(bucket):
+
+            if header[_state] == _slot_free:
+                return slot
+
+            if header[_expires_at] and now >= header[_expires_at]:
+                return slot
+
+            used_at = max(header[_last_read], header[_last_write])
+            if lru_used_at is None or used_at < lru_used_at:
+                lru_slot, lru_used_at = slot, used_at
+
+        return lru_slot
+
+# ################################################################################################################################
+
+    def _read_key_data(self, slot, header):
+        start = slot + _slot.size
+        return self._mmap[start:start + header[_key_len]]
+
+    def _read_key(self, slot, header):
+        return _decode(header[_key_type], self._read_key_data(slot, header))
+
+    def _read_value(self, slot, header):
+        start = slot + _slot.size + self.max_key_size
+        return _decode(header[_value_type], self._mmap[start:start + header[_value_len]])
+
+    def _write_header(self, slot, header):
+        _slot.pack_into(self._mmap, slot, *header)
+
+    def _write_value(self, slot, header, value_type, value_data):
+        start = slot + _slot.size + self.max_key_size
+        self._mmap[start:start + len(value_data)] = value_data
+        header[_value_type] = value_type
+        header[_value_len] = len(value_data)
+
+    def _free(self, slot):
+        self._mmap[slot:slot + 1] = b'\x00'
+
+# ################################################################################################################################
+
+    def _encode_value(self, value):
+        value_type, value_data = _encode(value)
+        if len(value_data) > self.max_value_size:
+            raise ValueError('Value too long {} > {}'.format(len(value_data), self.max_value_size))
+        return value_type, value_data
+
+    def _encode_key(self, key):
+        key_type, key_data = _encode(key, True)
+        if len(key_data) > self.max_key_size:
+            raise ValueError('Key too long {} > {}'.format(len(key_data), self.max_key_size))
+        return key_type, key_data, crc32(key_data, key_type) & 0xffffffff
+
+# ################################################################################################################################
+
+    def _to_entry(self, key, header, value, position=0):
+        entry = Entry()
+        entry.key = key
+        entry.value = value
+        entry.hits = header[_hits]
+        entry.position = position
+        entry.expiry = header[_expiry]
+        entry.expires_at = header[_expires_at]
+        entry.last_read = header[_last_read]
+        entry.prev_read = header[_prev_read]
+        entry.last_write = header[_last_write]
+        entry.prev_write = header[_prev_write]
+        entry.set_metadata()
+
+        return entry
+
+# ################################################################################################################################
+
+    def __contains__(self, key):
+        key_type, key_data, key_hash = self._encode_key(key)
+        bucket = self._get_bucket(key_hash)
+
+        with self._lock:
+            self._lock_bucket(bucket)
+            try:
+                return self._find(bucket, key_type, key_data, key_hash)[0] is not None
+            finally:
+                self._unlock_bucket(bucket)
+
+# ################################################################################################################################
+
+    def __len__(self):
+        return len(self._scan(None, None, 0, self._count_action))
+
+    def _count_action(self, slot, header, key, now, out):
+        out.append(None)
+
+# ################################################################################################################################
+
+    def _scan(self, matcher, data, limit, action):
+        """ Runs action for each key in cache matching the input data, looking up at most limit keys unless limit is 0.
+        Without a matcher, all keys are used. Each bucket is locked only while it is being looked up.
+        """
+        out = []
+        idx = 0
+        now = time()
+
+        with self._lock:
+            if not self._mmap:
+                return out
+
+            for bucket in range(_header_size, _header_size + self.bucket_count * self.bucket_size, self.bucket_size):
+                self._lock_bucket(bucket)
+                try:
+                    for slot, header in self._iter_slots(bucket):
+
+                        if header[_state] != _slot_used:
+                            continue
+
+                        idx += 1
+                        key = self._read_key(slot, header)
+
+                        if matcher is None or (isinstance(key, string_types) and matcher(key, data)):
+                            action(slot, header, key, now, out)
+
+                        if idx == limit:
+                            return out
+                finally:
+                    self._unlock_bucket(bucket)
+
+        return out
+
+# ################################################################################################################################
+
+    def _get_regex(self, data):
+        """ Returns a compiled regex pattern, keeping up to regex_cache_size most recently used ones. Must be called
+        with self._lock held.
+        """
+        regex = self._regex_cache.pop(data, None)
+
+        if regex is None:
+            regex = re_compile(data)
+            if len(self._regex_cache) >= regex_cache_size:
+                self._regex_cache.popitem(False)
+
+        self._regex_cache[data] = regex
+        return regex
+
+# ################################################################################################################################
+
+    def _is_expired(self, slot, header, key, now):
+        """ Frees a slot if its entry has already expired. Must be called with the bucket's lock held.
+        """
+        if header[_expires_at] and now >= header[_expires_at]:
+            self._free(slot)
+            self._expired_on_op.append(key)
+            return True
+
+# ################################################################################################################################
+
+    def _get_slot(self, slot, header, key, details, now):
+        """ Returns a value or entry from a slot, updating its access metadata. Must be called with the bucket's lock held.
+        """
+        self.get_ops += 1
+        self.hits += 1
+
+        header[_prev_read] = header[_last_read]
+        header[_last_read] = now
+        header[_hits] += 1
+
+        if self.extend_expiry_on_get and header[_expiry]:
+            header[_expires_at] = now + header[_expiry]
+
+        self._write_header(slot, header)
+        value = self._read_value(slot, header)
+
+        return self._to_entry(key, header, value) if details else value
+
+# ################################################################################################################################
+
+    def get(self, key, default, details):
+        """ Returns a value by key, or None if the value is not found.
+        """
+        key_type, key_data, key_hash = self._encode_key(key)
+        bucket = self._get_bucket(key_hash)
+        now = time()
+
+        with self._lock:
+            self._lock_bucket(bucket)
+            try:
+                slot, header = self._find(bucket, key_type, key_data, key_hash)
+
+                if slot is None:
+                    self.misses += 1
+                    return None if default is self.default_get else default
+
+                if self._is_expired(slot, header, key, now):
+                    raise KeyExpiredError(key)
+
+                return self._get_slot(slot, header, key, details, now)
+
+            finally:
+                self._unlock_bucket(bucket)
+
+# ################################################################################################################################
+
+    def _get_action(self, details):
+        def _action(slot, header, key, now, out):
+            if not self._is_expired(slot, header, key, now):
+                out.append((key, self._get_slot(slot, header, key, details, now)))
+        return _action
+
+    def get_by_prefix(self, data, details, limit):
+        return dict(self._scan(_match_prefix, data, limit, self._get_action(details)))
+
+    def get_by_suffix(self, data, details, limit):
+        return dict(self._scan(_match_suffix, data, limit, self._get_action(details)))
+
+    def get_by_regex(self, data, details, limit):
+        with self._lock:
+            return dict(self._scan(_match_regex, self._get_regex(data), limit, self._get_action(details)))
+
+    def get_contains(self, data, details, limit):
+        return dict(self._scan(_match_contains, data, limit, self._get_action(details)))
+
+    def get_not_contains(self, data, details, limit):
+        return dict(self._scan(_match_not_contains, data, limit, self._get_action(details)))
+
+    def get_contains_all(self, data, details, limit):
+        return dict(self._scan(_match_contains_all, data, limit, self._get_action(details)))
+
+    def get_contains_any(self, data, details, limit):
+        return dict(self._scan(_match_contains_any, data, limit, self._get_action(details)))
+
+# ################################################################################################################################
+
+    def _set_slot(self, slot, header, key, value_type, value_data, expiry, now):
+        """ Stores a new value of an existing key. Returns the previous entry or raises KeyExpiredError if the key has
+        already expired. Must be called with the bucket's lock held.
+        """
+        self.set_ops += 1
+
+        # If we have a key that previously was not using expiry, we must set it now if expiry is given on input.
+        if not header[_expires_at]:
+            if expiry:
+                header[_expiry] = expiry
+                header[_expires_at] = now + expiry
+        else:
+            if self._is_expired(slot, header, key, now):
+                raise KeyExpiredError(key)
+
+            # If expiry == 0.0 it means that we are resetting an already existing expiry time
+            if expiry == 0.0:
+                header[_expiry] = 0.0
+                header[_expires_at] = 0.0
+
+            # The entry exists and has not expired so now, if we are configured to, prolong its expiration time
+            elif self.extend_expiry_on_set and header[_expiry]:
+                header[_expires_at] = now + header[_expiry]
+
+        prev_header = header[:]
+        prev_value = self._read_value(slot, header)
+
+        header[_prev_write] = header[_last_write]
+        header[_last_write] = now
+
+        self._write_value(slot, header, value_type, value_data)
+        self._write_header(slot, header)
+
+        return prev_header, prev_value
+
+# ################################################################################################################################
+
+    def set(self, key, value, expiry, details, meta_ref=None, orig_now=None):
+        """ Sets key to a given value, returning the previous value or, if details is True, the current entry.
+        """
+        key_type, key_data, key_hash = self._encode_key(key)
+        value_type, value_data = self._encode_value(value)
+        bucket = self._get_bucket(key_hash)
+        now = orig_now or time()
+
+        with self._lock:
+            self._lock_bucket(bucket)
+            try:
+                slot, header = self._find(bucket, key_type, key_data, key_hash)
+
+                # Ok, we have this key in cache
+                if slot is not None:
+                    _, out = self._set_slot(slot, header, key, value_type, value_data, expiry, now)
+
+                # No such key in cache - let's add it, possibly evicting another one.
+                else:
+                    self.set_ops += 1
+                    out = None
+
+                    slot = self._find_free(bucket, now)
+                    header = [_slot_used, key_type, 0, len(key_data), key_hash, 0, 0,
+                        expiry, now + expiry if expiry else 0.0, 0.0, 0.0, now, 0.0]
+
+                    start = slot + _slot.size
+                    self._mmap[start:start + len(key_data)] = key_data
+
+                    self._write_value(slot, header, value_type, value_data)
+                    self._write_header(slot, header)
+
+            finally:
+                self._unlock_bucket(bucket)
+
+        if meta_ref is not None:
+            meta_ref['expires_at'] = header[_expires_at]
+            meta_ref['orig_now'] = now
+
+        return self._to_entry(key, header, value) if details else out
+
+# ################################################################################################################################
+
+    def _set_many(self, matcher, data, value, expiry, details, meta_ref, return_found, limit, orig_now):
+        """ Sets a given value for all keys matching the input data.
+        """
+        value_type, value_data = self._encode_value(value)
+        now = orig_now or time()
+
+        def _action(slot, header, key, _ignored_now, out):
+            prev_header, prev_value = self._set_slot(slot, header, key, value_type, value_data, expiry, now)
+            if return_found:
+                out.append((key, self._to_entry(key, prev_header, prev_value) if details else prev_value))
+            elif not out:
+                out.append(None)
+
+        out = self._scan(matcher, data, limit, _action)
+
+        if meta_ref is not None:
+            meta_ref['_now'] = now
+            if out:
+                meta_ref['_any_found'] = True
+
+        return dict(out) if return_found else {}
+
+    def set_by_prefix(self, data, value, expiry, details, meta_ref, return_found, limit, orig_now=None):
+        return self._set_many(_match_prefix, data, value, expiry, details, meta_ref, return_found, limit, orig_now)
+
+    def set_by_suffix(self, data, value, expiry, details, meta_ref, return_found, limit, orig_now=None):
+        return self._set_many(_match_suffix, data, value, expiry, details, meta_ref, return_found, limit, orig_now)
+
+    def set_by_regex(self, data, value, expiry, details, meta_ref, return_found, limit, orig_now=None):
+        with self._lock:
+            regex = self._get_regex(data)
+        return self._set_many(_match_regex, regex, value, expiry, details, meta_ref, return_found, limit, orig_now)
+
+    def set_contains(self, data, value, expiry, details, meta_ref, return_found, limit, orig_now=None):
+        return self._set_many(_match_contains, data, value, expiry, details, meta_ref, return_found, limit, orig_now)
+
+    def set_not_contains(self, data, value, expiry, details, meta_ref, return_found, limit, orig_now=None):
+        return self._set_many(_match_not_contains, data, value, expiry, details, meta_ref, return_found, limit, orig_now)
+
+    def set_contains_all(self, data, value, expiry, details, meta_ref, return_found, limit, orig_now=None):
+        return self._set_many(_match_contains_all, data, value, expiry, details, meta_ref, return_found, limit, orig_now)
+
+    def set_contains_any(self, data, value, expiry, details, meta_ref, return_found, limit, orig_now=None):
+        return self._set_many(_match_contains_any, data, value, expiry, details, meta_ref, return_found, limit, orig_now)
+
+# ################################################################################################################################
+
+    def delete(self, key):
+        """ Deletes a key, returning its value, or None if there was no such key.
+        """
+        key_type, key_data, key_hash = self._encode_key(key)
+        bucket = self._get_bucket(key_hash)
+
+        with self._lock:
+            self._lock_bucket(bucket)
+            try:
+                slot, header = self._find(bucket, key_type, key_data, key_hash)
+                if slot is not None:
+                    value = self._read_value(slot, header)
+                    self._free(slot)
+                    return value
+            finally:
+                self._unlock_bucket(bucket)
+
+# ################################################################################################################################
+
+    def _delete_many(self, matcher, data, return_found, limit):
+        """ Deletes all keys matching the input data.
+        """
+        def _action(slot, header, key, now, out):
+            if return_found:
+                out.append((key, self._read_value(slot, header)))
+            self._free(slot)
+
+        return dict(self._scan(matcher, data, limit, _action))
+
+    def delete_by_prefix(self, data, return_found, limit):
+        return self._delete_many(_match_prefix, data, return_found, limit)
+
+    def delete_by_suffix(self, data, return_found, limit):
+        return self._delete_many(_match_suffix, data, return_found, limit)
+
+    def delete_by_regex(self, data, return_found, limit):
+        with self._lock:
+            return self._delete_many(_match_regex, self._get_regex(data), return_found, limit)
+
+    def delete_contains(self, data, return_found, limit):
+        return self._delete_many(_match_contains, data, return_found, limit)
+
+    def delete_not_contains(self, data, return_found, limit):
+        return self._delete_many(_match_not_contains, data, return_found, limit)
+
+    def delete_contains_all(self, data, return_found, limit):
+        return self._delete_many(_match_contains_all, data, return_found, limit)
+
+    def delete_contains_any(self, data, return_found, limit):
+        return self._delete_many(_match_contains_any, data, return_found, limit)
+
+# ################################################################################################################################
+
+    def _expire_slot(self, slot, header, expiry, now):
+        """ Makes an entry expire after 'expiry' seconds. Must be called with the bucket's lock held.
+        """
+        header[_expiry] = expiry
+        header[_expires_at] = now + expiry if expiry else 0.0
+        self._write_header(slot, header)
+
+# ################################################################################################################################
+
+    def expire(self, key, expiry, meta_ref):
+        """ Makes a given cache entry expire after 'expiry' seconds.
+        """
+        key_type, key_data, key_hash = self._encode_key(key)
+        bucket = self._get_bucket(key_hash)
+        now = time()
+
+        with self._lock:
+            self._lock_bucket(bucket)
+            try:
+                slot, header = self._find(bucket, key_type, key_data, key_hash)
+                if slot is None or self._is_expired(slot, header, key, now):
+                    return False
+
+                self._expire_slot(slot, header, expiry, now)
+
+            finally:
+                self._unlock_bucket(bucket)
+
+        if meta_ref is not None:
+            meta_ref['expires_at'] = header[_expires_at]
+            meta_ref['orig_now'] = now
+
+        return True
+
+# ################################################################################################################################
+
+    def _expire_many(self, matcher, data, expiry, limit):
+        """ Sets expiration for all keys matching the input data.
+        """
+        def _action(slot, header, key, now, out):
+            if not self._is_expired(slot, header, key, now):
+                self._expire_slot(slot, header, expiry, now)
+                out.append(key)
+
+        return bool(self._scan(matcher, data, limit, _action))
+
+    def expire_by_prefix(self, data, expiry, limit=0):
+        return self._expire_many(_match_prefix, data, expiry, limit)
+
+    def expire_by_suffix(self, data, expiry, limit=0):
+        return self._expire_many(_match_suffix, data, expiry, limit)
+
+    def expire_by_regex(self, data, expiry, limit=0):
+        with self._lock:
+            return self._expire_many(_match_regex, self._get_regex(data), expiry, limit)
+
+    def expire_contains(self, data, expiry, limit=0):
+        return self._expire_many(_match_contains, data, expiry, limit)
+
+    def expire_not_contains(self, data, expiry, limit=0):
+        return self._expire_many(_match_not_contains, data, expiry, limit)
+
+    def expire_contains_all(self, data, expiry, limit=0):
+        return self._expire_many(_match_contains_all, data, expiry, limit)
+
+    def expire_contains_any(self, data, expiry, limit=0):
+        return self._expire_many(_match_contains_any, data, expiry, limit)
+
+# ################################################################################################################################
+
+    def set_expiration_data(self, key, expiry, expires_at):
+        """ Sets expiry and expires_at attributes of a cache entry unless the entry is to expire later already.
+        """
+        key_type, key_data, key_hash = self._encode_key(key)
+        bucket = self._get_bucket(key_hash)
+
+        with self._lock:
+            self._lock_bucket(bucket)
+            try:
+                slot, header = self._find(bucket, key_type, key_data, key_hash)
+                if slot is None:
+                    raise KeyError('Key `%s` not found by set_expiration_data' % key)
+
+                if expires_at > header[_expires_at]:
+                    header[_expiry] = expiry
+                    header[_expires_at] = expires_at
+                    self._write_header(slot, header)
+            finally:
+                self._unlock_bucket(bucket)
+
+# ################################################################################################################################
+
+    def delete_expired(self):
+        """ Deletes all entries expired as of now. Also, returns all entries found to have expired by other operations
+        of this process.
+        """
+        def _action(slot, header, key, now, out):
+            if header[_expires_at] and now >= header[_expires_at]:
+                self._free(slot)
+                out.append(key)
+
+        with self._lock:
+            deleted = self._scan(None, None, 0, _action)
+            deleted.extend(self._expired_on_op)
+            self._expired_on_op[:] = []
+
+        return deleted
+
+# ################################################################################################################################
+
+    def clear(self):
+        """ Removes all entries from shared memory.
+        """
+        with self._lock:
+            if not self._mmap:
+                return
+
+            empty = b'\x00' * self.bucket_size
+
+            for bucket in range(_header_size, _header_size + self.bucket_count * self.bucket_size, self.bucket_size):
+                self._lock_bucket(bucket)
+                try:
+                    self._mmap[bucket:bucket + self.bucket_size] = empty
+                finally:
+                    self._unlock_bucket(bucket)
+
+            self._expired_on_op[:] = []
+            self.hits = 0
+            self.misses = 0
+            self.set_ops = 0
+            self.get_ops = 0
+
+# ################################################################################################################################
+
+    def _key_action(self, slot, header, key, now, out):
+        out.append(key)
+
+    def _entry_action(self, slot, header, key, now, out):
+        out.append((key, self._to_entry(key, header, self._read_value(slot, header))))
+
+    def keys(self):
+        return self._scan(None, None, 0, self._key_action)
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    def values(self):
+        return [entry for _, entry in self._scan(None, None, 0, self._entry_action)]
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def items(self):
+        return self._scan(None, None, 0, self._entry_action)
+
+    def iteritems(self):
+        return iter(self.items())
+
+# ################################################################################################################################
+
+    def keys_by_position(self):
+        """ Returns all keys, from the most to the least recently used one.
+        """
+        items = self.items()
+        items.sort(key=lambda item: max(item[1].last_read, item[1].last_write), reverse=True)
+        return [key for key, _ in items]
+
+# ################################################################################################################################
+
+    def get_slice(self, start, stop, step):
+        items = self.items()
+        items.sort(key=lambda item: max(item[1].last_read, item[1].last_write), reverse=True)
+
+        for position, (key, entry) in list(enumerate(items))[start:stop:step]:
+            as_dict = entry.to_dict()
+            as_dict['position'] = position
+            yield as_dict
+
+# ################################################################################################################################
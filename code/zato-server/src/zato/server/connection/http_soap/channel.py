@@ -520,6 +520,7 @@ class RequestHandler(object):
         if channel_item['cache_type']:
             cache_key, response = self.get_response_from_cache(service, raw_request, channel_item, channel_params, wsgi_environ)
             if response:
+                self.server.service_store.release_instance(service)
                 return response
 
         # Add any path params matched to WSGI environment so it can be easily accessible later on
@@ -537,6 +538,9 @@ class RequestHandler(object):
         if channel_item['cache_type']:
             self.set_response_in_cache(channel_item, cache_key, response)
 
+        # The response object is not shared with the next request the service instance may be reused for
+        self.server.service_store.release_instance(service)
+
         # Having used the cache or not, we can return the response now
         return response
 
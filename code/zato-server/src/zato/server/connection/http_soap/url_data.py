@@ -30,7 +30,7 @@ from zato.common.util.auth import on_basic_auth, on_wsse_pwd, WSSE
 from zato.common.util.url_dispatcher import get_match_target
 from zato.server.connection.http_soap import Forbidden, Unauthorized
 from zato.server.jwt import JWT
-from zato.url_dispatcher import CyURLData, Matcher
+from zato.url_dispatcher import CyURLData, default_match_cache_size, Matcher
 
 # ################################################################################################################################
 
@@ -87,7 +87,8 @@ class URLData(CyURLData, OAuthDataStore):
                  openstack_config=None, xpath_sec_config=None, tls_channel_sec_config=None, tls_key_cert_config=None, \
                  vault_conn_sec_config=None, kvdb=None, broker_client=None, odb=None, json_pointer_store=None, xpath_store=None,
                  jwt_secret=None, vault_conn_api=None):
-        super(URLData, self).__init__(channel_data)
+        super(URLData, self).__init__(channel_data,
+            int(worker.server.fs_server_config.http.get('url_match_cache_size', default_match_cache_size)))
         self.worker = worker # type: WorkerStore
         self.url_sec = url_sec
         self.basic_auth_config = basic_auth_config
@@ -669,7 +670,11 @@ class URLData(CyURLData, OAuthDataStore):
 
         # No error, let's delete channel info
         if match_idx != ZATO_NONE:
-            self.channel_data.pop(match_idx)
+            old_data = self.channel_data.pop(match_idx)
+
+            # Neither the cache nor the router can point to the deleted channel anymore
+            self.invalidate_channel_cache(old_data['match_target'])
+            self.rebuild_router()
 
 # ################################################################################################################################
 
@@ -1168,7 +1173,8 @@ class URLData(CyURLData, OAuthDataStore):
 
     def sort_channel_data(self):
         """ Sorts channel items by name and then re-arranges the result so that user-facing services are closer to the begining
-        of the list which makes it faster to look them up - searches in the list are O(n).
+        of the list. The order established here is the one that the router follows if more than one channel matches a request,
+        which is why the router is rebuilt each time the list is sorted.
         """
         channel_data = []
         user_services = []
@@ -1187,6 +1193,7 @@ class URLData(CyURLData, OAuthDataStore):
         channel_data.extend(internal_services)
 
         self.channel_data[:] = channel_data
+        self.rebuild_router()
 
 # ################################################################################################################################
 
@@ -1240,13 +1247,13 @@ class URLData(CyURLData, OAuthDataStore):
 
     def _create_channel(self, msg, old_data):
         """ Creates a new channel, both its core data and the related security definition.
-        Clears out URL cache for that entry, if it existed at all.
+        Clears out URL cache because the new channel may now be the one that matches targets cached for other channels.
         """
         match_target = get_match_target(msg, http_methods_allowed_re=self.worker.server.http_methods_allowed_re)
         self.channel_data.append(self._channel_item_from_msg(msg, match_target, old_data))
         self.url_sec[match_target] = self._sec_info_from_msg(msg)
 
-        self._remove_from_cache(match_target)
+        self.clear_cache()
         self.sort_channel_data()
 
 # ################################################################################################################################
@@ -1263,7 +1270,7 @@ class URLData(CyURLData, OAuthDataStore):
         }, http_methods_allowed_re=self.worker.server.http_methods_allowed_re)
 
         # Delete from URL cache
-        self._remove_from_cache(old_match_target)
+        self.invalidate_channel_cache(old_match_target)
 
         # In case of an internal error, we won't have the match all
         match_idx = ZATO_NONE
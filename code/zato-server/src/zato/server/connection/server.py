@@ -13,6 +13,9 @@ from contextlib import closing
 from logging import getLogger
 from traceback import format_exc
 
+# gevent
+from gevent import joinall, spawn
+
 # Zato
 from zato.client import AnyServiceInvoker
 from zato.common import SERVER_UP_STATUS
@@ -208,10 +211,55 @@ class Servers(object):
             for server in servers:
                 self._servers['{}@{}'.format(server.name, server.cluster_name)] = server
 
+# ################################################################################################################################
+
+    def _invoke_server_all_pids(self, server, service, request=None, *args, **kwargs):
+        """ Invokes a service on all processes of a single server, returning a combined response from all of them
+        and a flag indicating whether all PIDs that responded did it without errors.
+        """
+        # Will be set to False if there is at least one error message among all the worker processes.
+        out_ok = True
+
+        response = {
+            'is_ok': False,
+            'server_data': None,
+            'error_info': None,
+            'meta': {
+                'address': server.address,
+            }
+        }
+        try:
+
+            # This is a dictionary of responses for all PIDs of a given server
+            response['server_data'] = server.invoke_all_pids(service, request, *args, **kwargs).data
+
+            # A list of responses for that server from all its PIDs
+            per_pid_responses = response['server_data'].values()
+
+            server_is_ok = True
+
+            for per_pid_response in per_pid_responses:
+                per_pid_is_ok = per_pid_response['is_ok']
+
+                # We check all PIDs but break as soon as it is known that there was an error
+                if not per_pid_is_ok:
+                    out_ok = False
+                    server_is_ok = False
+
+                # Do not need to iterate anymore, we know there was an error
+                break
+
+            response['is_ok'] = server_is_ok
+        except Exception:
+            response['server_data'] = format_exc()
+
+        return out_ok, response
+
 # ################################################################################################################################
 
     def invoke_all(self, service, request=None, *args, **kwargs):
         """ Invokes a service on all servers, including all of their processes, and returns combined output.
+        All servers are invoked concurrently and each of them invokes its own processes concurrently too.
         """
         # Look up current state of servers in ODB
         self.populate_servers()
@@ -219,46 +267,20 @@ class Servers(object):
         # Server name -> Responses for all PIDs from that server
         out = {}
 
-        # Will be set to False if there is at least one error messages among all the servers and worker processes.
-        out_ok = True
+        greenlets = []
 
         for server in self._servers.values():
-
             if server.up_status == SERVER_UP_STATUS.RUNNING:
-                response = {
-                    'is_ok': False,
-                    'server_data': None,
-                    'error_info': None,
-                    'meta': {
-                        'address': server.address,
-                    }
-                }
-                try:
-
-                    # This is a dictionary of responses for all PIDs of a given server
-                    response['server_data'] = server.invoke_all_pids(service, request, *args, **kwargs).data
-
-                    # A list of responses for that server from all its PIDs
-                    per_pid_responses = response['server_data'].values()
-
-                    server_is_ok = True
-
-                    for per_pid_response in per_pid_responses:
-                        per_pid_is_ok = per_pid_response['is_ok']
-
-                        # We check all PIDs but break as soon as it is known that there was an error
-                        if not per_pid_is_ok:
-                            out_ok = False
-                            server_is_ok = False
-
-                        # Do not need to iterate anymore, we know there was an error
-                        break
-
-                    response['is_ok'] = server_is_ok
-                except Exception:
-                    response['server_data'] = format_exc()
-                finally:
-                    out[server.name] = response
+                greenlets.append((server.name, spawn(self._invoke_server_all_pids, server, service, request, *args, **kwargs)))
+
+        joinall([greenlet for _, greenlet in greenlets])
+
+        # Will be set to False if there is at least one error messages among all the servers and worker processes.
+        out_ok = True
+
+        for server_name, greenlet in greenlets:
+            server_out_ok, out[server_name] = greenlet.value
+            out_ok = out_ok and server_out_ok
 
         return out_ok, out
 
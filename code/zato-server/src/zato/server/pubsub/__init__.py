@@ -10,18 +10,24 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import logging
-from contextlib import closing
+from contextlib import closing, contextmanager
+from re import compile as re_compile
 from datetime import datetime
+from heapq import heapify, heappop, heappush
 from operator import attrgetter
 from traceback import format_exc
 
 # gevent
-from gevent import sleep, spawn
+from gevent import sleep, spawn, spawn_later
+from gevent.event import AsyncResult, Event
 from gevent.lock import RLock
 
 # globre
 from globre import compile as globre_compile
 
+# paste
+from paste.util.converters import asbool
+
 # Texttable
 from texttable import Texttable
 
@@ -36,15 +42,18 @@ from zato.common.odb.model import WebSocketClientPubSubKeys
 from zato.common.odb.query.pubsub.delivery import confirm_pubsub_msg_delivered as _confirm_pubsub_msg_delivered, \
      get_delivery_server_for_sub_key, get_sql_messages_by_msg_id_list as _get_sql_messages_by_msg_id_list, \
      get_sql_messages_by_sub_key as _get_sql_messages_by_sub_key, get_sql_msg_ids_by_sub_key as _get_sql_msg_ids_by_sub_key
+from zato.common.odb.query.pubsub.cleanup import cleanup_topic_batched
 from zato.common.odb.query.pubsub.queue import set_to_delete
+from zato.common.odb.query.pubsub.topic import get_gd_depth_topic
 from zato.common.pubsub import dict_keys, skip_to_external
-from zato.common.util import make_repr, new_cid, spawn_greenlet
+from zato.common.util import absolutize, make_repr, new_cid, spawn_greenlet
 from zato.common.util.event import EventLog
 from zato.common.util.hook import HookTool
 from zato.common.util.pubsub import make_short_msg_copy_from_dict
 from zato.common.util.python_ import get_current_stack
 from zato.common.util.time_ import utcnow_as_ms
 from zato.common.util.wsx import find_wsx_environ
+from zato.server.pubsub.journal import NonGDJournal
 
 # ################################################################################################################################
 
@@ -129,6 +138,94 @@ def get_expiration(cid, input, default_expiration=_default_expiration):
 
 # ################################################################################################################################
 
+class ShardedLock(object):
+    """ A fixed number of RLock objects, each of them guarding all the keys, e.g. topic IDs, that hash to it,
+    so that operations on unrelated keys do not need to wait for each other.
+    """
+    def __init__(self, size=64):
+        self.size = size
+        self.locks = [RLock() for _ in range(size)]
+
+    def __call__(self, key):
+        return self.locks[hash(key) % self.size]
+
+    @contextmanager
+    def all(self):
+        """ Acquires all the locks, always in the same order. Must not be called by a greenlet that already holds
+        one of them, otherwise it could deadlock with another greenlet waiting for that one.
+        """
+        for lock in self.locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(self.locks):
+                lock.release()
+
+# ################################################################################################################################
+
+class GDGroupCommit(object):
+    """ Collects GD messages that concurrent publishers send to the same topic so that they can be stored in SQL
+    in a single transaction. Each publisher is blocked until that transaction is committed, which means that its messages
+    are as durable as they are without group commits, but there is one commit for all the publishers in a group.
+    """
+    def __init__(self, topic_name, max_time, max_msg):
+        self.topic_name = topic_name
+        self.max_time = max_time / 1000.0 # Configuration uses milliseconds
+        self.max_msg = max_msg
+        self.pending = []
+        self.pending_msg = 0
+        self.timer = None
+
+    def publish(self, ctx, flush_func):
+        """ Adds GD messages from a single publication to the current group and waits until the group is stored in SQL.
+        Raises an exception if this publication's messages could not be stored.
+        """
+        result = AsyncResult()
+
+        self.pending.append((ctx, result))
+        self.pending_msg += len(ctx.gd_msg_list)
+
+        # There are enough messages to store them right away, from our own greenlet ..
+        if self.pending_msg >= self.max_msg:
+            self.flush(flush_func)
+
+        # .. otherwise, they will be stored when the group's time is up, unless the group fills up earlier.
+        elif not self.timer:
+            self.timer = spawn_later(self.max_time, self.flush, flush_func, True)
+
+        result.get()
+
+    def flush(self, flush_func, is_timer=False):
+        """ Stores all the pending messages through flush_func and releases the publishers waiting for them.
+        flush_func receives a list of publications and returns an exception or None for each of them.
+        """
+        pending, self.pending = self.pending, []
+        self.pending_msg = 0
+
+        # The timer is no longer needed if the group is stored because it is full
+        if self.timer:
+            if not is_timer:
+                self.timer.kill(block=False)
+            self.timer = None
+
+        if not pending:
+            return
+
+        try:
+            errors = flush_func([ctx for ctx, _ in pending])
+        except Exception as e:
+            logger.warn('Could not store GD messages for topic `%s` (%d), e:`%s`', self.topic_name, len(pending), format_exc())
+            errors = [e] * len(pending)
+
+        for (_, result), error in zip(pending, errors):
+            if error:
+                result.set_exception(error)
+            else:
+                result.set()
+
+# ################################################################################################################################
+
 class EventType:
 
     class Topic:
@@ -168,6 +265,56 @@ class ToDictBase(object):
 
 # ################################################################################################################################
 
+class TopicMatcher(object):
+    """ Finds the first of an endpoint's pub= or sub= patterns that matches a topic name. Patterns are combined into
+    alternations of a few regular expressions rather than tried one by one, and results are cached for each topic name.
+    """
+    # Python 2 supports at most 100 groups in a regular expression, and patterns may contain groups of their own
+    patterns_per_regex = 50
+
+    def __init__(self, patterns, max_cache_size=1000):
+        self.max_cache_size = max_cache_size
+        self.cache = {}
+
+        # A list of (regex, group name -> original pattern) tuples
+        self.regexes = []
+
+        # Patterns are [original, compiled] lists, in the order of precedence - since alternatives are tried left to right,
+        # the first pattern that matches in a combined regex is also the first one that would match on its own.
+        for idx in range(0, len(patterns), self.patterns_per_regex):
+            group_to_orig = {}
+            alternatives = []
+
+            for group_idx, (orig, matcher) in enumerate(patterns[idx:idx+self.patterns_per_regex]):
+                group_name = '_zato_{}'.format(group_idx)
+                group_to_orig[group_name] = orig
+                alternatives.append('(?P<{}>{})'.format(group_name, matcher.pattern))
+
+            self.regexes.append((re_compile('|'.join(alternatives), matcher.flags), group_to_orig))
+
+    def match(self, name):
+        """ Returns the original pattern that matches name, or None if there is none.
+        """
+        try:
+            return self.cache[name]
+        except KeyError:
+            out = None
+
+            for regex, group_to_orig in self.regexes:
+                match = regex.match(name)
+                if match:
+                    out = group_to_orig[match.lastgroup]
+                    break
+
+            # Topic names may be arbitrary so the cache starts afresh rather than grow without bound
+            if len(self.cache) >= self.max_cache_size:
+                self.cache.clear()
+
+            self.cache[name] = out
+            return out
+
+# ################################################################################################################################
+
 class Endpoint(ToDictBase):
     """ A publisher/subscriber in pub/sub workflows.
     """
@@ -192,6 +339,10 @@ class Endpoint(ToDictBase):
 
         self.set_up_patterns()
 
+        # Editing an endpoint creates a new Endpoint object so there is no need to ever invalidate these
+        self.pub_topic_matcher = TopicMatcher(self.pub_topic_patterns)
+        self.sub_topic_matcher = TopicMatcher(self.sub_topic_patterns)
+
 # ################################################################################################################################
 
     def __repr__(self):
@@ -269,6 +420,12 @@ class Topic(ToDictBase):
         self.event_log = EventLog('t.{}.{}.{}'.format(self.server_name, self.server_pid, self.name))
         self.set_hooks()
 
+        # GD messages from concurrent publishers are stored in shared SQL transactions if group commits are enabled
+        gd_group_commit_time = config.get('gd_group_commit_time') or PUBSUB.DEFAULT.GD_GROUP_COMMIT_TIME
+        gd_group_commit_max_msg = config.get('gd_group_commit_max_msg') or PUBSUB.DEFAULT.GD_GROUP_COMMIT_MAX_MSG
+        self.gd_group_commit = GDGroupCommit(self.name, gd_group_commit_time, gd_group_commit_max_msg) \
+            if gd_group_commit_time else None
+
         # For now, task sync interval is the same for GD and non-GD messages
         # so we can arbitrarily pick the former to serve for both types of messages.
         self.task_sync_interval = config.task_sync_interval / 1000.0
@@ -292,6 +449,14 @@ class Topic(ToDictBase):
         # The last time a GD message was published to this topic
         self.gd_pub_time_max = None
 
+        # How many GD messages are in this topic waiting for subscribers, i.e. not in any subscriber's queue yet,
+        # or None if it is not known and needs to be counted in SQL. In between periodic reconciliations with SQL,
+        # it is updated by publications from current server only.
+        self.gd_depth = None
+
+        # Value of self.msg_pub_counter_gd when the background maintenance task last cleaned up this topic's GD messages
+        self.gd_maintenance_counter = 0
+
 # ################################################################################################################################
 
     def _emit_set_hooks(self, ctx=None, _event=EventType.Topic.set_hooks):
@@ -409,8 +574,25 @@ class Topic(ToDictBase):
 
 # ################################################################################################################################
 
-    def needs_msg_cleanup(self):
-        return self.msg_pub_counter_gd % 10000 == 0
+    def get_next_sync_time(self):
+        """ Returns the earliest time at which subscribers can be notified about new messages published to this topic.
+        """
+        return self.last_synced + self.task_sync_interval
+
+# ################################################################################################################################
+
+    def incr_gd_depth(self, value):
+        """ Increases the cached GD depth of this topic, unless it is not known at all.
+        """
+        if self.gd_depth is not None:
+            self.gd_depth += value
+
+# ################################################################################################################################
+
+    def needs_gd_maintenance(self):
+        """ Returns True if there have been any GD messages published to this topic since its last maintenance.
+        """
+        return self.msg_pub_counter_gd != self.gd_maintenance_counter
 
 # ################################################################################################################################
 
@@ -511,13 +693,23 @@ class InRAMSyncBacklog(object):
     and will be ultimately delivered to them. Stores a list of sub_keys and all messages that a sub_key points to.
     It acts as a multi-key dict and keeps only a single copy of message for each sub_key.
     """
-    def __init__(self, pubsub):
+    def __init__(self, pubsub, topic_locks=None):
         self.pubsub = pubsub        # type: PubSub
         self.sub_key_to_msg_id = {} # Sub key  -> Msg ID set --- What messages are available for a given subcriber
         self.msg_id_to_sub_key = {} # Msg ID   -> Sub key set  - What subscribers are interested in a given message
         self.msg_id_to_msg = {}     # Msg ID   -> Message data - What is the actual contents of each message
         self.topic_msg_id = {}      # Topic ID -> Msg ID set --- What messages are available for each topic (no matter sub_key)
-        self.lock = RLock()
+
+        # Each message and each sub_key belong to exactly one topic so all of them are guarded by their topic's lock,
+        # which means that publishers and subscribers of unrelated topics do not need to wait for each other.
+        self.topic_locks = topic_locks or ShardedLock()
+
+        # A min-heap of (expiration_time, msg_id) tuples so that the cleanup task can find expired messages without
+        # having to iterate over all of them. Entries of messages deleted or updated in the meantime are not removed
+        # from the heap right away - they are skipped by the cleanup task and the heap is compacted once there are too many.
+        # New entries are pushed with a single topic's lock held, which is safe because heappush never switches greenlets,
+        # whereas popping and compacting always take place with all of the topic locks held.
+        self.expiration_heap = []
 
         # Start in background a cleanup task that deletes all expired and removed messages
         spawn_greenlet(self.run_cleanup_task)
@@ -527,7 +719,11 @@ class InRAMSyncBacklog(object):
     def add_messages(self, cid, topic_id, topic_name, max_depth, sub_keys, messages, _default_pri=PUBSUB.PRIORITY.DEFAULT):
         """ Adds all input messages to sub_keys for the topic.
         """
-        with self.lock:
+        with self.topic_locks(topic_id):
+
+            # Record the messages for all sub_keys, including these that they may overflow for below
+            if self.pubsub.journal:
+                self.pubsub.journal.add(messages, sub_keys)
 
             # Local aliases
             msg_ids = [msg['pub_msg_id'] for msg in messages]
@@ -538,7 +734,7 @@ class InRAMSyncBacklog(object):
             for sub_key in sub_keys:
 
                 # .. but first, make sure that storing these messages would not overflow the topic's depth,
-                # if it could exceed the max depth, store the messages in log files only ..
+                # if it could exceed the max depth, store the messages in log files (and the journal) only ..
                 if len(topic_messages) + len_messages > max_depth:
                     self.log_messages_to_store(cid, topic_name, max_depth, sub_key, messages)
 
@@ -553,6 +749,9 @@ class InRAMSyncBacklog(object):
             for msg in messages:
                 self.msg_id_to_msg[msg['pub_msg_id']] = msg
 
+                # .. make it known when it expires ..
+                heappush(self.expiration_heap, (msg['expiration_time'], msg['pub_msg_id']))
+
                 # .. attach server metadata ..
                 msg['server_name'] = self.pubsub.server.name
                 msg['server_pid'] = self.pubsub.server.pid
@@ -571,16 +770,32 @@ class InRAMSyncBacklog(object):
 # ################################################################################################################################
 
     def update_msg(self, msg, _update_attrs=_update_attrs, _warn='No such message in sync backlog `%s`'):
-        with self.lock:
+
+        # We need to know the message's topic before we can acquire its lock ..
+        _msg = self.msg_id_to_msg.get(msg['msg_id'])
+        if not _msg:
+            logger.warn(_warn, msg['msg_id'])
+            logger_zato.warn(_warn, msg['msg_id'])
+            return False # No such message
+
+        with self.topic_locks(_msg['topic_id']):
+
+            # .. and the message may have been deleted before we acquired it.
             _msg = self.msg_id_to_msg.get(msg['msg_id'])
             if not _msg:
                 logger.warn(_warn, msg['msg_id'])
                 logger_zato.warn(_warn, msg['msg_id'])
                 return False # No such message
             else:
+                expiration_time = _msg['expiration_time']
+
                 for attr in _update_attrs:
                     _msg[attr] = msg[attr]
 
+                # The previous entry in the heap will be skipped because its expiration time will not match
+                if _msg['expiration_time'] != expiration_time:
+                    heappush(self.expiration_heap, (_msg['expiration_time'], _msg['pub_msg_id']))
+
                 # Ok, found and updated
                 return True
 
@@ -594,10 +809,13 @@ class InRAMSyncBacklog(object):
 # ################################################################################################################################
 
     def _delete_messages(self, msg_list):
-        """ Low-level implementation of self.delete_messages - must be called with self.lock held.
+        """ Low-level implementation of self.delete_messages - must be called with all of self.topic_locks held.
         """
         logger.info('Deleting non-GD messages `%s`', msg_list)
 
+        if self.pubsub.journal:
+            self.pubsub.journal.ack(msg_list)
+
         for msg_id in list(msg_list):
 
             found_to_sub_key = self.msg_id_to_sub_key.pop(msg_id, None)
@@ -643,21 +861,21 @@ class InRAMSyncBacklog(object):
     def delete_messages(self, msg_list):
         """ Deletes all messages from input msg_list.
         """
-        with self.lock:
+        with self.topic_locks.all():
             self._delete_messages(msg_list)
 
 # ################################################################################################################################
 
     def has_messages_by_sub_key(self, sub_key):
-        with self.lock:
-            return len(self.sub_key_to_msg_id.get(sub_key, [])) > 0
+        # No lock is needed for a single look-up, and we do not know sub_key's topic here anyway
+        return len(self.sub_key_to_msg_id.get(sub_key, [])) > 0
 
 # ################################################################################################################################
 
     def clear_topic(self, topic_id):
         logger.info('Clearing topic `%s` (id:%s)', self.pubsub.get_topic_by_id(topic_id).name, topic_id)
 
-        with self.lock:
+        with self.topic_locks.all():
             # Not all servers will have messages for the topic, hence .get
             messages = self.topic_msg_id.get(topic_id) or []
             if messages:
@@ -667,7 +885,7 @@ class InRAMSyncBacklog(object):
 # ################################################################################################################################
 
     def _get_delete_messages_by_sub_keys(self, topic_id, sub_keys, delete_msg=True, delete_sub=False):
-        """ Low-level implementation of retrieve_messages_by_sub_keys which must be called with self.lock held.
+        """ Low-level implementation of retrieve_messages_by_sub_keys which must be called with topic_id's lock held.
         """
         now = utcnow_as_ms() # We cannot return expired messages
         msg_seen = set() # We cannot have duplicates on output
@@ -747,15 +965,21 @@ class InRAMSyncBacklog(object):
     def retrieve_messages_by_sub_keys(self, topic_id, sub_keys):
         """ Retrieves and returns all messages matching input - messages are deleted from RAM.
         """
-        with self.lock:
-            return self._get_delete_messages_by_sub_keys(topic_id, sub_keys)
+        with self.topic_locks(topic_id):
+            out = self._get_delete_messages_by_sub_keys(topic_id, sub_keys)
+
+            # Whoever retrieves the messages will record them in its own journal
+            if self.pubsub.journal and out:
+                self.pubsub.journal.ack([msg['pub_msg_id'] for msg in out], sub_keys)
+
+            return out
 
 # ################################################################################################################################
 
     def get_messages_by_topic_id(self, topic_id, needs_short_copy, query=None):
         """ Returns messages for topic by its ID, optionally with pagination and filtering by input query.
         """
-        with self.lock:
+        with self.topic_locks(topic_id):
             msg_id_list = self.topic_msg_id.get(topic_id, [])
             if not msg_id_list:
                 return []
@@ -782,8 +1006,7 @@ class InRAMSyncBacklog(object):
 # ################################################################################################################################
 
     def get_message_by_id(self, msg_id):
-        with self.lock:
-            return self.msg_id_to_msg[msg_id]
+        return self.msg_id_to_msg[msg_id]
 
 # ################################################################################################################################
 
@@ -791,7 +1014,7 @@ class InRAMSyncBacklog(object):
         """ Unsubscribes all the sub_keys from the input topic.
         """
         # Always acquire a lock for this kind of operation
-        with self.lock:
+        with self.topic_locks(topic_id):
 
             # For each sub_key ..
             for sub_key in sub_keys:
@@ -815,70 +1038,131 @@ class InRAMSyncBacklog(object):
                         topic_msg = self.topic_msg_id[topic_id]
                         topic_msg.remove(msg_id)
 
+            if self.pubsub.journal:
+                self.pubsub.journal.ack(None, sub_keys)
+
         logger.info(pattern, sub_keys, topic_name)
         logger_zato.info(pattern, sub_keys, topic_name)
 
 # ################################################################################################################################
 
-    def run_cleanup_task(self, _utcnow=utcnow_as_ms, _sleep=sleep):
-        """ A background task waking up periodically to remove all expired and retrieved messages from backlog.
+    def _pop_expired_messages(self, now, chunk_size):
+        """ Removes from the expiration heap and returns up to chunk_size messages that are expired as of now.
+        Must be called with all of self.topic_locks held.
         """
-        while True:
-            try:
-                with self.lock:
+        out = []
+        msg_ids = set()
 
-                    # Local alias
-                    publishers = {}
+        while self.expiration_heap and len(out) < chunk_size:
 
-                    # We keep them separate so as not to modify any objects during iteration.
-                    expired_msg = []
+            expiration_time, msg_id = self.expiration_heap[0]
 
-                    # Calling it once will suffice.
-                    now = _utcnow()
+            # The heap is sorted by expiration time so there are no more expired messages
+            if now < expiration_time:
+                break
 
-                    for msg_id, msg in iteritems(self.msg_id_to_msg):
+            heappop(self.expiration_heap)
 
-                        if now >= msg['expiration_time']:
+            # Skip messages that were already deleted or whose expiration time was updated,
+            # as well as ones whose expiration time was changed back to a value already in the heap.
+            if msg_id in msg_ids:
+                continue
 
-                            # It's possible that there will be many expired messages all sent by the same publisher
-                            # so there is no need to query self.pubsub for each message.
-                            if msg['published_by_id'] not in publishers:
-                                publishers[msg['published_by_id']] = self.pubsub.get_endpoint_by_id(msg['published_by_id'])
+            msg = self.msg_id_to_msg.get(msg_id)
+            if msg and msg['expiration_time'] == expiration_time:
+                out.append(msg)
+                msg_ids.add(msg_id)
 
-                            # We can be sure that it is always found
-                            publisher = publishers[msg['published_by_id']]
+        return out
+
+# ################################################################################################################################
 
-                            # Log the message to make sure the expiration event is always logged ..
-                            logger_zato.info('Found an expired msg:`%s`, topic:`%s`, publisher:`%s`, pub_time:`%s`, exp:`%s`',
-                                msg['pub_msg_id'], msg['topic_name'], publisher.name, msg['pub_time'], msg['expiration'])
+    def _delete_expired_messages(self, expired, publishers):
+        """ Deletes input expired messages from all in-RAM structures. Must be called with all of self.topic_locks held.
+        """
+        for msg in expired:
 
-                            # .. and append it to the list of messages to be deleted.
-                            expired_msg.append((msg['pub_msg_id'], msg['topic_id']))
+            msg_id = msg['pub_msg_id']
 
-                    # For logging what was done
-                    len_expired = len(expired_msg)
+            # It's possible that there will be many expired messages all sent by the same publisher
+            # so there is no need to query self.pubsub for each message.
+            if msg['published_by_id'] not in publishers:
+                publishers[msg['published_by_id']] = self.pubsub.get_endpoint_by_id(msg['published_by_id'])
 
-                    # Iterate over all the expired messages found and delete them from in-RAM structures
-                    for msg_id, topic_id in expired_msg:
+            # We can be sure that it is always found
+            publisher = publishers[msg['published_by_id']]
 
-                        # Get all sub_keys waiting for these messages and delete the message from each one,
-                        # but note that there may be possibly no subscribers at all if the message was published
-                        # to a topic without any subscribers.
-                        for sub_key in self.msg_id_to_sub_key.pop(msg_id):
-                            self.sub_key_to_msg_id[sub_key].remove(msg_id)
+            # Log the message to make sure the expiration event is always logged
+            logger_zato.info('Found an expired msg:`%s`, topic:`%s`, publisher:`%s`, pub_time:`%s`, exp:`%s`',
+                msg_id, msg['topic_name'], publisher.name, msg['pub_time'], msg['expiration'])
 
-                        # Remove all references to the message from topic
-                        self.topic_msg_id[topic_id].remove(msg_id)
+            # Get all sub_keys waiting for these messages and delete the message from each one,
+            # but note that there may be possibly no subscribers at all if the message was published
+            # to a topic without any subscribers.
+            for sub_key in self.msg_id_to_sub_key.pop(msg_id, ()):
+                self.sub_key_to_msg_id[sub_key].discard(msg_id)
 
-                        # And finally, remove the message's contents
-                        del self.msg_id_to_msg[msg_id]
+            # Remove all references to the message from topic
+            self.topic_msg_id[msg['topic_id']].discard(msg_id)
+
+            # And finally, remove the message's contents
+            del self.msg_id_to_msg[msg_id]
+
+# ################################################################################################################################
+
+    def _compact_expiration_heap(self):
+        """ Rebuilds the expiration heap out of messages currently in RAM only.
+        Must be called with all of self.topic_locks held.
+        """
+        self.expiration_heap[:] = [(msg['expiration_time'], msg_id) for msg_id, msg in iteritems(self.msg_id_to_msg)]
+        heapify(self.expiration_heap)
+
+# ################################################################################################################################
+
+    def run_cleanup_task(self, chunk_size=1000, compact_ratio=2, _utcnow=utcnow_as_ms, _sleep=sleep):
+        """ A background task waking up periodically to remove all expired and retrieved messages from backlog.
+        Expired messages are deleted in chunks of up to chunk_size, with self.topic_locks released between chunks
+        so as not to stall publishers when a lot of messages expire at the same time.
+        """
+        while True:
+            try:
+
+                # Local alias
+                publishers = {}
+
+                # For logging what was done
+                len_expired = 0
+
+                # Calling it once will suffice.
+                now = _utcnow()
+
+                while True:
+                    with self.topic_locks.all():
+                        expired = self._pop_expired_messages(now, chunk_size)
+                        self._delete_expired_messages(expired, publishers)
 
-                suffix = 's' if (len_expired==0 or len_expired > 1) else ''
-                len_messages = len(self.msg_id_to_msg)
-                if len_expired or len_messages:
-                    logger.info('In-RAM. Deleted %s pub/sub message%s. Left:%s' % (len_expired, suffix, self.msg_id_to_msg))
+                    len_expired += len(expired)
 
-                # Sleep for a moment before checking again but don't do it with self.lock held.
+                    # We have found all the expired messages ..
+                    if len(expired) < chunk_size:
+                        break
+
+                    # .. or there may be more of them, in which case we let other greenlets run before we continue.
+                    _sleep(0)
+
+                with self.topic_locks.all():
+
+                    # Remove entries of messages that were deleted before they expired, e.g. because they were delivered,
+                    # but only if there are many of them - otherwise, they will be skipped once they expire.
+                    len_messages = len(self.msg_id_to_msg)
+                    if len(self.expiration_heap) > compact_ratio * len_messages + chunk_size:
+                        self._compact_expiration_heap()
+
+                if len_expired:
+                    suffix = '' if len_expired == 1 else 's'
+                    logger.info('In-RAM. Deleted %s pub/sub message%s. Left:%s', len_expired, suffix, len_messages)
+
+                # Sleep for a moment before checking again but don't do it with self.topic_locks held.
                 _sleep(2)
 
             except Exception:
@@ -899,7 +1183,8 @@ class InRAMSyncBacklog(object):
         logger.warn(msg, *args)
         logger_zato.warn(msg, *args)
 
-        # Store messages in logger - by default will go to disk
+        # Store messages in logger - by default will go to disk. If there is a journal, the messages have been
+        # already added to it too, so they will be replayed on startup, unless they expire or are deleted before that.
         logger_overflow.info('CID:%s, topic:`%s`, sub_key:%s, messages:%s', cid, topic_name, sub_key, messages)
 
 # ################################################################################################################################
@@ -907,7 +1192,7 @@ class InRAMSyncBacklog(object):
     def get_topic_depth(self, topic_id, _default=set()):
         """ Returns depth of a given in-RAM queue for the topic.
         """
-        with self.lock:
+        with self.topic_locks(topic_id):
             return len(self.topic_msg_id.get(topic_id, _default))
 
 # ################################################################################################################################
@@ -919,8 +1204,28 @@ class PubSub(object):
         self.server = server
         self.broker_client = broker_client
         self.event_log = EventLog('ps.{}.{}.{}'.format(self.cluster_id, self.server.name, self.server.pid))
-        self.lock = RLock()
         self.keep_running = True
+
+        # Guards changes to the maps of endpoints, topics, subscriptions and sub_key servers below. Each change replaces
+        # a map with its modified copy instead of updating it in place, which means that look-ups, far more frequent
+        # than changes, do not need to acquire this lock at all.
+        self.lock = RLock()
+
+        # Guards per-topic state, e.g. flags telling whether there are new messages for a topic. Shared with the in-RAM
+        # backlog so that publishers and the notification task need to wait only for others using the same topic.
+        self.topic_locks = ShardedLock()
+
+        # Guards message counters only
+        self.counter_lock = RLock()
+
+        # A min-heap of (next_sync_time, topic_id) tuples of topics that have had messages published since they were last
+        # synced with their subscribers, along with a set of IDs of these topics, so that the notification task
+        # never needs to go through topics that have no new messages.
+        self.sync_heap = []
+        self.sync_heap_topics = set()
+
+        # Set each time a topic is added to the heap so that the notification task can wake up earlier than it planned to
+        self.sync_event = Event()
         self.sk_server_table_columns = self.server.fs_server_config.pubsub.get('sk_server_table_columns') or \
             default_sk_server_table_columns
 
@@ -944,8 +1249,21 @@ class PubSub(object):
         self.pubsub_tool_by_sub_key = {}       # Sub key        -> PubSubTool object
         self.pubsub_tools = []                 # A list of PubSubTool objects, each containing delivery tasks
 
+        # An optional journal of non-GD messages that lets them be replayed after a restart
+        self.journal = None # type: NonGDJournal
+
+        if asbool(server.fs_server_config.pubsub.get('journal_enabled', False)):
+            self.journal = NonGDJournal(
+                absolutize(server.fs_server_config.pubsub.get('journal_dir') or PUBSUB.DEFAULT.JOURNAL_DIR, server.base_dir),
+                int(server.fs_server_config.pubsub.get('journal_segment_size') or PUBSUB.DEFAULT.JOURNAL_SEGMENT_SIZE),
+                recovery_grace_period=int(server.fs_server_config.pubsub.get('journal_recovery_grace_period') or
+                    PUBSUB.DEFAULT.JOURNAL_RECOVERY_GRACE_PERIOD))
+
+            spawn_greenlet(self.journal.run_compaction_task,
+                int(server.fs_server_config.pubsub.get('journal_compact_interval') or PUBSUB.DEFAULT.JOURNAL_COMPACT_INTERVAL))
+
         # A backlog of messages that have at least one subscription, i.e. this is what delivery servers use.
-        self.sync_backlog = InRAMSyncBacklog(self)
+        self.sync_backlog = InRAMSyncBacklog(self, self.topic_locks)
 
         # Getter methods for each endpoint type that return actual endpoints,
         # e.g. REST outgoing connections. Values are set by worker store.
@@ -970,10 +1288,18 @@ class PubSub(object):
         self.data_prefix_len = server.fs_server_config.pubsub.data_prefix_len
         self.data_prefix_short_len = server.fs_server_config.pubsub.data_prefix_short_len
 
+        # How often to delete GD messages that are no longer needed and to count GD messages in topics,
+        # and how many rows at most to delete in one transaction.
+        self.gd_maintenance_interval = int(server.fs_server_config.pubsub.get('gd_maintenance_interval') or
+            PUBSUB.DEFAULT.GD_MAINTENANCE_INTERVAL)
+        self.gd_cleanup_batch_size = int(server.fs_server_config.pubsub.get('gd_cleanup_batch_size') or
+            PUBSUB.DEFAULT.GD_CLEANUP_BATCH_SIZE)
+
         # Manages access to service hooks
         self.hook_tool = HookTool(self.server, HookCtx, hook_type_to_method, self.invoke_service)
 
         spawn_greenlet(self.trigger_notify_pubsub_tasks)
+        spawn_greenlet(self.run_gd_maintenance_task)
 
 # ################################################################################################################################
 
@@ -985,7 +1311,7 @@ class PubSub(object):
 # ################################################################################################################################
 
     def incr_pubsub_msg_counter(self, endpoint_id):
-        with self.lock:
+        with self.counter_lock:
 
             # Update the overall counter
             self.msg_pub_counter += 1
@@ -999,71 +1325,64 @@ class PubSub(object):
 # ################################################################################################################################
 
     def needs_endpoint_meta_update(self, endpoint_id):
-        with self.lock:
-            return self.endpoint_msg_counter[endpoint_id] % self.endpoint_meta_store_frequency == 0
+        return self.endpoint_msg_counter[endpoint_id] % self.endpoint_meta_store_frequency == 0
 
 # ################################################################################################################################
 
     def get_subscriptions_by_topic(self, topic_name, require_backlog_messages=False):
-        with self.lock:
-            subs = self.subscriptions_by_topic.get(topic_name, [])
-            if require_backlog_messages:
-                out = []
-                for item in subs:
-                    if self.sync_backlog.has_messages_by_sub_key(item.sub_key):
-                        out.append(item)
-                return out
-            else:
-                return subs
+        subs = self.subscriptions_by_topic.get(topic_name, [])
+        if require_backlog_messages:
+            out = []
+            for item in subs:
+                if self.sync_backlog.has_messages_by_sub_key(item.sub_key):
+                    out.append(item)
+            return out
+        else:
+            return subs
 
 # ################################################################################################################################
 
     def _get_subscription_by_sub_key(self, sub_key):
-        """ Low-level implementation of self.get_subscription_by_sub_key, must be called with self.lock held.
+        """ Low-level implementation of self.get_subscription_by_sub_key.
         """
         return self.subscriptions_by_sub_key[sub_key]
 
 # ################################################################################################################################
 
     def get_subscription_by_sub_key(self, sub_key):
-        with self.lock:
-            try:
-                return self._get_subscription_by_sub_key(sub_key)
-            except KeyError:
-                return None
+        try:
+            return self._get_subscription_by_sub_key(sub_key)
+        except KeyError:
+            return None
 
 # ################################################################################################################################
 
     def get_subscription_by_id(self, sub_id):
-        with self.lock:
-            for sub in itervalues(self.subscriptions_by_sub_key):
-                if sub.id == sub_id:
-                    return sub
+        for sub in itervalues(self.subscriptions_by_sub_key):
+            if sub.id == sub_id:
+                return sub
 
 # ################################################################################################################################
 
     def get_subscription_by_ext_client_id(self, ext_client_id):
-        with self.lock:
-            for sub in itervalues(self.subscriptions_by_sub_key):
-                if sub.ext_client_id == ext_client_id:
-                    return sub
+        for sub in itervalues(self.subscriptions_by_sub_key):
+            if sub.ext_client_id == ext_client_id:
+                return sub
 
 # ################################################################################################################################
 
     def has_sub_key(self, sub_key):
-        with self.lock:
-            return sub_key in self.subscriptions_by_sub_key
+        return sub_key in self.subscriptions_by_sub_key
 
 # ################################################################################################################################
 
     def has_messages_in_backlog(self, sub_key):
-        with self.lock:
-            return self.sync_backlog.has_messages_by_sub_key(sub_key)
+        return self.sync_backlog.has_messages_by_sub_key(sub_key)
 
 # ################################################################################################################################
 
     def _len_subscribers(self, topic_name):
-        """ Low-level implementation of self.len_subscribers, must be called with self.lock held.
+        """ Low-level implementation of self.len_subscribers.
         """
         return len(self.subscriptions_by_topic[topic_name])
 
@@ -1072,79 +1391,70 @@ class PubSub(object):
     def len_subscribers(self, topic_name):
         """ Returns the amount of subscribers for a given topic.
         """
-        with self.lock:
-            return self._len_subscribers(topic_name)
+        return self._len_subscribers(topic_name)
 
 # ################################################################################################################################
 
     def has_subscribers(self, topic_name):
         """ Returns True if input topic has at least one subscriber.
         """
-        with self.lock:
-            return self._len_subscribers(topic_name) > 0
+        return self._len_subscribers(topic_name) > 0
 
 # ################################################################################################################################
 
     def has_topic_by_name(self, topic_name):
-        with self.lock:
-            try:
-                self._get_topic_by_name(topic_name)
-            except KeyError:
-                return False
-            else:
-                return True
+        try:
+            self._get_topic_by_name(topic_name)
+        except KeyError:
+            return False
+        else:
+            return True
 
 # ################################################################################################################################
 
     def has_topic_by_id(self, topic_id):
-        with self.lock:
-            try:
-                self.topics[topic_id]
-            except KeyError:
-                return False
-            else:
-                return True
+        try:
+            self.topics[topic_id]
+        except KeyError:
+            return False
+        else:
+            return True
 
 # ################################################################################################################################
 
     def get_endpoint_by_id(self, endpoint_id):
-        with self.lock:
-            return self.endpoints[endpoint_id]
+        return self.endpoints[endpoint_id]
 
 # ################################################################################################################################
 
     def get_endpoint_by_name(self, endpoint_name):
-        with self.lock:
-            for endpoint in self.endpoints.values():
-                if endpoint.name == endpoint_name:
-                    return endpoint
-            else:
-                raise KeyError('Could not find endpoint by name `{}` among `{}`'.format(endpoint_name, self.endpoints))
+        endpoints = self.endpoints
+        for endpoint in endpoints.values():
+            if endpoint.name == endpoint_name:
+                return endpoint
+        else:
+            raise KeyError('Could not find endpoint by name `{}` among `{}`'.format(endpoint_name, endpoints))
 
 # ################################################################################################################################
 
     def get_endpoint_id_by_sec_id(self, sec_id):
-        with self.lock:
-            return self.sec_id_to_endpoint_id[sec_id]
+        return self.sec_id_to_endpoint_id[sec_id]
 
 # ################################################################################################################################
 
     def get_endpoint_id_by_ws_channel_id(self, ws_channel_id):
-        with self.lock:
-            return self.ws_channel_id_to_endpoint_id[ws_channel_id]
+        return self.ws_channel_id_to_endpoint_id[ws_channel_id]
 
 # ################################################################################################################################
 
     def get_endpoint_by_ws_channel_id(self, ws_channel_id):
-        with self.lock:
-            endpoint_id = self.ws_channel_id_to_endpoint_id[ws_channel_id]
-            return self.endpoints[endpoint_id]
+        endpoint_id = self.ws_channel_id_to_endpoint_id[ws_channel_id]
+        return self.endpoints[endpoint_id]
 
 # ################################################################################################################################
 
     def get_endpoint_id_by_service_id(self, service_id):
-        with self.lock:
-            return self.service_id_to_endpoint_id[service_id]
+        return self.service_id_to_endpoint_id[service_id]
 
 # ################################################################################################################################
 
@@ -1154,16 +1464,14 @@ class PubSub(object):
 # ################################################################################################################################
 
     def get_topic_id_by_name(self, topic_name):
-        with self.lock:
-            return self._get_topic_id_by_name(topic_name)
+        return self._get_topic_id_by_name(topic_name)
 
 # ################################################################################################################################
 
     def get_non_gd_topic_depth(self, topic_name):
         """ Returns of non-GD messages for a given topic by its name.
         """
-        with self.lock:
-            return self.sync_backlog.get_topic_depth(self._get_topic_id_by_name(topic_name))
+        return self.sync_backlog.get_topic_depth(self._get_topic_id_by_name(topic_name))
 
 # ################################################################################################################################
 
@@ -1175,32 +1483,29 @@ class PubSub(object):
 # ################################################################################################################################
 
     def get_topic_by_name(self, topic_name):
-        with self.lock:
-            return self._get_topic_by_name(topic_name)
+        return self._get_topic_by_name(topic_name)
 
 # ################################################################################################################################
 
     def _get_topic_by_id(self, topic_id):
-        """ Low-level implementation of self.get_topic_by_id, must be called with self.lock held.
+        """ Low-level implementation of self.get_topic_by_id.
         """
         return self.topics[topic_id]
 
 # ################################################################################################################################
 
     def get_topic_by_id(self, topic_id):
-        with self.lock:
-            return self._get_topic_by_id(topic_id)
+        return self._get_topic_by_id(topic_id)
 
 # ################################################################################################################################
 
     def get_topic_name_by_sub_key(self, sub_key):
-        with self.lock:
-            return self._get_subscription_by_sub_key(sub_key).topic_name
+        return self._get_subscription_by_sub_key(sub_key).topic_name
 
 # ################################################################################################################################
 
     def _get_endpoint_by_id(self, endpoint_id):
-        """ Returns an endpoint by ID, must be called with self.lock held.
+        """ Returns an endpoint by ID.
         """
         return self.endpoints[endpoint_id]
 
@@ -1208,9 +1513,8 @@ class PubSub(object):
 
     def get_sub_key_to_topic_name_dict(self, sub_key_list):
         out = {}
-        with self.lock:
-            for sub_key in sub_key_list:
-                out[sub_key] = self._get_subscription_by_sub_key(sub_key).topic_name
+        for sub_key in sub_key_list:
+            out[sub_key] = self._get_subscription_by_sub_key(sub_key).topic_name
 
         return out
 
@@ -1222,31 +1526,50 @@ class PubSub(object):
 # ################################################################################################################################
 
     def get_topic_by_sub_key(self, sub_key):
-        with self.lock:
-            return self._get_topic_by_sub_key(sub_key)
+        return self._get_topic_by_sub_key(sub_key)
 
 # ################################################################################################################################
 
     def get_topic_list_by_sub_key_list(self, sk_list):
         out = {}
-        with self.lock:
-            for sub_key in sk_list:
-                out[sub_key] = self._get_topic_by_sub_key(sub_key)
+        for sub_key in sk_list:
+            out[sub_key] = self._get_topic_by_sub_key(sub_key)
         return out
 
 # ################################################################################################################################
 
-    def _create_endpoint(self, config):
-        self.endpoints[config.id] = Endpoint(config)
+    def _create_endpoints(self, config_list):
+        """ Low-level implementation of self.create_endpoint and self.create_endpoints, must be called with self.lock held.
+        Each map is copied once for all the endpoints given on input rather than once per endpoint.
+        """
+        endpoints = dict(self.endpoints)
+        sec_id_to_endpoint_id = dict(self.sec_id_to_endpoint_id)
+        ws_channel_id_to_endpoint_id = dict(self.ws_channel_id_to_endpoint_id)
+        service_id_to_endpoint_id = dict(self.service_id_to_endpoint_id)
+
+        for config in config_list:
+            endpoints[config.id] = Endpoint(config)
+
+            if config['security_id']:
+                sec_id_to_endpoint_id[config['security_id']] = config.id
 
-        if config['security_id']:
-            self.sec_id_to_endpoint_id[config['security_id']] = config.id
+            if config['ws_channel_id']:
+                ws_channel_id_to_endpoint_id[config['ws_channel_id']] = config.id
 
-        if config['ws_channel_id']:
-            self.ws_channel_id_to_endpoint_id[config['ws_channel_id']] = config.id
+            if config['service_id']:
+                service_id_to_endpoint_id[config['service_id']] = config.id
 
-        if config['service_id']:
-            self.service_id_to_endpoint_id[config['service_id']] = config.id
+        self.endpoints = endpoints
+        self.sec_id_to_endpoint_id = sec_id_to_endpoint_id
+        self.ws_channel_id_to_endpoint_id = ws_channel_id_to_endpoint_id
+        self.service_id_to_endpoint_id = service_id_to_endpoint_id
+
+# ################################################################################################################################
+
+    def _create_endpoint(self, config):
+        """ Low-level implementation of self.create_endpoint, must be called with self.lock held.
+        """
+        self._create_endpoints([config])
 
 # ################################################################################################################################
 
@@ -1254,10 +1577,22 @@ class PubSub(object):
         with self.lock:
             self._create_endpoint(config)
 
+# ################################################################################################################################
+
+    def create_endpoints(self, config_list):
+        """ Creates many endpoints at once, e.g. when the server starts.
+        """
+        with self.lock:
+            self._create_endpoints(config_list)
+
 # ################################################################################################################################
 
     def _delete_endpoint(self, endpoint_id):
-        del self.endpoints[endpoint_id]
+        """ Low-level implementation of self.delete_endpoint, must be called with self.lock held.
+        """
+        endpoints = dict(self.endpoints)
+        del endpoints[endpoint_id]
+        self.endpoints = endpoints
 
         sec_id = None
         ws_chan_id = None
@@ -1279,13 +1614,19 @@ class PubSub(object):
                 break
 
         if sec_id:
-            del self.sec_id_to_endpoint_id[sec_id]
+            sec_id_to_endpoint_id = dict(self.sec_id_to_endpoint_id)
+            del sec_id_to_endpoint_id[sec_id]
+            self.sec_id_to_endpoint_id = sec_id_to_endpoint_id
 
         if ws_chan_id:
-            del self.ws_channel_id_to_endpoint_id[ws_chan_id]
+            ws_channel_id_to_endpoint_id = dict(self.ws_channel_id_to_endpoint_id)
+            del ws_channel_id_to_endpoint_id[ws_chan_id]
+            self.ws_channel_id_to_endpoint_id = ws_channel_id_to_endpoint_id
 
         if service_id:
-            del self.service_id_to_endpoint_id[service_id]
+            service_id_to_endpoint_id = dict(self.service_id_to_endpoint_id)
+            del service_id_to_endpoint_id[service_id]
+            self.service_id_to_endpoint_id = service_id_to_endpoint_id
 
 # ################################################################################################################################
 
@@ -1310,15 +1651,37 @@ class PubSub(object):
 
 # ################################################################################################################################
 
-    def _add_subscription(self, config):
-        """ Low-level implementation of self.add_subscription.
+    def _add_subscriptions(self, config_list):
+        """ Low-level implementation of self.add_subscription and self._subscribe_many, must be called with self.lock held.
+        Each map, and each list of subscriptions to a topic, is copied once for all the subscriptions given on input
+        rather than once per subscription.
         """
-        sub = Subscription(config)
+        subscriptions_by_topic = dict(self.subscriptions_by_topic)
+        subscriptions_by_sub_key = dict(self._subscriptions_by_sub_key)
+
+        # Names of topics whose lists of subscriptions have been already copied
+        copied = set()
 
-        existing_by_topic = self.subscriptions_by_topic.setdefault(config.topic_name, [])
-        existing_by_topic.append(sub)
+        for config in config_list:
+            sub = Subscription(config)
+
+            if config.topic_name in copied:
+                subscriptions_by_topic[config.topic_name].append(sub)
+            else:
+                subscriptions_by_topic[config.topic_name] = subscriptions_by_topic.get(config.topic_name, []) + [sub]
+                copied.add(config.topic_name)
 
-        self.subscriptions_by_sub_key[config.sub_key] = sub
+            subscriptions_by_sub_key[config.sub_key] = sub
+
+        self.subscriptions_by_topic = subscriptions_by_topic
+        self._subscriptions_by_sub_key = subscriptions_by_sub_key
+
+# ################################################################################################################################
+
+    def _add_subscription(self, config):
+        """ Low-level implementation of self.add_subscription, must be called with self.lock held.
+        """
+        self._add_subscriptions([config])
 
 # ################################################################################################################################
 
@@ -1330,6 +1693,11 @@ class PubSub(object):
             # Creates a subscription ..
             self._add_subscription(config)
 
+            # .. a new subscriber receives all the GD messages waiting in the topic so their number is not known anymore ..
+            topic = self.topics.get(config.topic_id)
+            if topic:
+                topic.gd_depth = None
+
             # .. triggers a relevant hook, if any is configured.
             hook = self.get_on_subscribed_hook(config.sub_key)
             if hook:
@@ -1341,7 +1709,10 @@ class PubSub(object):
         """ Deletes a subscription from the list of subscription. By default, it is not an error to call
         the method with an invalid sub_key. Must be invoked with self.lock held.
         """
-        sub = self.subscriptions_by_sub_key.pop(sub_key, _invalid)
+        subscriptions_by_sub_key = dict(self._subscriptions_by_sub_key)
+        sub = subscriptions_by_sub_key.pop(sub_key, _invalid)
+        self._subscriptions_by_sub_key = subscriptions_by_sub_key
+
         if sub is _invalid and (not ignore_missing):
             raise KeyError('No such sub_key `%s`', sub_key)
         else:
@@ -1360,6 +1731,16 @@ class PubSub(object):
             if not self.has_sub_key(config.sub_key):
                 self._add_subscription(config)
 
+            self._set_up_delivery(config)
+
+# ################################################################################################################################
+
+    def _set_up_delivery(self, config, sk_server_config_list=None):
+        """ Starts a delivery task for a newly added subscription or finds the server that handles its deliveries.
+        If sk_server_config_list is given, configs of sub_key servers are appended to it instead of being set one by one.
+        """
+        with self.lock:
+
             # We don't start dedicated tasks for WebSockets - they are all dynamic without a fixed server.
             # But for other endpoint types, we create and start a delivery task here.
             if config.endpoint_type != PUBSUB.ENDPOINT_TYPE.WEB_SOCKETS.id:
@@ -1386,7 +1767,30 @@ class PubSub(object):
                     else:
                         config.server_pid = self.server.server_startup_ipc.get_pubsub_pid()
                         config.server_name = self.server.name
-                        self.set_sub_key_server(config)
+
+                        if sk_server_config_list is None:
+                            self.set_sub_key_server(config)
+                        else:
+                            sk_server_config_list.append(config)
+
+# ################################################################################################################################
+
+    def _subscribe_many(self, config_list):
+        """ Like self._subscribe but for many subscriptions at once, e.g. when the server starts. All the subscriptions
+        are added to the maps in one go and then delivery is set up for each of them as usual.
+        """
+        with self.lock:
+
+            # Goes directly to the map rather than through self.has_sub_key which logs all the sub_keys on each call
+            self._add_subscriptions([config for config in config_list if config.sub_key not in self._subscriptions_by_sub_key])
+
+            sk_server_config_list = []
+
+            for config in config_list:
+                self._set_up_delivery(config, sk_server_config_list)
+
+            if sk_server_config_list:
+                self._set_sub_key_servers(sk_server_config_list)
 
 # ################################################################################################################################
 
@@ -1417,12 +1821,29 @@ class PubSub(object):
 
 # ################################################################################################################################
 
-    def _create_topic(self, config):
-        self._set_topic_config_hook_data(config)
-        config.meta_store_frequency = self.topic_meta_store_frequency
+    def _create_topics(self, config_list):
+        """ Low-level implementation of self.create_topic and self.create_topics, must be called with self.lock held.
+        Each map is copied once for all the topics given on input rather than once per topic.
+        """
+        topics = dict(self.topics)
+        topic_name_to_id = dict(self.topic_name_to_id)
 
-        self.topics[config.id] = Topic(config, self.server.name, self.server.pid)
-        self.topic_name_to_id[config.name] = config.id
+        for config in config_list:
+            self._set_topic_config_hook_data(config)
+            config.meta_store_frequency = self.topic_meta_store_frequency
+
+            topics[config.id] = Topic(config, self.server.name, self.server.pid)
+            topic_name_to_id[config.name] = config.id
+
+        self.topics = topics
+        self.topic_name_to_id = topic_name_to_id
+
+# ################################################################################################################################
+
+    def _create_topic(self, config):
+        """ Low-level implementation of self.create_topic, must be called with self.lock held.
+        """
+        self._create_topics([config])
 
 # ################################################################################################################################
 
@@ -1430,12 +1851,30 @@ class PubSub(object):
         with self.lock:
             self._create_topic(config)
 
+# ################################################################################################################################
+
+    def create_topics(self, config_list):
+        """ Creates many topics at once, e.g. when the server starts.
+        """
+        with self.lock:
+            self._create_topics(config_list)
+
 # ################################################################################################################################
 
     def _delete_topic(self, topic_id, topic_name):
-        del self.topic_name_to_id[topic_name]
-        self.subscriptions_by_topic.pop(topic_name, None) # May have no subscriptions hence .pop instead of del
-        del self.topics[topic_id]
+        """ Low-level implementation of self.delete_topic, must be called with self.lock held.
+        """
+        topic_name_to_id = dict(self.topic_name_to_id)
+        del topic_name_to_id[topic_name]
+        self.topic_name_to_id = topic_name_to_id
+
+        subscriptions_by_topic = dict(self.subscriptions_by_topic)
+        subscriptions_by_topic.pop(topic_name, None) # May have no subscriptions hence .pop instead of del
+        self.subscriptions_by_topic = subscriptions_by_topic
+
+        topics = dict(self.topics)
+        del topics[topic_id]
+        self.topics = topics
 
 # ################################################################################################################################
 
@@ -1448,10 +1887,23 @@ class PubSub(object):
 
     def edit_topic(self, del_name, config):
         with self.lock:
-            subscriptions_by_topic = self.subscriptions_by_topic.pop(del_name, [])
+            subscriptions = self.subscriptions_by_topic.get(del_name, [])
+            old_topic = self.topics[config.id]
             self._delete_topic(config.id, del_name)
             self._create_topic(config)
-            self.subscriptions_by_topic[config.name] = subscriptions_by_topic
+
+            subscriptions_by_topic = dict(self.subscriptions_by_topic)
+            subscriptions_by_topic[config.name] = subscriptions
+            self.subscriptions_by_topic = subscriptions_by_topic
+
+            # Messages published before the edit still need to be synced, according to the new task sync interval
+            topic = self.topics[config.id]
+            topic.sync_has_gd_msg = old_topic.sync_has_gd_msg
+            topic.sync_has_non_gd_msg = old_topic.sync_has_non_gd_msg
+            topic.gd_pub_time_max = old_topic.gd_pub_time_max
+
+            if topic.id in self.sync_heap_topics:
+                self._reschedule_topic_sync(topic)
 
 # ################################################################################################################################
 
@@ -1494,37 +1946,34 @@ class PubSub(object):
                 return
 
         # Alright, this endpoint has the correct role, but are there are any matching patterns for this topic?
-        for orig, matcher in getattr(endpoint, target):
-            if matcher.match(name):
-                return orig
+        return getattr(endpoint, target).match(name)
 
 # ################################################################################################################################
 
     def is_allowed_pub_topic(self, name, security_id=None, ws_channel_id=None):
-        return self._is_allowed('pub_topic_patterns', name, True, security_id, ws_channel_id)
+        return self._is_allowed('pub_topic_matcher', name, True, security_id, ws_channel_id)
 
 # ################################################################################################################################
 
     def is_allowed_pub_topic_by_endpoint_id(self, name, endpoint_id):
-        return self._is_allowed('pub_topic_patterns', name, True, None, None, endpoint_id)
+        return self._is_allowed('pub_topic_matcher', name, True, None, None, endpoint_id)
 
 # ################################################################################################################################
 
     def is_allowed_sub_topic(self, name, security_id=None, ws_channel_id=None):
-        return self._is_allowed('sub_topic_patterns', name, False, security_id, ws_channel_id)
+        return self._is_allowed('sub_topic_matcher', name, False, security_id, ws_channel_id)
 
 # ################################################################################################################################
 
     def is_allowed_sub_topic_by_endpoint_id(self, name, endpoint_id):
-        return self._is_allowed('sub_topic_patterns', name, False, None, None, endpoint_id)
+        return self._is_allowed('sub_topic_matcher', name, False, None, None, endpoint_id)
 
 # ################################################################################################################################
 
     def get_topics(self):
         """ Returns all topics in existence.
         """
-        with self.lock:
-            return self.topics
+        return self.topics
 
 # ################################################################################################################################
 
@@ -1532,10 +1981,9 @@ class PubSub(object):
         """ Returns all topics to which endpoint_id can subscribe.
         """
         out = []
-        with self.lock:
-            for topic in self.topics.values():
-                if self.is_allowed_sub_topic_by_endpoint_id(topic.name, endpoint_id):
-                    out.append(topic)
+        for topic in self.topics.values():
+            if self.is_allowed_sub_topic_by_endpoint_id(topic.name, endpoint_id):
+                out.append(topic)
 
         return out
 
@@ -1553,14 +2001,12 @@ class PubSub(object):
     def is_subscribed_to(self, endpoint_id, topic_name):
         """ Returns True if the endpoint is subscribed to the named topic.
         """
-        with self.lock:
-            return self._is_subscribed_to(endpoint_id, topic_name)
+        return self._is_subscribed_to(endpoint_id, topic_name)
 
 # ################################################################################################################################
 
     def get_pubsub_tool_by_sub_key(self, sub_key):
-        with self.lock:
-            return self.pubsub_tool_by_sub_key[sub_key]
+        return self.pubsub_tool_by_sub_key[sub_key]
 
 # ################################################################################################################################
 
@@ -1634,21 +2080,43 @@ class PubSub(object):
 
 # ################################################################################################################################
 
-    def _set_sub_key_server(self, config):
-        """ Low-level implementation of self.set_sub_key_server - must be called with self.lock held.
+    def _set_sub_key_servers(self, config_list):
+        """ Low-level implementation of self.set_sub_key_server and self._subscribe_many - must be called with self.lock held.
+        The map of sub_key servers is copied, and the table of all of them is logged, only once for all the configs on input.
         """
-        sub = self._get_subscription_by_sub_key(config['sub_key'])
-        config['endpoint_id'] = sub.endpoint_id
-        config['endpoint_name'] = self._get_endpoint_by_id(sub.endpoint_id)
-        config['wsx'] = int(config['endpoint_type'] == PUBSUB.ENDPOINT_TYPE.WEB_SOCKETS.id)
-        self.sub_key_servers[config['sub_key']] = SubKeyServer(config)
+        subscriptions_by_sub_key = self.subscriptions_by_sub_key
+        sub_key_servers = dict(self.sub_key_servers)
+
+        for config in config_list:
+            sub = subscriptions_by_sub_key[config['sub_key']]
+            config['endpoint_id'] = sub.endpoint_id
+            config['endpoint_name'] = self._get_endpoint_by_id(sub.endpoint_id)
+            config['wsx'] = int(config['endpoint_type'] == PUBSUB.ENDPOINT_TYPE.WEB_SOCKETS.id)
+
+            sub_key_servers[config['sub_key']] = SubKeyServer(config)
+
+        self.sub_key_servers = sub_key_servers
 
         sks_table = self.format_sk_servers()
-        msg = 'Set sk_server{}for sub_key `%(sub_key)s` (wsx:%(wsx)s) - `%(server_name)s:%(server_pid)s`, '\
-            'current sk_servers:\n{}'.format(' ' if config['server_pid'] else ' (no PID) ', sks_table)
+        last_idx = len(config_list) - 1
+
+        for idx, config in enumerate(config_list):
+            msg = 'Set sk_server{}for sub_key `%(sub_key)s` (wsx:%(wsx)s) - `%(server_name)s:%(server_pid)s`'.format(
+                ' ' if config['server_pid'] else ' (no PID) ')
+
+            # Only the last message has the table of sk_servers, which is the same for all of them
+            if idx == last_idx:
+                msg += ', current sk_servers:\n{}'.format(sks_table)
 
-        logger.info(msg, config)
-        logger_zato.info(msg, config)
+            logger.info(msg, config)
+            logger_zato.info(msg, config)
+
+# ################################################################################################################################
+
+    def _set_sub_key_server(self, config):
+        """ Low-level implementation of self.set_sub_key_server - must be called with self.lock held.
+        """
+        self._set_sub_key_servers([config])
 
 # ################################################################################################################################
 
@@ -1664,17 +2132,13 @@ class PubSub(object):
 # ################################################################################################################################
 
     def get_sub_key_server(self, sub_key, default=None):
-        with self.lock:
-            return self._get_sub_key_server(sub_key, default)
+        return self._get_sub_key_server(sub_key, default)
 
 # ################################################################################################################################
 
     def get_delivery_server_by_sub_key(self, sub_key, needs_lock=True):
-        if needs_lock:
-            with self.lock:
-                return self._get_sub_key_server(sub_key)
-        else:
-            return self._get_sub_key_server(sub_key)
+        # Kept for backward compatibility, needs_lock is no longer used because no lock is needed for look-ups.
+        return self._get_sub_key_server(sub_key)
 
 # ################################################################################################################################
 
@@ -1687,7 +2151,9 @@ class PubSub(object):
                 logger.info(msg, sub_key, sub_key_server.server_name, sub_key_server.server_pid)
                 logger_zato.info(msg, sub_key, sub_key_server.server_name, sub_key_server.server_pid)
 
-                del self.sub_key_servers[sub_key]
+                sub_key_servers = dict(self.sub_key_servers)
+                del sub_key_servers[sub_key]
+                self.sub_key_servers = sub_key_servers
             else:
                 logger.info('Could not find sub_key `%s` while deleting sub_key server, current `%s` `%s`',
                     sub_key, self.server.name, self.server.pid)
@@ -1699,12 +2165,10 @@ class PubSub(object):
         which we must remove from our config because without this client they are no longer usable (until the client reconnects).
         """
         with self.lock:
+            sub_key_servers = dict(self.sub_key_servers)
             for sub_key in config.sub_key_list:
-                self.sub_key_servers.pop(sub_key, None)
-                for server_info in self.sub_key_servers.values():
-                    if server_info.sub_key == sub_key:
-                        del self.sub_key_servers[sub_key]
-                        break
+                sub_key_servers.pop(sub_key, None)
+            self.sub_key_servers = sub_key_servers
 
 # ################################################################################################################################
 
@@ -1829,6 +2293,13 @@ class PubSub(object):
         return _get_sql_messages_by_msg_id_list(session, self.server.cluster_id, sub_key, pub_time_max, msg_id_list).\
                all()
 
+# ################################################################################################################################
+
+    def get_recovered_non_gd_messages(self, sub_key):
+        """ Returns non-GD messages for sub_key that were found in the journal on startup, if there is one.
+        """
+        return self.journal.get_recovered_messages(sub_key) if self.journal else []
+
 # ################################################################################################################################
 
     def confirm_pubsub_msg_delivered(self, sub_key, delivered_pub_msg_id_list):
@@ -1838,6 +2309,10 @@ class PubSub(object):
             _confirm_pubsub_msg_delivered(session, self.server.cluster_id, sub_key, delivered_pub_msg_id_list, utcnow_as_ms())
             session.commit()
 
+        # Non-GD messages among the delivered ones no longer need to be replayed
+        if self.journal:
+            self.journal.ack(delivered_pub_msg_id_list, [sub_key])
+
 # ################################################################################################################################
 
     def store_in_ram(self, cid, topic_id, topic_name, sub_keys, non_gd_msg_list, from_error=0, _logger=logger):
@@ -1849,7 +2324,7 @@ class PubSub(object):
         _logger.info('Storing in RAM. CID:`%s`, topic ID:`%s`, name:`%s`, sub_keys:`%s`, ngd-list:`%s`, e:`%d`',
             cid, topic_id, topic_name, sub_keys, [elem['pub_msg_id'] for elem in non_gd_msg_list], from_error)
 
-        with self.lock:
+        with self.topic_locks(topic_id):
 
             # Store the non-GD messages in backlog ..
             self.sync_backlog.add_messages(cid, topic_id, topic_name, self.topics[topic_id].max_depth_non_gd,
@@ -1876,11 +2351,11 @@ class PubSub(object):
                 # Delete subscription metadata from local pubsub, note that we use .get
                 # instead of deleting directly because this dictionary will be empty
                 # right after a server starts but before any client for that topic (such as WSX) connects to it.
-                subscriptions_by_topic = self.subscriptions_by_topic.get(topic_name, [])
-
-                for sub in subscriptions_by_topic[:]:
-                    if sub.sub_key in sub_keys:
-                        subscriptions_by_topic.remove(sub)
+                subscriptions = self.subscriptions_by_topic.get(topic_name)
+                if subscriptions:
+                    subscriptions_by_topic = dict(self.subscriptions_by_topic)
+                    subscriptions_by_topic[topic_name] = [sub for sub in subscriptions if sub.sub_key not in sub_keys]
+                    self.subscriptions_by_topic = subscriptions_by_topic
 
                 for sub_key in sub_keys:
 
@@ -1928,6 +2403,18 @@ class PubSub(object):
         """
         self.pubsub_tools.append(pubsub_tool)
 
+# ################################################################################################################################
+
+    def get_queue_depth_by_sub_key(self):
+        """ Returns a dictionary of sub_key -> (GD depth, non-GD depth) for all delivery tasks running in this server.
+        """
+        out = {}
+
+        for pubsub_tool in self.pubsub_tools:
+            out.update(pubsub_tool.get_queue_depth_by_sub_key())
+
+        return out
+
 # ################################################################################################################################
 
     def set_pubsub_tool_for_sub_key(self, sub_key, pubsub_tool):
@@ -1955,27 +2442,24 @@ class PubSub(object):
         """ Returns a hook for messages to be invoked right before they are about to be delivered
         or None if such a hook is not defined for sub_key's topic.
         """
-        with self.lock:
-            sub = self.get_subscription_by_sub_key(sub_key)
-            return self._get_topic_by_name(sub.topic_name).before_delivery_hook_service_invoker
+        sub = self.get_subscription_by_sub_key(sub_key)
+        return self._get_topic_by_name(sub.topic_name).before_delivery_hook_service_invoker
 
 # ################################################################################################################################
 
     def get_on_subscribed_hook(self, sub_key):
         """ Returns a hook triggered when a new subscription is made to a particular topic.
         """
-        with self.lock:
-            sub = self.get_subscription_by_sub_key(sub_key)
-            return self._get_topic_by_name(sub.topic_name).on_subscribed_service_invoker
+        sub = self.get_subscription_by_sub_key(sub_key)
+        return self._get_topic_by_name(sub.topic_name).on_subscribed_service_invoker
 
 # ################################################################################################################################
 
     def get_on_unsubscribed_hook(self, sub_key=None, sub=None):
         """ Returns a hook triggered when a client unsubscribes from a topic.
         """
-        with self.lock:
-            sub = sub or self.get_subscription_by_sub_key(sub_key)
-            return self._get_topic_by_name(sub.topic_name).on_unsubscribed_service_invoker
+        sub = sub or self.get_subscription_by_sub_key(sub_key)
+        return self._get_topic_by_name(sub.topic_name).on_unsubscribed_service_invoker
 
 # ################################################################################################################################
 
@@ -1983,9 +2467,8 @@ class PubSub(object):
         """ Returns a hook that sends outgoing SOAP Suds connections-based messages or None if there is no such hook
         for sub_key's topic.
         """
-        with self.lock:
-            sub = self.get_subscription_by_sub_key(sub_key)
-            return self._get_topic_by_name(sub.topic_name).on_outgoing_soap_invoke_invoker
+        sub = self.get_subscription_by_sub_key(sub_key)
+        return self._get_topic_by_name(sub.topic_name).on_outgoing_soap_invoke_invoker
 
 # ################################################################################################################################
 
@@ -2066,6 +2549,9 @@ class PubSub(object):
         with closing(self.server.odb.session()) as session:
             set_to_delete(session, self.cluster_id, sub_key, msg_list, utcnow_as_ms())
 
+        if self.journal:
+            self.journal.ack(msg_list, [sub_key])
+
 # ################################################################################################################################
 
     def topic_lock(self, topic_name):
@@ -2080,7 +2566,7 @@ class PubSub(object):
 
     def _set_sync_has_msg(self, topic_id, is_gd, value, source, gd_pub_time_max=None):
         """ Updates a given topic's flags indicating that a message has been published since the last sync.
-        Must be called with self.lock held.
+        Must be called with the topic's lock held.
         """
         topic = self.topics[topic_id] # type: Topic
         if is_gd:
@@ -2089,6 +2575,10 @@ class PubSub(object):
         else:
             topic.sync_has_non_gd_msg = value
 
+        # Let the notification task know that the topic will need to be synced
+        if value:
+            self._schedule_topic_sync(topic)
+
         self.emit_set_sync_has_msg({
             'topic_id': topic_id,
             'is_gd': is_gd,
@@ -2101,10 +2591,33 @@ class PubSub(object):
             'topic.sync_has_non_gd_msg': topic.sync_has_non_gd_msg
         })
 
+# ################################################################################################################################
+
+    def _schedule_topic_sync(self, topic, _heappush=heappush):
+        """ Makes the notification task sync the topic with its subscribers once the topic's task sync interval elapses,
+        unless it is already scheduled. Must be called with the topic's lock held.
+        """
+        if topic.id not in self.sync_heap_topics:
+            self.sync_heap_topics.add(topic.id)
+            _heappush(self.sync_heap, (topic.get_next_sync_time(), topic.id))
+            self.sync_event.set()
+
+# ################################################################################################################################
+
+    def _reschedule_topic_sync(self, topic, _heapify=heapify, _heappush=heappush):
+        """ Replaces a topic's entry in the sync heap with one computed from the topic's current task sync interval.
+        The heap is modified in place because the notification task keeps a reference to it.
+        """
+        self.sync_heap[:] = [item for item in self.sync_heap if item[1] != topic.id]
+        _heapify(self.sync_heap)
+        _heappush(self.sync_heap, (topic.get_next_sync_time(), topic.id))
+        self.sync_heap_topics.add(topic.id)
+        self.sync_event.set()
+
 # ################################################################################################################################
 
     def set_sync_has_msg(self, topic_id, is_gd, value, source, gd_pub_time_max):
-        with self.lock:
+        with self.topic_locks(topic_id):
             self._set_sync_has_msg(topic_id, is_gd, value, source, gd_pub_time_max)
 
 # ################################################################################################################################
@@ -2138,9 +2651,72 @@ class PubSub(object):
 
 # ################################################################################################################################
 
-    def trigger_notify_pubsub_tasks(self):
+    def _ack_journal_non_local(self, sub_keys, non_gd_msg_list):
+        """ Acknowledges in the journal all the messages from input that are about to be handed over
+        to sub_keys whose delivery tasks run in other servers.
+        """
+        non_local = []
+
+        for sub_key in sub_keys:
+            sk_server = self._get_sub_key_server(sub_key)
+            if sk_server and (sk_server.server_name, sk_server.server_pid) != (self.server.name, self.server.pid):
+                non_local.append(sub_key)
+
+        if non_local:
+            self.journal.ack([msg['pub_msg_id'] for msg in non_gd_msg_list], non_local)
+
+# ################################################################################################################################
+
+    def _run_gd_maintenance(self, topic, _utcnow_as_ms=utcnow_as_ms):
+        """ Deletes GD messages of a topic that are no longer needed and counts the ones still waiting for subscribers.
+        """
+        needs_cleanup = topic.needs_gd_maintenance()
+
+        # Nothing was published and the depth is not cached, so there is nothing to do
+        if not (needs_cleanup or topic.gd_depth is not None):
+            return
+
+        with closing(self.server.odb.session()) as session:
+
+            if needs_cleanup:
+
+                # Any messages published from now on will be cleaned up in the next run
+                topic.gd_maintenance_counter = topic.msg_pub_counter_gd
+
+                total = cleanup_topic_batched(session, self.cluster_id, topic.id, _utcnow_as_ms(), self.gd_cleanup_batch_size)
+
+                if total:
+                    suffix = '' if total == 1 else 's'
+                    logger.info('GD. Deleted %s pub/sub message%s from topic `%s`', total, suffix, topic.name)
+
+            # Reconcile the cached depth with what is in SQL, including messages published by other servers
+            topic.gd_depth = get_gd_depth_topic(session, self.cluster_id, topic.id)
+
+# ################################################################################################################################
+
+    def run_gd_maintenance_task(self, _sleep=sleep):
+        """ A background task that periodically cleans up GD messages in topics that this server published to
+        and reconciles cached depths of topics with SQL.
+        """
+        while self.keep_running:
+
+            _sleep(self.gd_maintenance_interval)
+
+            for topic in list(itervalues(self.topics)):
+                try:
+                    self._run_gd_maintenance(topic)
+                except Exception:
+                    e = format_exc()
+                    log_msg = 'Could not run GD maintenance for topic `%s`, e:`%s`'
+                    logger.warn(log_msg, topic.name, e)
+                    logger_zato.warn(log_msg, topic.name, e)
+
+# ################################################################################################################################
+
+    def trigger_notify_pubsub_tasks(self, idle_wait_time=5, _heappop=heappop, _utcnow_as_ms=utcnow_as_ms):
         """ A background greenlet which periodically lets delivery tasks that there are perhaps
-        new GD messages for the topic this class represents.
+        new GD messages for the topic this class represents. Only topics from self.sync_heap are synced, each one
+        no sooner than its task sync interval allows, and the greenlet sleeps until the next one is due.
         """
 
         # Local aliases
@@ -2152,11 +2728,12 @@ class PubSub(object):
 
         _new_cid      = new_cid
         _spawn        = spawn
-        _sleep        = sleep
-        _self_lock    = self.lock
-        _self_topics  = self.topics
         _keep_running = self.keep_running
 
+        _sync_heap        = self.sync_heap
+        _sync_heap_topics = self.sync_heap_topics
+        _sync_event       = self.sync_event
+
         _logger_info      = logger.info
         _logger_warn      = logger.warn
         _logger_zato_warn = logger_zato.warn
@@ -2218,51 +2795,76 @@ class PubSub(object):
         # Loop forever or until stopped
         while _keep_running:
 
-            # Sleep for a while before continuing - the call to sleep is here because this while loop is quite long
-            # so it would be inconvenient to have it down below.
-            _sleep(0.01)
+            # Sleep until the first topic in the heap is due or until a new topic is added to the heap, which may be due
+            # earlier. Clearing the event first means that we cannot miss topics added while we are checking the heap.
+            _sync_event.clear()
 
-            # Blocks other pub/sub processes for a moment
-            with _self_lock:
+            if _sync_heap:
+                wait_time = _sync_heap[0][0] - _utcnow_as_ms()
+                if wait_time > 0:
+                    _sync_event.wait(wait_time)
+                    continue
+            else:
+                _sync_event.wait(idle_wait_time)
+                continue
 
-                # Will map a few temporary objects down below
-                topic_id_dict = {}
+            # Will map a few temporary objects down below
+            topic_id_dict = {}
 
-                # Get all topics ..
-                for _topic in _self_topics.values(): # type: Topic
+            # A snapshot of all topics - the dictionary is never modified in place so it can be read without any lock
+            topics = self.topics
+            topic_locks = self.topic_locks
 
-                    # Does the topic require task synchronization now?
-                    if not _topic.needs_task_sync():
-                        continue
-                    else:
-                        _topic.update_task_sync_time()
+            now = _utcnow_as_ms()
+
+            # Get all topics that are due ..
+            while _sync_heap and _sync_heap[0][0] <= now:
+
+                topic_id = _heappop(_sync_heap)[1]
+                _sync_heap_topics.discard(topic_id)
+
+                # .. the topic could have been deleted after it was scheduled ..
+                _topic = topics.get(topic_id) # type: Topic
+                if not _topic:
+                    continue
 
-                    # OK, the time has come for this topic to sync its state with subscribers
+                with topic_locks(topic_id):
+
+                    # The time has come for this topic to sync its state with subscribers
                     # but still skip it if we know that there have been no messages published to it since the last time.
+                    _topic.update_task_sync_time()
+
                     if not (_topic.sync_has_gd_msg or _topic.sync_has_non_gd_msg):
                         continue
 
                     # There are some messages, let's see if there are subscribers ..
                     subs = _self_get_subscriptions_by_topic(_topic.name)
 
-                    # .. if there are any subscriptions at all, we store that information for later use.
+                    # .. if there are any subscriptions at all, we store that information for later use ..
                     if subs:
                         topic_id_dict[_topic.id] = (_topic.name, subs)
 
-                # OK, if we had any subscriptions for at least one topic and there are any messages waiting,
-                # we can continue.
-                try:
+                    # .. otherwise, the messages will wait for subscribers and we check again after the next interval.
+                    else:
+                        self._schedule_topic_sync(_topic)
+
+            # OK, if we had any subscriptions for at least one topic and there are any messages waiting,
+            # we can continue.
+            try:
+
+                if topic_id_dict:
 
-                    if topic_id_dict:
+                    #
+                    # Event log
+                    #
+                    _do_emit_loop_topic_id_dict(topic_id_dict)
 
-                        #
-                        # Event log
-                        #
-                        _do_emit_loop_topic_id_dict(topic_id_dict)
+                for topic_id in topic_id_dict:
 
-                    for topic_id in topic_id_dict:
+                    # Blocks, for a moment, other greenlets using this particular topic only
+                    with topic_locks(topic_id):
 
-                        topic = _self_topics[topic_id]
+                        topic = topics[topic_id]
 
                         # .. get the temporary metadata object stored earlier ..
                         topic_name, subs = topic_id_dict[topic_id]
@@ -2288,6 +2890,10 @@ class PubSub(object):
 
                             non_gd_msg_list = _sync_backlog_get_delete_messages_by_sub_keys(topic_id, sub_keys)
 
+                            # Other servers will record messages in their own journals once they receive them
+                            if self.journal and non_gd_msg_list:
+                                self._ack_journal_non_local(sub_keys, non_gd_msg_list)
+
                             #
                             # Event log
                             #
@@ -2329,10 +2935,10 @@ class PubSub(object):
                         _self_set_sync_has_msg(topic_id, True, False, 'PubSub.loop')
                         _self_set_sync_has_msg(topic_id, False, False, 'PubSub.loop')
 
-                except Exception:
-                    e_formatted = format_exc()
-                    _logger_zato_warn(e_formatted)
-                    _logger_warn(e_formatted)
+            except Exception:
+                e_formatted = format_exc()
+                _logger_zato_warn(e_formatted)
+                _logger_warn(e_formatted)
 
 # ################################################################################################################################
 # ################################################################################################################################
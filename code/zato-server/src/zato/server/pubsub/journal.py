@@ -0,0 +1,491 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os
+from fcntl import LOCK_EX, LOCK_NB, flock
+from json import dumps, loads
+from logging import getLogger
+from mmap import mmap
+from struct import Struct
+from traceback import format_exc
+
+# gevent
+from gevent import sleep
+from gevent.lock import RLock
+
+# Python 2/3 compatibility
+from future.utils import iteritems, itervalues
+
+# Zato
+from zato.common.util.time_ import utcnow_as_ms
+
+# ################################################################################################################################
+
+logger = getLogger('zato_pubsub.journal')
+logger_zato = getLogger('zato')
+
+# ################################################################################################################################
+
+# Each record is prefixed with its length - since segments are zero-filled when created and the length is written only
+# after the record's data, a length of zero marks the end of a segment, including one left behind by a record
+# whose process stopped in the middle of writing it.
+_length = Struct('<I')
+_length_size = _length.size
+
+_segment_suffix = '.seg'
+_segment_name = '{:020d}' + _segment_suffix
+_lock_name = 'lock'
+
+# Record types
+_add = 'add' # Messages added for sub_keys
+_ack = 'ack' # Messages delivered or deleted for sub_keys, or for all of them if sub_keys is None
+
+# ################################################################################################################################
+
+class JournalEntry(object):
+    """ A message kept in the journal until it is delivered to all of its sub_keys.
+    """
+    __slots__ = ('data', 'expiration_time', 'sub_keys', 'segments', 'recovered_sub_keys')
+
+    def __init__(self, data, expiration_time):
+        self.data = data                   # The message as it was serialized to JSON
+        self.expiration_time = expiration_time
+        self.sub_keys = set()              # Sub keys that the message has not been delivered to yet
+        self.segments = set()              # IDs of segments that contain the message's add records
+        self.recovered_sub_keys = set()    # Sub keys read from disk on startup and not yet replayed
+
+# ################################################################################################################################
+
+class Segment(object):
+    """ A fixed-size, memory-mapped file that records are appended to.
+    """
+    def __init__(self, path, segment_id, size=None):
+        self.path = path
+        self.id = segment_id
+        self.position = 0    # Where the next record will be written
+        self.add_count = 0   # How many add records there are in the segment
+        self.live_count = 0  # How many entries still need the segment's add records
+
+        # A new segment is created with size given on input, otherwise this is an existing one to read from
+        if size:
+            with open(path, 'w+b') as f:
+                f.truncate(size)
+
+        self.file = open(path, 'r+b')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.mmap = mmap(self.file.fileno(), self.size)
+
+# ################################################################################################################################
+
+    def __repr__(self):
+        return '<{} at {} id:{} pos:{} size:{} add:{} live:{}>'.format(self.__class__.__name__, hex(id(self)),
+            self.id, self.position, self.size, self.add_count, self.live_count)
+
+# ################################################################################################################################
+
+    def has_room(self, data_size):
+        # Room is needed for the record itself, its length and the length of zero that follows it
+        return self.position + data_size + 2 * _length_size <= self.size
+
+# ################################################################################################################################
+
+    def append(self, data):
+        """ Appends a record to the segment - must be called only if self.has_room returned True.
+        """
+        data_start = self.position + _length_size
+        data_end = data_start + len(data)
+
+        # The length goes last so that readers never see a record which is only partially written
+        self.mmap[data_start:data_end] = data
+        self.mmap[self.position:data_start] = _length.pack(len(data))
+        self.position = data_end
+
+# ################################################################################################################################
+
+    def read(self):
+        """ Yields all records from the segment, moving self.position past the last one.
+        """
+        while self.position + _length_size <= self.size:
+
+            data_size = _length.unpack_from(self.mmap, self.position)[0]
+            data_start = self.position + _length_size
+            data_end = data_start + data_size
+
+            if not data_size or data_end > self.size:
+                break
+
+            yield self.mmap[data_start:data_end]
+            self.position = data_end
+
+# ################################################################################################################################
+
+    def flush(self):
+        self.mmap.flush()
+
+# ################################################################################################################################
+
+    def close(self):
+        self.mmap.close()
+        self.file.close()
+
+# ################################################################################################################################
+
+    def delete(self):
+        self.close()
+        os.remove(self.path)
+
+# ################################################################################################################################
+
+class NonGDJournal(object):
+    """ An append-only journal of non-GD messages stored in memory-mapped segment files. Each server process has its own
+    journal in a sub-directory of base_dir that it locks for as long as it runs. On startup, a process picks the first
+    directory not locked by another process and reads all the segments found there, thanks to which it can replay
+    messages that were not delivered before the previous process using that directory stopped.
+
+    Segments are compacted in background - the oldest ones are deleted once all of their messages have been delivered
+    or have expired, and messages still waiting in segments that are mostly no longer needed are copied to the current one.
+
+    The directory a process locks need not be the one of a previous process with the same subscriptions, so messages
+    recovered for sub_keys whose delivery tasks run in other processes would never be replayed. Such messages are dropped
+    if they are not replayed within recovery_grace_period seconds, otherwise they would keep their segments from being deleted.
+    """
+    def __init__(self, base_dir, segment_size, compact_ratio=4, recovery_grace_period=300):
+        self.base_dir = base_dir
+        self.segment_size = segment_size
+        self.compact_ratio = compact_ratio
+        self.recovery_grace_period = recovery_grace_period
+        self.recovery_deadline = None # When to drop recovered messages that have not been replayed, in milliseconds
+        self.lock = RLock()
+        self.entries = {}  # Msg ID     -> JournalEntry object
+        self.segments = [] # All segments, the current one, which records are appended to, is always the last one
+
+        self.dir_name, self.lock_file = self._lock_dir()
+        self.load()
+
+# ################################################################################################################################
+
+    def _lock_dir(self):
+        """ Locks and returns the first sub-directory of self.base_dir not locked by another process.
+        """
+        idx = 0
+
+        while True:
+            dir_name = os.path.join(self.base_dir, str(idx))
+
+            if not os.path.exists(dir_name):
+                os.makedirs(dir_name)
+
+            lock_file = open(os.path.join(dir_name, _lock_name), 'a')
+
+            try:
+                flock(lock_file.fileno(), LOCK_EX | LOCK_NB)
+            except (IOError, OSError):
+                lock_file.close()
+                idx += 1
+            else:
+                return dir_name, lock_file
+
+# ################################################################################################################################
+
+    def _add_segment(self, min_size=0):
+        """ Creates a new current segment, big enough to hold a record of min_size bytes.
+        """
+        if self.segments:
+            self.segments[-1].flush()
+
+        segment_id = self.segments[-1].id + 1 if self.segments else 0
+        path = os.path.join(self.dir_name, _segment_name.format(segment_id))
+        size = max(self.segment_size, min_size + 2 * _length_size)
+
+        segment = Segment(path, segment_id, size)
+        self.segments.append(segment)
+
+        return segment
+
+# ################################################################################################################################
+
+    def _append(self, record):
+        """ Appends a record to the current segment, creating a new one if there is not enough room in it.
+        """
+        segment = self.segments[-1]
+
+        if not segment.has_room(len(record)):
+            segment = self._add_segment(len(record))
+
+        segment.append(record)
+
+        return segment
+
+# ################################################################################################################################
+
+    def _append_add(self, sub_keys, data):
+        """ Appends an add record - its first line is a header and the rest is the message's JSON.
+        """
+        segment = self._append(dumps([_add, list(sub_keys)]).encode('utf8') + b'\n' + data)
+        segment.add_count += 1
+
+        return segment
+
+# ################################################################################################################################
+
+    def _append_ack(self, msg_ids, sub_keys):
+        self._append(dumps([_ack, msg_ids, sub_keys]).encode('utf8'))
+
+# ################################################################################################################################
+
+    def _pin(self, entry, segment):
+        if segment.id not in entry.segments:
+            entry.segments.add(segment.id)
+            segment.live_count += 1
+
+# ################################################################################################################################
+
+    def _unpin(self, entry):
+        segments = dict((segment.id, segment) for segment in self.segments)
+        for segment_id in entry.segments:
+            segments[segment_id].live_count -= 1
+        entry.segments.clear()
+
+# ################################################################################################################################
+
+    def _remove_sub_keys(self, msg_id, entry, sub_keys):
+        """ Removes sub_keys from an entry, or all of them if sub_keys is None, and deletes the entry if none is left.
+        """
+        if sub_keys is None:
+            entry.sub_keys.clear()
+        else:
+            entry.sub_keys.difference_update(sub_keys)
+            entry.recovered_sub_keys.difference_update(sub_keys)
+
+        if not entry.sub_keys:
+            self._unpin(entry)
+            del self.entries[msg_id]
+
+# ################################################################################################################################
+
+    def load(self):
+        """ Reads all the segments found on disk and starts a new one that records will be appended to.
+        """
+        names = sorted(name for name in os.listdir(self.dir_name) if name.endswith(_segment_suffix))
+
+        for name in names:
+            path = os.path.join(self.dir_name, name)
+
+            # The process stopped before it could allocate the segment so there is nothing in it
+            if not os.path.getsize(path):
+                os.remove(path)
+                continue
+
+            segment = Segment(path, int(name[:-len(_segment_suffix)]))
+            self.segments.append(segment)
+
+            for record in segment.read():
+
+                header, _, data = record.partition(b'\n')
+                header = loads(header.decode('utf8'))
+
+                if header[0] == _add:
+                    segment.add_count += 1
+                    msg = loads(data.decode('utf8'))
+
+                    entry = self.entries.get(msg['pub_msg_id'])
+                    if not entry:
+                        entry = self.entries[msg['pub_msg_id']] = JournalEntry(data, msg['expiration_time'])
+
+                    entry.sub_keys.update(header[1])
+                    self._pin(entry, segment)
+
+                else:
+                    _, msg_ids, sub_keys = header
+                    self._ack(msg_ids, sub_keys)
+
+        # Everything found on disk can be replayed now ..
+        for entry in itervalues(self.entries):
+            entry.recovered_sub_keys.update(entry.sub_keys)
+
+        if self.entries:
+            self.recovery_deadline = utcnow_as_ms() + self.recovery_grace_period * 1000
+
+        # .. and all new records will go to a new segment.
+        self._add_segment()
+
+        if self.entries:
+            msg = 'Found %d non-GD message(s) in %d segment(s) of pub/sub journal `%s`'
+            logger.info(msg, len(self.entries), len(names), self.dir_name)
+            logger_zato.info(msg, len(self.entries), len(names), self.dir_name)
+
+# ################################################################################################################################
+
+    def add(self, messages, sub_keys):
+        """ Records that input messages are to be delivered to sub_keys.
+        """
+        try:
+            with self.lock:
+                for msg in messages:
+
+                    entry = self.entries.get(msg['pub_msg_id'])
+
+                    # Only sub_keys that the message has not been recorded for yet need to be appended
+                    new_sub_keys = set(sub_keys) - entry.sub_keys if entry else set(sub_keys)
+                    if not new_sub_keys:
+                        continue
+
+                    if not entry:
+                        data = dumps(msg, default=str).encode('utf8')
+                        entry = self.entries[msg['pub_msg_id']] = JournalEntry(data, msg['expiration_time'])
+
+                    entry.sub_keys.update(new_sub_keys)
+                    self._pin(entry, self._append_add(new_sub_keys, entry.data))
+
+        except Exception:
+            msg = 'Could not add messages to pub/sub journal, e:`%s`'
+            logger.warn(msg, format_exc())
+            logger_zato.warn(msg, format_exc())
+
+# ################################################################################################################################
+
+    def _ack(self, msg_ids, sub_keys):
+        """ Low-level implementation of self.ack - must be called with self.lock held.
+        """
+        if msg_ids is None:
+            for msg_id, entry in list(iteritems(self.entries)):
+                self._remove_sub_keys(msg_id, entry, sub_keys)
+        else:
+            for msg_id in msg_ids:
+                entry = self.entries.get(msg_id)
+                if entry:
+                    self._remove_sub_keys(msg_id, entry, sub_keys)
+
+# ################################################################################################################################
+
+    def ack(self, msg_ids, sub_keys=None):
+        """ Records that input messages no longer need to be delivered to sub_keys, e.g. because they have been
+        delivered or deleted. If msg_ids is None, it applies to all messages and if sub_keys is None, to all sub_keys.
+        """
+        try:
+            with self.lock:
+
+                # There is no need to append anything for messages that we do not have
+                if msg_ids is not None:
+                    msg_ids = [msg_id for msg_id in msg_ids if msg_id in self.entries]
+                    if not msg_ids:
+                        return
+
+                sub_keys = list(sub_keys) if sub_keys is not None else None
+
+                self._append_ack(msg_ids, sub_keys)
+                self._ack(msg_ids, sub_keys)
+
+        except Exception:
+            msg = 'Could not acknowledge messages in pub/sub journal, e:`%s`'
+            logger.warn(msg, format_exc())
+            logger_zato.warn(msg, format_exc())
+
+# ################################################################################################################################
+
+    def get_recovered_messages(self, sub_key, _utcnow_as_ms=utcnow_as_ms):
+        """ Returns all unexpired messages for sub_key that were found on disk on startup, each of them only once.
+        """
+        out = []
+        now = _utcnow_as_ms()
+
+        with self.lock:
+            for entry in itervalues(self.entries):
+                if sub_key in entry.recovered_sub_keys:
+                    entry.recovered_sub_keys.remove(sub_key)
+                    if entry.expiration_time > now:
+                        out.append(loads(entry.data.decode('utf8')))
+
+        return sorted(out, key=lambda msg: msg['pub_time'])
+
+# ################################################################################################################################
+
+    def _drop_recovered(self):
+        """ Acknowledges all the recovered messages that have not been replayed, i.e. ones for sub_keys that this process
+        does not deliver messages to. Must be called with self.lock held.
+        """
+        by_sub_keys = {} # Recovered sub_keys -> IDs of messages that have not been replayed for them
+
+        for msg_id, entry in iteritems(self.entries):
+            if entry.recovered_sub_keys:
+                by_sub_keys.setdefault(tuple(sorted(entry.recovered_sub_keys)), []).append(msg_id)
+
+        for sub_keys, msg_ids in iteritems(by_sub_keys):
+            self._append_ack(msg_ids, list(sub_keys))
+            self._ack(msg_ids, sub_keys)
+
+        if by_sub_keys:
+            msg = 'Dropped %d non-GD message(s) not replayed from pub/sub journal `%s`, sub_keys:`%s`'
+            msg_count = sum(len(msg_ids) for msg_ids in itervalues(by_sub_keys))
+            sub_keys = sorted(set(sub_key for sub_keys in by_sub_keys for sub_key in sub_keys))
+            logger.info(msg, msg_count, self.dir_name, sub_keys)
+            logger_zato.info(msg, msg_count, self.dir_name, sub_keys)
+
+# ################################################################################################################################
+
+    def compact(self, _utcnow_as_ms=utcnow_as_ms):
+        """ Deletes expired entries and the oldest segments whose add records are no longer needed, copying messages
+        still waiting in a segment to the current one first if there are few of them compared to all the segment's records.
+        Only the oldest segments are deleted because their ack records may refer to add records from earlier ones.
+        """
+        with self.lock:
+
+            now = _utcnow_as_ms()
+
+            for msg_id, entry in list(iteritems(self.entries)):
+                if entry.expiration_time <= now:
+                    self._remove_sub_keys(msg_id, entry, None)
+
+            if self.recovery_deadline is not None and now >= self.recovery_deadline:
+                self._drop_recovered()
+                self.recovery_deadline = None
+
+            deleted = 0
+
+            while len(self.segments) > 1:
+
+                segment = self.segments[0]
+
+                if segment.live_count and segment.live_count * self.compact_ratio > segment.add_count:
+                    break
+
+                if segment.live_count:
+                    for entry in itervalues(self.entries):
+                        if segment.id in entry.segments:
+                            self._unpin(entry)
+                            self._pin(entry, self._append_add(entry.sub_keys, entry.data))
+
+                self.segments.pop(0).delete()
+                deleted += 1
+
+            self.segments[-1].flush()
+
+            return deleted
+
+# ################################################################################################################################
+
+    def run_compaction_task(self, interval, _sleep=sleep):
+        """ A background task compacting the journal periodically.
+        """
+        while True:
+            try:
+                deleted = self.compact()
+                if deleted:
+                    logger.info('Deleted %d pub/sub journal segment(s) from `%s`, messages:%d',
+                        deleted, self.dir_name, len(self.entries))
+            except Exception:
+                msg = 'Could not compact pub/sub journal, e:`%s`'
+                logger.warn(msg, format_exc())
+                logger_zato.warn(msg, format_exc())
+            finally:
+                _sleep(interval)
+
+# ################################################################################################################################
@@ -18,6 +18,7 @@ from traceback import format_exc
 
 # gevent
 from gevent import sleep, spawn
+from gevent.event import Event
 from gevent.lock import RLock
 
 # sortedcontainers
@@ -51,13 +52,66 @@ _notify_methods = (PUBSUB.DELIVERY_METHOD.NOTIFY.id, PUBSUB.DELIVERY_METHOD.WEB_
 # ################################################################################################################################
 
 class SortedList(_SortedList):
-    """ A custom subclass that knows how to remove pubsub messages from SortedList instances.
+    """ A custom subclass that knows how to remove pubsub messages from SortedList instances. It also keeps track
+    of how many GD and non-GD messages it contains so that queue depths can be returned without iterating over messages.
     """
+    def __init__(self, *args, **kwargs):
+        self.gd_count = 0
+        self.non_gd_count = 0
+        super(SortedList, self).__init__(*args, **kwargs)
+
+# ################################################################################################################################
+
+    def _recount(self):
+        self.gd_count = sum(1 for msg in self if msg.has_gd)
+        self.non_gd_count = len(self) - self.gd_count
+
+# ################################################################################################################################
+
+    def add(self, msg):
+        super(SortedList, self).add(msg)
+
+        if msg.has_gd:
+            self.gd_count += 1
+        else:
+            self.non_gd_count += 1
+
+# ################################################################################################################################
+
+    def update(self, iterable):
+        # Bulk updates are not used on hot paths so it is fine to count all messages again
+        super(SortedList, self).update(iterable)
+        self._recount()
+
+    _update = update
+
+# ################################################################################################################################
+
+    def clear(self):
+        super(SortedList, self).clear()
+        self.gd_count = 0
+        self.non_gd_count = 0
+
+    _clear = clear
+
+# ################################################################################################################################
+
+    def _delete(self, pos, idx):
+        """ All the methods removing individual messages from the list end up here.
+        """
+        if self._lists[pos][idx].has_gd:
+            self.gd_count -= 1
+        else:
+            self.non_gd_count -= 1
+
+        super(SortedList, self)._delete(pos, idx)
+
+# ################################################################################################################################
+
     def remove_pubsub_msg(self, msg):
         """ Removes a pubsub message from a SortedList instance - we cannot use the regular .remove method
         because it may triggger __cmp__ per https://github.com/grantjenks/sorted_containers/issues/81.
         """
-        logger.info('In remove_pubsub_msg msg:`%s`, self._maxes:`%s`', msg, self._maxes)
         pos = bisect_left(self._maxes, msg)
 
         if pos == len(self._maxes):
@@ -106,6 +160,9 @@ class DeliveryTask(object):
         # This is a lock used for micro-operations such as changing or consulting the contents of self.delete_requested.
         self.interrupt_lock = RLock()
 
+        # Set each time there are new messages for us to deliver so that we do not need to poll self.delivery_list
+        self.wake_event = Event()
+
         # If self.wrap_in_list is True, messages will be always wrapped in a list,
         # even if there is only one message to send. Note that self.wrap_in_list will be False
         # only if both batch_size is 1 and wrap_one_msg_in_list is True.
@@ -340,22 +397,30 @@ class DeliveryTask(object):
 
 # ################################################################################################################################
 
-    def _should_wake(self, _now=utcnow_as_ms):
-        """ Returns True if the task should be woken up g. because its time has come already to process messages,
-        assumming there are any waiting for it.
+    def wake(self):
+        """ Lets the task know that there may be new messages for it to deliver.
+        """
+        self.wake_event.set()
+
+# ################################################################################################################################
+
+    def _get_wait_time(self, _now=utcnow_as_ms):
+        """ Returns for how many seconds the task needs to wait before it can deliver messages queued up for it,
+        which is zero if their time has come already.
         """
         now = _now()
         diff = round(now - self.last_run, 2)
 
         if diff >= self.delivery_interval:
-            if self.delivery_list:
-                logger.info('Waking task:%s now:%s last:%s diff:%s interval:%s len-list:%d',
-                    self.sub_key, now, self.last_run, diff, self.delivery_interval, len(self.delivery_list))
-                return True
+            logger.info('Waking task:%s now:%s last:%s diff:%s interval:%s len-list:%d',
+                self.sub_key, now, self.last_run, diff, self.delivery_interval, len(self.delivery_list))
+            return 0
+        else:
+            return self.delivery_interval - diff
 
 # ################################################################################################################################
 
-    def run(self, default_sleep_time=0.1, _status=PUBSUB.RUN_DELIVERY_STATUS, _notify_methods=_notify_methods):
+    def run(self, idle_wait_time=5, _status=PUBSUB.RUN_DELIVERY_STATUS, _notify_methods=_notify_methods):
         """ Runs the delivery task's main loop.
         """
         logger.info('Starting delivery task for sub_key:`%s` (%s, %s)',
@@ -371,7 +436,7 @@ class DeliveryTask(object):
         # * The server is ultimately brought up and we need to find these messages that were previously
         #   published but never delivered
         #
-        # Since this is about messages taken from the database, by definition, all of them they must be GD ones.
+        # Messages taken from the database are GD ones, but non-GD ones may be also replayed from the journal, if there is one.
         #
         self.pubsub_tool.enqueue_initial_messages(self.sub_key, self.topic_name, self.sub_config.endpoint_name)
 
@@ -398,40 +463,47 @@ class DeliveryTask(object):
                     sleep(5)
                     continue
 
-                if self._should_wake():
-
-                    with self.delivery_lock:
-
-                        # Update last run time to be able to wake up in time for the next delivery
-                        self.last_run = utcnow_as_ms()
+                # Clear the flag before checking our delivery list - this way, any messages added after the check
+                # will set the flag again and we will not miss them while waiting below.
+                self.wake_event.clear()
 
-                        # Get the list of all message IDs for which delivery was successful,
-                        # indicating whether all currently lined up messages have been
-                        # successfully delivered.
-                        result = self.run_delivery()
-
-                        # On success, sleep for a moment because we have just run out of all messages.
-                        if result == _status.OK:
-                            continue
-
-                        elif result == _status.NO_MSG:
-                            sleep(default_sleep_time)
+                # There is nothing to deliver so we can wait until new messages arrive, which is when we are woken up.
+                # The timeout is only so that changes to self.sub_config.delivery_method are still noticed.
+                if not self.delivery_list:
+                    self.wake_event.wait(idle_wait_time)
+                    continue
 
-                        # Otherwise, sleep for a longer time because our endpoint must have returned an error.
-                        # After this sleep, self.run_delivery will again attempt to deliver all messages
-                        # we queued up. Note that we are the only delivery task for this sub_key  so when we sleep here
-                        # for a moment, we do not block other deliveries.
-                        else:
-                            sleep_time = self.wait_sock_err if result == _status.SOCKET_ERROR else self.wait_non_sock_err
-                            msg = 'Sleeping for {}s after `{}` in sub_key:`{}`'.format(sleep_time, result, self.sub_key)
-                            logger.warn(msg)
-                            logger_zato.warn(msg)
-                            sleep(sleep_time)
+                # There are messages but we delivered other ones too recently so we need to wait for our turn.
+                # Note that this is a timer that gevent's hub keeps along with all the other ones, not a separate loop.
+                wait_time = self._get_wait_time()
+                if wait_time:
+                    sleep(wait_time)
+                    continue
 
-                else:
+                with self.delivery_lock:
 
-                    # Wait for our turn
-                    sleep(default_sleep_time)
+                    # Update last run time to be able to wake up in time for the next delivery
+                    self.last_run = utcnow_as_ms()
+
+                    # Get the list of all message IDs for which delivery was successful,
+                    # indicating whether all currently lined up messages have been
+                    # successfully delivered.
+                    result = self.run_delivery()
+
+                    # On success or if there was nothing to deliver, go back to waiting for new messages.
+                    if result in (_status.OK, _status.NO_MSG):
+                        continue
+
+                    # Otherwise, sleep for a longer time because our endpoint must have returned an error.
+                    # After this sleep, self.run_delivery will again attempt to deliver all messages
+                    # we queued up. Note that we are the only delivery task for this sub_key  so when we sleep here
+                    # for a moment, we do not block other deliveries.
+                    else:
+                        sleep_time = self.wait_sock_err if result == _status.SOCKET_ERROR else self.wait_non_sock_err
+                        msg = 'Sleeping for {}s after `{}` in sub_key:`{}`'.format(sleep_time, result, self.sub_key)
+                        logger.warn(msg)
+                        logger_zato.warn(msg)
+                        sleep(sleep_time)
 
 # ################################################################################################################################
 
@@ -447,6 +519,7 @@ class DeliveryTask(object):
         if self.keep_running:
             logger.info('Stopping delivery task for sub_key:`%s`', self.sub_key)
             self.keep_running = False
+            self.wake()
 
 # ################################################################################################################################
 
@@ -461,16 +534,7 @@ class DeliveryTask(object):
     def get_queue_depth(self):
         """ Returns the number of GD and non-GD messages in delivery list.
         """
-        gd = 0
-        non_gd = 0
-
-        for msg in self.delivery_list:
-            if msg.has_gd:
-                gd += 1
-            else:
-                non_gd += 1
-
-        return gd, non_gd
+        return self.delivery_list.gd_count, self.delivery_list.non_gd_count
 
     def get_gd_queue_depth(self):
         return self.get_queue_depth()[0]
@@ -818,8 +882,15 @@ class PubSubTool(object):
                 if sub_key not in msg['deliver_to_sk']:
                     continue
 
+            # This is a no-op for messages that were published through this server and are in the journal already.
+            # Note that it needs to take place before the message is built because the latter modifies its input.
+            if self.pubsub.journal:
+                self.pubsub.journal.add([msg], [sub_key])
+
             self.delivery_lists[sub_key].add(NonGDMessage(sub_key, self.server_name, self.server_pid, msg))
 
+        self.delivery_tasks[sub_key].wake()
+
 # ################################################################################################################################
 
     def add_non_gd_messages_by_sub_key(self, sub_key, messages):
@@ -962,6 +1033,9 @@ class PubSubTool(object):
         logger.info('Pushing %d GD message{}to task:%s msg_ids:%s'.format(
             ' ' if count==1 else 's '), count, sub_key, msg_ids)
 
+        if count:
+            self.delivery_tasks[sub_key].wake()
+
 # ################################################################################################################################
 
     def _enqueue_gd_messages_by_sub_key(self, sub_key, gd_msg_list):
@@ -1028,6 +1102,21 @@ class PubSubTool(object):
                 if session:
                     session.close()
 
+            # Non-GD messages are not in the database but they may have been recorded in the journal before a restart
+            try:
+                non_gd_msg_list = self.pubsub.get_recovered_non_gd_messages(sub_key)
+                if non_gd_msg_list:
+                    for _logger in logger, logger_zato:
+                        _logger.info('Found %d initial non-GD message(s) in journal for sub_key:`%s` (%s -> %s)',
+                            len(non_gd_msg_list), sub_key, topic_name, endpoint_name)
+
+                    self._add_non_gd_messages_by_sub_key(sub_key, non_gd_msg_list)
+
+            except Exception:
+                for _logger in logger, logger_zato:
+                    _logger.warn('Could not enqueue initial non-GD messages for `%s` (%s -> %s), e:`%s`',
+                        sub_key, topic_name, endpoint_name, format_exc())
+
 # ################################################################################################################################
 
     def confirm_pubsub_msg_delivered(self, sub_key, delivered_list):
@@ -1059,6 +1148,14 @@ class PubSubTool(object):
         with self.lock:
             return self.delivery_tasks.values()
 
+# ################################################################################################################################
+
+    def get_queue_depth_by_sub_key(self):
+        """ Returns a dictionary of sub_key -> (GD depth, non-GD depth) for all the sub_keys handled by this pubsub_tool.
+        """
+        with self.lock:
+            return dict((sub_key, task.get_queue_depth()) for sub_key, task in iteritems(self.delivery_tasks))
+
 # ################################################################################################################################
 
     def delete_messages(self, sub_key, msg_list):
@@ -85,10 +85,13 @@ if typing.TYPE_CHECKING:
     from zato.common.crypto import ServerCryptoManager
     from zato.server.base.worker import WorkerStore
     from zato.server.base.parallel import ParallelServer
+    from zato.server.service.reqresp.sio import SIOInputPlan, SIOOutputPlan
 
     # For pyflakes
     ParallelServer = ParallelServer
     ServerCryptoManager = ServerCryptoManager
+    SIOInputPlan = SIOInputPlan
+    SIOOutputPlan = SIOOutputPlan
     WorkerStore = WorkerStore
 
 # ################################################################################################################################
@@ -229,6 +232,8 @@ class Service(object):
     _out_plain_http = None
 
     _req_resp_freq = 0
+    _sio_input_plan = None # type: SIOInputPlan
+    _sio_output_plan = None # type: SIOOutputPlan
     _has_before_job_hooks = None
     _has_after_job_hooks = None
     _before_job_hooks = []
@@ -246,12 +251,26 @@ class Service(object):
     # For invoking other servers directly
     servers = None
 
-    def __init__(self, _get_logger=logging.getLogger, _Bunch=Bunch, _Request=Request, _Response=Response,
-            _DictNav=DictNav, _ListNav=ListNav, _Outgoing=Outgoing, _WMQFacade=WMQFacade, _ZMQFacade=ZMQFacade,
-            *ignored_args, **ignored_kwargs):
+    # If above zero, up to that many instances of a service are kept after they are done with a request and reused
+    # for subsequent ones instead of creating new instances. Only services that do not keep any state in self
+    # after their 'handle' method returns, e.g. in spawned greenlets, can opt in to it.
+    instance_pool_size = 0
+    _instance_pool = None
+
+    def __init__(self, _get_logger=logging.getLogger, _DictNav=DictNav, _ListNav=ListNav, *ignored_args, **ignored_kwargs):
         self.name = self.__class__.__service_name # Will be set through .get_name by Service Store
         self.impl_name = self.__class__.__service_impl_name # Ditto
         self.logger = _get_logger(self.name)
+        self.dictnav = _DictNav
+        self.listnav = _ListNav
+        self.patterns = None
+        self._out = None # Built on first use of self.out, most services never access any outgoing connection
+        self.reset()
+
+    def reset(self, _Bunch=Bunch, _Request=Request, _Response=Response):
+        """ Sets all the request-scoped attributes to their initial values - called when an instance is created
+        and each time it is returned to its class's instance pool.
+        """
         self.server = None         # type: ParallelServer
         self.broker_client = None
         self.channel = None
@@ -272,33 +291,38 @@ class Service(object):
         self.slow_threshold = maxint # After how many ms to consider the response came too late
         self.msg = None
         self.time = None
-        self.patterns = None
         self.user_config = None
-        self.dictnav = _DictNav
-        self.listnav = _ListNav
         self.has_validate_input = False
         self.has_validate_output = False
         self.cache = None
 
-        self.out = self.outgoing = _Outgoing(
-            self.amqp,
-            self._out_ftp,
-            _WMQFacade(self) if self.component_enabled_ibm_mq else None,
-            self._worker_config.out_odoo,
-            self._out_plain_http,
-            self._worker_config.out_soap,
-            self._worker_store.sql_pool_store,
-            self._worker_store.stomp_outconn_api,
-            ZMQFacade(self._worker_store.zmq_out_api) if self.component_enabled_zeromq else NO_DEFAULT_VALUE,
-            self._worker_store.outconn_wsx,
-            self._worker_store.vault_conn_api,
-            SMSAPI(self._worker_store.sms_twilio_api) if self.component_enabled_sms else None,
-            self._worker_config.out_sap,
-            self._worker_config.out_sftp,
-            self._worker_store.outconn_ldap,
-            self._worker_store.outconn_mongodb,
-            self._worker_store.def_kafka,
-        )
+    def _get_out(self, _Outgoing=Outgoing, _WMQFacade=WMQFacade, _ZMQFacade=ZMQFacade, _SMSAPI=SMSAPI):
+        if self._out is None:
+            self._out = _Outgoing(
+                self.amqp,
+                self._out_ftp,
+                _WMQFacade(self) if self.component_enabled_ibm_mq else None,
+                self._worker_config.out_odoo,
+                self._out_plain_http,
+                self._worker_config.out_soap,
+                self._worker_store.sql_pool_store,
+                self._worker_store.stomp_outconn_api,
+                _ZMQFacade(self._worker_store.zmq_out_api) if self.component_enabled_zeromq else NO_DEFAULT_VALUE,
+                self._worker_store.outconn_wsx,
+                self._worker_store.vault_conn_api,
+                _SMSAPI(self._worker_store.sms_twilio_api) if self.component_enabled_sms else None,
+                self._worker_config.out_sap,
+                self._worker_config.out_sftp,
+                self._worker_store.outconn_ldap,
+                self._worker_store.outconn_mongodb,
+                self._worker_store.def_kafka,
+            )
+        return self._out
+
+    def _set_out(self, value):
+        self._out = value
+
+    out = outgoing = property(_get_out, _set_out)
 
     @staticmethod
     def get_name_static(class_):
@@ -377,7 +401,7 @@ class Service(object):
             self.msg = MessageFacade(
                 self._json_pointer_store, self._xpath_store, self._msg_ns_store, self.request.payload, self.time)
 
-        if self.component_enabled_patterns:
+        if self.component_enabled_patterns and self.patterns is None:
             self.patterns = PatternsFacade(self)
 
         if may_have_wsgi_environ:
@@ -386,8 +410,8 @@ class Service(object):
         # self.is_sio attribute is set by ServiceStore during deployment
         if self.has_sio:
             self.request.init(True, self.cid, self.SimpleIO, self.data_format, self.transport, self.wsgi_environ,
-                self.server.encrypt)
-            self.response.init(self.cid, self.SimpleIO, self.data_format)
+                self.server.encrypt, self._sio_input_plan)
+            self.response.init(self.cid, self.SimpleIO, self.data_format, self._sio_output_plan)
 
         # Cache is always enabled
         self.cache = self._worker_store.cache_api
@@ -489,7 +513,7 @@ class Service(object):
             try:
 
                 if service.server.component_enabled.stats:
-                    service.usage = service.kvdb.conn.incr('{}{}'.format(KVDB.SERVICE_USAGE, service.name))
+                    service.usage = service.server.stats_collector.incr_usage(service.name)
                 service.invocation_time = _utcnow()
 
                 # All hooks are optional so we check if they have not been replaced with None by ServiceStore.
@@ -610,7 +634,9 @@ class Service(object):
             if timeout:
                 try:
                     g = spawn(self.update_handle, *invoke_args, **kwargs)
-                    return g.get(block=True, timeout=timeout)
+                    out = g.get(block=True, timeout=timeout)
+                    self.server.service_store.release_instance(service)
+                    return out
                 except Timeout:
                     g.kill()
                     logger.warn('Service `%s` timed out (%s)', service.name, self.cid)
@@ -618,6 +644,7 @@ class Service(object):
                         raise
             else:
                 out = self.update_handle(*invoke_args, **kwargs)
+                self.server.service_store.release_instance(service)
                 if kwargs.get('skip_response_elem'):
                     response_elem = out.keys()[0]
                     return out[response_elem]
@@ -653,8 +680,9 @@ class Service(object):
 
     def invoke_async(self, name, payload='', channel=CHANNEL.INVOKE_ASYNC, data_format=DATA_FORMAT.DICT,
                      transport=None, expiration=BROKER.DEFAULT_EXPIRATION, to_json_string=False, cid=None, callback=None,
-                     zato_ctx={}, environ={}):
-        """ Invokes a service asynchronously by its name.
+                     zato_ctx={}, environ={}, allow_local=False):
+        """ Invokes a service asynchronously by its name. If allow_local is True, the service will be invoked in the current
+        process instead of whichever server process picks it up first.
         """
         if self.component_enabled_target_matcher:
             name, target = self.extract_target(name)
@@ -703,13 +731,15 @@ class Service(object):
 
         # If we have a target we need to invoke all the servers
         # and these which are not able to handle the target will drop the message.
-        (self.broker_client.publish if target else self.broker_client.invoke_async)(msg, expiration=expiration)
+        if target:
+            self.broker_client.publish(msg, expiration=expiration)
+        else:
+            self.broker_client.invoke_async(msg, expiration=expiration, allow_local=allow_local)
 
         return cid
 
     def post_handle(self, _get_response_value=get_response_value, _utcnow=datetime.utcnow,
-        _service_time_basic=KVDB.SERVICE_TIME_BASIC, _service_time_raw=KVDB.SERVICE_TIME_RAW,
-        _service_time_raw_by_minute=KVDB.SERVICE_TIME_RAW_BY_MINUTE):
+        _req_resp_sample=KVDB.REQ_RESP_SAMPLE):
         """ An internal method executed after the service has completed and has
         a response ready to return. Updates its statistics and, optionally, stores
         a sample request/response pair.
@@ -729,21 +759,9 @@ class Service(object):
 
             self.processing_time = int(round(proc_time))
 
-            with self.kvdb.conn.pipeline() as pipe:
-
-                pipe.hset('%s%s' % (_service_time_basic, self.name), 'last', self.processing_time)
-                pipe.rpush('%s%s' % (_service_time_raw, self.name), self.processing_time)
-
-                key = '%s%s:%s' % (_service_time_raw_by_minute,
-                    self.name, self.handle_return_time.strftime('%Y:%m:%d:%H:%M'))
-                pipe.rpush(key, self.processing_time)
-
-                # .. we'll have 5 minutes (5 * 60 seconds = 300 seconds)
-                # to aggregate processing times for a given minute and then it will expire
-
-                # Note that we need Redis 2.1.3+ otherwise the key has just been overwritten
-                pipe.expire(key, 300)
-                pipe.execute()
+            # Statistics are collected in-process and flushed to KVDB periodically in background
+            self.server.stats_collector.record(
+                self.name, self.processing_time, self.handle_return_time.strftime('%Y:%m:%d:%H:%M'))
 
         #
         # Sample requests/responses
@@ -768,7 +786,7 @@ class Service(object):
                 'req': req,
                 'resp':_get_response_value(self.response), # TODO: Don't parse it here and a moment later below
             }
-            self.kvdb.conn.hmset(key, data)
+            self.kvdb.conn.hmset('%s%s' % (_req_resp_sample, self.name), data)
 
         #
         # Slow responses
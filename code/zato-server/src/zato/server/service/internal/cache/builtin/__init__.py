@@ -19,6 +19,7 @@ from zato.common import CACHE as _COMMON_CACHE
 from zato.common.broker_message import CACHE
 from zato.common.odb.model import CacheBuiltin
 from zato.common.odb.query import cache_builtin_list
+from zato.common.util.sql import parse_instance_opaque_attr
 from zato.server.service import Bool, Int
 from zato.server.service.internal import AdminService, AdminSIO
 from zato.server.service.internal.cache import common_instance_hook
@@ -31,7 +32,8 @@ get_list_docs = 'built-in cache definitions'
 broker_message = CACHE
 broker_message_prefix = 'BUILTIN_'
 list_func = cache_builtin_list
-output_optional_extra = ['current_size', 'cache_id']
+input_optional_extra = [Bool('needs_key_index')]
+output_optional_extra = ['current_size', 'cache_id', Bool('needs_key_index')]
 
 # ################################################################################################################################
 
@@ -64,9 +66,12 @@ class Get(AdminService):
         output_required = ('name', 'is_active', 'is_default', 'cache_type', Int('max_size'), Int('max_item_size'),
             Bool('extend_expiry_on_get'), Bool('extend_expiry_on_set'), 'sync_method', 'persistent_storage',
             Int('current_size'))
+        output_optional = (Bool('needs_key_index'),)
 
     def handle(self):
-        response = asdict(self.server.odb.get_cache_builtin(self.server.cluster_id, self.request.input.cache_id))
+        instance = self.server.odb.get_cache_builtin(self.server.cluster_id, self.request.input.cache_id)
+        response = asdict(instance)
+        response.update(parse_instance_opaque_attr(instance))
         response['current_size'] = self.cache.get_size(_COMMON_CACHE.TYPE.BUILTIN, response['name'])
 
         self.response.payload = response
@@ -9,6 +9,7 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # stdlib
+from collections import OrderedDict
 from contextlib import closing
 from json import loads
 from logging import DEBUG, getLogger
@@ -21,11 +22,12 @@ from dateparser import parse as dt_parse
 # gevent
 from gevent import spawn
 
+# Python 2/3 compatibility
+from future.utils import itervalues
+
 # Zato
 from zato.common import DATA_FORMAT, PUBSUB, ZATO_NONE
 from zato.common.exception import Forbidden, NotFound, ServiceUnavailable
-from zato.common.odb.query.pubsub.cleanup import delete_enq_delivered, delete_enq_marked_deleted, delete_msg_delivered, \
-     delete_msg_expired
 from zato.common.odb.query.pubsub.publish import sql_publish_with_retry
 from zato.common.odb.query.pubsub.topic import get_gd_depth_topic
 from zato.common.pubsub import PubSubMessage
@@ -67,12 +69,13 @@ _inserting_gd_msg = 'Inserting GD messages for topic `%s` `%s` published by `%s`
 class PubCtx(object):
     """ A container for information describing a single publication.
     """
-    __slots__ = ('cluster_id', 'pubsub', 'topic', 'endpoint_id', 'endpoint_name', 'subscriptions_by_topic', 'msg_id_list',
-        'gd_msg_list', 'non_gd_msg_list', 'pub_pattern_matched', 'ext_client_id', 'is_re_run', 'now', 'current_depth',
-        'last_msg')
+    __slots__ = ('cid', 'cluster_id', 'pubsub', 'topic', 'endpoint_id', 'endpoint_name', 'subscriptions_by_topic',
+        'msg_id_list', 'gd_msg_list', 'non_gd_msg_list', 'pub_pattern_matched', 'ext_client_id', 'is_re_run', 'now',
+        'current_depth', 'last_msg', 'needs_depth_check')
 
-    def __init__(self, cluster_id, pubsub, topic, endpoint_id, endpoint_name, subscriptions_by_topic, msg_id_list, gd_msg_list,
-            non_gd_msg_list, pub_pattern_matched, ext_client_id, is_re_run, now):
+    def __init__(self, cid, cluster_id, pubsub, topic, endpoint_id, endpoint_name, subscriptions_by_topic, msg_id_list,
+            gd_msg_list, non_gd_msg_list, pub_pattern_matched, ext_client_id, is_re_run, now):
+        self.cid = cid
         self.cluster_id = cluster_id
         self.pubsub = pubsub
         self.topic = topic
@@ -88,6 +91,7 @@ class PubCtx(object):
         self.now = now
         self.current_depth = None
         self.last_msg = self.gd_msg_list[-1] if self.gd_msg_list else self.non_gd_msg_list[-1]
+        self.needs_depth_check = False
 
 # ################################################################################################################################
 
@@ -383,7 +387,7 @@ class Publish(AdminService):
             has_wsx_no_server, input.get('reply_to_sk', None))
 
         # Create a wrapper object for all the input data and metadata
-        ctx = PubCtx(self.server.cluster_id, pubsub, topic, endpoint_id, pubsub.get_endpoint_by_id(endpoint_id).name,
+        ctx = PubCtx(self.cid, self.server.cluster_id, pubsub, topic, endpoint_id, pubsub.get_endpoint_by_id(endpoint_id).name,
             subscriptions_by_topic, msg_id_list, gd_msg_list, non_gd_msg_list, pub_pattern_matched,
             input.get('ext_client_id'), False, now)
 
@@ -392,11 +396,104 @@ class Publish(AdminService):
 
 # ################################################################################################################################
 
-    def _cleanup_sql_data(self, session, cluster_id, topic_id, now):
-        delete_msg_delivered(session, cluster_id, topic_id)
-        delete_msg_expired(session, cluster_id, topic_id, now)
-        delete_enq_delivered(session, cluster_id, topic_id)
-        delete_enq_marked_deleted(session, cluster_id, topic_id)
+    def _store_gd_msg_list(self, session, ctx_list):
+        """ Stores in SQL GD messages from one or more publications to the same topic, without committing the session.
+        Returns publications that were rejected because they would exceed the topic's max depth.
+        """
+        topic = ctx_list[0].topic
+        cluster_id = ctx_list[0].cluster_id
+        now = ctx_list[-1].now
+        rejected = []
+
+        # Test first if we should check the depth in this iteration.
+        if any(ctx.needs_depth_check for ctx in ctx_list):
+
+            # Get current depth of this topic - in SQL only if it is not known already ..
+            current_depth = topic.gd_depth
+
+            if current_depth is None:
+                current_depth = get_gd_depth_topic(session, cluster_id, topic.id)
+                topic.gd_depth = current_depth
+
+            # .. and reject publications for which max depth is already reached.
+            for ctx in ctx_list:
+                len_gd_msg_list = len(ctx.gd_msg_list)
+
+                if current_depth + len_gd_msg_list > topic.max_depth_gd:
+                    rejected.append(ctx)
+                else:
+                    # This only updates the local ctx variable
+                    current_depth += len_gd_msg_list
+                    ctx.current_depth = current_depth
+
+        # Publications with the same subscribers can be inserted together
+        by_sub_keys = OrderedDict()
+
+        for ctx in ctx_list:
+            if ctx not in rejected:
+                sub_keys = tuple(sub.sub_key for sub in ctx.subscriptions_by_topic)
+                subscriptions_by_topic, gd_msg_list = by_sub_keys.setdefault(sub_keys, (ctx.subscriptions_by_topic, []))
+                gd_msg_list.extend(ctx.gd_msg_list)
+
+                if has_logger_pubsub_debug:
+                    logger_pubsub.debug(_inserting_gd_msg, topic.name, [elem['pub_msg_id'] for elem in ctx.gd_msg_list],
+                        ctx.endpoint_name, ctx.ext_client_id, ctx.cid)
+
+        for subscriptions_by_topic, gd_msg_list in itervalues(by_sub_keys):
+
+            # This is the call that runs SQL INSERT statements with messages for topics and subscriber queues
+            sql_publish_with_retry(session, self.cid, cluster_id, topic.id, subscriptions_by_topic, gd_msg_list, now)
+
+        return rejected
+
+# ################################################################################################################################
+
+    def _publish_gd(self, ctx_list):
+        """ Stores GD messages from one or more publications in a new SQL transaction.
+        Returns publications that were rejected because they would exceed the topic's max depth.
+        """
+        with closing(self.odb.session()) as session:
+            rejected = self._store_gd_msg_list(session, ctx_list)
+
+            # Run an SQL commit for all queries above ..
+            session.commit()
+
+        # Messages that were not moved to any subscriber's queue wait in the topic, which increases its depth
+        for ctx in ctx_list:
+            if ctx not in rejected and not ctx.subscriptions_by_topic:
+                ctx.topic.incr_gd_depth(len(ctx.gd_msg_list))
+
+        return rejected
+
+# ################################################################################################################################
+
+    def _publish_gd_group(self, ctx_list):
+        """ Called by topics with group commits enabled to store GD messages from concurrent publications
+        in a single transaction. Returns an exception or None for each publication, in the same order as in ctx_list.
+        """
+        try:
+            rejected = self._publish_gd(ctx_list)
+
+        # If the group could not be stored, e.g. because one of the publishers sent a duplicate msg_id,
+        # each publication is stored in its own transaction so that only the ones that actually fail are reported.
+        except Exception:
+            logger_pubsub.info('Could not store a group of %d GD publications to `%s`, storing them separately, e:`%s`',
+                len(ctx_list), ctx_list[0].topic.name, format_exc())
+
+            out = []
+
+            for ctx in ctx_list:
+                try:
+                    rejected = self._publish_gd([ctx])
+                except Exception as e:
+                    out.append(e)
+                else:
+                    out.append(self.get_reject_exception(ctx.cid, ctx.topic.name, True) if rejected else None)
+
+            return out
+
+        else:
+            return [self.get_reject_exception(ctx.cid, ctx.topic.name, True) if ctx in rejected else None for ctx in ctx_list]
 
 # ################################################################################################################################
 
@@ -436,38 +533,18 @@ class Publish(AdminService):
         # We don't always have GD messages on input so there is no point in running an SQL transaction otherwise.
         if has_gd_msg_list:
 
-            with closing(self.odb.session()) as session:
-
-                # No matter if we can publish or not, we may possibly cleanup old messages first.
-                if ctx.topic.needs_msg_cleanup():
-                    self._cleanup_sql_data(session, ctx.cluster_id, ctx.topic.id, ctx.now)
-
-                # .. test first if we should check the depth in this iteration.
-                if ctx.topic.needs_depth_check():
-
-                    # Get current depth of this topic ..
-                    ctx.current_depth = get_gd_depth_topic(session, ctx.cluster_id, ctx.topic.id)
+            # Checked now because it depends on the topic's message counter which other publishers will increase
+            ctx.needs_depth_check = ctx.topic.needs_depth_check()
 
-                    # .. and abort if max depth is already reached.
-                    if ctx.current_depth + len_gd_msg_list > ctx.topic.max_depth_gd:
-                        self.reject_publication(ctx.topic.name, True)
-                    else:
+            # If group commits are enabled, our messages will be stored in SQL in a transaction shared with other
+            # publishers to the same topic. Either way, we return only after the messages have been committed.
+            if ctx.topic.gd_group_commit:
+                ctx.topic.gd_group_commit.publish(ctx, self._publish_gd_group)
 
-                        # This only updates the local ctx variable
-                        ctx.current_depth = ctx.current_depth + len_gd_msg_list
-
-                pub_msg_list = [elem['pub_msg_id'] for elem in ctx.gd_msg_list]
-
-                if has_logger_pubsub_debug:
-                    logger_pubsub.debug(_inserting_gd_msg, ctx.topic.name, pub_msg_list, ctx.endpoint_name,
-                        ctx.ext_client_id, self.cid)
-
-                # This is the call that runs SQL INSERT statements with messages for topics and subscriber queues
-                sql_publish_with_retry(session, self.cid, ctx.cluster_id, ctx.topic.id, ctx.subscriptions_by_topic,
-                    ctx.gd_msg_list, ctx.now)
-
-                # Run an SQL commit for all queries above ..
-                session.commit()
+            # .. otherwise, this publication has a transaction of its own.
+            else:
+                if self._publish_gd([ctx]):
+                    self.reject_publication(ctx.topic.name, True)
 
             # .. and set a flag to signal that there are some GD messages available
             ctx.pubsub.set_sync_has_msg(ctx.topic.id, True, True, 'Publish.publish', ctx.now)
@@ -546,13 +623,20 @@ class Publish(AdminService):
         else:
             self.response.payload.msg_id_list = ctx.msg_id_list
 
+# ################################################################################################################################
+
+    def get_reject_exception(self, cid, topic_name, is_gd):
+        """ Returns an exception indicating that a publication was rejected.
+        """
+        return ServiceUnavailable(cid,
+            'Publication rejected - would exceed {} max depth for `{}`'.format('GD' if is_gd else 'non-GD', topic_name))
+
 # ################################################################################################################################
 
     def reject_publication(self, topic_name, is_gd):
         """ Raises an exception to indicate that a publication was rejected.
         """
-        raise ServiceUnavailable(self.cid,
-            'Publication rejected - would exceed {} max depth for `{}`'.format('GD' if is_gd else 'non-GD', topic_name))
+        raise self.get_reject_exception(self.cid, topic_name, is_gd)
 
 # ################################################################################################################################
 
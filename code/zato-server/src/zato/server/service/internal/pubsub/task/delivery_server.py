@@ -14,6 +14,9 @@ from contextlib import closing
 # Bunch
 from bunch import bunchify
 
+# Python 2/3 compatibility
+from future.utils import iteritems
+
 # Zato
 from zato.common.odb.model import PubSubSubscription, Server, WebSocketClient, WebSocketClientPubSubKeys, WebSocketSubscription
 from zato.common.util.time_ import datetime_from_ms
@@ -132,6 +135,40 @@ class GetDeliveryServerDetails(AdminService):
 
 # ################################################################################################################################
 
+class GetDeliveryServerQueueDepthList(AdminService):
+    """ Returns queue depths of all delivery tasks on current PID in a single response.
+    """
+    name = 'pubsub.task.get-delivery-server-queue-depth-list'
+
+    class SimpleIO:
+        output_required = ('sub_key', 'topic_name', Int('messages'), Int('messages_gd'), Int('messages_non_gd'))
+        output_repeated = True
+        response_elem = None
+
+    def handle(self):
+
+        out = []
+
+        for sub_key, (gd_depth, non_gd_depth) in sorted(iteritems(self.pubsub.get_queue_depth_by_sub_key())):
+
+            # The subscription may have been just deleted, in which case its delivery task is about to stop
+            try:
+                topic_name = self.pubsub.get_topic_name_by_sub_key(sub_key)
+            except KeyError:
+                continue
+
+            out.append({
+                'sub_key': sub_key,
+                'topic_name': topic_name,
+                'messages': gd_depth + non_gd_depth,
+                'messages_gd': gd_depth,
+                'messages_non_gd': non_gd_depth,
+            })
+
+        self.response.payload[:] = out
+
+# ################################################################################################################################
+
 class DeliveryServerGetList(AdminService):
     """ Returns all delivery servers defined for cluster.
     """
@@ -22,7 +22,7 @@ from bunch import Bunch
 # dateutil
 from dateutil.parser import parse
 from dateutil.relativedelta import relativedelta
-from dateutil.rrule import MINUTELY, rrule, rruleset
+from dateutil.rrule import DAILY, HOURLY, MINUTELY, rrule, rruleset
 
 # SciPy
 from scipy import stats as sp_stats
@@ -37,9 +37,30 @@ from zato.common.broker_message import STATS
 from zato.common.odb.model import Service
 from zato.server.service import Integer, UTC
 from zato.server.service.internal import AdminService, AdminSIO
+from zato.server.stats import get_index_key, _raw_by_minute_expire
 
 STATS_KEYS = ('usage', 'max', 'rate', 'mean', 'min')
 
+# Prefixes of aggregated keys -> how often they are created and what format their suffixes use
+AGGR_SUFFIX_INFO = {
+    KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE: (MINUTELY, '%Y:%m:%d:%H:%M'),
+    KVDB.SERVICE_TIME_AGGREGATED_BY_HOUR: (HOURLY, '%Y:%m:%d:%H'),
+    KVDB.SERVICE_TIME_AGGREGATED_BY_DAY: (DAILY, '%Y:%m:%d'),
+}
+
+# How many parts, separated by colons, suffixes of statistics keys are made of - used when migrating to indexed keys
+SUFFIX_PARTS = {
+    KVDB.SERVICE_TIME_RAW_BY_MINUTE: 5,
+    KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE: 5,
+    KVDB.SERVICE_TIME_AGGREGATED_BY_HOUR: 4,
+    KVDB.SERVICE_TIME_AGGREGATED_BY_DAY: 3,
+    KVDB.SERVICE_TIME_AGGREGATED_BY_MONTH: 2,
+    KVDB.SERVICE_SUMMARY_BY_DAY: 3,
+    KVDB.SERVICE_SUMMARY_BY_WEEK: 3,
+    KVDB.SERVICE_SUMMARY_BY_MONTH: 2,
+    KVDB.SERVICE_SUMMARY_BY_YEAR: 1,
+}
+
 def stop_excluding_rrset(freq, start, stop):
     rrs = rruleset()
     rrs.rrule(rrule(freq, dtstart=start, until=stop))
@@ -47,6 +68,19 @@ def stop_excluding_rrset(freq, start, stop):
 
     return rrs
 
+def get_sub_suffixes(key_suffix, suffix_format, freq, sub_suffix_format):
+    """ Returns all the suffixes of a finer granularity that a given suffix consists of,
+    e.g. all the minutes of an hour or all the days of a month.
+    """
+    out = []
+
+    for elem in rrule(freq, dtstart=datetime.strptime(key_suffix, suffix_format)):
+        if elem.strftime(suffix_format) != key_suffix:
+            break
+        out.append(elem.strftime(sub_suffix_format))
+
+    return out
+
 # ##############################################################################
 
 class Delete(AdminService):
@@ -95,47 +129,53 @@ class BaseAggregatingService(AdminService):
         else:
             return 0, 0, 0, 0
 
-    def collect_service_stats(self, keys_pattern, key_prefix, key_suffix, total_seconds,
-                              suffix_needs_colon=True, chop_off_service_name=True, needs_rate=True):
-
+    def collect_service_stats(self, key_prefix, key_suffixes, total_seconds, needs_rate=True):
+        """ Collects statistics of all the services that have data under a given key prefix in any of the periods
+        that key_suffixes point to. Only keys listed in indexes of these periods are read.
+        """
         service_stats = {}
-        if suffix_needs_colon:
-            key_suffix = ':' + key_suffix
+        conn = self.kvdb.conn
 
-        for key in self.kvdb.conn.keys(keys_pattern):
-            service_name = key.replace(key_prefix, '').replace(key_suffix, '')
-            if chop_off_service_name:
-                service_name = service_name[:-3]
+        for key_suffix in key_suffixes:
 
-            values = self.kvdb.conn.hgetall(key)
+            service_names = list(conn.smembers(get_index_key(key_prefix, key_suffix)))
+            if not service_names:
+                continue
 
-            stats = service_stats.setdefault(service_name, {})
+            with conn.pipeline() as pipe:
+                for service_name in service_names:
+                    pipe.hgetall('{}{}:{}'.format(key_prefix, service_name, key_suffix))
+                all_values = pipe.execute()
 
-            for name in STATS_KEYS:
+            for service_name, values in zip(service_names, all_values):
 
-                value = values.get(name)
-                if value:
-                    if name in('rate', 'mean'):
-                        value = float(value)
-                    else:
-                        value = int(value)
+                stats = service_stats.setdefault(service_name, {})
 
-                    if not name in stats:
-                        if name == 'mean':
-                            stats[name] = []
-                        elif name == 'min':
-                            stats[name] = maxint
-                        else:
-                            stats[name] = 0
+                for name in STATS_KEYS:
 
-                    if name == 'usage':
-                        stats[name] += value
-                    elif name == 'max':
-                        stats[name] = max(stats[name], value)
-                    elif name == 'mean':
-                        stats[name].append(value)
-                    elif name == 'min':
-                        stats[name] = min(stats[name], value)
+                    value = values.get(name)
+                    if value:
+                        if name in('rate', 'mean'):
+                            value = float(value)
+                        else:
+                            value = int(value)
+
+                        if not name in stats:
+                            if name == 'mean':
+                                stats[name] = []
+                            elif name == 'min':
+                                stats[name] = maxint
+                            else:
+                                stats[name] = 0
+
+                        if name == 'usage':
+                            stats[name] += value
+                        elif name == 'max':
+                            stats[name] = max(stats[name], value)
+                        elif name == 'mean':
+                            stats[name].append(value)
+                        elif name == 'min':
+                            stats[name] = min(stats[name], value)
 
         for service_name, values in service_stats.items():
             mean = values.get('mean')
@@ -162,27 +202,36 @@ class BaseAggregatingService(AdminService):
             total_seconds = mdays[delta_diff.month] * SECONDS_IN_DAY # TODO: Use calendar.monthrange instead of mdays so leap years are taken into account
 
         key_suffix = delta_diff.strftime(source_strftime_format)
+        freq, sub_suffix_format = AGGR_SUFFIX_INFO[source]
+
         service_stats = self.collect_service_stats(
-            '{}*:{}*'.format(source, key_suffix), source, key_suffix, total_seconds)
+            source, get_sub_suffixes(key_suffix, source_strftime_format, freq, sub_suffix_format), total_seconds)
 
         self.hset_aggr_keys(service_stats, target, key_suffix)
 
+    def get_expire_after(self):
+        """ Returns in how many seconds aggregated keys should expire.
+        """
+        expire_after = int(self.server.fs_server_config.get('stats', {}).get('expire_after', 24))
+        return expire_after * 60 * 60 # Hours times minutes in an hour and seconds in a minute
+
     def hset_aggr_keys(self, service_stats, key_prefix, key_suffix):
         for service_name, values in service_stats.items():
-            if service_name.endswith(':'):
-                service_name = service_name[:-1]
-
-            aggr_key = '{}{}:{}'.format(key_prefix, service_name, key_suffix)
-            for name in STATS_KEYS:
-                self.hset_aggr_key(aggr_key, name, values[name])
+            self.hset_aggr_values(key_prefix, service_name, key_suffix, values)
 
-    def hset_aggr_key(self, aggr_key, hash_key, hash_value):
-        self.server.kvdb.conn.hset(aggr_key, hash_key, hash_value)
+    def hset_aggr_values(self, key_prefix, service_name, key_suffix, values):
+        """ Stores aggregated values of a service and adds the service to the index of a given period.
+        """
+        aggr_key = '{}{}:{}'.format(key_prefix, service_name, key_suffix)
+        index_key = get_index_key(key_prefix, key_suffix)
+        expire_after = self.get_expire_after()
 
-        # Expire the aggregated key after that many hours
-        expire_after = int(self.server.fs_server_config.get('stats', {}).get('expire_after', 24))
-        expire_after = expire_after * 60 * 60 # Hours times minutes in an hour and seconds in a minute
-        self.server.kvdb.conn.expire(aggr_key, expire_after)
+        with self.server.kvdb.conn.pipeline() as pipe:
+            pipe.hmset(aggr_key, {name: values[name] for name in STATS_KEYS})
+            pipe.expire(aggr_key, expire_after)
+            pipe.sadd(index_key, service_name)
+            pipe.expire(index_key, expire_after)
+            pipe.execute()
 
 # ##############################################################################
 
@@ -205,9 +254,9 @@ class ProcessRawTimes(BaseAggregatingService):
             key, value = item.split('=')
             config[key] = int(value)
 
-        for key in self.server.kvdb.conn.keys(KVDB.SERVICE_TIME_RAW + '*'):
+        for service_name in self.server.kvdb.conn.smembers(KVDB.SERVICE_TIME_RAW_INDEX):
 
-            service_name = key.replace(KVDB.SERVICE_TIME_RAW, '')
+            key = KVDB.SERVICE_TIME_RAW + service_name
 
             current_mean = float(
                 self.server.kvdb.conn.hget(KVDB.SERVICE_TIME_BASIC + service_name, 'mean_all_time') or 0)
@@ -246,18 +295,20 @@ class AggregateByMinute(BaseAggregatingService):
         now = datetime.utcnow()
         key_suffix = (now - timedelta(minutes=2)).strftime('%Y:%m:%d:%H:%M')
 
-        for key in self.server.kvdb.conn.keys('{}*:{}'.format(KVDB.SERVICE_TIME_RAW_BY_MINUTE, key_suffix)):
+        index_key = get_index_key(KVDB.SERVICE_TIME_RAW_BY_MINUTE, key_suffix)
 
-            service_name = key.replace(KVDB.SERVICE_TIME_RAW_BY_MINUTE, '').replace(':' + key_suffix, '')
-            aggr_key = '{}{}:{}'.format(KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, service_name, key_suffix)
+        for service_name in self.server.kvdb.conn.smembers(index_key):
 
+            key = '{}{}:{}'.format(KVDB.SERVICE_TIME_RAW_BY_MINUTE, service_name, key_suffix)
             batch_min, batch_max, batch_mean, batch_total = self.aggregate_raw_times(key, service_name)
 
-            self.hset_aggr_key(aggr_key, 'min', batch_min)
-            self.hset_aggr_key(aggr_key, 'max', batch_max)
-            self.hset_aggr_key(aggr_key, 'mean', batch_mean)
-            self.hset_aggr_key(aggr_key, 'usage', batch_total)
-            self.hset_aggr_key(aggr_key, 'rate', batch_total / 60.0) # I.e. req/s
+            self.hset_aggr_values(KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, service_name, key_suffix, {
+                'min': batch_min,
+                'max': batch_max,
+                'mean': batch_mean,
+                'usage': batch_total,
+                'rate': batch_total / 60.0, # I.e. req/s
+            })
 
             # Raw per-minute statistics keys will expire by themselves, we don't need
             # to delete them manually.
@@ -309,6 +360,57 @@ class AggregateByMonth(BaseAggregatingService):
 
 # ##############################################################################
 
+class MigrateIndex(BaseAggregatingService):
+    """ Adds to indexes all the statistics keys created before the keys began to be indexed.
+    Runs once per cluster and uses SCAN rather than KEYS so as not to block KVDB.
+    """
+    def handle(self):
+
+        conn = self.server.kvdb.conn
+
+        if not conn.setnx(KVDB.SERVICE_STATS_INDEX_MIGRATED, datetime.utcnow().isoformat()):
+            return
+
+        # Longer prefixes first so that, e.g. raw-by-minute keys are not taken for raw ones
+        prefixes = sorted(SUFFIX_PARTS, key=len, reverse=True)
+
+        # Indexes expire when their keys do, i.e. the same way that they would if they were created by StatsCollector
+        # or by aggregating services - raw per-minute keys are kept for a few minutes only and all the other ones
+        # for as long as server.conf says.
+        expire_after = dict.fromkeys(SUFFIX_PARTS, self.get_expire_after())
+        expire_after[KVDB.SERVICE_TIME_RAW_BY_MINUTE] = _raw_by_minute_expire
+
+        with conn.pipeline() as pipe:
+
+            for idx, key in enumerate(conn.scan_iter('zato:stats:service:*', 1000), 1):
+
+                if key.startswith(KVDB.SERVICE_TIME_RAW) and not key.startswith(KVDB.SERVICE_TIME_RAW_BY_MINUTE):
+                    pipe.sadd(KVDB.SERVICE_TIME_RAW_INDEX, key[len(KVDB.SERVICE_TIME_RAW):])
+
+                else:
+                    for prefix in prefixes:
+                        if key.startswith(prefix):
+                            parts = key[len(prefix):].split(':')
+                            suffix_parts = SUFFIX_PARTS[prefix]
+
+                            service_name = ':'.join(parts[:-suffix_parts])
+                            key_suffix = ':'.join(parts[-suffix_parts:])
+                            index_key = get_index_key(prefix, key_suffix)
+
+                            pipe.sadd(index_key, service_name)
+                            pipe.expire(index_key, expire_after[prefix])
+                            break
+
+                # Flush the pipeline every now and then so it never grows too big
+                if idx % 1000 == 0:
+                    pipe.execute()
+
+            pipe.execute()
+
+        self.logger.info('Statistics keys migrated to indexes')
+
+# ##############################################################################
+
 class StatsReturningService(AdminService):
     """ A base class for services returning time-oriented statistics.
     """
@@ -392,11 +494,24 @@ class StatsReturningService(AdminService):
         # Optionally, the last one will pick only top n elements of a given type (top mean response time
         # or top usage).
 
-        # 1st pass
-        for suffix in suffixes:
-            keys = self.server.kvdb.conn.keys('{}{}:{}'.format(stats_key_prefix, service, suffix))
-            for key in keys:
-                service_name = key.replace(stats_key_prefix, '').replace(':{}'.format(suffix), '')
+        # 1st pass - reads indexes of all the periods in one pipeline
+        with self.server.kvdb.conn.pipeline() as pipe:
+            for suffix in suffixes:
+                index_key = get_index_key(stats_key_prefix, suffix)
+                if service == '*':
+                    pipe.smembers(index_key)
+                else:
+                    pipe.sismember(index_key, service)
+            index_results = pipe.execute()
+
+        for suffix, index_result in zip(suffixes, index_results):
+
+            if service == '*':
+                service_names = index_result
+            else:
+                service_names = [service] if index_result else []
+
+            for service_name in service_names:
 
                 stats_elem = StatsElem(service_name)
                 stats_elems[service_name] = stats_elem
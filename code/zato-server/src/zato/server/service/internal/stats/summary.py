@@ -144,7 +144,7 @@ class BaseSummarizingService(BaseAggregatingService):
         return (elem.strftime('%Y') for elem in stop_excluding_rrset(YEARLY, start, stop))
 
     def _get_patterns(self, now, start, stop, kvdb_key, method):
-        return ('{}*:{}'.format(kvdb_key, elem) for elem in method(now, start, stop))
+        return ((kvdb_key, elem) for elem in method(now, start, stop))
 
     def get_by_minute_patterns(self, now, start=None, stop=None):
         return self._get_patterns(now, start, stop, KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, self.get_minutely_suffixes)
@@ -178,10 +178,8 @@ class BaseSummarizingService(BaseAggregatingService):
 
             services = {}
 
-            for elem in chain(*patterns):
-                prefix, suffix = elem.split('*')
-                suffix = suffix[1:]
-                stats = self.collect_service_stats(elem, prefix, suffix, None, False, False, False)
+            for prefix, suffix in chain(*patterns):
+                stats = self.collect_service_stats(prefix, [suffix], None, False)
 
                 for service_name, values in stats.items():
                     stats = services.setdefault(service_name, deepcopy(DEFAULT_STATS))
@@ -146,16 +146,21 @@ class Request(SIOConverter):
 
 # ################################################################################################################################
 
-    def init(self, is_sio, cid, sio, data_format, transport, wsgi_environ, encrypt_func):
+    def init(self, is_sio, cid, sio, data_format, transport, wsgi_environ, encrypt_func, sio_input_plan=None):
         """ Initializes the object with an invocation-specific data.
         """
         self.input = ServiceInput()
         self.encrypt_func = encrypt_func
 
         if is_sio:
-            required_list = getattr(sio, 'input_required', [])
-            required_list = [required_list] if isinstance(required_list, basestring) else required_list
-            self.init_flat_sio(cid, sio, data_format, transport, wsgi_environ, required_list)
+
+            # The plan can be used only if it was compiled for the same SimpleIO configuration that we have
+            if sio_input_plan is not None and sio_input_plan.simple_io_config is self.simple_io_config:
+                self.init_compiled_sio(cid, sio_input_plan, data_format, transport, wsgi_environ)
+            else:
+                required_list = getattr(sio, 'input_required', [])
+                required_list = [required_list] if isinstance(required_list, basestring) else required_list
+                self.init_flat_sio(cid, sio, data_format, transport, wsgi_environ, required_list)
 
         # We merge channel params in if requested even if it's not SIO
         else:
@@ -216,6 +221,34 @@ class Request(SIOConverter):
             if param not in self.input:
                 self.input[param] = value
 
+# ################################################################################################################################
+
+    def init_compiled_sio(self, cid, sio_input_plan, data_format, transport, wsgi_environ):
+        """ Initializes flat SIO requests using an input plan compiled when the service was deployed.
+        """
+        self.is_xml = data_format == SIMPLE_IO.FORMAT.XML
+        self.data_format = data_format
+        self.transport = transport
+        self._wsgi_environ = wsgi_environ
+        self.encrypt_secrets = sio_input_plan.encrypt_secrets
+
+        self.has_simple_io_config = True
+        self.bool_parameter_prefixes = sio_input_plan.bool_parameter_prefixes
+        self.int_parameters = sio_input_plan.int_parameters
+        self.int_parameter_suffixes = sio_input_plan.int_parameter_suffixes
+        self.bytes_to_str_encoding = sio_input_plan.bytes_to_str_encoding
+
+        # Needs to check for this exact default value to prevent a FutureWarning in 'if not self.payload'
+        if sio_input_plan.has_required and self.payload == '' and not self.channel_params:
+            raise ZatoException(cid, 'Missing input')
+
+        self.input.update(sio_input_plan.get_params(cid, self.payload, data_format, self.channel_params, self.params_priority,
+            self.encrypt_func, self.logger))
+
+        for param, value in iteritems(self.channel_params):
+            if param not in self.input:
+                self.input[param] = value
+
 # ################################################################################################################################
 
     def get_params(self, params_to_visit, use_channel_params_only, path_prefix='', default_value=NO_DEFAULT_VALUE,
@@ -282,12 +315,16 @@ class SimpleIOPayload(SIOConverter):
     All of the attributes are prefixed with zato_ so that they don't conflict with non-Zato data..
     """
     def __init__(self, zato_cid, data_format, required_list, optional_list, simple_io_config, response_elem, namespace,
-            output_repeated, skip_empty, ignore_skip_empty, allow_empty_required, _sio_container=(tuple, list)):
+            output_repeated, skip_empty, ignore_skip_empty, allow_empty_required, sio_output_plan=None,
+            _sio_container=(tuple, list)):
         self.zato_cid = zato_cid
         self.zato_data_format = data_format
         self.zato_is_xml = self.zato_data_format == SIMPLE_IO.FORMAT.XML
         self.zato_output = []
 
+        # XML responses are always produced without a compiled plan
+        self.zato_sio_output_plan = None if self.zato_is_xml else sio_output_plan
+
         required_list = required_list if isinstance(required_list, _sio_container) else [required_list]
         optional_list = optional_list if isinstance(optional_list, _sio_container) else [optional_list]
 
@@ -423,7 +460,18 @@ class SimpleIOPayload(SIOConverter):
             else:
                 value = {}
 
-        if self.zato_output_repeated:
+        if self.zato_sio_output_plan is not None:
+            plan = self.zato_sio_output_plan
+
+            if self.zato_output_repeated:
+                value = plan.get_items(self.zato_cid, self.zato_output, self.zato_data_format)
+            else:
+                value = plan.get_items(self.zato_cid, [dict((name, getattr(self, name, '')) for name in plan.names)],
+                    self.zato_data_format)[0]
+
+            output = None
+
+        elif self.zato_output_repeated:
             output = self.zato_output
         else:
             output = set(dir(self)) & self.zato_all_attrs
@@ -632,24 +680,40 @@ class Response(object):
 
     payload = property(_get_payload, _set_payload)
 
-    def init(self, cid, io, data_format, _not_given=NOT_GIVEN):
+    def init(self, cid, io, data_format, sio_output_plan=None, _not_given=NOT_GIVEN):
         self.data_format = data_format
 
-        required_list = getattr(io, 'output_required', [])
-        required_list = [required_list] if isinstance(required_list, basestring) else required_list
+        # Use the compiled plan only if it was built for the same SimpleIO configuration that we have
+        if sio_output_plan is not None and sio_output_plan.simple_io_config is self.simple_io_config:
+            required_list = sio_output_plan.required_list
+            optional_list = sio_output_plan.optional_list
+            response_elem = sio_output_plan.response_elem
+            namespace = sio_output_plan.namespace
+            output_repeated = sio_output_plan.output_repeated
+            skip_empty_keys = sio_output_plan.skip_empty_keys
+            force_empty_keys = sio_output_plan.force_empty_keys
+            allow_empty_required = sio_output_plan.allow_empty_required
+
+        else:
+            sio_output_plan = None
+
+            required_list = getattr(io, 'output_required', [])
+            required_list = [required_list] if isinstance(required_list, basestring) else required_list
+
+            optional_list = getattr(io, 'output_optional', [])
+            optional_list = [optional_list] if isinstance(optional_list, basestring) else optional_list
 
-        optional_list = getattr(io, 'output_optional', [])
-        optional_list = [optional_list] if isinstance(optional_list, basestring) else optional_list
+            response_elem = getattr(io, 'response_elem', _not_given)
+            response_elem = response_elem if response_elem != _not_given else 'response'
+            namespace = getattr(io, 'namespace', '')
+            output_repeated = getattr(io, 'output_repeated', False)
+            skip_empty_keys = getattr(io, 'skip_empty_keys', False)
+            force_empty_keys = getattr(io, 'force_empty_keys', [])
+            allow_empty_required = getattr(io, 'allow_empty_required', False)
 
-        response_elem = getattr(io, 'response_elem', _not_given)
-        response_elem = response_elem if response_elem != _not_given else 'response'
-        namespace = getattr(io, 'namespace', '')
-        output_repeated = getattr(io, 'output_repeated', False)
         self.outgoing_declared = True if required_list or optional_list else False
-        skip_empty_keys = getattr(io, 'skip_empty_keys', False)
-        force_empty_keys = getattr(io, 'force_empty_keys', [])
-        allow_empty_required = getattr(io, 'allow_empty_required', False)
 
         if required_list or optional_list:
             self._payload = SimpleIOPayload(cid, data_format, required_list, optional_list, self.simple_io_config,
-                response_elem, namespace, output_repeated, skip_empty_keys, force_empty_keys, allow_empty_required)
+                response_elem, namespace, output_repeated, skip_empty_keys, force_empty_keys, allow_empty_required,
+                sio_output_plan)
@@ -26,7 +26,7 @@ from paste.util.converters import asbool
 
 # Python 2/3 compatibility
 from builtins import bytes
-from past.builtins import cmp, unicode
+from past.builtins import basestring, cmp, unicode
 
 # Zato
 from zato.common import APISPEC, DATA_FORMAT, NO_DEFAULT_VALUE, PARAMS_PRIORITY, ParsingException, path, SECRETS, \
@@ -593,6 +593,351 @@ def convert_param(cid, payload, param, data_format, is_required, default_value,
 
 # ################################################################################################################################
 
+_special_values = (str(ZATO_NONE), str(ZATO_SEC_USE_RBAC))
+
+def _convert_input_plain(entry, value, *ignored):
+    return value
+
+def _convert_input_bool(entry, value, *ignored):
+    return None if value == '' else asbool(value or None) # value can be an empty string and asbool chokes on that
+
+def _convert_input_force_type(entry, value, data_format, *ignored):
+    if value is None or value == '':
+        return None
+    return entry.param.convert(value, entry.name, data_format, False)
+
+def _convert_input_int(entry, value, *ignored):
+    if value == b'':
+        return None
+    if value and value not in _special_values:
+        return int(value)
+    return value
+
+def _convert_input_secret(entry, value, data_format, encrypt_func):
+    if value and encrypt_func and value not in _special_values:
+        return encrypt_func(value)
+    return value
+
+# ################################################################################################################################
+
+def _convert_output_bool(entry, value, *ignored):
+    return entry.empty_value if value == '' else asbool(value or None)
+
+def _convert_output_force_type(entry, value, data_format, *ignored):
+    if value is None:
+        return None
+    if value == '':
+        return entry.empty_value
+    return entry.param.convert(value, entry.name, data_format, True)
+
+_convert_output_int = _convert_input_int
+_convert_output_plain = _convert_input_plain
+
+# ################################################################################################################################
+
+def _run_converter(cid, entry, value, data_format, encrypt_func=None):
+    """ Runs a value through the entry's converter, handling errors the same way that convert_sio does.
+    """
+    try:
+        return entry.converter(entry, value, data_format, encrypt_func)
+    except Exception as e:
+        if isinstance(e, Reportable):
+            e.cid = cid
+            raise
+        else:
+            msg = 'Conversion error, param:`{}`, param_name:`{}`, repr:`{}`, type:`{}`, e:`{}`'.format(
+                entry.param, entry.name, repr(value), type(value), format_exc())
+            logger.error(msg)
+
+            raise ZatoException(msg=msg)
+
+# ################################################################################################################################
+
+class SIOInputParam(object):
+    """ A single input parameter of a SimpleIO definition along with everything about it that does not depend on requests.
+    """
+    __slots__ = ('name', 'param', 'is_required', 'is_complex', 'is_as_is', 'converter', 'default')
+
+    def __init__(self, param, is_required, default_value, encrypt_secrets, bool_parameter_prefixes, int_parameters,
+        int_parameter_suffixes):
+
+        self.name = param.name if isinstance(param, ForceType) else param
+        self.param = param
+        self.is_required = is_required
+        self.is_complex = isinstance(param, COMPLEX_VALUE)
+        self.is_as_is = isinstance(param, (AsIs, Opaque))
+
+        # Used if the parameter is optional and there is no value for it on input
+        self.default = resolve_default_value(param, default_value)
+
+        # The same order of checks as in convert_sio
+        if is_bool(param, self.name, bool_parameter_prefixes):
+            self.converter = _convert_input_bool
+        elif isinstance(param, ForceType):
+            self.converter = _convert_input_force_type
+        elif is_int(self.name, int_parameters, int_parameter_suffixes):
+            self.converter = _convert_input_int
+        elif encrypt_secrets and is_secret(self.name):
+            self.converter = _convert_input_secret
+        else:
+            self.converter = _convert_input_plain
+
+    def __repr__(self):
+        return '<{} at {} name:`{}` required:`{}` converter:`{}`>'.format(
+            self.__class__.__name__, hex(id(self)), self.name, self.is_required, self.converter.__name__)
+
+# ################################################################################################################################
+
+class SIOInputPlan(object):
+    """ SimpleIO input of a service compiled into a flat list of parameters. Built once per service class,
+    when it is deployed, and then used by Request for each invocation instead of looking up the same SimpleIO attributes
+    and server-wide configuration on each request.
+    """
+    __slots__ = ('simple_io_config', 'params', 'has_required', 'path_prefix', 'default_value', 'use_text',
+        'use_channel_params_only', 'encrypt_secrets', 'bytes_to_str_encoding', 'bool_parameter_prefixes', 'int_parameters',
+        'int_parameter_suffixes')
+
+    def __init__(self, sio, simple_io_config, _sio_container=(tuple, list)):
+
+        # Request will use this plan only if it is given the very same configuration that the plan was built with
+        self.simple_io_config = simple_io_config
+
+        required_list = getattr(sio, 'input_required', [])
+        required_list = required_list if isinstance(required_list, _sio_container) else [required_list]
+
+        optional_list = getattr(sio, 'input_optional', [])
+        optional_list = optional_list if isinstance(optional_list, _sio_container) else [optional_list]
+
+        self.path_prefix = getattr(sio, 'request_elem', 'request')
+        self.default_value = getattr(sio, 'default_value', NO_DEFAULT_VALUE)
+        self.use_text = getattr(sio, 'use_text', True)
+        self.use_channel_params_only = getattr(sio, 'use_channel_params_only', False)
+        self.encrypt_secrets = getattr(sio, 'encrypt_secrets', True)
+        self.bytes_to_str_encoding = simple_io_config['bytes_to_str']['encoding']
+
+        self.bool_parameter_prefixes = simple_io_config.get('bool_parameter_prefixes', [])
+        self.int_parameters = simple_io_config.get('int_parameters', [])
+        self.int_parameter_suffixes = simple_io_config.get('int_parameter_suffixes', [])
+
+        self.params = []
+        self.has_required = bool(required_list)
+
+        for is_required, params in ((True, required_list), (False, optional_list)):
+            for param in params:
+                self.params.append(SIOInputParam(param, is_required, self.default_value, self.encrypt_secrets,
+                    self.bool_parameter_prefixes, self.int_parameters, self.int_parameter_suffixes))
+
+# ################################################################################################################################
+
+    def _get_value(self, cid, entry, payload, data_format, get_from_payload, channel_params, channel_first, encrypt_func):
+        """ Returns a value of a single input parameter - what convert_param does but with all the per-parameter
+        decisions already made.
+        """
+        # We've got a value from the channel, i.e. in GET parameters
+        channel_value = channel_params.get(entry.name, ZATO_NONE)
+
+        if channel_value != ZATO_NONE:
+            channel_value = _run_converter(cid, entry, channel_value, data_format, encrypt_func)
+
+        # Return the value immediately if we already know channel_params are of higer priority
+        if channel_first and channel_value != ZATO_NONE:
+            return channel_value
+
+        if payload is not None:
+            value = get_from_payload(payload, entry.name, cid, entry.is_required, entry.is_complex,
+                self.default_value, self.path_prefix, self.use_text)
+        else:
+            value = NOT_GIVEN
+
+        if (not isinstance(value, PubSubMessage)) and value == NOT_GIVEN:
+            if self.default_value != NO_DEFAULT_VALUE:
+                return self.default_value
+
+            if entry.is_required:
+
+                # Nothing in payload but it still may be in channel_params
+                if channel_value is not None and channel_value != ZATO_NONE:
+                    return channel_value
+
+                msg = 'Required input element:`{}` not found, value:`{}`, data_format:`{}`, payload:`{}`'\
+                    ', channel_params:`{}`'.format(entry.param, ZATO_NONE, data_format, payload, channel_params)
+                raise ParsingException(cid, msg)
+
+            return entry.default
+
+        if value is not None and not entry.is_complex:
+            if isinstance(value, bytes):
+                value = value.decode('utf-8')
+            else:
+                value = unicode(value)
+
+        if entry.is_as_is:
+            return value
+
+        return _run_converter(cid, entry, value, data_format, encrypt_func)
+
+# ################################################################################################################################
+
+    def get_params(self, cid, payload, data_format, channel_params, params_priority, encrypt_func, request_logger):
+        """ Returns all of the input parameters extracted from a request and converted. Raises ParsingException
+        if any is missing or cannot be converted.
+        """
+        params = {}
+
+        if self.use_channel_params_only:
+            payload = ''
+
+        get_from_payload = convert_impl[data_format]
+        channel_first = params_priority == PARAMS_PRIORITY.CHANNEL_PARAMS_OVER_MSG
+        bytes_to_str_encoding = self.bytes_to_str_encoding
+
+        for entry in self.params:
+            try:
+                value = self._get_value(
+                    cid, entry, payload, data_format, get_from_payload, channel_params, channel_first, encrypt_func)
+
+                if bytes_to_str_encoding and isinstance(value, bytes):
+                    value = value.decode(bytes_to_str_encoding)
+
+                params[entry.name] = value
+
+            except Exception:
+                msg = 'Caught an exception, param:`{}`, params_to_visit:`{}`, has_simple_io_config:`{}`, e:`{}`'.format(
+                    entry.param, [elem.param for elem in self.params if elem.is_required == entry.is_required], True,
+                    format_exc())
+                request_logger.error(msg)
+                raise ParsingException(msg)
+
+        return params
+
+# ################################################################################################################################
+
+class SIOOutputParam(object):
+    """ A single output parameter of a SimpleIO definition along with everything about it that does not depend on responses.
+    """
+    __slots__ = ('name', 'param', 'is_required', 'is_as_is', 'may_skip', 'empty_value', 'converter')
+
+    def __init__(self, param, is_required, skip_empty_keys, force_empty_keys, bool_parameter_prefixes, int_parameters,
+        int_parameter_suffixes):
+
+        self.name = param.name if isinstance(param, ForceType) else param
+        self.param = param
+        self.is_required = is_required
+        self.is_as_is = isinstance(param, AsIs)
+
+        # Whether the key may be omitted in output if its value is empty
+        self.may_skip = skip_empty_keys and param not in force_empty_keys
+
+        # What empty strings are turned into by converters
+        self.empty_value = _resolve_output_value(param, skip_empty_keys)
+
+        # The same order of checks as in convert_sio, secrets are never encrypted on output
+        if is_bool(param, self.name, bool_parameter_prefixes):
+            self.converter = _convert_output_bool
+        elif isinstance(param, ForceType):
+            self.converter = _convert_output_force_type
+        elif is_int(self.name, int_parameters, int_parameter_suffixes):
+            self.converter = _convert_output_int
+        else:
+            self.converter = _convert_output_plain
+
+    def __repr__(self):
+        return '<{} at {} name:`{}` required:`{}` converter:`{}`>'.format(
+            self.__class__.__name__, hex(id(self)), self.name, self.is_required, self.converter.__name__)
+
+# ################################################################################################################################
+
+class SIOOutputPlan(object):
+    """ SimpleIO output of a service compiled into a flat list of parameters. Built once per service class, when it is
+    deployed, and then used by Response and SimpleIOPayload to produce non-XML responses in a single pass over output rows.
+    """
+    __slots__ = ('simple_io_config', 'params', 'required_list', 'optional_list', 'names', 'response_elem', 'namespace',
+        'output_repeated', 'skip_empty_keys', 'force_empty_keys', 'allow_empty_required', 'bytes_to_str_encoding')
+
+    def __init__(self, sio, simple_io_config, _not_given=NOT_GIVEN, _sio_container=(tuple, list)):
+
+        # As with input, responses will use this plan only if they have the same configuration that the plan was built with
+        self.simple_io_config = simple_io_config
+
+        required_list = getattr(sio, 'output_required', [])
+        self.required_list = required_list if isinstance(required_list, _sio_container) else [required_list]
+
+        optional_list = getattr(sio, 'output_optional', [])
+        self.optional_list = optional_list if isinstance(optional_list, _sio_container) else [optional_list]
+
+        response_elem = getattr(sio, 'response_elem', _not_given)
+        self.response_elem = response_elem if response_elem != _not_given else 'response'
+        self.namespace = getattr(sio, 'namespace', '')
+        self.output_repeated = getattr(sio, 'output_repeated', False)
+        self.skip_empty_keys = getattr(sio, 'skip_empty_keys', False)
+        self.force_empty_keys = getattr(sio, 'force_empty_keys', [])
+        self.allow_empty_required = getattr(sio, 'allow_empty_required', False)
+        self.bytes_to_str_encoding = simple_io_config['bytes_to_str']['encoding']
+
+        bool_parameter_prefixes = simple_io_config.get('bool_parameter_prefixes', [])
+        int_parameters = simple_io_config.get('int_parameters', [])
+        int_parameter_suffixes = simple_io_config.get('int_parameter_suffixes', [])
+
+        self.params = []
+
+        for is_required, params in ((True, self.required_list), (False, self.optional_list)):
+            for param in params:
+                self.params.append(SIOOutputParam(param, is_required, self.skip_empty_keys, self.force_empty_keys,
+                    bool_parameter_prefixes, int_parameters, int_parameter_suffixes))
+
+        self.names = [entry.name for entry in self.params]
+
+# ################################################################################################################################
+
+    def get_items(self, cid, output, data_format, _basestring=basestring, _bytes=bytes, _dict=dict):
+        """ Turns a list of dicts, keyed tuples or SQLAlchemy objects into a list of output dicts.
+        """
+        out = []
+        params = self.params
+        allow_empty_required = self.allow_empty_required
+        bytes_to_str_encoding = self.bytes_to_str_encoding
+
+        for item in output:
+
+            out_item = {}
+            is_dict = isinstance(item, _dict)
+
+            for entry in params:
+
+                value = item.get(entry.name, '') if is_dict else getattr(item, entry.name, '')
+
+                # Empty strings are either allowed as they are or they must not be used for required elements
+                if isinstance(value, _basestring) and not value:
+                    if value == '' and allow_empty_required:
+                        if not entry.may_skip:
+                            out_item[entry.name] = value
+                        continue
+
+                    if entry.is_required:
+                        raise ZatoException(cid, 'Expected elem:`{}` not found in item:`{!r}`'.format(
+                            entry.param, (item.keys(), item) if (not is_dict and hasattr(item, 'keys')) else item))
+
+                if not entry.is_as_is:
+                    value = _run_converter(cid, entry, value, data_format)
+
+                    if bytes_to_str_encoding and isinstance(value, _bytes):
+                        value = value.decode(bytes_to_str_encoding)
+
+                if not value and value != 0:
+                    if entry.may_skip:
+                        continue
+
+                if isinstance(value, _bytes):
+                    value = value.decode('utf-8')
+
+                out_item[entry.name] = value
+
+            out.append(out_item)
+
+        return out
+
+# ################################################################################################################################
+
 class SIO_TYPE_MAP:
 
 # ################################################################################################################################
@@ -48,6 +48,7 @@ from zato.common.util import deployment_info, import_module_from_path, is_func_o
 from zato.common.util.json_ import dumps
 from zato.server.service import after_handle_hooks, after_job_hooks, before_handle_hooks, before_job_hooks, PubSubHook, Service
 from zato.server.service.internal import AdminService
+from zato.server.service.reqresp.sio import SIOInputPlan, SIOOutputPlan
 
 # ################################################################################################################################
 
@@ -154,6 +155,13 @@ def set_up_class_attributes(class_, service_store=None, name=None):
     except AttributeError:
         class_.has_sio = False
 
+    # Instances of services that opt in to pooling are reused across requests
+    class_._instance_pool = [] if class_.instance_pool_size else None
+
+    # Will be compiled below if we have all the configuration needed for it
+    class_._sio_input_plan = None
+    class_._sio_output_plan = None
+
     # May be None during unit-tests. Not every one will provide it because it's not always needed in a given test.
     if service_store:
 
@@ -182,6 +190,15 @@ def set_up_class_attributes(class_, service_store=None, name=None):
         class_._json_pointer_store = service_store.server.worker_store.worker_config.json_pointer_store
         class_._xpath_store = service_store.server.worker_store.worker_config.xpath_store
 
+        # SimpleIO input and output are compiled once here instead of being re-examined for each request
+        simple_io_config = service_store.server.worker_store.worker_config.simple_io
+        if class_.has_sio and simple_io_config:
+            try:
+                class_._sio_input_plan = SIOInputPlan(class_.SimpleIO, simple_io_config)
+                class_._sio_output_plan = SIOOutputPlan(class_.SimpleIO, simple_io_config)
+            except Exception:
+                logger.warn('Could not compile SimpleIO of `%s`, e:`%s`', name, format_exc())
+
         _req_resp_freq_key = '%s%s' % (KVDB.REQ_RESP_SAMPLE, name)
         class_._req_resp_freq = int(service_store.server.kvdb.conn.hget(_req_resp_freq_key, 'freq') or 0)
 
@@ -354,7 +371,26 @@ class ServiceStore(object):
         """ Returns a new instance of a service of the given impl name.
         """
         _info = self.services[impl_name]
-        return _info['service_class'](), _info['is_active']
+        service_class = _info['service_class']
+
+        pool = service_class._instance_pool
+        if pool:
+            try:
+                return pool.pop(), _info['is_active']
+            except IndexError: # Another greenlet could have taken the last one in the meantime
+                pass
+
+        return service_class(), _info['is_active']
+
+# ################################################################################################################################
+
+    def release_instance(self, service):
+        """ Returns a service instance to its class's pool, if the class has one and it is not full yet.
+        """
+        pool = service._instance_pool
+        if pool is not None and len(pool) < service.instance_pool_size:
+            service.reset()
+            pool.append(service)
 
 # ################################################################################################################################
 
@@ -10,26 +10,269 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import logging
+from traceback import format_exc
 
 # dateutil
 from dateutil.rrule import MINUTELY, rrule
 
+# gevent
+from gevent import sleep
+
+# Python 2/3 compatibility
+from future.utils import iteritems
+
 # Zato
 from zato.common import KVDB
 
 logger = logging.getLogger(__name__)
 
+# ################################################################################################################################
+
+_stats_prefix = 'zato:stats:'
+_stats_prefix_len = len(_stats_prefix)
+
+# ################################################################################################################################
+
+def get_index_key(key_prefix, key_suffix, _stats_index=KVDB.SERVICE_STATS_INDEX, _stats_prefix_len=_stats_prefix_len):
+    """ Returns the name of a set indexing all the services that have statistics under a given key prefix in a given period,
+    e.g. zato:stats:index:service:time:aggr-by-minute:2019:01:02:03:04 for KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE.
+    """
+    return '%s%s%s' % (_stats_index, key_prefix[_stats_prefix_len:], key_suffix)
+
+# ################################################################################################################################
+
 class MaintenanceTool(object):
     """ A tool for performing maintenance-related tasks, such as deleting the statistics.
     """
     def __init__(self, conn):
         self.conn = conn
 
-    def delete(self, start, stop, interval):
+    def delete(self, start, stop, interval, _key_prefix=KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE):
         with self.conn.pipeline() as p:
-            suffixes = (elem.strftime(':%Y:%m:%d:%H:%M') for elem in rrule(MINUTELY, dtstart=start, until=stop))
+            suffixes = (elem.strftime('%Y:%m:%d:%H:%M') for elem in rrule(MINUTELY, dtstart=start, until=stop))
             for suffix in suffixes:
-                for key in self.conn.keys('{}*{}'.format(KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, suffix)):
-                    p.delete(key)
+                index_key = get_index_key(_key_prefix, suffix)
+                for service_name in self.conn.smembers(index_key):
+                    p.delete('{}{}:{}'.format(_key_prefix, service_name, suffix))
+                p.delete(index_key)
 
             p.execute()
+
+# ################################################################################################################################
+
+# How many sub-buckets each power-of-two range of values is split into, i.e. what the precision of histograms is.
+# With 32 sub-buckets, values below 64 ms are kept exactly and each larger value is within about 3% of the original one.
+_sub_bucket_bits = 5
+_sub_bucket_count = 1 << _sub_bucket_bits
+_exact_max = _sub_bucket_count * 2
+
+# How long, in seconds, raw per-minute processing times are kept in KVDB, this must be kept in sync with AggregateByMinute.
+# MigrateIndex uses it too, for indexes of these keys.
+_raw_by_minute_expire = 300
+
+# ################################################################################################################################
+
+def get_bucket_idx(value, _sub_bucket_bits=_sub_bucket_bits, _sub_bucket_count=_sub_bucket_count, _exact_max=_exact_max):
+    """ Returns the index of a histogram bucket that a non-negative integer value belongs to.
+    """
+    if value < _exact_max:
+        return value
+
+    shift = value.bit_length() - _sub_bucket_bits - 1
+    return _exact_max + (shift - 1) * _sub_bucket_count + (value >> shift) - _sub_bucket_count
+
+def get_bucket_value(idx, _sub_bucket_bits=_sub_bucket_bits, _sub_bucket_count=_sub_bucket_count, _exact_max=_exact_max):
+    """ Returns a value representing all the values of a given histogram bucket, i.e. its midpoint.
+    """
+    if idx < _exact_max:
+        return idx
+
+    shift, sub_idx = divmod(idx - _exact_max, _sub_bucket_count)
+    shift += 1
+    lower = (sub_idx + _sub_bucket_count) << shift
+
+    return lower + ((1 << shift) - 1) // 2
+
+# ################################################################################################################################
+
+class LatencyHistogram(object):
+    """ A histogram of processing times with buckets of fixed boundaries, in the spirit of HDR histograms.
+    """
+    __slots__ = ('counts', 'count', 'min', 'max')
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value, _get_bucket_idx=get_bucket_idx):
+        idx = _get_bucket_idx(value)
+        counts = self.counts
+        counts[idx] = counts.get(idx, 0) + 1
+        self.count += 1
+
+        if self.min is None or value < self.min:
+            self.min = value
+
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """ Adds to self all the values recorded by another histogram.
+        """
+        counts = self.counts
+        for idx, count in iteritems(other.counts):
+            counts[idx] = counts.get(idx, 0) + count
+
+        self.count += other.count
+
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def get_values(self, _get_bucket_value=get_bucket_value):
+        """ Returns a list of values, one for each one recorded, each of them represented by its bucket's value
+        though never lower or higher than the minimum and maximum ones actually seen.
+        """
+        out = []
+        _min = self.min
+        _max = self.max
+
+        for idx in sorted(self.counts):
+            value = _get_bucket_value(idx)
+            value = min(max(value, _min), _max)
+            out.extend([value] * self.counts[idx])
+
+        return out
+
+# ################################################################################################################################
+
+class StatsCollector(object):
+    """ Collects statistics of services invoked in the current worker process and periodically flushes them to KVDB,
+    in a single pipeline, under the same keys that services used to write to directly on each invocation.
+    No locks are needed - all updates take place without yielding to other greenlets
+    and flushing replaces the containers with new ones before it sends the previous ones over to KVDB.
+    """
+    def __init__(self, conn, flush_interval=5.0):
+        self.conn = conn
+        self.flush_interval = flush_interval
+        self.keep_running = True
+
+        # Service name -> how many times it was invoked in this process
+        self.usage = {}
+
+        # Service name -> how many times it was invoked since the last flush
+        self.usage_delta = {}
+
+        # Service name -> the last processing time
+        self.last = {}
+
+        # (Service name, minute) -> LatencyHistogram
+        self.by_minute = {}
+
+# ################################################################################################################################
+
+    def incr_usage(self, name):
+        """ Increments usage of a service, returning the number of times it has been invoked in this process so far.
+        """
+        usage = self.usage.get(name, 0) + 1
+        self.usage[name] = usage
+        self.usage_delta[name] = self.usage_delta.get(name, 0) + 1
+
+        return usage
+
+# ################################################################################################################################
+
+    def record(self, name, processing_time, minute):
+        """ Records how long it took for a service to complete in a given minute, formatted as %Y:%m:%d:%H:%M.
+        """
+        self.last[name] = processing_time
+
+        key = (name, minute)
+        histogram = self.by_minute.get(key)
+
+        if not histogram:
+            histogram = self.by_minute[key] = LatencyHistogram()
+
+        histogram.record(processing_time)
+
+# ################################################################################################################################
+
+    def flush(self, _service_usage=KVDB.SERVICE_USAGE, _service_time_basic=KVDB.SERVICE_TIME_BASIC,
+        _service_time_raw=KVDB.SERVICE_TIME_RAW, _service_time_raw_by_minute=KVDB.SERVICE_TIME_RAW_BY_MINUTE,
+        _service_time_raw_index=KVDB.SERVICE_TIME_RAW_INDEX, _raw_by_minute_expire=_raw_by_minute_expire):
+        """ Sends to KVDB everything collected since the previous flush.
+        """
+        usage_delta, self.usage_delta = self.usage_delta, {}
+        last, self.last = self.last, {}
+        by_minute, self.by_minute = self.by_minute, {}
+
+        if not (usage_delta or last or by_minute):
+            return
+
+        try:
+            with self.conn.pipeline() as pipe:
+
+                for name, delta in iteritems(usage_delta):
+                    pipe.incrby('%s%s' % (_service_usage, name), delta)
+
+                for name, processing_time in iteritems(last):
+                    pipe.hset('%s%s' % (_service_time_basic, name), 'last', processing_time)
+
+                for (name, minute), histogram in iteritems(by_minute):
+                    values = histogram.get_values()
+                    key = '%s%s:%s' % (_service_time_raw_by_minute, name, minute)
+
+                    pipe.rpush('%s%s' % (_service_time_raw, name), *values)
+                    pipe.rpush(key, *values)
+                    pipe.expire(key, _raw_by_minute_expire)
+
+                    # Indexes let aggregating services find the keys above without resorting to KEYS
+                    index_key = get_index_key(_service_time_raw_by_minute, minute)
+                    pipe.sadd(_service_time_raw_index, name)
+                    pipe.sadd(index_key, name)
+                    pipe.expire(index_key, _raw_by_minute_expire)
+
+                pipe.execute()
+
+        except Exception:
+            logger.warn('Could not flush statistics, will retry in %ss, e:`%s`', self.flush_interval, format_exc())
+            self._restore(usage_delta, last, by_minute)
+
+# ################################################################################################################################
+
+    def _restore(self, usage_delta, last, by_minute):
+        """ Merges data that could not be flushed with whatever has been collected in the meantime.
+        """
+        for name, delta in iteritems(usage_delta):
+            self.usage_delta[name] = self.usage_delta.get(name, 0) + delta
+
+        for name, processing_time in iteritems(last):
+            self.last.setdefault(name, processing_time)
+
+        for key, histogram in iteritems(by_minute):
+            current = self.by_minute.get(key)
+            if current:
+                current.merge(histogram)
+            else:
+                self.by_minute[key] = histogram
+
+# ################################################################################################################################
+
+    def run(self):
+        """ Flushes statistics in a loop, to be run in its own greenlet.
+        """
+        while self.keep_running:
+            sleep(self.flush_interval)
+            self.flush()
+
+# ################################################################################################################################
+
+    def stop(self):
+        """ Stops the flushing loop and sends out anything that is still to be flushed.
+        """
+        self.keep_running = False
+        self.flush()
+
+# ################################################################################################################################
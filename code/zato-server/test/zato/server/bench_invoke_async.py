@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# gevent
+from gevent.monkey import patch_all
+patch_all()
+
+# stdlib
+from timeit import default_timer
+
+# Bunch
+from bunch import Bunch
+
+# fakeredis
+from fakeredis import FakeServer, FakeStrictRedis
+
+# gevent
+from gevent import sleep
+from gevent.event import Event
+
+# Zato
+from zato.broker.client import BrokerClient
+from zato.cli.create_server import lua_zato_rename_if_exists
+from zato.common import BROKER
+from zato.common.broker_message import MESSAGE_TYPE, TOPICS
+
+# ################################################################################################################################
+
+# Run with `python bench_invoke_async.py` - requires fakeredis and lupa. Shows how many async invocations per second
+# are handled when they are published to all servers, each racing to rename a key, when they are popped off a work queue
+# and when they are handed over to the current process without going through Redis.
+
+server_count = 4
+job_count = 500
+
+# Messages that the pub-sub transport keeps in Redis expire after that many seconds so some may never be handled
+max_wait = BROKER.DEFAULT_EXPIRATION
+
+lua_programs = [['zato.rename_if_exists', lua_zato_rename_if_exists]]
+
+# ################################################################################################################################
+
+class BenchKVDB(object):
+    """ Has the subset of zato.common.kvdb.KVDB's API that broker clients use, backed by fakeredis.
+    """
+    def __init__(self, server):
+        self.server = server
+        self.conn = FakeStrictRedis(server=server, decode_responses=True)
+        self.config = Bunch(host='localhost', port=6379)
+        self.decrypt_func = None
+
+    def copy(self):
+        return BenchKVDB(self.server)
+
+    def init(self):
+        pass
+
+    def pubsub(self):
+        return self.conn.pubsub()
+
+    def publish(self, *args, **kwargs):
+        return self.conn.publish(*args, **kwargs)
+
+    def close(self):
+        pass
+
+# ################################################################################################################################
+
+class Counter(object):
+    def __init__(self):
+        self.count = 0
+        self.done = Event()
+
+    def on_message(self, msg):
+        self.count += 1
+        if self.count == job_count:
+            self.done.set()
+
+# ################################################################################################################################
+
+def get_client(kvdb, client_type, topic_callbacks, async_transport):
+    client = BrokerClient(kvdb.copy(), client_type, topic_callbacks, lua_programs, async_transport)
+
+    while not client.ready:
+        sleep(0.01)
+
+    return client
+
+# ################################################################################################################################
+
+def run(async_transport, allow_local=False):
+
+    kvdb = BenchKVDB(FakeServer())
+    counter = Counter()
+    callbacks = {TOPICS[MESSAGE_TYPE.TO_PARALLEL_ANY]: counter.on_message}
+
+    servers = [get_client(kvdb, 'parallel', callbacks, async_transport) for _ in range(server_count)]
+
+    # Local invocations are made by one of the servers, other ones are made by a client that cannot handle them itself
+    if allow_local:
+        source = servers[0]
+    else:
+        source = get_client(kvdb, 'scheduler', {TOPICS[MESSAGE_TYPE.TO_SCHEDULER]: counter.on_message}, async_transport)
+
+    # Let all the clients subscribe before anything is published
+    sleep(0.5)
+
+    start = default_timer()
+
+    for idx in range(job_count):
+        source.invoke_async({'action': '', 'idx': idx}, allow_local=allow_local)
+
+    counter.done.wait(max_wait)
+    total_time = default_timer() - start
+
+    for client in servers + [source]:
+        client.close()
+
+    return counter.count, total_time
+
+# ################################################################################################################################
+
+def main():
+
+    print('Servers: {}, jobs: {}'.format(server_count, job_count))
+
+    # Pub-sub goes last because its subscribers keep listening after their clients are closed
+    for name, async_transport, allow_local in (
+        ('local', BROKER.ASYNC_TRANSPORT.WORK_QUEUE, True),
+        ('work queue', BROKER.ASYNC_TRANSPORT.WORK_QUEUE, False),
+        ('pub-sub', BROKER.ASYNC_TRANSPORT.PUB_SUB, False),
+        ):
+
+        handled, total_time = run(async_transport, allow_local)
+        print('{:>10}: {:.4f}s; {:.0f} jobs/s; handled: {}'.format(name, total_time, handled / total_time, handled))
+
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    main()
+
+# ################################################################################################################################
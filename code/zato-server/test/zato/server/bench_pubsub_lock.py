@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import logging
+import os
+from random import Random
+from timeit import default_timer
+
+# Bunch
+from bunch import Bunch
+
+# gevent
+from gevent import joinall, sleep, spawn
+
+# Zato
+from zato.common.util.time_ import utcnow_as_ms
+from zato.server.pubsub import PubSub, ShardedLock
+
+# ################################################################################################################################
+
+# Run with `python bench_pubsub_lock.py`. Publishers send non-GD messages to random topics while the notification task
+# syncs topics with their subscribers. Each log entry switches greenlets, as it does with handlers writing to a network,
+# so a greenlet holding a topic's lock for a moment blocks all the publishers waiting for the same lock. With a single lock
+# for all topics, as previously, this means all the publishers, whereas with sharded locks this is only a few of them.
+
+topic_count = 1000
+publisher_count = 50
+msg_per_publisher = 100
+log_io_time = 0.001
+shard_counts = (1, 64)
+
+# ################################################################################################################################
+
+class YieldingHandler(logging.Handler):
+    """ Simulates a log handler doing network I/O.
+    """
+    def emit(self, record):
+        sleep(log_io_time)
+
+# ################################################################################################################################
+
+def get_pubsub(shards):
+
+    server = Bunch(name='bench', pid=os.getpid(), invoke=lambda *args, **kwargs: None, fs_server_config=Bunch(
+        pubsub=Bunch(log_if_deliv_server_not_found=False, log_if_wsx_deliv_server_not_found=False,
+            data_prefix_len=2048, data_prefix_short_len=64),
+        pubsub_meta_topic=Bunch(enabled=False, store_frequency=1),
+        pubsub_meta_endpoint_pub=Bunch(enabled=False, store_frequency=1, data_len=0, max_history=0),
+    ))
+
+    pubsub = PubSub(1, server)
+
+    # Both the registry and the in-RAM backlog need to use the same locks
+    pubsub.topic_locks = pubsub.sync_backlog.topic_locks = ShardedLock(shards)
+
+    sub_key_servers = {}
+
+    for idx in range(topic_count):
+        topic_name = '/bench/{}'.format(idx)
+        sub_key = 'zpsk.bench.{}'.format(idx)
+
+        pubsub.create_topic(Bunch(id=idx, name=topic_name, is_active=True, is_internal=False, max_depth_gd=10000,
+            max_depth_non_gd=10000, has_gd=False, depth_check_freq=100, pub_buffer_size_gd=0, task_delivery_interval=100,
+            task_sync_interval=10, hook_service_id=None))
+
+        pubsub.add_subscription(Bunch(id=idx, creation_time=1, sub_key=sub_key, endpoint_id=1, topic_id=idx,
+            topic_name=topic_name, sub_pattern_matched='sub=/bench/*', task_delivery_interval=100, ext_client_id='',
+            ws_channel_id=None))
+
+        sub_key_servers[sub_key] = Bunch(server_name=server.name, server_pid=server.pid)
+
+    # Set directly rather than through set_sub_key_server which logs a table of all of them each time
+    pubsub.sub_key_servers = sub_key_servers
+
+    return pubsub
+
+# ################################################################################################################################
+
+def publish(pubsub, publisher_id):
+    random = Random(publisher_id)
+
+    for idx in range(msg_per_publisher):
+        topic_id = random.randrange(topic_count)
+        now = utcnow_as_ms()
+
+        msg = {
+            'pub_msg_id': 'zpsm.bench.{}.{}'.format(publisher_id, idx),
+            'topic_id': topic_id,
+            'topic_name': '/bench/{}'.format(topic_id),
+            'published_by_id': 1,
+            'pub_time': now,
+            'expiration': 60000,
+            'expiration_time': now + 60000,
+        }
+
+        pubsub.store_in_ram(None, topic_id, msg['topic_name'], ['zpsk.bench.{}'.format(topic_id)], [msg])
+
+# ################################################################################################################################
+
+def run(shards):
+
+    pubsub = get_pubsub(shards)
+
+    start = default_timer()
+    joinall([spawn(publish, pubsub, publisher_id) for publisher_id in range(publisher_count)])
+    elapsed = default_timer() - start
+
+    print('Shards:{:>4}; topics:{}; publishers:{}; {:.0f} msg/s'.format(
+        shards, topic_count, publisher_count, publisher_count * msg_per_publisher / elapsed))
+
+# ################################################################################################################################
+
+def main():
+
+    logger = logging.getLogger('zato_pubsub.ps')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.addHandler(YieldingHandler())
+
+    # Each run takes place in a new process because background tasks of PubSub objects never stop
+    for shards in shard_counts:
+        pid = os.fork()
+        if not pid:
+            run(shards)
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    main()
+
+# ################################################################################################################################
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import tracemalloc
+from timeit import default_timer
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.server.service import Service
+from zato.server.service.store import ServiceStore, set_up_class_attributes
+
+# ################################################################################################################################
+
+# Run with `python bench_service_alloc.py` - shows how much memory is allocated for each request and how long it takes
+# to obtain a service instance, invoke it and give it back when Outgoing is built eagerly for each new instance,
+# which is what Service.__init__ used to do, when it is built lazily and when instances are taken from a pool.
+
+iterations = 20000
+
+# ################################################################################################################################
+
+class MyService(Service):
+    def handle(self):
+        self.response.payload = {'cid': self.cid, 'data': self.request.payload}
+
+class MyPooledService(MyService):
+    instance_pool_size = 10
+
+# ################################################################################################################################
+
+def get_store():
+
+    worker_config = Bunch(out_odoo={}, out_soap={}, out_sap={}, out_sftp={})
+
+    worker_store = Bunch(sql_pool_store={}, stomp_outconn_api={}, zmq_out_api={}, outconn_wsx={}, vault_conn_api={},
+        sms_twilio_api={}, outconn_ldap={}, outconn_mongodb={}, def_kafka={})
+
+    services = {}
+
+    for class_ in MyService, MyPooledService:
+        set_up_class_attributes(class_)
+        class_._worker_config = worker_config
+        class_._worker_store = worker_store
+
+        # All the facades that Outgoing may need are created
+        class_.component_enabled_ibm_mq = True
+        class_.component_enabled_zeromq = True
+        class_.component_enabled_sms = True
+
+        services[class_.get_impl_name()] = {'service_class': class_, 'is_active': True}
+        class_.get_name()
+
+    return ServiceStore(services)
+
+# ################################################################################################################################
+
+def invoke(store, impl_name, idx, needs_out):
+    service, _ = store.new_instance(impl_name)
+
+    if needs_out:
+        service.out
+
+    service.cid = idx
+    service.request.payload = idx
+    service.handle()
+
+    response = service.response.payload
+    store.release_instance(service)
+
+    return response
+
+# ################################################################################################################################
+
+def run(store, impl_name, needs_out):
+
+    # Warm up the pool, if there is one
+    invoke(store, impl_name, 0, needs_out)
+
+    start = default_timer()
+    for idx in range(iterations):
+        invoke(store, impl_name, idx, needs_out)
+    total_time = default_timer() - start
+
+    # Peak memory, in bytes, allocated while each request is being handled
+    peak_total = 0
+
+    tracemalloc.start()
+    for idx in range(iterations):
+        tracemalloc.clear_traces()
+        invoke(store, impl_name, idx, needs_out)
+        peak_total += tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return total_time, peak_total / iterations
+
+# ################################################################################################################################
+
+def main():
+
+    store = get_store()
+
+    print('Iterations: {}'.format(iterations))
+
+    for name, class_, needs_out in (
+        ('eager', MyService, True),
+        ('lazy', MyService, False),
+        ('pooled', MyPooledService, False),
+        ):
+
+        total_time, bytes_per_request = run(store, class_.get_impl_name(), needs_out)
+        print('{:>7}: {:.4f}s; {:.2f} us/request; {:.0f} bytes/request'.format(
+            name, total_time, total_time / iterations * 1000000, bytes_per_request))
+
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    main()
+
+# ################################################################################################################################
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import logging
+from timeit import default_timer
+
+# Zato
+from zato.common import DATA_FORMAT
+from zato.server.service import AsIs, Boolean, Integer
+from zato.server.service.reqresp import Request, SimpleIOPayload
+from zato.server.service.reqresp.sio import SIOInputPlan, SIOOutputPlan
+
+# ################################################################################################################################
+
+# Run with `python bench_sio.py` - compares the original SimpleIO input parsing and output serialization
+# with compiled SIOInputPlan and SIOOutputPlan objects.
+
+logger = logging.getLogger(__name__)
+
+field_count = 30
+iterations = 20000
+output_rows = 5000
+output_iterations = 20
+
+simple_io_config = {
+    'int_parameters': ['id'],
+    'int_parameter_suffixes': ['_id', '_count', '_size', '_timeout'],
+    'bool_parameter_prefixes': ['by_', 'has_', 'is_', 'may_', 'needs_', 'should_'],
+    'bytes_to_str': {'encoding': 'utf8'},
+}
+
+# ################################################################################################################################
+
+def get_sio_and_payload(field_count):
+
+    required = []
+    optional = []
+    payload = {}
+
+    for idx in range(field_count):
+        kind = idx % 5
+
+        if kind == 0:
+            name = 'field{}_id'.format(idx)
+            payload[name] = str(idx)
+        elif kind == 1:
+            name = 'is_field{}'.format(idx)
+            payload[name] = 'true'
+        elif kind == 2:
+            name = Integer('field{}_value'.format(idx))
+            payload[name.name] = str(idx)
+        elif kind == 3:
+            name = AsIs('field{}_as_is'.format(idx))
+            payload[name.name] = 'abc'
+        else:
+            name = 'field{}'.format(idx)
+            payload[name] = 'value{}'.format(idx)
+
+        # Every fourth element is optional and every other optional one is missing on input
+        if idx % 4:
+            required.append(name)
+        else:
+            optional.append(Boolean('has_missing{}'.format(idx)) if idx % 8 else name)
+
+    class SimpleIO:
+        input_required = output_required = tuple(required)
+        input_optional = output_optional = tuple(optional)
+
+    return SimpleIO, payload
+
+# ################################################################################################################################
+
+def run(sio, payload, sio_input_plan):
+    request = Request(logger, simple_io_config)
+    request.payload = payload
+    request.init(True, 'cid', sio, DATA_FORMAT.JSON, 'http', {}, None, sio_input_plan)
+    return request.input
+
+# ################################################################################################################################
+
+def run_output(sio, rows, sio_output_plan):
+    payload = SimpleIOPayload('cid', DATA_FORMAT.JSON, sio.output_required, sio.output_optional, simple_io_config, 'response',
+        '', True, False, [], False, sio_output_plan)
+    payload[:] = rows
+    return payload.getvalue()
+
+# ################################################################################################################################
+
+def main():
+
+    sio, payload = get_sio_and_payload(field_count)
+    sio_input_plan = SIOInputPlan(sio, simple_io_config)
+
+    # Both paths must produce the same input
+    assert run(sio, payload, None) == run(sio, payload, sio_input_plan)
+
+    start = default_timer()
+    for _ in range(iterations):
+        run(sio, payload, None)
+    original_time = default_timer() - start
+
+    start = default_timer()
+    for _ in range(iterations):
+        run(sio, payload, sio_input_plan)
+    plan_time = default_timer() - start
+
+    print('Input fields:{}; iterations:{}'.format(field_count, iterations))
+    print('Original: {:.3f}s ({:.1f} us/request)'.format(original_time, original_time / iterations * 1e6))
+    print('Compiled: {:.3f}s ({:.1f} us/request)'.format(plan_time, plan_time / iterations * 1e6))
+
+    rows = [dict(payload) for _ in range(output_rows)]
+    sio_output_plan = SIOOutputPlan(sio, simple_io_config)
+
+    assert run_output(sio, rows, None) == run_output(sio, rows, sio_output_plan)
+
+    start = default_timer()
+    for _ in range(output_iterations):
+        run_output(sio, rows, None)
+    original_time = default_timer() - start
+
+    start = default_timer()
+    for _ in range(output_iterations):
+        run_output(sio, rows, sio_output_plan)
+    plan_time = default_timer() - start
+
+    print('Output fields:{}; rows:{}; iterations:{}'.format(field_count, output_rows, output_iterations))
+    print('Original: {:.3f}s ({:.1f} ms/response)'.format(original_time, original_time / output_iterations * 1e3))
+    print('Compiled: {:.3f}s ({:.1f} ms/response)'.format(plan_time, plan_time / output_iterations * 1e3))
+
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    main()
+
+# ################################################################################################################################
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from datetime import datetime, timedelta
+from timeit import default_timer
+
+# Bunch
+from bunch import Bunch
+
+# fakeredis
+from fakeredis import FakeStrictRedis
+
+# Zato
+from zato.common import KVDB
+from zato.server.service.internal.stats import AggregateByHour
+from zato.server.stats import get_index_key
+
+# ################################################################################################################################
+
+# Run with `python bench_stats.py` - requires fakeredis. Shows that aggregating statistics of a period takes the same time
+# regardless of how many services have statistics in other periods, whereas KEYS, used previously, needs to go through all of them.
+
+service_counts = (100, 1000, 10000)
+active_services = 20
+repeat = 5
+
+# ################################################################################################################################
+
+class BenchAggregateByHour(AggregateByHour):
+    def __init__(self, conn):
+        self.kvdb = Bunch(conn=conn)
+        self.server = Bunch(kvdb=self.kvdb, fs_server_config={}, component_enabled=Bunch(stats=True))
+
+# ################################################################################################################################
+
+def store(conn, service_name, minute):
+    key_prefix = KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE
+    key_suffix = minute.strftime('%Y:%m:%d:%H:%M')
+    index_key = get_index_key(key_prefix, key_suffix)
+
+    conn.hmset('{}{}:{}'.format(key_prefix, service_name, key_suffix), {
+        'usage': 10, 'max': 20, 'rate': 0.1, 'mean': 5.0, 'min': 1})
+    conn.sadd(index_key, service_name)
+
+# ################################################################################################################################
+
+def main():
+
+    now = datetime.utcnow()
+    previous_hour = (now - timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+    older_hour = previous_hour - timedelta(hours=1)
+
+    print('Active services in the aggregated hour: {}'.format(active_services))
+
+    for service_count in service_counts:
+
+        conn = FakeStrictRedis(decode_responses=True)
+        conn.flushall()
+
+        # Services with statistics in another period only
+        for idx in range(service_count):
+            for minute in range(5):
+                store(conn, 'service.{}'.format(idx), older_hour + timedelta(minutes=minute))
+
+        # Services active in the period to aggregate
+        for idx in range(active_services):
+            for minute in range(60):
+                store(conn, 'active.{}'.format(idx), previous_hour + timedelta(minutes=minute))
+
+        service = BenchAggregateByHour(conn)
+
+        start = default_timer()
+        for _ in range(repeat):
+            service.aggregate_partly_aggregated(timedelta(hours=1), '%Y:%m:%d:%H',
+                KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, KVDB.SERVICE_TIME_AGGREGATED_BY_HOUR, now)
+        indexed_time = (default_timer() - start) / repeat
+
+        # What the previous implementation had to do before reading any statistics
+        start = default_timer()
+        for _ in range(repeat):
+            conn.keys('{}*:{}*'.format(KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, previous_hour.strftime('%Y:%m:%d:%H')))
+        keys_time = (default_timer() - start) / repeat
+
+        print('Services:{:>6}; indexed aggregation: {:.4f}s; KEYS alone: {:.4f}s'.format(
+            service_count, indexed_time, keys_time))
+
+# ################################################################################################################################
+
+if __name__ == '__main__':
+    main()
+
+# ################################################################################################################################
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from time import time
+from unittest import TestCase
+
+# anyjson
+from anyjson import dumps
+
+# Bunch
+from bunch import Bunch
+
+# fakeredis
+from fakeredis import FakeServer, FakeStrictRedis
+
+# gevent
+from gevent import killall, sleep, spawn
+
+# mock
+from mock import patch
+
+# Zato
+from zato.broker.client import BrokerClient, WORK_QUEUE_KEY
+from zato.common import BROKER
+from zato.common.broker_message import KEYS, MESSAGE_TYPE, TOPICS
+
+# ################################################################################################################################
+
+# Requires fakeredis and lupa
+
+_to_parallel_any = MESSAGE_TYPE.TO_PARALLEL_ANY
+work_queue_key = WORK_QUEUE_KEY.format(KEYS[_to_parallel_any])
+
+# ################################################################################################################################
+
+class FakeRedis(FakeStrictRedis):
+    """ Blocks in BRPOP by letting other greenlets run rather than by blocking the whole thread.
+    """
+    def brpop(self, key, timeout=0):
+        wait_until = time() + timeout
+        while True:
+            value = self.rpop(key)
+            if value is not None:
+                return key, value
+            if time() >= wait_until:
+                return None
+            sleep(0.01)
+
+# ################################################################################################################################
+
+class FakeKVDB(object):
+    """ Has the subset of zato.common.kvdb.KVDB's API that broker clients use, backed by fakeredis.
+    """
+    def __init__(self, server):
+        self.server = server
+        self.conn = FakeRedis(server=server, decode_responses=True)
+        self.decrypt_func = None
+
+    def copy(self):
+        return FakeKVDB(self.server)
+
+    def init(self):
+        pass
+
+    def close(self):
+        pass
+
+# ################################################################################################################################
+
+class WorkQueueTestCase(TestCase):
+
+    def setUp(self):
+        self.kvdb = FakeKVDB(FakeServer())
+        self.greenlets = []
+
+        # Clients are not started in background threads - their queues are consumed by greenlets of each test instead
+        patcher = patch('zato.common.py23_.start_new_thread', lambda target, args: None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        killall(self.greenlets)
+
+# ################################################################################################################################
+
+    def get_client(self, on_message=None, work_queue_batch_size=BROKER.DEFAULT_WORK_QUEUE_BATCH_SIZE):
+        """ Returns a client that handles async invocations with on_message or, if it is not given, one that only sends them.
+        """
+        topic_callbacks = {TOPICS[_to_parallel_any]: on_message} if on_message else {}
+        return BrokerClient(self.kvdb.copy(), 'parallel', topic_callbacks, [], BROKER.ASYNC_TRANSPORT.WORK_QUEUE,
+            work_queue_batch_size)
+
+    def start(self, client):
+        self.greenlets.append(spawn(client.run_work_queue, _to_parallel_any))
+        self.greenlets.append(spawn(client.run_local_queue))
+
+    def wait_for(self, handled, count, timeout=5):
+        wait_until = time() + timeout
+        while len(handled) < count and time() < wait_until:
+            sleep(0.01)
+
+# ################################################################################################################################
+
+    def test_one_consumer_per_message(self):
+
+        # (consumer_id, idx) tuples
+        handled = []
+
+        for consumer_id in (1, 2):
+            self.start(self.get_client(lambda msg, consumer_id=consumer_id: handled.append((consumer_id, msg.idx)), 5))
+
+        source = self.get_client()
+        for idx in range(100):
+            source.invoke_async({'action': '', 'idx': idx})
+
+            # Let the consumers take messages as they are being pushed
+            if idx % 10 == 0:
+                sleep(0.02)
+
+        self.wait_for(handled, 100)
+        sleep(0.1)
+
+        # Each message was handled once, by one of the consumers only
+        self.assertEqual(sorted(idx for _, idx in handled), list(range(100)))
+        self.assertEqual(self.kvdb.conn.llen(work_queue_key), 0)
+
+# ################################################################################################################################
+
+    def test_batches_fifo(self):
+        handled = []
+        consumer = self.get_client(lambda msg: handled.append(msg.idx), 5)
+
+        # Everything is pushed before the consumer starts so it pops one message and then takes batches off the list
+        source = self.get_client()
+        for idx in range(12):
+            source.invoke_async({'action': '', 'idx': idx})
+
+        self.start(consumer)
+        self.wait_for(handled, 12)
+
+        self.assertEqual(handled, list(range(12)))
+        self.assertEqual(self.kvdb.conn.llen(work_queue_key), 0)
+
+# ################################################################################################################################
+
+    def test_expired_skipped(self):
+        handled = []
+        consumer = self.get_client(lambda msg: handled.append(msg.idx), 5)
+
+        source = self.get_client()
+        source.invoke_async({'action': '', 'idx': 1})
+        self.kvdb.conn.lpush(work_queue_key, '{};{}'.format(time() - 1, dumps({'action': '', 'idx': 2})))
+        source.invoke_async({'action': '', 'idx': 3})
+
+        self.start(consumer)
+        self.wait_for(handled, 2)
+        sleep(0.1)
+
+        self.assertEqual(handled, [1, 3])
+
+# ################################################################################################################################
+
+    def test_expiration_only_extended(self):
+        source = self.get_client()
+
+        source.invoke_async({'action': '', 'idx': 1}, expiration=100)
+
+        # A message with a shorter expiration does not make the list expire any sooner ..
+        source.invoke_async({'action': '', 'idx': 2}, expiration=5)
+        self.assertGreater(self.kvdb.conn.ttl(work_queue_key), 90)
+
+        # .. but one with a longer expiration makes the list expire later.
+        source.invoke_async({'action': '', 'idx': 3}, expiration=200)
+        self.assertGreater(self.kvdb.conn.ttl(work_queue_key), 190)
+
+        self.assertEqual(self.kvdb.conn.llen(work_queue_key), 3)
+
+# ################################################################################################################################
+
+    def test_allow_local(self):
+        handled = []
+        client = self.get_client(lambda msg: handled.append(Bunch(msg)))
+
+        # Only the local queue is consumed so the message cannot be handled through Redis
+        self.greenlets.append(spawn(client.run_local_queue))
+
+        client.invoke_async({'action': '', 'idx': 1}, allow_local=True)
+        self.wait_for(handled, 1)
+
+        self.assertEqual(len(handled), 1)
+        self.assertEqual(handled[0].idx, 1)
+        self.assertEqual(handled[0].msg_type, _to_parallel_any)
+        self.assertFalse(self.kvdb.conn.exists(work_queue_key))
+
+# ################################################################################################################################
+
+    def test_allow_local_no_callback(self):
+
+        # A client that cannot handle the message itself sends it through Redis regardless of allow_local
+        self.get_client().invoke_async({'action': '', 'idx': 1}, allow_local=True)
+        self.assertEqual(self.kvdb.conn.llen(work_queue_key), 1)
+
+# ################################################################################################################################
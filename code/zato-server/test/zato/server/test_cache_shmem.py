@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os
+from time import sleep
+from unittest import TestCase
+from uuid import uuid4
+
+# Zato
+from zato.cache import KeyExpiredError
+from zato.server.connection.cache_shmem import _header, _magic, SharedMemoryCache, slots_per_bucket, unlink_deployment_caches
+
+# ################################################################################################################################
+
+class SharedMemoryCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.deployment_key = uuid4().hex
+        self.caches = []
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close(True)
+
+    def get_cache(self, cache_id=1, max_size=100, max_item_size=1000):
+        cache = SharedMemoryCache(self.deployment_key, cache_id, max_size, max_item_size)
+        self.caches.append(cache)
+        return cache
+
+# ################################################################################################################################
+
+    def test_set_get_delete(self):
+        cache = self.get_cache()
+
+        self.assertIsNone(cache.set('key1', 'value1', 0, False))
+        self.assertEqual(cache.set('key1', 'value2', 0, False), 'value1')
+        self.assertEqual(cache.get('key1', cache.default_get, False), 'value2')
+
+        cache.set(b'key2', {'a': [1, 2]}, 0, False)
+        cache.set(3, 33, 0, False)
+
+        self.assertEqual(cache.get(b'key2', cache.default_get, False), {'a': [1, 2]})
+        self.assertEqual(cache.get(3, cache.default_get, False), 33)
+        self.assertIsNone(cache.get('key4', cache.default_get, False))
+        self.assertEqual(cache.get('key4', 'default', False), 'default')
+
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.delete('key1'), 'value2')
+        self.assertNotIn('key1', cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_details(self):
+        cache = self.get_cache()
+        cache.set('key1', 'value1', 0, False)
+        cache.get('key1', cache.default_get, False)
+
+        entry = cache.get('key1', cache.default_get, True)
+        self.assertEqual(entry.key, 'key1')
+        self.assertEqual(entry.value, 'value1')
+        self.assertEqual(entry.hits, 2)
+        self.assertTrue(entry.last_read >= entry.last_write)
+
+    def test_too_long(self):
+        cache = self.get_cache(max_item_size=10)
+        self.assertRaises(ValueError, cache.set, 'key1', 'a' * 11, 0, False)
+        self.assertRaises(ValueError, cache.set, 'a' * 1000, 'value1', 0, False)
+
+# ################################################################################################################################
+
+    def test_by_prefix(self):
+        cache = self.get_cache()
+
+        for idx in range(20):
+            cache.set('abc{}'.format(idx), idx, 0, False)
+        cache.set('def', 1, 0, False)
+
+        self.assertEqual(len(cache.get_by_prefix('abc', False, 0)), 20)
+        self.assertEqual(sorted(cache.get_by_regex('abc1[0-9]', False, 0).values()), list(range(10, 20)))
+
+        meta_ref = {'_now': None, '_any_found': False}
+        self.assertEqual(len(cache.set_by_prefix('abc', 'new', 0, False, meta_ref, True, 0)), 20)
+        self.assertTrue(meta_ref['_any_found'])
+        self.assertEqual(cache.get('abc1', cache.default_get, False), 'new')
+
+        self.assertEqual(len(cache.delete_by_suffix('1', True, 0)), 2)
+        self.assertEqual(len(cache), 19)
+
+# ################################################################################################################################
+
+    def test_expiry(self):
+        cache = self.get_cache()
+        cache.set('key1', 'value1', 0.01, False)
+        sleep(0.02)
+
+        self.assertRaises(KeyExpiredError, cache.get, 'key1', cache.default_get, False)
+        self.assertEqual(cache.delete_expired(), ['key1'])
+
+        cache.set('key2', 'value2', 0, False)
+        self.assertTrue(cache.expire('key2', 100, None))
+        self.assertEqual(cache.get('key2', cache.default_get, True).expiry, 100)
+
+# ################################################################################################################################
+
+    def test_eviction(self):
+        cache = self.get_cache(max_size=slots_per_bucket)
+
+        for idx in range(slots_per_bucket * 3):
+            cache.set(idx, idx, 0, False)
+
+        self.assertEqual(len(cache), slots_per_bucket)
+        self.assertEqual(cache.get(slots_per_bucket * 3 - 1, cache.default_get, False), slots_per_bucket * 3 - 1)
+
+# ################################################################################################################################
+
+    def test_shared_between_processes(self):
+        cache = self.get_cache()
+        cache.set('key1', 'value1', 0, False)
+
+        pid = os.fork()
+        if not pid:
+            child_cache = SharedMemoryCache(self.deployment_key, 1, 100, 1000)
+            child_cache.set('key2', child_cache.get('key1', child_cache.default_get, False) * 2, 0, False)
+            os._exit(0)
+
+        os.waitpid(pid, 0)
+        self.assertEqual(cache.get('key2', cache.default_get, False), 'value1value1')
+
+    def test_layout_changed(self):
+        cache = self.get_cache()
+        cache.set('key1', 'value1', 0, False)
+
+        other = self.get_cache(max_size=1000)
+        self.assertEqual(len(other), 0)
+
+    def test_header(self):
+        cache = self.get_cache()
+
+        header = _header.unpack_from(cache._mmap, 0)
+        self.assertEqual(header[0], _magic)
+        self.assertEqual(tuple(header[1:]), (-(-100 // slots_per_bucket), slots_per_bucket, 256, 1000))
+
+        # A process opening a segment with a different layout in its header cannot use it
+        _header.pack_into(cache._mmap, 0, _magic, 1, slots_per_bucket, 256, 1000)
+        self.assertRaises(ValueError, cache._ipc.store_initial)
+
+    def test_close_keeps_segment(self):
+        cache = self.get_cache()
+        cache.set('key1', 'value1', 0, False)
+
+        # Other workers still use the segment so a new process, e.g. a restarted worker, sees its contents
+        cache.close()
+        restarted = self.get_cache()
+        self.assertEqual(restarted.get('key1', restarted.default_get, False), 'value1')
+
+    def test_close_unlink(self):
+        cache = self.get_cache()
+        cache.set('key1', 'value1', 0, False)
+
+        # A deleted cache starts empty if it is created anew
+        cache.close(True)
+        self.assertEqual(len(self.get_cache()), 0)
+
+    def test_unlink_deployment_caches(self):
+        cache = self.get_cache()
+        cache.set('key1', 'value1', 0, False)
+
+        other_deployment_cache = SharedMemoryCache(uuid4().hex, 1, 100, 1000)
+        self.caches.append(other_deployment_cache)
+        other_deployment_cache.set('key1', 'value1', 0, False)
+
+        cache.close()
+        other_deployment_cache.close()
+        unlink_deployment_caches(self.deployment_key)
+
+        self.assertEqual(len(self.get_cache()), 0)
+
+        other_deployment_cache = SharedMemoryCache(other_deployment_cache.deployment_key, 1, 100, 1000)
+        self.caches.append(other_deployment_cache)
+        self.assertEqual(len(other_deployment_cache), 1)
+
+# ################################################################################################################################
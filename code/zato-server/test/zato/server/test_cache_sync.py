@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.common import CACHE
+from zato.server.connection.cache import CacheAPI, SyncBatch
+
+# ################################################################################################################################
+
+_STATE_CHANGED = CACHE.STATE_CHANGED
+
+# ################################################################################################################################
+
+class SyncBatchTestCase(TestCase):
+
+    def test_coalesce_set_delete(self):
+        batch = SyncBatch()
+
+        for idx in range(10):
+            batch.add(_STATE_CHANGED.SET, {'key':'key1', 'value':idx})
+        batch.add(_STATE_CHANGED.SET, {'key':'key2', 'value':'a'})
+        batch.add(_STATE_CHANGED.DELETE, {'key':'key1'})
+
+        self.assertEqual(batch.size, 2)
+        self.assertEqual(batch.get_ops(), [
+            (_STATE_CHANGED.SET, {'key':'key2', 'value':'a'}),
+            (_STATE_CHANGED.DELETE, {'key':'key1'}),
+        ])
+
+    def test_coalesce_expire(self):
+        batch = SyncBatch()
+        batch.add(_STATE_CHANGED.SET, {'key':'key1', 'value':1})
+        batch.add(_STATE_CHANGED.EXPIRE, {'key':'key1', 'expiry':10})
+
+        self.assertEqual([op for op, _ in batch.get_ops()], [_STATE_CHANGED.SET, _STATE_CHANGED.EXPIRE])
+
+        batch.add(_STATE_CHANGED.SET, {'key':'key1', 'value':2})
+        self.assertEqual(batch.get_ops(), [(_STATE_CHANGED.SET, {'key':'key1', 'value':2})])
+
+    def test_multi_key_op_is_barrier(self):
+        batch = SyncBatch()
+        batch.add(_STATE_CHANGED.SET, {'key':'key1', 'value':1})
+        batch.add(_STATE_CHANGED.DELETE_BY_PREFIX, {'key':'key', 'limit':0})
+        batch.add(_STATE_CHANGED.SET, {'key':'key1', 'value':2})
+
+        self.assertEqual([op for op, _ in batch.get_ops()],
+            [_STATE_CHANGED.SET, _STATE_CHANGED.DELETE_BY_PREFIX, _STATE_CHANGED.SET])
+
+    def test_clear(self):
+        batch = SyncBatch()
+        batch.add(_STATE_CHANGED.SET, {'key':'key1', 'value':1})
+        batch.add(_STATE_CHANGED.SET_BY_PREFIX, {'key':'key', 'value':1, 'limit':0})
+        batch.add(_STATE_CHANGED.CLEAR, {})
+
+        self.assertEqual(batch.size, 1)
+        self.assertEqual(batch.get_ops(), [(_STATE_CHANGED.CLEAR, {})])
+
+# ################################################################################################################################
+
+class SyncBatchOpTestCase(TestCase):
+
+    def setUp(self):
+        self.api = CacheAPI(Bunch(worker_id=1))
+
+    def test_value_published(self):
+        op, data = self.api._get_sync_batch_op(_STATE_CHANGED.SET, {'key':'key1', 'value':'abc', 'expiry':1.0,
+            'expires_at':2.0, 'orig_now':1.0})
+
+        self.assertEqual(op, _STATE_CHANGED.SET)
+        self.assertEqual(data, {'key':'key1', 'value':'abc', 'is_value_pickled':False, 'expiry':1.0,
+            'expires_at':2.0, 'orig_now':1.0})
+
+    def test_large_value_invalidated(self):
+        self.api.sync_batch_max_value_size = 2
+
+        op, data = self.api._get_sync_batch_op(_STATE_CHANGED.SET, {'key':'key1', 'value':'abc'})
+        self.assertEqual(op, _STATE_CHANGED.DELETE)
+        self.assertEqual(data, {'key':'key1'})
+
+        op, data = self.api._get_sync_batch_op(_STATE_CHANGED.SET_BY_PREFIX, {'key':'key', 'value':'abc', 'limit':5})
+        self.assertEqual(op, _STATE_CHANGED.DELETE_BY_PREFIX)
+        self.assertEqual(data, {'key':'key', 'limit':5})
+
+# ################################################################################################################################
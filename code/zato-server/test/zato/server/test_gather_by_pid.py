@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from time import time
+from unittest import TestCase
+
+# gevent
+from gevent import sleep
+
+# Zato
+from zato.server.base.parallel import ParallelServer
+
+# ################################################################################################################################
+
+class GatherByPIDTestCase(TestCase):
+
+    def setUp(self):
+        self.server = ParallelServer()
+        self.server.invoke_by_pid = self.invoke_by_pid
+
+        # PID -> how long it takes that process to reply
+        self.delays = {}
+
+        # PID -> an exception that process raises
+        self.errors = {}
+
+        self.invoked = []
+
+    def invoke_by_pid(self, service, request, target_pid, timeout=None, *ignored_args, **ignored_kwargs):
+        """ Stands in for IPC which, like the real one, returns no data if there is no response within timeout seconds.
+        A process may also stall without IPC giving up on it, e.g. because a socket blocks.
+        """
+        self.invoked.append((service, request, target_pid, timeout))
+
+        delay = self.delays.get(target_pid, 0.01)
+        sleep(delay)
+
+        if target_pid in self.errors:
+            raise self.errors[target_pid]
+
+        if delay >= timeout:
+            return False, None
+
+        return True, {'pid': target_pid}
+
+# ################################################################################################################################
+
+    def test_all_ok(self):
+        out = self.server.gather_by_pid('my.service', None, [1, 2, 3], 1)
+
+        self.assertEqual(sorted(self.invoked), [('my.service', '', 1, 1), ('my.service', '', 2, 1), ('my.service', '', 3, 1)])
+        self.assertEqual(sorted(out), [1, 2, 3])
+
+        for pid, response in out.items():
+            self.assertTrue(response['is_ok'])
+            self.assertFalse(response['is_timeout'])
+            self.assertEqual(response['pid_data'], {'pid': pid})
+            self.assertIsNone(response['error_info'])
+            self.assertLess(response['response_time'], 0.5)
+
+# ################################################################################################################################
+
+    def test_one_pid_stalls(self):
+
+        # This process stalls well past the deadline
+        self.delays[2] = 1
+
+        start = time()
+        out = self.server.gather_by_pid('my.service', None, [1, 2, 3], 0.2)
+        total_time = time() - start
+
+        # All the processes were invoked concurrently so the overall deadline was kept ..
+        self.assertLess(total_time, 0.5)
+
+        # .. and responses from the other processes are still returned ..
+        for pid in (1, 3):
+            self.assertTrue(out[pid]['is_ok'])
+            self.assertFalse(out[pid]['is_timeout'])
+            self.assertEqual(out[pid]['pid_data'], {'pid': pid})
+            self.assertLess(out[pid]['response_time'], 0.1)
+
+        # .. whereas the one that stalled is reported as timed out.
+        self.assertFalse(out[2]['is_ok'])
+        self.assertTrue(out[2]['is_timeout'])
+        self.assertIsNone(out[2]['pid_data'])
+        self.assertEqual(out[2]['error_info'], 'No response from PID `2` within 0.2s')
+        self.assertGreaterEqual(out[2]['response_time'], 0.2)
+
+# ################################################################################################################################
+
+    def test_ipc_timeout(self):
+
+        # IPC gives up on this process at the deadline, which is reported in the same way
+        # regardless of whether the overall wait has already ended or not.
+        self.delays[2] = 0.1
+
+        out = self.server.gather_by_pid('my.service', None, [1, 2], 0.1)
+
+        self.assertTrue(out[1]['is_ok'])
+        self.assertFalse(out[2]['is_ok'])
+        self.assertTrue(out[2]['is_timeout'])
+        self.assertEqual(out[2]['error_info'], 'No response from PID `2` within 0.1s')
+        self.assertGreaterEqual(out[2]['response_time'], 0.1)
+
+# ################################################################################################################################
+
+    def test_one_pid_fails(self):
+        self.errors[2] = Exception('IPC error')
+
+        out = self.server.gather_by_pid('my.service', None, [1, 2], 1)
+
+        self.assertTrue(out[1]['is_ok'])
+        self.assertFalse(out[2]['is_ok'])
+        self.assertFalse(out[2]['is_timeout'])
+        self.assertIn('IPC error', out[2]['error_info'])
+        self.assertIsNotNone(out[2]['response_time'])
+
+# ################################################################################################################################
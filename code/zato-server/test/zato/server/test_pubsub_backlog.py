@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.common import PUBSUB
+from zato.common.util.time_ import utcnow_as_ms
+from zato.server.pubsub import PubSub
+
+# ################################################################################################################################
+
+topic_id = 1
+topic_name = '/test'
+sub_key = 'zpsk.test.1'
+
+# ################################################################################################################################
+
+class SyncBacklogExpirationTestCase(TestCase):
+
+    def setUp(self):
+        server = Bunch(name='test', pid=os.getpid(), fs_server_config=Bunch(
+            pubsub=Bunch(log_if_deliv_server_not_found=False, log_if_wsx_deliv_server_not_found=False,
+                data_prefix_len=2048, data_prefix_short_len=64),
+            pubsub_meta_topic=Bunch(enabled=False, store_frequency=1),
+            pubsub_meta_endpoint_pub=Bunch(enabled=False, store_frequency=1, data_len=0, max_history=0),
+        ))
+
+        self.pubsub = PubSub(1, server)
+        self.pubsub.create_endpoint(Bunch(id=1, name='endpoint.1', endpoint_type=PUBSUB.ENDPOINT_TYPE.REST.id,
+            role=PUBSUB.ROLE.PUBLISHER_SUBSCRIBER.id, is_active=True, is_internal=False, topic_patterns='pub=/test',
+            security_id=None, ws_channel_id=None, service_id=None))
+
+        self.backlog = self.pubsub.sync_backlog
+        self.now = utcnow_as_ms()
+
+# ################################################################################################################################
+
+    def get_msg(self, idx, expiration_time):
+        return {
+            'pub_msg_id': 'zpsm.{}'.format(idx),
+            'topic_id': topic_id,
+            'topic_name': topic_name,
+            'published_by_id': 1,
+            'pub_time': self.now - 10,
+            'data': 'abc',
+            'size': 3,
+            'expiration': 1000,
+            'expiration_time': expiration_time,
+            'priority': 5,
+            'pub_correl_id': None,
+            'in_reply_to': None,
+            'mime_type': 'text/plain',
+        }
+
+    def add_messages(self, count, expiration_time):
+        self.backlog.add_messages('cid.1', topic_id, topic_name, 1000, [sub_key],
+            [self.get_msg(idx, expiration_time) for idx in range(count)])
+
+    def update_msg(self, idx, expiration_time):
+        msg = self.get_msg(idx, expiration_time)
+        msg['msg_id'] = msg['pub_msg_id']
+        self.assertTrue(self.backlog.update_msg(msg))
+
+    def delete_expired(self, now, chunk_size=100):
+        with self.backlog.topic_locks.all():
+            expired = self.backlog._pop_expired_messages(now, chunk_size)
+            self.backlog._delete_expired_messages(expired, {})
+
+        return sorted(msg['pub_msg_id'] for msg in expired)
+
+# ################################################################################################################################
+
+    def test_update_then_expire(self):
+        self.add_messages(3, self.now - 1)
+
+        # The expiration time does not change so the message must not be in the heap twice
+        self.update_msg(1, self.now - 1)
+        self.assertEqual(len(self.backlog.expiration_heap), 3)
+
+        self.assertEqual(self.delete_expired(self.now), ['zpsm.0', 'zpsm.1', 'zpsm.2'])
+        self.assertEqual(self.backlog.msg_id_to_msg, {})
+        self.assertEqual(self.backlog.sub_key_to_msg_id[sub_key], set())
+
+# ################################################################################################################################
+
+    def test_update_expiration(self):
+        self.add_messages(2, self.now - 1)
+        self.update_msg(1, self.now + 100)
+
+        # The previous entry of the updated message is skipped ..
+        self.assertEqual(self.delete_expired(self.now), ['zpsm.0'])
+
+        # .. and the message expires at its new time.
+        self.assertEqual(self.delete_expired(self.now + 100), ['zpsm.1'])
+        self.assertEqual(self.backlog.msg_id_to_msg, {})
+
+# ################################################################################################################################
+
+    def test_update_expiration_back(self):
+        self.add_messages(2, self.now - 1)
+
+        # Changing the expiration time back means that there are two matching entries in the heap ..
+        self.update_msg(1, self.now - 2)
+        self.update_msg(1, self.now - 1)
+
+        # .. but the message is still returned only once, including when the entries are in separate chunks.
+        self.assertEqual(self.delete_expired(self.now), ['zpsm.0', 'zpsm.1'])
+        self.assertEqual(self.backlog.msg_id_to_msg, {})
+
+        self.add_messages(1, self.now - 1)
+        self.update_msg(0, self.now - 2)
+        self.update_msg(0, self.now - 1)
+
+        self.assertEqual(self.delete_expired(self.now, 1), ['zpsm.0'])
+        self.assertEqual(self.delete_expired(self.now, 1), [])
+        self.assertEqual(self.backlog.expiration_heap, [])
+
+# ################################################################################################################################
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# SQLAlchemy
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Zato
+from zato.common import PUBSUB
+from zato.common.odb.model import Base
+from zato.common.odb.query.pubsub.cleanup import EnqueuedMsgTable, MsgTable
+from zato.common.util.time_ import utcnow_as_ms
+from zato.server.pubsub import PubSub
+
+# ################################################################################################################################
+
+cluster_id = 1
+topic_id = 1
+
+_delivered = PUBSUB.DELIVERY_STATUS.DELIVERED
+
+# ################################################################################################################################
+
+def get_pubsub(session_maker):
+    server = Bunch(name='test', pid=os.getpid(), odb=Bunch(session=session_maker), fs_server_config=Bunch(
+        pubsub=Bunch(log_if_deliv_server_not_found=False, log_if_wsx_deliv_server_not_found=False,
+            data_prefix_len=2048, data_prefix_short_len=64, gd_cleanup_batch_size='3'),
+        pubsub_meta_topic=Bunch(enabled=False, store_frequency=1),
+        pubsub_meta_endpoint_pub=Bunch(enabled=False, store_frequency=1, data_len=0, max_history=0),
+    ))
+
+    pubsub = PubSub(cluster_id, server)
+    pubsub.create_topic(Bunch(id=topic_id, name='/test', is_active=True, is_internal=False, max_depth_gd=10000,
+        max_depth_non_gd=10000, has_gd=True, depth_check_freq=100, pub_buffer_size_gd=0, task_delivery_interval=100,
+        task_sync_interval=10, hook_service_id=None))
+
+    return pubsub
+
+# ################################################################################################################################
+
+class GDMaintenanceTestCase(TestCase):
+
+    def setUp(self):
+
+        # Foreign keys are not enforced by SQLite so rows of clusters, endpoints and subscriptions are not needed
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+
+        self.session_maker = sessionmaker(bind=engine)
+        self.session_count = 0
+
+        def _session():
+            self.session_count += 1
+            return self.session_maker()
+
+        self.pubsub = get_pubsub(_session)
+        self.topic = self.pubsub.topics[topic_id]
+        self.msg_idx = 0
+
+# ################################################################################################################################
+
+    def add_msg_list(self, count, is_in_sub_queue=False, is_expired=False, queues=()):
+        """ Adds GD messages as though they were published, along with their subscriber queues, one for each status in queues.
+        """
+        now = utcnow_as_ms()
+        session = self.session_maker()
+
+        for _ in range(count):
+            self.msg_idx += 1
+            pub_msg_id = 'zpsm.{}'.format(self.msg_idx)
+
+            session.execute(MsgTable.insert().values({
+                'pub_msg_id': pub_msg_id,
+                'pub_pattern_matched': 'pub=/test',
+                'pub_time': now - 100,
+                'expiration': 50 if is_expired else 86400000,
+                'expiration_time': now - 50 if is_expired else now + 86400,
+                'data': 'abc',
+                'data_prefix': 'abc',
+                'data_prefix_short': 'abc',
+                'mime_type': 'application/json',
+                'priority': 5,
+                'size': 3,
+                'has_gd': True,
+                'is_in_sub_queue': is_in_sub_queue,
+                'published_by_id': 1,
+                'topic_id': topic_id,
+                'cluster_id': cluster_id,
+            }))
+
+            for idx, delivery_status in enumerate(queues):
+                session.execute(EnqueuedMsgTable.insert().values({
+                    'creation_time': now - 100,
+                    'sub_pattern_matched': 'sub=/test',
+                    'delivery_status': delivery_status,
+                    'pub_msg_id': pub_msg_id,
+                    'endpoint_id': 1,
+                    'topic_id': topic_id,
+                    'sub_key': 'zpsk.{}'.format(idx),
+                    'cluster_id': cluster_id,
+                }))
+
+        session.commit()
+        session.close()
+
+    def get_msg_count(self):
+        session = self.session_maker()
+        try:
+            return len(session.execute(MsgTable.select()).fetchall())
+        finally:
+            session.close()
+
+# ################################################################################################################################
+
+    def test_nothing_to_do(self):
+        self.pubsub._run_gd_maintenance(self.topic)
+
+        # Nothing was published and the depth is not cached so SQL is not used at all
+        self.assertEqual(self.session_count, 0)
+        self.assertIsNone(self.topic.gd_depth)
+
+# ################################################################################################################################
+
+    def test_cleanup(self):
+
+        # Delivered - above batch size, expired - below it and waiting for subscribers - exactly at batch size
+        self.add_msg_list(4, is_in_sub_queue=True, queues=(_delivered, _delivered))
+        self.add_msg_list(2, is_expired=True)
+        self.add_msg_list(3)
+
+        self.topic.msg_pub_counter_gd = 9
+        self.pubsub._run_gd_maintenance(self.topic)
+
+        # Only the messages waiting for subscribers are left and they are the topic's depth
+        self.assertEqual(self.get_msg_count(), 3)
+        self.assertEqual(self.topic.gd_depth, 3)
+        self.assertFalse(self.topic.needs_gd_maintenance())
+
+# ################################################################################################################################
+
+    def test_reconcile_depth_only(self):
+        self.add_msg_list(3)
+        self.topic.msg_pub_counter_gd = 3
+        self.pubsub._run_gd_maintenance(self.topic)
+
+        # Other servers publish to the same topic, including messages that have already expired
+        self.add_msg_list(2)
+        self.add_msg_list(1, is_expired=True)
+
+        self.pubsub._run_gd_maintenance(self.topic)
+
+        # Nothing was published through this server since the previous run so nothing was deleted,
+        # but the depth still reflects what the other servers published.
+        self.assertEqual(self.get_msg_count(), 6)
+        self.assertEqual(self.topic.gd_depth, 6)
+
+# ################################################################################################################################
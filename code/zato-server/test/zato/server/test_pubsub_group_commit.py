@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# gevent
+from gevent import joinall, sleep, spawn
+
+# Zato
+from zato.common.exception import ServiceUnavailable
+from zato.server.pubsub import GDGroupCommit
+from zato.server.service.internal.pubsub.publish import Publish
+from zato.server.service.store import set_up_class_attributes
+
+# ################################################################################################################################
+
+topic_name = '/test'
+
+# ################################################################################################################################
+
+def get_ctx(cid, msg_count=1):
+    return Bunch(cid=cid, topic=Bunch(name=topic_name), gd_msg_list=[{'pub_msg_id': cid}] * msg_count)
+
+# ################################################################################################################################
+
+class GDGroupCommitTestCase(TestCase):
+
+    def setUp(self):
+        self.flushed = []
+        self.errors = {}
+
+    def flush(self, ctx_list):
+        self.flushed.append([ctx.cid for ctx in ctx_list])
+        return [self.errors.get(ctx.cid) for ctx in ctx_list]
+
+    def publish_all(self, group_commit, cid_list, flush_func=None):
+        """ Publishes each cid from a greenlet of its own and returns None or an exception for each one.
+        """
+        out = {}
+
+        def _publish(cid):
+            try:
+                group_commit.publish(get_ctx(cid), flush_func or self.flush)
+            except Exception as e:
+                out[cid] = e
+            else:
+                out[cid] = None
+
+        joinall([spawn(_publish, cid) for cid in cid_list])
+        return [out[cid] for cid in cid_list]
+
+# ################################################################################################################################
+
+    def test_group_by_time(self):
+        group_commit = GDGroupCommit(topic_name, 50, 100)
+
+        self.assertEqual(self.publish_all(group_commit, ['a', 'b', 'c']), [None, None, None])
+        self.assertEqual(self.flushed, [['a', 'b', 'c']])
+        self.assertIsNone(group_commit.timer)
+
+# ################################################################################################################################
+
+    def test_group_by_max_msg(self):
+
+        # The time would never be up so the groups can only be stored because they are full
+        group_commit = GDGroupCommit(topic_name, 60000, 2)
+
+        self.assertEqual(self.publish_all(group_commit, ['a', 'b', 'c', 'd']), [None, None, None, None])
+        self.assertEqual(self.flushed, [['a', 'b'], ['c', 'd']])
+        self.assertIsNone(group_commit.timer)
+
+# ################################################################################################################################
+
+    def test_publication_errors(self):
+        group_commit = GDGroupCommit(topic_name, 50, 100)
+
+        e = Exception('Publication failed')
+        self.errors['b'] = e
+
+        # Only the publisher whose messages could not be stored gets an exception
+        self.assertEqual(self.publish_all(group_commit, ['a', 'b', 'c']), [None, e, None])
+
+# ################################################################################################################################
+
+    def test_flush_failure(self):
+        group_commit = GDGroupCommit(topic_name, 50, 100)
+
+        def _flush(ctx_list):
+            raise Exception('Flush failed')
+
+        errors = self.publish_all(group_commit, ['a', 'b'], _flush)
+
+        for e in errors:
+            self.assertEqual(e.args, ('Flush failed',))
+
+        # The next group is independent of the one that failed
+        self.assertEqual(self.publish_all(group_commit, ['c']), [None])
+        self.assertEqual(self.flushed, [['c']])
+
+# ################################################################################################################################
+
+class PublishGroupTestCase(TestCase):
+
+    def setUp(self):
+        set_up_class_attributes(Publish)
+        Publish.get_name()
+
+        self.committed = []
+        self.failed = set()
+        self.rejected = set()
+
+        self.service = Publish()
+        self.service.cid = 'cid.1'
+        self.service._publish_gd = self._publish_gd
+
+    def _publish_gd(self, ctx_list):
+        """ Stands in for a single SQL transaction - the whole of it fails if any of the publications fails.
+        """
+        sleep(0.01)
+        cid_list = [ctx.cid for ctx in ctx_list]
+
+        for cid in cid_list:
+            if cid in self.failed:
+                raise Exception('Could not store `{}`'.format(cid))
+
+        self.committed.append(cid_list)
+        return [ctx for ctx in ctx_list if ctx.cid in self.rejected]
+
+# ################################################################################################################################
+
+    def test_group_commit(self):
+        self.rejected.add('b')
+
+        errors = self.service._publish_gd_group([get_ctx('a'), get_ctx('b'), get_ctx('c')])
+
+        self.assertEqual(self.committed, [['a', 'b', 'c']])
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], ServiceUnavailable)
+        self.assertIsNone(errors[2])
+
+# ################################################################################################################################
+
+    def test_fallback(self):
+        self.failed.add('b')
+        self.rejected.add('c')
+
+        errors = self.service._publish_gd_group([get_ctx('a'), get_ctx('b'), get_ctx('c'), get_ctx('d')])
+
+        # The group failed so each publication had a transaction of its own ..
+        self.assertEqual(self.committed, [['a'], ['c'], ['d']])
+
+        # .. which means that only the publication that actually failed or was rejected is reported.
+        self.assertIsNone(errors[0])
+        self.assertEqual(errors[1].args, ('Could not store `b`',))
+        self.assertIsInstance(errors[2], ServiceUnavailable)
+        self.assertIsNone(errors[3])
+
+# ################################################################################################################################
+
+    def test_fallback_concurrent_publishers(self):
+        self.failed.add('b')
+
+        group_commit = GDGroupCommit(topic_name, 50, 100)
+        out = {}
+
+        def _publish(cid):
+            try:
+                group_commit.publish(get_ctx(cid), self.service._publish_gd_group)
+            except Exception as e:
+                out[cid] = e
+            else:
+                out[cid] = None
+
+        joinall([spawn(_publish, cid) for cid in ['a', 'b', 'c']])
+
+        self.assertEqual(self.committed, [['a'], ['c']])
+        self.assertIsNone(out['a'])
+        self.assertEqual(out['b'].args, ('Could not store `b`',))
+        self.assertIsNone(out['c'])
+
+# ################################################################################################################################
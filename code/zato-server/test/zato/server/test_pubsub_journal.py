@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+# Zato
+from zato.common.util.time_ import utcnow_as_ms
+from zato.server.pubsub.journal import NonGDJournal
+
+# ################################################################################################################################
+
+def get_msg(idx, expiration_time=None):
+    now = utcnow_as_ms()
+    return {
+        'pub_msg_id': 'zpsm.{}'.format(idx),
+        'pub_time': now + idx,
+        'expiration_time': expiration_time or now + 60000,
+        'data': 'data.{}'.format(idx),
+        'sub_pattern_matched': {'zpsk.1': 'sub=/test', 'zpsk.2': 'sub=/test'},
+    }
+
+# ################################################################################################################################
+
+class NonGDJournalTestCase(TestCase):
+
+    def setUp(self):
+        self.base_dir = mkdtemp(prefix='zato-test-journal')
+        self.journals = []
+
+    def tearDown(self):
+        for journal in self.journals:
+            for segment in journal.segments:
+                segment.close()
+            journal.lock_file.close()
+        rmtree(self.base_dir)
+
+    def get_journal(self, segment_size=4096, recovery_grace_period=300):
+        journal = NonGDJournal(self.base_dir, segment_size, recovery_grace_period=recovery_grace_period)
+        self.journals.append(journal)
+        return journal
+
+    def reopen(self, journal, recovery_grace_period=300):
+        self.journals.remove(journal)
+        for segment in journal.segments:
+            segment.close()
+        journal.lock_file.close()
+        return self.get_journal(journal.segment_size, recovery_grace_period)
+
+# ################################################################################################################################
+
+    def test_replay_after_restart(self):
+        journal = self.get_journal()
+        journal.add([get_msg(1), get_msg(2), get_msg(3)], ['zpsk.1', 'zpsk.2'])
+        journal.ack(['zpsm.1'], ['zpsk.1'])
+        journal.ack(['zpsm.2'])
+
+        # Nothing is replayed before a restart
+        self.assertEqual(journal.get_recovered_messages('zpsk.1'), [])
+
+        journal = self.reopen(journal)
+
+        msg_list = journal.get_recovered_messages('zpsk.1')
+        self.assertEqual([msg['pub_msg_id'] for msg in msg_list], ['zpsm.3'])
+        self.assertEqual(msg_list[0]['sub_pattern_matched']['zpsk.1'], 'sub=/test')
+
+        msg_list = journal.get_recovered_messages('zpsk.2')
+        self.assertEqual([msg['pub_msg_id'] for msg in msg_list], ['zpsm.1', 'zpsm.3'])
+
+        # Each message is replayed only once
+        self.assertEqual(journal.get_recovered_messages('zpsk.2'), [])
+
+# ################################################################################################################################
+
+    def test_expired_messages_are_not_replayed(self):
+        journal = self.get_journal()
+        journal.add([get_msg(1, utcnow_as_ms() - 1), get_msg(2)], ['zpsk.1'])
+
+        journal = self.reopen(journal)
+
+        msg_list = journal.get_recovered_messages('zpsk.1')
+        self.assertEqual([msg['pub_msg_id'] for msg in msg_list], ['zpsm.2'])
+
+# ################################################################################################################################
+
+    def test_unsubscribe(self):
+        journal = self.get_journal()
+        journal.add([get_msg(1), get_msg(2)], ['zpsk.1', 'zpsk.2'])
+        journal.ack(None, ['zpsk.1'])
+
+        journal = self.reopen(journal)
+
+        self.assertEqual(journal.get_recovered_messages('zpsk.1'), [])
+        self.assertEqual(len(journal.get_recovered_messages('zpsk.2')), 2)
+
+# ################################################################################################################################
+
+    def test_partial_record_is_ignored(self):
+        journal = self.get_journal()
+        journal.add([get_msg(1)], ['zpsk.1'])
+
+        # Simulate a process that stopped after writing a record's data but before writing its length
+        segment = journal.segments[-1]
+        segment.mmap[segment.position + 4:segment.position + 10] = b'abcdef'
+
+        journal = self.reopen(journal)
+
+        msg_list = journal.get_recovered_messages('zpsk.1')
+        self.assertEqual([msg['pub_msg_id'] for msg in msg_list], ['zpsm.1'])
+
+# ################################################################################################################################
+
+    def test_compaction(self):
+        journal = self.get_journal()
+
+        for idx in range(100):
+            journal.add([get_msg(idx)], ['zpsk.1'])
+
+        self.assertTrue(len(journal.segments) > 3)
+
+        # All messages delivered but one - its segment is rewritten and all the other ones, except for the current one,
+        # are deleted along with their files.
+        journal.ack(['zpsm.{}'.format(idx) for idx in range(100) if idx != 1], ['zpsk.1'])
+        journal.compact()
+
+        self.assertEqual(len(journal.segments), 1)
+        self.assertEqual(len(os.listdir(journal.dir_name)), 2) # The current segment and the lock file
+
+        journal = self.reopen(journal)
+
+        msg_list = journal.get_recovered_messages('zpsk.1')
+        self.assertEqual([msg['pub_msg_id'] for msg in msg_list], ['zpsm.1'])
+
+# ################################################################################################################################
+
+    def test_each_process_has_its_own_directory(self):
+        journal1 = self.get_journal()
+        journal2 = self.get_journal()
+
+        self.assertNotEqual(journal1.dir_name, journal2.dir_name)
+
+# ################################################################################################################################
+
+    def test_recovered_messages_not_replayed_are_dropped(self):
+        journal = self.get_journal()
+
+        for idx in range(100):
+            journal.add([get_msg(idx)], ['zpsk.1', 'zpsk.2'])
+
+        journal = self.reopen(journal, recovery_grace_period=10)
+        deadline = journal.recovery_deadline
+
+        # Only zpsk.1 is delivered by this process, zpsk.2 is handled by another one
+        msg_list = journal.get_recovered_messages('zpsk.1')
+        journal.ack([msg['pub_msg_id'] for msg in msg_list], ['zpsk.1'])
+
+        # Until the grace period is over, zpsk.2 could still be replayed so its messages keep their segments
+        journal.compact(lambda: deadline - 1)
+        self.assertTrue(len(journal.segments) > 3)
+        self.assertEqual(len(journal.entries), 100)
+
+        journal.compact(lambda: deadline)
+        self.assertEqual(len(journal.segments), 1)
+        self.assertEqual(journal.entries, {})
+        self.assertIsNone(journal.recovery_deadline)
+
+        # Dropped messages are not found on disk after another restart either
+        journal = self.reopen(journal)
+        self.assertEqual(journal.get_recovered_messages('zpsk.2'), [])
+        self.assertIsNone(journal.recovery_deadline)
+
+# ################################################################################################################################
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.common import PUBSUB
+from zato.server.pubsub import PubSub
+
+# ################################################################################################################################
+
+def get_pubsub(**server_attrs):
+    server = Bunch(server_attrs, name='test', pid=os.getpid(), fs_server_config=Bunch(
+        pubsub=Bunch(log_if_deliv_server_not_found=False, log_if_wsx_deliv_server_not_found=False,
+            data_prefix_len=2048, data_prefix_short_len=64),
+        pubsub_meta_topic=Bunch(enabled=False, store_frequency=1),
+        pubsub_meta_endpoint_pub=Bunch(enabled=False, store_frequency=1, data_len=0, max_history=0),
+    ))
+
+    return PubSub(1, server)
+
+# ################################################################################################################################
+
+def get_endpoint_config(idx, security_id=None, ws_channel_id=None, service_id=None):
+    return Bunch(id=idx, name='endpoint.{}'.format(idx), endpoint_type=PUBSUB.ENDPOINT_TYPE.REST.id,
+        role=PUBSUB.ROLE.PUBLISHER.id, is_active=True, is_internal=False, topic_patterns='pub=/test/*', security_id=security_id,
+        ws_channel_id=ws_channel_id, service_id=service_id)
+
+def get_topic_config(idx):
+    return Bunch(id=idx, name='/test/{}'.format(idx), is_active=True, is_internal=False, max_depth_gd=10000,
+        max_depth_non_gd=10000, has_gd=False, depth_check_freq=100, pub_buffer_size_gd=0, task_delivery_interval=100,
+        task_sync_interval=10, hook_service_id=None)
+
+def get_sub_config(idx, topic_idx, endpoint_type=PUBSUB.ENDPOINT_TYPE.WEB_SOCKETS.id):
+    return Bunch(id=idx, creation_time=1, sub_key='zpsk.test.{}'.format(idx), endpoint_id=1, topic_id=topic_idx,
+        topic_name='/test/{}'.format(topic_idx), sub_pattern_matched='sub=/test/*', task_delivery_interval=100,
+        ext_client_id='', ws_channel_id=None, endpoint_type=endpoint_type, cluster_id=1, server_id=2)
+
+# ################################################################################################################################
+
+class PubSubMapsTestCase(TestCase):
+
+    def test_create_endpoints(self):
+        pubsub = get_pubsub()
+        pubsub.create_endpoint(get_endpoint_config(1, security_id=11))
+
+        endpoints = pubsub.endpoints
+        sec_id_to_endpoint_id = pubsub.sec_id_to_endpoint_id
+
+        pubsub.create_endpoints([
+            get_endpoint_config(2, security_id=12),
+            get_endpoint_config(3, ws_channel_id=23),
+            get_endpoint_config(4, service_id=34),
+        ])
+
+        self.assertEqual(sorted(pubsub.endpoints), [1, 2, 3, 4])
+        self.assertEqual(pubsub.sec_id_to_endpoint_id, {11: 1, 12: 2})
+        self.assertEqual(pubsub.ws_channel_id_to_endpoint_id, {23: 3})
+        self.assertEqual(pubsub.service_id_to_endpoint_id, {34: 4})
+
+        # Maps that may be in use by readers are never modified in place
+        self.assertEqual(sorted(endpoints), [1])
+        self.assertEqual(sec_id_to_endpoint_id, {11: 1})
+
+# ################################################################################################################################
+
+    def test_create_topics(self):
+        pubsub = get_pubsub()
+        pubsub.create_topic(get_topic_config(1))
+
+        topics = pubsub.topics
+        pubsub.create_topics([get_topic_config(2), get_topic_config(3)])
+
+        self.assertEqual(sorted(pubsub.topics), [1, 2, 3])
+        self.assertEqual(pubsub.topic_name_to_id, {'/test/1': 1, '/test/2': 2, '/test/3': 3})
+        self.assertEqual(sorted(topics), [1])
+
+# ################################################################################################################################
+
+    def test_subscribe_many(self):
+        pubsub = get_pubsub()
+        pubsub._subscribe_many([get_sub_config(1, 1)])
+
+        subscriptions_by_topic = pubsub.subscriptions_by_topic
+        topic_subs = subscriptions_by_topic['/test/1']
+
+        # Subscription 1 already exists so it must not be added again
+        pubsub._subscribe_many([get_sub_config(idx, idx % 2) for idx in range(1, 6)])
+
+        self.assertEqual([sub.sub_key for sub in pubsub.subscriptions_by_topic['/test/0']], ['zpsk.test.2', 'zpsk.test.4'])
+        self.assertEqual([sub.sub_key for sub in pubsub.subscriptions_by_topic['/test/1']],
+            ['zpsk.test.1', 'zpsk.test.3', 'zpsk.test.5'])
+        self.assertEqual(sorted(pubsub.subscriptions_by_sub_key), ['zpsk.test.{}'.format(idx) for idx in range(1, 6)])
+
+        # Neither the previous map nor the lists in it have been modified
+        self.assertEqual(sorted(subscriptions_by_topic), ['/test/1'])
+        self.assertEqual([sub.sub_key for sub in topic_subs], ['zpsk.test.1'])
+
+# ################################################################################################################################
+
+    def test_subscribe_many_sub_key_servers(self):
+
+        # Delivery tasks are started by the first worker so here sub_key servers are only set
+        pubsub = get_pubsub(id=2, is_first_worker=False, server_startup_ipc=Bunch(get_pubsub_pid=lambda: 123))
+        pubsub.create_endpoint(get_endpoint_config(1))
+
+        pubsub._subscribe_many([get_sub_config(idx, idx % 2, PUBSUB.ENDPOINT_TYPE.REST.id) for idx in range(1, 4)])
+
+        self.assertEqual(sorted(pubsub.sub_key_servers), ['zpsk.test.1', 'zpsk.test.2', 'zpsk.test.3'])
+
+        for sk_server in pubsub.sub_key_servers.values():
+            self.assertEqual(sk_server.server_name, 'test')
+            self.assertEqual(sk_server.server_pid, 123)
+            self.assertEqual(sk_server.config['endpoint_id'], 1)
+
+# ################################################################################################################################
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# globre
+from globre import compile as globre_compile
+
+# Zato
+from zato.server.pubsub import TopicMatcher
+
+# ################################################################################################################################
+
+def get_patterns(*patterns):
+    return [['pub={}'.format(pattern), globre_compile(pattern)] for pattern in patterns]
+
+# ################################################################################################################################
+
+class TopicMatcherTestCase(TestCase):
+
+    def test_first_matching_pattern_wins(self):
+        matcher = TopicMatcher(get_patterns('/customer/*', '/customer/new', '/**'))
+
+        self.assertEqual(matcher.match('/customer/new'), 'pub=/customer/*')
+        self.assertEqual(matcher.match('/invoice/new'), 'pub=/**')
+
+# ################################################################################################################################
+
+    def test_no_match(self):
+        matcher = TopicMatcher(get_patterns('/customer/*', '/invoice/?'))
+
+        self.assertIsNone(matcher.match('/order/new'))
+        self.assertIsNone(matcher.match('/invoice/'))
+        self.assertEqual(matcher.match('/invoice/1'), 'pub=/invoice/?')
+
+# ################################################################################################################################
+
+    def test_no_patterns(self):
+        matcher = TopicMatcher([])
+        self.assertIsNone(matcher.match('/customer/new'))
+
+# ################################################################################################################################
+
+    def test_same_as_patterns_tried_one_by_one(self):
+
+        # More patterns than fit in a single combined regex
+        patterns = get_patterns(*['/topic/{}/*'.format(idx) for idx in range(120)] + ['/topic/**'])
+        matcher = TopicMatcher(patterns)
+
+        self.assertEqual(len(matcher.regexes), 3)
+
+        for name in ('/topic/0/a', '/topic/49/a', '/topic/50/a', '/topic/119/a', '/topic/120/a', '/abc'):
+            expected = None
+            for orig, compiled in patterns:
+                if compiled.match(name):
+                    expected = orig
+                    break
+            self.assertEqual(matcher.match(name), expected)
+
+# ################################################################################################################################
+
+    def test_cache_is_bounded(self):
+        matcher = TopicMatcher(get_patterns('/customer/*'), max_cache_size=2)
+
+        matcher.match('/customer/1')
+        matcher.match('/customer/2')
+        self.assertEqual(len(matcher.cache), 2)
+
+        matcher.match('/customer/3')
+        self.assertEqual(matcher.cache, {'/customer/3': 'pub=/customer/*'})
+
+# ################################################################################################################################
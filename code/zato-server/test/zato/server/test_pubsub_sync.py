@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import os
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# gevent
+from gevent import kill, sleep, spawn
+
+# Zato
+from zato.common import PUBSUB
+from zato.server.pubsub import PubSub
+
+# ################################################################################################################################
+
+topic_id = 1
+topic_name = '/test'
+sub_key = 'zpsk.test.1'
+
+# ################################################################################################################################
+
+def get_topic_config(task_sync_interval):
+    return Bunch(id=topic_id, name=topic_name, is_active=True, is_internal=False, max_depth_gd=10000, max_depth_non_gd=10000,
+        has_gd=False, depth_check_freq=100, pub_buffer_size_gd=0, task_delivery_interval=100,
+        task_sync_interval=task_sync_interval, hook_service_id=None)
+
+# ################################################################################################################################
+
+class SyncHeapTestCase(TestCase):
+
+    def setUp(self):
+        self.synced = []
+
+        def _invoke(name, msg, *ignored_args, **ignored_kwargs):
+            self.synced.append(msg['topic_id'])
+
+        # Delivery tasks are started by the first worker so here a sub_key server is only set
+        server = Bunch(id=2, name='test', pid=os.getpid(), is_first_worker=False, invoke=_invoke,
+            server_startup_ipc=Bunch(get_pubsub_pid=lambda: 123), fs_server_config=Bunch(
+                pubsub=Bunch(log_if_deliv_server_not_found=False, log_if_wsx_deliv_server_not_found=False,
+                    data_prefix_len=2048, data_prefix_short_len=64),
+                pubsub_meta_topic=Bunch(enabled=False, store_frequency=1),
+                pubsub_meta_endpoint_pub=Bunch(enabled=False, store_frequency=1, data_len=0, max_history=0),
+        ))
+
+        self.pubsub = PubSub(1, server)
+        self.pubsub.create_endpoint(Bunch(id=1, name='endpoint.1', endpoint_type=PUBSUB.ENDPOINT_TYPE.REST.id,
+            role=PUBSUB.ROLE.PUBLISHER_SUBSCRIBER.id, is_active=True, is_internal=False, topic_patterns='sub=/test',
+            security_id=None, ws_channel_id=None, service_id=None))
+        self.pubsub.create_topic(get_topic_config(10000))
+        self.pubsub._subscribe_many([Bunch(id=1, creation_time=1, sub_key=sub_key, endpoint_id=1, topic_id=topic_id,
+            topic_name=topic_name, sub_pattern_matched='sub=/test', task_delivery_interval=100, ext_client_id='',
+            ws_channel_id=None, endpoint_type=PUBSUB.ENDPOINT_TYPE.REST.id, cluster_id=1, server_id=2)])
+
+        self.task = spawn(self.pubsub.trigger_notify_pubsub_tasks, idle_wait_time=60)
+
+    def tearDown(self):
+        kill(self.task)
+
+# ################################################################################################################################
+
+    def publish(self):
+        self.pubsub.set_sync_has_msg(topic_id, False, True, 'test', None)
+
+    def edit_topic(self, task_sync_interval):
+        self.pubsub.edit_topic(topic_name, get_topic_config(task_sync_interval))
+
+# ################################################################################################################################
+
+    def test_sync_when_due(self):
+        self.edit_topic(100)
+        self.publish()
+
+        # The task is woken up when the topic is scheduled but the topic is not due yet ..
+        sleep(0.03)
+        self.assertEqual(self.synced, [])
+
+        # .. and now it is.
+        sleep(0.15)
+        self.assertEqual(self.synced, [topic_id])
+
+        # There are no new messages so the topic is not scheduled again
+        self.assertEqual(self.pubsub.sync_heap, [])
+        self.assertFalse(self.pubsub.topics[topic_id].sync_has_non_gd_msg)
+
+# ################################################################################################################################
+
+    def test_reschedule_shorter_interval(self):
+        self.publish()
+        sleep(0.03)
+
+        # The topic waits for the whole previous interval unless it is re-scheduled
+        self.edit_topic(50)
+        self.assertEqual(len(self.pubsub.sync_heap), 1)
+
+        sleep(0.15)
+        self.assertEqual(self.synced, [topic_id])
+        self.assertEqual(self.pubsub.sync_heap, [])
+
+# ################################################################################################################################
+
+    def test_reschedule_longer_interval(self):
+        self.edit_topic(50)
+        self.publish()
+
+        self.edit_topic(10000)
+        self.assertEqual(len(self.pubsub.sync_heap), 1)
+
+        # The entry computed from the previous interval is gone ..
+        sleep(0.15)
+        self.assertEqual(self.synced, [])
+
+        # .. and messages published before the edit will be synced according to the new one.
+        topic = self.pubsub.topics[topic_id]
+        self.assertTrue(topic.sync_has_non_gd_msg)
+        self.assertEqual(self.pubsub.sync_heap, [(topic.get_next_sync_time(), topic_id)])
+
+# ################################################################################################################################
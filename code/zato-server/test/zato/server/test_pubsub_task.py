@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# gevent
+from gevent import sleep
+from gevent.lock import RLock
+
+# Zato
+from zato.common import PUBSUB
+from zato.server.pubsub.task import DeliveryTask, SortedList
+
+# ################################################################################################################################
+
+class FakeMessage(object):
+    def __init__(self, idx, has_gd):
+        self.pub_msg_id = 'zpsm.{}'.format(idx)
+        self.idx = idx
+        self.has_gd = has_gd
+
+    def __lt__(self, other):
+        return self.idx < other.idx
+
+    def __eq__(self, other):
+        return self.idx == other.idx
+
+# ################################################################################################################################
+
+class SortedListTestCase(TestCase):
+
+    def assertCounts(self, sorted_list):
+        self.assertEqual(sorted_list.gd_count, sum(1 for msg in sorted_list if msg.has_gd))
+        self.assertEqual(sorted_list.non_gd_count, sum(1 for msg in sorted_list if not msg.has_gd))
+
+# ################################################################################################################################
+
+    def test_counts(self):
+        messages = [FakeMessage(idx, idx % 3 == 0) for idx in range(100)]
+
+        sorted_list = SortedList()
+        for msg in messages:
+            sorted_list.add(msg)
+
+        self.assertEqual(sorted_list.gd_count, 34)
+        self.assertEqual(sorted_list.non_gd_count, 66)
+
+        for msg in messages[:10]:
+            sorted_list.remove_pubsub_msg(msg)
+
+        self.assertEqual(sorted_list.gd_count, 30)
+        self.assertEqual(sorted_list.non_gd_count, 60)
+
+        sorted_list.pop()
+        sorted_list.discard(messages[50])
+        del sorted_list[10:20]
+        self.assertCounts(sorted_list)
+
+        sorted_list.update(FakeMessage(idx, True) for idx in range(100, 150))
+        self.assertCounts(sorted_list)
+
+        sorted_list.clear()
+        self.assertEqual(sorted_list.gd_count, 0)
+        self.assertEqual(sorted_list.non_gd_count, 0)
+
+# ################################################################################################################################
+
+    def test_initial_values(self):
+        sorted_list = SortedList(FakeMessage(idx, idx % 2 == 0) for idx in range(10))
+
+        self.assertEqual(sorted_list.gd_count, 5)
+        self.assertEqual(sorted_list.non_gd_count, 5)
+
+# ################################################################################################################################
+
+    def test_remove_missing_message(self):
+        sorted_list = SortedList()
+        sorted_list.add(FakeMessage(1, True))
+
+        self.assertRaises(ValueError, sorted_list.remove_pubsub_msg, FakeMessage(2, True))
+
+        self.assertEqual(sorted_list.gd_count, 1)
+        self.assertEqual(sorted_list.non_gd_count, 0)
+
+# ################################################################################################################################
+
+class MyDeliveryTask(DeliveryTask):
+    """ Delivers messages by storing them in a list, optionally taking some time to do it.
+    """
+    def __init__(self, delivery_list, delivery_time=0):
+        self.delivered = []
+        self.delivery_time = delivery_time
+        self.has_stopped = False
+
+        sub_config = Bunch(topic_name='/test', wait_sock_err=10, wait_non_sock_err=5, task_delivery_interval=0,
+            delivery_max_retry=100, delivery_method=PUBSUB.DELIVERY_METHOD.NOTIFY.id, delivery_batch_size=100,
+            wrap_one_msg_in_list=True, endpoint_name='test')
+
+        super(MyDeliveryTask, self).__init__(Bunch(enqueue_initial_messages=lambda *ignored: None), None, 'zpsk.test',
+            RLock(), delivery_list, None, None, sub_config)
+
+    def run_delivery(self):
+        self.delivered.extend(msg.idx for msg in self.delivery_list)
+        self.delivery_list.clear()
+
+        if self.delivery_time:
+            sleep(self.delivery_time)
+
+        return PUBSUB.RUN_DELIVERY_STATUS.OK
+
+    def run(self):
+        super(MyDeliveryTask, self).run()
+        self.has_stopped = True
+
+# ################################################################################################################################
+
+class DeliveryTaskWakeTestCase(TestCase):
+    """ Delivery tasks wait for up to 5 seconds if there are no messages so each test below expects the messages
+    to be delivered much sooner than that.
+    """
+    def tearDown(self):
+        self.task.stop()
+
+    def test_messages_before_start(self):
+        self.task = MyDeliveryTask(SortedList([FakeMessage(1, True)]))
+        sleep(0.01)
+
+        self.assertEqual(self.task.delivered, [1])
+
+# ################################################################################################################################
+
+    def test_wake_during_wait(self):
+        self.task = MyDeliveryTask(SortedList())
+        sleep(0.01)
+
+        # Without a wake-up call the task does not poll its list ..
+        self.task.delivery_list.add(FakeMessage(1, True))
+        sleep(0.05)
+        self.assertEqual(self.task.delivered, [])
+
+        # .. but it delivers messages as soon as it is woken up.
+        self.task.wake()
+        sleep(0.01)
+        self.assertEqual(self.task.delivered, [1])
+
+# ################################################################################################################################
+
+    def test_wake_before_wait(self):
+
+        # The task will be still delivering the first message when the second one is added ..
+        self.task = MyDeliveryTask(SortedList([FakeMessage(1, True)]), 0.3)
+        self.assertEqual(self.task.delivered, [1])
+
+        self.task.delivery_list.add(FakeMessage(2, True))
+        self.task.wake()
+
+        # .. so it must not go back to waiting before delivering the second one too.
+        sleep(0.2)
+        self.assertEqual(self.task.delivered, [1, 2])
+
+# ################################################################################################################################
+
+    def test_stop(self):
+        self.task = MyDeliveryTask(SortedList())
+        sleep(0.01)
+
+        self.task.stop()
+        sleep(0.01)
+
+        self.assertTrue(self.task.has_stopped)
+
+# ################################################################################################################################
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.server.service import Service
+from zato.server.service.store import ServiceStore, set_up_class_attributes
+
+# ################################################################################################################################
+
+class MyService(Service):
+    pass
+
+class MyPooledService(Service):
+    instance_pool_size = 2
+
+# ################################################################################################################################
+
+class ServicePoolTestCase(TestCase):
+
+    def setUp(self):
+        services = {}
+
+        for class_ in MyService, MyPooledService:
+            set_up_class_attributes(class_)
+            class_._worker_config = Bunch(out_odoo={}, out_soap={}, out_sap={}, out_sftp={})
+            class_._worker_store = Bunch(sql_pool_store={}, stomp_outconn_api={}, zmq_out_api={}, outconn_wsx={},
+                vault_conn_api={}, sms_twilio_api={}, outconn_ldap={}, outconn_mongodb={}, def_kafka={})
+            class_.component_enabled_ibm_mq = False
+            class_.component_enabled_zeromq = False
+            class_.component_enabled_sms = False
+            class_.get_name()
+            services[class_.get_impl_name()] = {'service_class': class_, 'is_active': True}
+
+        self.store = ServiceStore(services)
+
+    def new_instance(self, class_):
+        return self.store.new_instance(class_.get_impl_name())[0]
+
+# ################################################################################################################################
+
+    def test_pooled_instance_is_reused(self):
+        service = self.new_instance(MyPooledService)
+        service.cid = 'abc'
+        service.response.payload = 'def'
+        response = service.response
+
+        self.store.release_instance(service)
+        reused = self.new_instance(MyPooledService)
+
+        self.assertIs(reused, service)
+        self.assertIsNone(reused.cid)
+        self.assertEqual(reused.response.payload, '')
+
+        # The response object the previous request returned is not affected by the next one
+        self.assertIsNot(reused.response, response)
+        self.assertEqual(response.payload, 'def')
+
+# ################################################################################################################################
+
+    def test_pool_size(self):
+        services = [self.new_instance(MyPooledService) for _ in range(3)]
+
+        for service in services:
+            self.store.release_instance(service)
+
+        self.assertEqual(MyPooledService._instance_pool, services[:2])
+
+# ################################################################################################################################
+
+    def test_no_pool(self):
+        service = self.new_instance(MyService)
+        self.store.release_instance(service)
+
+        self.assertIsNone(MyService._instance_pool)
+        self.assertIsNot(self.new_instance(MyService), service)
+
+# ################################################################################################################################
+
+    def test_lazy_outgoing(self):
+        service = self.new_instance(MyService)
+        self.assertIsNone(service._out)
+
+        out = service.out
+        self.assertIs(service.outgoing, out)
+        self.assertIs(out.sql, service._worker_store.sql_pool_store)
+
+# ################################################################################################################################
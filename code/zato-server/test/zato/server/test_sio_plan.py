@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import logging
+from unittest import TestCase
+
+# SQLAlchemy
+from sqlalchemy.util import KeyedTuple
+
+# Zato
+from zato.common import DATA_FORMAT, PARAMS_PRIORITY, ParsingException, ZatoException
+from zato.server.service import AsIs, Boolean, CSV, Dict, Float, Integer, List, Opaque, Unicode
+from zato.server.service.reqresp import Request, SimpleIOPayload
+from zato.server.service.reqresp.sio import SIOInputPlan, SIOOutputPlan
+
+# ################################################################################################################################
+
+logger = logging.getLogger(__name__)
+
+simple_io_config = {
+    'int_parameters': ['id'],
+    'int_parameter_suffixes': ['_id', '_count'],
+    'bool_parameter_prefixes': ['has_', 'is_'],
+    'bytes_to_str': {'encoding': 'utf8'},
+}
+
+# ################################################################################################################################
+
+def get_sio(**attrs):
+    return type(str('SimpleIO'), (object,), attrs)
+
+# ################################################################################################################################
+
+class SIOInputPlanTestCase(TestCase):
+    """ Each request is parsed both by the original code and by SIOInputPlan and the results must be the same.
+    """
+    def get_input(self, sio, payload, sio_input_plan, channel_params, params_priority):
+        request = Request(logger, simple_io_config)
+        request.payload = payload
+        request.channel_params = channel_params
+        request.params_priority = params_priority
+        request.init(True, 'cid', sio, DATA_FORMAT.JSON, 'http', {}, None, sio_input_plan)
+        return request.input
+
+    def assert_same_input(self, sio, payload, channel_params=None, params_priority=PARAMS_PRIORITY.DEFAULT):
+        channel_params = channel_params or {}
+
+        expected = self.get_input(sio, payload, None, channel_params, params_priority)
+        given = self.get_input(sio, payload, SIOInputPlan(sio, simple_io_config), channel_params, params_priority)
+
+        self.assertEqual(given, expected)
+        self.assertEqual(sorted((key, type(value)) for key, value in given.items()),
+            sorted((key, type(value)) for key, value in expected.items()))
+
+        return given
+
+    def assert_same_error(self, exc_class, sio, payload):
+        for sio_input_plan in None, SIOInputPlan(sio, simple_io_config):
+            with self.assertRaises(exc_class):
+                self.get_input(sio, payload, sio_input_plan, {}, PARAMS_PRIORITY.DEFAULT)
+
+# ################################################################################################################################
+
+    def test_required_optional(self):
+        sio = get_sio(input_required=('id', 'user_id', 'is_active', 'name'), input_optional=('has_email', 'item_count', 'desc'))
+
+        given = self.assert_same_input(sio, {
+            'id': '1', 'user_id': '2', 'is_active': 'true', 'name': 'abc', 'has_email': 'false', 'item_count': '3',
+            'desc': 'zażółć'})
+        self.assertEqual(given, {
+            'id': 1, 'user_id': 2, 'is_active': True, 'name': 'abc', 'has_email': False, 'item_count': 3, 'desc': 'zażółć'})
+
+# ################################################################################################################################
+
+    def test_single_element_not_in_tuple(self):
+        self.assert_same_input(get_sio(input_required='user_id', input_optional='is_active'), {'user_id': '1'})
+
+# ################################################################################################################################
+
+    def test_optional_missing(self):
+        sio = get_sio(input_required=('name',), input_optional=('id', 'is_active', 'desc', Integer('size'), Boolean('flag'),
+            AsIs('as_is'), Unicode('text')))
+
+        given = self.assert_same_input(sio, {'name': 'abc'})
+        self.assertEqual(given.desc, '')
+
+# ################################################################################################################################
+
+    def test_optional_empty(self):
+        sio = get_sio(input_optional=('user_id', 'is_active', 'desc', Integer('size'), Boolean('flag'), Float('price')))
+        self.assert_same_input(sio, {'user_id': '', 'is_active': '', 'desc': '', 'size': '', 'flag': '', 'price': ''})
+
+# ################################################################################################################################
+
+    def test_optional_none(self):
+        sio = get_sio(input_optional=('user_id', 'is_active', 'desc', Integer('size'), Boolean('flag'), AsIs('as_is')))
+        self.assert_same_input(sio, {'user_id': None, 'is_active': None, 'desc': None, 'size': None, 'flag': None,
+            'as_is': None})
+
+# ################################################################################################################################
+
+    def test_sio_default_value(self):
+        sio = get_sio(input_required=('name',), input_optional=('desc', 'user_id', Integer('size')), default_value='dflt')
+
+        given = self.assert_same_input(sio, {'name': 'abc'})
+        self.assertEqual(given.desc, 'dflt')
+
+        # The SimpleIO-wide default value is used for missing required elements too
+        given = self.assert_same_input(sio, {'desc': 'def'})
+        self.assertEqual(given.name, 'dflt')
+
+# ################################################################################################################################
+
+    def test_force_type_default(self):
+        sio = get_sio(input_optional=(Integer('size', default=123), Boolean('flag', default=True), Unicode('text', default='abc')))
+
+        given = self.assert_same_input(sio, {'text': 'def'})
+        self.assertEqual(given, {'size': 123, 'flag': True, 'text': 'def'})
+
+# ################################################################################################################################
+
+    def test_force_type(self):
+        sio = get_sio(input_required=(Integer('size'), Boolean('flag'), Float('price'), Unicode('user_id'), CSV('tags'),
+            List('items'), Dict('attrs'), AsIs('record_id'), Opaque('has_opaque')))
+
+        given = self.assert_same_input(sio, {
+            'size': '12', 'flag': 'false', 'price': '1.5', 'user_id': '123', 'tags': 'a,b,c', 'items': [1, 2],
+            'attrs': {'a': 'b'}, 'record_id': '456', 'has_opaque': {'c': 'd'}})
+
+        # ForceType elements take precedence over the names of parameters
+        self.assertEqual(given.user_id, '123')
+        self.assertEqual(given.record_id, '456')
+        self.assertEqual(given.has_opaque, {'c': 'd'})
+
+# ################################################################################################################################
+
+    def test_secrets(self):
+        sio = get_sio(input_required=('password', 'secret'))
+        self.assert_same_input(sio, {'password': 'abc', 'secret': 'def'})
+
+# ################################################################################################################################
+
+    def test_channel_params(self):
+        sio = get_sio(input_required=('user_id', 'name'), input_optional=('is_active',))
+        channel_params = {'user_id': '1', 'is_active': 'true', 'extra': 'abc'}
+        payload = {'user_id': '2', 'name': 'def'}
+
+        given = self.assert_same_input(sio, payload, channel_params, PARAMS_PRIORITY.MSG_OVER_CHANNEL_PARAMS)
+        self.assertEqual(given.user_id, 2)
+
+        given = self.assert_same_input(sio, payload, channel_params, PARAMS_PRIORITY.CHANNEL_PARAMS_OVER_MSG)
+        self.assertEqual(given.user_id, 1)
+
+        # Required elements missing in the payload are taken from channel parameters
+        given = self.assert_same_input(sio, {'name': 'def'}, channel_params, PARAMS_PRIORITY.MSG_OVER_CHANNEL_PARAMS)
+        self.assertEqual(given.user_id, 1)
+
+# ################################################################################################################################
+
+    def test_use_channel_params_only(self):
+        sio = get_sio(input_optional=('user_id', 'name'), use_channel_params_only=True)
+        self.assert_same_input(sio, {'user_id': '2', 'name': 'abc'}, {'user_id': '1'})
+
+# ################################################################################################################################
+
+    def test_required_missing(self):
+        sio = get_sio(input_required=('user_id', 'name'))
+        self.assert_same_error(ParsingException, sio, {'user_id': '1'})
+
+    def test_no_input(self):
+        self.assert_same_error(ZatoException, get_sio(input_required=('name',)), '')
+
+    def test_invalid_value(self):
+        self.assert_same_error(ParsingException, get_sio(input_required=('user_id',)), {'user_id': 'abc'})
+
+# ################################################################################################################################
+
+    def test_plan_for_other_config_not_used(self):
+        sio = get_sio(input_required=('user_id',))
+        sio_input_plan = SIOInputPlan(sio, dict(simple_io_config, int_parameter_suffixes=[]))
+
+        # The plan would not have converted the value to an int
+        given = self.get_input(sio, {'user_id': '1'}, sio_input_plan, {}, PARAMS_PRIORITY.DEFAULT)
+        self.assertEqual(given.user_id, 1)
+
+# ################################################################################################################################
+
+class SIOOutputPlanTestCase(TestCase):
+    """ Each response is produced both by the original code and by SIOOutputPlan and the results must be the same.
+    """
+    def get_payload(self, sio, sio_output_plan):
+        return SimpleIOPayload('cid', DATA_FORMAT.JSON, getattr(sio, 'output_required', []),
+            getattr(sio, 'output_optional', []), simple_io_config, 'response', '', getattr(sio, 'output_repeated', False),
+            getattr(sio, 'skip_empty_keys', False), getattr(sio, 'force_empty_keys', []),
+            getattr(sio, 'allow_empty_required', False), sio_output_plan)
+
+    def get_output(self, sio, data, sio_output_plan):
+        payload = self.get_payload(sio, sio_output_plan)
+
+        if isinstance(data, list):
+            payload[:] = data
+        else:
+            payload.set_payload_attrs(data)
+
+        return payload.getvalue(False)['response']
+
+    def assert_same_output(self, sio, data):
+        expected = self.get_output(sio, data, None)
+        given = self.get_output(sio, data, SIOOutputPlan(sio, simple_io_config))
+
+        self.assertEqual(given, expected)
+
+        items = given if isinstance(given, list) else [given]
+        expected_items = expected if isinstance(expected, list) else [expected]
+
+        for item, expected_item in zip(items, expected_items):
+            self.assertEqual(sorted((key, type(value)) for key, value in item.items()),
+                sorted((key, type(value)) for key, value in expected_item.items()))
+
+        return given
+
+    def assert_same_error(self, sio, data):
+        for sio_output_plan in None, SIOOutputPlan(sio, simple_io_config):
+            with self.assertRaises(ZatoException):
+                self.get_output(sio, data, sio_output_plan)
+
+# ################################################################################################################################
+
+    def test_dict(self):
+        sio = get_sio(output_required=('id', 'user_id', 'is_active', 'name'), output_optional=('has_email', 'item_count'))
+
+        given = self.assert_same_output(sio, {
+            'id': '1', 'user_id': 2, 'is_active': 'true', 'name': b'abc', 'has_email': False, 'item_count': '3'})
+        self.assertEqual(given, {'id': 1, 'user_id': 2, 'is_active': True, 'name': 'abc', 'has_email': False, 'item_count': 3})
+
+# ################################################################################################################################
+
+    def test_list(self):
+        sio = get_sio(output_required=('user_id', 'name'), output_optional=('is_active', 'desc'))
+
+        given = self.assert_same_output(sio, [
+            {'user_id': '1', 'name': 'abc', 'is_active': 'true', 'desc': 'zażółć'},
+            {'user_id': 2, 'name': 'def'},
+            {'user_id': '3', 'name': 'ghi', 'is_active': None, 'desc': None},
+        ])
+        self.assertEqual(len(given), 3)
+
+# ################################################################################################################################
+
+    def test_keyed_tuples(self):
+        sio = get_sio(output_required=('user_id', 'name'), output_optional=('is_active', 'desc'))
+        self.assert_same_output(sio, [
+            KeyedTuple(['1', 'abc', 'false'], ['user_id', 'name', 'is_active']),
+            KeyedTuple([2, 'def', None], ['user_id', 'name', 'is_active']),
+        ])
+
+# ################################################################################################################################
+
+    def test_force_type(self):
+        sio = get_sio(output_required=(Integer('size'), Boolean('flag'), Float('price'), Unicode('user_id'), AsIs('record_id'),
+            List('items'), Dict('attrs')), output_optional=(Integer('count'), Boolean('is_set'), AsIs('has_as_is')))
+
+        self.assert_same_output(sio, [
+            {'size': '12', 'flag': 'false', 'price': 1.5, 'user_id': '123', 'record_id': '456', 'items': [1, 2],
+                'attrs': {'a': 'b'}, 'count': '', 'is_set': '', 'has_as_is': ''},
+            {'size': 1, 'flag': True, 'price': '2', 'user_id': 'abc', 'record_id': b'789', 'items': (3,), 'attrs': {}},
+        ])
+
+# ################################################################################################################################
+
+    def test_missing_optional(self):
+        sio = get_sio(output_required=('name',), output_optional=('user_id', 'is_active', 'desc', Integer('size')))
+        self.assert_same_output(sio, [{'name': 'abc'}, {'name': 'def', 'desc': '', 'user_id': None}])
+
+    def test_missing_required(self):
+        sio = get_sio(output_required=('name', 'user_id'))
+        self.assert_same_error(sio, [{'name': 'abc'}])
+        self.assert_same_error(sio, [{'name': 'abc', 'user_id': ''}])
+
+# ################################################################################################################################
+
+    def test_skip_empty_keys(self):
+        sio = get_sio(output_required=('name',), output_optional=('user_id', 'is_active', 'desc', Integer('size')),
+            skip_empty_keys=True, force_empty_keys=['desc'])
+
+        given = self.assert_same_output(sio, [{'name': 'abc', 'user_id': None, 'is_active': '', 'desc': '', 'size': 0}])
+        self.assertEqual(given, [{'name': 'abc', 'desc': '', 'size': 0}])
+
+# ################################################################################################################################
+
+    def test_allow_empty_required(self):
+        sio = get_sio(output_required=('name', 'user_id', 'is_active'), allow_empty_required=True)
+        self.assert_same_output(sio, [{'name': '', 'user_id': '', 'is_active': ''}, {'name': 'abc'}])
+
+# ################################################################################################################################
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.common import KVDB
+from zato.server.service.internal.stats import MigrateIndex
+from zato.server.service.store import set_up_class_attributes
+from zato.server.stats import get_bucket_idx, get_bucket_value, get_index_key, LatencyHistogram, StatsCollector
+
+# ################################################################################################################################
+
+class FakePipeline(object):
+    def __init__(self, conn):
+        self.conn = conn
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *ignored):
+        pass
+
+    def __getattr__(self, name):
+        def _command(*args):
+            self.commands.append((name,) + args)
+        return _command
+
+    def execute(self):
+        if self.conn.fail:
+            raise Exception('Execute failed')
+        self.conn.executed.append(self.commands)
+
+class FakeConn(object):
+    def __init__(self, keys=None):
+        self.executed = []
+        self.fail = False
+        self.keys = keys or []
+        self.values = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def setnx(self, key, value):
+        if key in self.values:
+            return False
+        self.values[key] = value
+        return True
+
+    def scan_iter(self, match, count):
+        return iter(self.keys)
+
+# ################################################################################################################################
+
+class LatencyHistogramTestCase(TestCase):
+
+    def test_buckets(self):
+        prev_idx = -1
+
+        for value in range(100000):
+            idx = get_bucket_idx(value)
+            bucket_value = get_bucket_value(idx)
+
+            self.assertGreaterEqual(idx, prev_idx)
+            self.assertEqual(get_bucket_idx(bucket_value), idx)
+            self.assertLessEqual(abs(bucket_value - value), max(1, value / 32.0))
+
+            prev_idx = idx
+
+    def test_get_values(self):
+        histogram = LatencyHistogram()
+        for value in (0, 5, 70, 70, 1000, 123456):
+            histogram.record(value)
+
+        self.assertEqual(histogram.count, 6)
+        self.assertEqual(histogram.min, 0)
+        self.assertEqual(histogram.max, 123456)
+        self.assertListEqual(histogram.get_values(), [0, 5, 70, 70, 999, 123456])
+
+# ################################################################################################################################
+
+class StatsCollectorTestCase(TestCase):
+
+    def test_flush(self):
+        conn = FakeConn()
+        collector = StatsCollector(conn)
+
+        self.assertEqual(collector.incr_usage('my.service'), 1)
+        self.assertEqual(collector.incr_usage('my.service'), 2)
+
+        collector.record('my.service', 10, '2019:01:02:03:04')
+        collector.record('my.service', 20, '2019:01:02:03:04')
+        collector.flush()
+
+        self.assertEqual(len(conn.executed), 1)
+        commands = conn.executed[0]
+
+        raw_by_minute_key = '{}my.service:2019:01:02:03:04'.format(KVDB.SERVICE_TIME_RAW_BY_MINUTE)
+
+        self.assertIn(('incrby', KVDB.SERVICE_USAGE + 'my.service', 2), commands)
+        self.assertIn(('hset', KVDB.SERVICE_TIME_BASIC + 'my.service', 'last', 20), commands)
+        self.assertIn(('rpush', KVDB.SERVICE_TIME_RAW + 'my.service', 10, 20), commands)
+        self.assertIn(('rpush', raw_by_minute_key, 10, 20), commands)
+        self.assertIn(('expire', raw_by_minute_key, 300), commands)
+
+        # Nothing new to flush
+        collector.flush()
+        self.assertEqual(len(conn.executed), 1)
+
+        # Local usage is kept across flushes
+        self.assertEqual(collector.incr_usage('my.service'), 3)
+
+    def test_flush_failure(self):
+        conn = FakeConn()
+        conn.fail = True
+        collector = StatsCollector(conn)
+
+        collector.incr_usage('my.service')
+        collector.record('my.service', 10, '2019:01:02:03:04')
+        collector.flush()
+
+        collector.incr_usage('my.service')
+        collector.record('my.service', 30, '2019:01:02:03:04')
+
+        conn.fail = False
+        collector.flush()
+
+        commands = conn.executed[0]
+        self.assertIn(('incrby', KVDB.SERVICE_USAGE + 'my.service', 2), commands)
+        self.assertIn(('hset', KVDB.SERVICE_TIME_BASIC + 'my.service', 'last', 30), commands)
+        self.assertIn(('rpush', KVDB.SERVICE_TIME_RAW + 'my.service', 10, 30), commands)
+
+# ################################################################################################################################
+
+class MigrateIndexTestCase(TestCase):
+
+    def get_service(self, conn):
+        set_up_class_attributes(MigrateIndex)
+        MigrateIndex.get_name()
+
+        service = MigrateIndex()
+        service.server = Bunch(kvdb=Bunch(conn=conn), fs_server_config={'stats': {'expire_after': '2'}})
+
+        return service
+
+    def test_migrate(self):
+        conn = FakeConn([
+            KVDB.SERVICE_TIME_RAW + 'my.service',
+            KVDB.SERVICE_TIME_RAW_BY_MINUTE + 'my.service:2019:01:02:03:04',
+            KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE + 'my.service:2019:01:02:03:04',
+            KVDB.SERVICE_TIME_AGGREGATED_BY_HOUR + 'my:service:2019:01:02:03',
+            KVDB.SERVICE_SUMMARY_BY_YEAR + 'my.service:2019',
+        ])
+        self.get_service(conn).handle()
+
+        self.assertEqual(len(conn.executed), 1)
+        commands = conn.executed[0]
+
+        raw_by_minute_index = get_index_key(KVDB.SERVICE_TIME_RAW_BY_MINUTE, '2019:01:02:03:04')
+        aggr_by_minute_index = get_index_key(KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, '2019:01:02:03:04')
+        aggr_by_hour_index = get_index_key(KVDB.SERVICE_TIME_AGGREGATED_BY_HOUR, '2019:01:02:03')
+        summary_by_year_index = get_index_key(KVDB.SERVICE_SUMMARY_BY_YEAR, '2019')
+
+        self.assertListEqual(commands, [
+            ('sadd', KVDB.SERVICE_TIME_RAW_INDEX, 'my.service'),
+
+            # Raw per-minute keys are kept for 5 minutes only, as in StatsCollector.flush ..
+            ('sadd', raw_by_minute_index, 'my.service'),
+            ('expire', raw_by_minute_index, 300),
+
+            # .. whereas everything else uses the server-wide setting of 2 hours.
+            ('sadd', aggr_by_minute_index, 'my.service'),
+            ('expire', aggr_by_minute_index, 7200),
+            ('sadd', aggr_by_hour_index, 'my:service'),
+            ('expire', aggr_by_hour_index, 7200),
+            ('sadd', summary_by_year_index, 'my.service'),
+            ('expire', summary_by_year_index, 7200),
+        ])
+
+    def test_migrate_once(self):
+        conn = FakeConn([KVDB.SERVICE_TIME_RAW + 'my.service'])
+
+        self.get_service(conn).handle()
+        self.get_service(conn).handle()
+
+        self.assertEqual(len(conn.executed), 1)
+
+# ################################################################################################################################
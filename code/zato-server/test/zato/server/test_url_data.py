@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2019, Zato Source s.r.o. https://zato.io
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.common import MISC
+from zato.server.connection.http_soap.url_data import URLData
+from zato.url_dispatcher import Matcher
+
+# ################################################################################################################################
+
+_sep = MISC.SEPARATOR
+_accept_any = 'haanyHTTP_SEPhaany'
+
+# ################################################################################################################################
+
+def get_channel(name, url_path, sec_type=None, security_name=None):
+    match_target = '{}{}{}{}{}{}{}'.format('', _sep, 'GET', _sep, _accept_any, _sep, url_path)
+    return {
+        'name': name,
+        'is_internal': False,
+        'sec_type': sec_type,
+        'security_name': security_name,
+        'match_target': match_target,
+        'match_target_compiled': Matcher(match_target, True),
+    }
+
+def get_worker(http_config):
+    return Bunch(server=Bunch(fs_server_config=Bunch(http=http_config, rbac=Bunch(auth_type_hook=None))))
+
+# ################################################################################################################################
+
+class URLDataTestCase(TestCase):
+
+    def test_match_cache_size_from_config(self):
+
+        # Values read from server.conf are always strings
+        url_data = URLData(get_worker({'url_match_cache_size': '123'}), [])
+        self.assertEqual(url_data.match_cache_size, 123)
+
+    def test_match_cache_size_default(self):
+        url_data = URLData(get_worker({}), [])
+        self.assertEqual(url_data.match_cache_size, 10000)
+
+# ################################################################################################################################
+
+    def test_delete_channel_data(self):
+        url_data = URLData(get_worker({}), [
+            get_channel('user', '/api/user/{user_id}', 'basic_auth', 'sec1'),
+            get_channel('static', '/api/static', 'basic_auth', 'sec2'),
+        ])
+
+        # Populate the cache and the router first
+        for url_path in '/api/user/1', '/api/static':
+            _, item = url_data.match(url_path, '', 'GET', '*/*', False)
+            self.assertIsNotNone(item)
+
+        url_data._delete_channel_data('basic_auth', 'sec1')
+
+        # The channel whose security definition was deleted cannot be matched anymore
+        self.assertEqual(url_data.match('/api/user/1', '', 'GET', '*/*', False), (None, None))
+
+        _, item = url_data.match('/api/static', '', 'GET', '*/*', False)
+        self.assertEqual(item['name'], 'static')
+
+# ################################################################################################################################
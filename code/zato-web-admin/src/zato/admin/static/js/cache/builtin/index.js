@@ -80,6 +80,8 @@ $.fn.zato.cache.builtin.data_table.new_row = function(item, data, include_tr) {
     row += String.format("<td class='ignore'>{0}</td>", is_default);
     row += String.format("<td class='ignore'>{0}</td>", item.extend_expiry_on_get);
     row += String.format("<td class='ignore'>{0}</td>", item.extend_expiry_on_set);
+    row += String.format("<td class='ignore'>{0}</td>", item.needs_key_index);
+    row += String.format("<td class='ignore'>{0}</td>", item.sync_method);
     row += String.format("<td class='ignore'>{0}</td>", data.cache_id);
 
     if(include_tr) {
@@ -28,13 +28,15 @@ class CreateForm(forms.Form):
         initial=CACHE.DEFAULT.MAX_ITEM_SIZE, widget=forms.TextInput(attrs={'class':'required', 'style':'width:15%'}))
     extend_expiry_on_get = forms.BooleanField(required=False, widget=forms.CheckboxInput(attrs={'checked':'checked'}))
     extend_expiry_on_set = forms.BooleanField(required=False, widget=forms.CheckboxInput(attrs={'checked':'checked'}))
-    sync_method = forms.ChoiceField(widget=forms.Select(attrs={'style':'width:50%'}))
+    needs_key_index = forms.BooleanField(required=False, widget=forms.CheckboxInput())
+    sync_method = forms.ChoiceField(
+        initial=CACHE.SYNC_METHOD.IN_BACKGROUND.id, widget=forms.Select(attrs={'style':'width:50%'}))
     persistent_storage = forms.ChoiceField(widget=forms.Select(attrs={'style':'width:50%'}))
     cache_id = forms.CharField(widget=forms.HiddenInput())
 
     def __init__(self, prefix=None, post_data=None, req=None):
         super(CreateForm, self).__init__(post_data, prefix=prefix)
-        add_select(self, 'sync_method', CACHE.SYNC_METHOD())
+        add_select(self, 'sync_method', CACHE.SYNC_METHOD(), False)
         add_select(self, 'persistent_storage', CACHE.PERSISTENT_STORAGE())
 
 # ################################################################################################################################